@@ -15,7 +15,9 @@ import gc
 import getopt
 import os
 import sys
+import threading
 import time
+import traceback
 import weakref
 from collections import OrderedDict
 
@@ -28,10 +30,11 @@ from . import __version__
 from . import devices, modules
 from .Interfaces import InterfaceDirectory
 from .devices.Device import Device, DeviceTask
-from .util import DataManager, ptime, Qt
+from .util import DataManager, appdata, deviceloader, ptime, Qt, startupprofile
 from .util.DataManager import DirHandle
 from .util.HelpfulException import HelpfulException
 from .util.debug import logExc, logMsg, createLogWindow
+from .util.future import Future
 
 _ = logExc  # prevent cleanup of logExc; needed by debug
 
@@ -223,16 +226,9 @@ class Manager(Qt.QObject):
                 return cf
         raise FileNotFoundError(f"Could not find default.cfg file in any of: {CONFIGPATH}")
 
-    def _appDataDir(self):
+    def appDataDir(self):
         # return the user application data directory
-        if sys.platform == 'win32':
-            # resolves to "C:/Documents and Settings/User/Application Data/acq4" on XP
-            # and "C:\User\Username\AppData\Roaming" on win7
-            return os.path.join(os.environ['APPDATA'], 'acq4')
-        elif sys.platform == 'darwin':
-            return os.path.expanduser('~/Library/Preferences/acq4')
-        else:
-            return os.path.expanduser('~/.local/acq4')
+        return appdata.appDataDir()
 
     def readConfig(self, configFile):
         """Read configuration file, create device objects, add devices to list"""
@@ -310,27 +306,8 @@ class Manager(Qt.QObject):
 
                 ## configure new devices
                 elif key == 'devices':
-                    for k in cfg['devices']:
-                        if self.disableAllDevs or k in self.disableDevs:
-                            print(f"    --> Ignoring device '{k}' -- disabled by request")
-                            logMsg(f"    --> Ignoring device '{k}' -- disabled by request")
-                            continue
-                        print(f"  === Configuring device '{k}' ===")
-                        logMsg(f"  === Configuring device '{k}' ===")
-                        try:
-                            conf = cfg['devices'][k]
-                            driverName = conf['driver']
-                            if 'config' in conf:  # for backward compatibility
-                                conf = conf['config']
-                            self.loadDevice(driverName, conf, k)
-                        except:
-                            print(f"Error configuring device {k}:")
-                            if self.exitOnError:
-                                raise
-                            else:
-                                printExc()
-                    print("=== Device configuration complete ===")
-                    logMsg("=== Device configuration complete ===")
+                    workers = cfg.get('parallelDeviceInit', cfg.get('misc', {}).get('parallelDeviceInit', False))
+                    self._loadDevices(cfg['devices'], workers)
 
                 ## Copy in new module definitions
                 elif key == 'modules':
@@ -360,6 +337,18 @@ class Manager(Qt.QObject):
                     from MetaArray import MetaArray
                     MetaArray.defaultCompression = comp
 
+                elif key == 'indexFormat':
+                    print(f"=== Setting directory index format: {val} ===")
+                    DataManager.dm.setIndexFormat(val)
+
+                elif key == 'metadataCache':
+                    if val is True:
+                        val = os.path.join(self.appDataDir(), 'metadataCache.sqlite')
+                    elif val is False:
+                        val = None
+                    print(f"=== Setting metadata cache: {val} ===")
+                    DataManager.dm.setMetadataCache(val)
+
                 elif key == 'folderTypes':
                     self._folderTypes = val
 
@@ -439,6 +428,66 @@ class Manager(Qt.QObject):
     def configFileName(self, name):
         return os.path.join(self.configDir, name)
 
+    def _loadDevices(self, devConfigs, workers=False):
+        """Create all devices in *devConfigs* ({name: {'driver': ..., ...}}).
+
+        Devices are created after any other devices named in their configuration (see
+        acq4.util.deviceloader). If *workers* is True or an integer > 1, devices that do not depend
+        on each other are initialized concurrently by a pool of that many threads (True uses one
+        thread per device). Only enable this for device drivers that are safe to construct outside
+        the GUI thread; devices are moved to the GUI thread once created.
+
+        Errors are collected per device, and a timing report is written to the log.
+        """
+        devConfigs = dict(devConfigs)
+        for k in list(devConfigs):
+            if self.disableAllDevs or k in self.disableDevs:
+                print(f"    --> Ignoring device '{k}' -- disabled by request")
+                logMsg(f"    --> Ignoring device '{k}' -- disabled by request")
+                del devConfigs[k]
+
+        if workers is True:
+            workers = len(devConfigs)
+        workers = int(workers or 1)
+        guiThread = Qt.QCoreApplication.instance().thread() if Qt.QCoreApplication.instance() is not None else None
+
+        def load(name, conf):
+            driverName = conf['driver']
+            if 'config' in conf:  # for backward compatibility
+                conf = conf['config']
+            dev = self.loadDevice(driverName, conf, name)
+            if guiThread is not None and isinstance(dev, Qt.QObject) and dev.thread() != guiThread:
+                dev.moveToThread(guiThread)
+            return dev
+
+        def started(name):
+            print(f"  === Configuring device '{name}' ===")
+            logMsg(f"  === Configuring device '{name}' ===")
+
+        def finished(result):
+            startupprofile.record('device', result.name, result.duration)
+            if isinstance(result.error, tuple):
+                print(f"Error configuring device {result.name}:")
+                traceback.print_exception(*result.error)
+                logMsg(f"Error configuring device {result.name}", msgType='error', exception=result.error)
+            elif result.failed:
+                print(f"    --> Not configuring device '{result.name}': {result.error}")
+                logMsg(f"    --> Not configuring device '{result.name}': {result.error}", msgType='error')
+
+        report = deviceloader.loadDevices(
+            devConfigs, load, maxWorkers=workers, onStart=started, onFinish=finished,
+            idleFn=Qt.QApplication.processEvents if workers > 1 else None)
+        print("=== Device configuration complete ===")
+        logMsg("=== Device configuration complete ===")
+        print(report.formatReport())
+        logMsg(report.formatReport(), importance=3)
+
+        if self.exitOnError:
+            for error in report.failures().values():
+                if isinstance(error, tuple):
+                    raise error[1]
+        return report
+
     def loadDevice(self, devClassName, conf, name):
         """Create a new instance of a device.
         
@@ -524,9 +573,9 @@ class Manager(Qt.QObject):
         elif execPath is not None:
             self.exec_(execPath)
 
-        modclass = modules.getModuleClass(moduleClassName)
-
-        mod = modclass(self, name, config)
+        with startupprofile.timed('module', name):
+            modclass = modules.getModuleClass(moduleClassName)
+            mod = modclass(self, name, config)
         with self.lock:
             self.modules[name] = mod
 
@@ -919,6 +968,9 @@ class DeviceLocker(object):
 class Task:
     id = 0
 
+    # If True, results are not written to storage when the task stops; see storeResults().
+    deferStorage = False
+
     def __init__(self, dm, command):
         self.dm = dm
         self.command = command
@@ -931,6 +983,11 @@ class Task:
         self.startTime = None
         self.stopTime = None
 
+        # notified (and the count incremented) whenever a device task reports completion or the
+        # task is stopped; see waitUntilDone()
+        self._wakeup = threading.Condition()
+        self._wakeupCount = 0
+
         # self.reserved = False
         try:
             self.cfg = command['protocol']
@@ -943,9 +1000,13 @@ class Task:
         Task.id += 1
 
         ## TODO:  set up data storage with cfg['storeData'] and ['writeLocation']
-        self.devNames = list(command.keys())
+        self._createDeviceTasks()
+
+    def _createDeviceTasks(self):
+        self.devNames = list(self.command.keys())
         self.devNames.remove('protocol')
         self.devs = {devName: self.dm.getDevice(devName) for devName in self.devNames}
+        self._configOrder = None
 
         ## Create task objects. Each task object is a handle to the device which is unique for this task run.
         self.tasks = {}
@@ -957,6 +1018,47 @@ class Task:
                 continue
             self.tasks[devName] = task
 
+    def rearm(self, command=None):
+        """Prepare this task to be executed again, optionally with an updated *command*.
+
+        Device tasks that support DeviceTask.rearm() keep their hardware configuration (for example,
+        the DAQ keeps its channels and clock configuration and only receives new waveforms). If any
+        device task cannot accept the new command, all device tasks are recreated as if this were
+        a new Task.
+
+        Return True if the existing device tasks were reused.
+        """
+        with self.taskLock:
+            if len(self.startedDevs) > 0:
+                raise RuntimeError("Cannot rearm a task that is still running.")
+            if command is None:
+                command = self.command
+            if 'protocol' not in command:
+                raise TypeError("Command specified for task is invalid. (Must be dictionary with 'protocol' key)")
+
+            reuse = set(command.keys()) == set(self.command.keys())
+            if reuse:
+                for devName, task in self.tasks.items():
+                    if not task.rearm(command[devName]):
+                        reuse = False
+                        break
+
+            self.command = command
+            self.cfg = command['protocol']
+            if not reuse:
+                self._createDeviceTasks()
+
+            self.result = None
+            self.startTime = None
+            self.stopTime = None
+            return reuse
+
+    def reexecute(self, updatedCommand=None, block=True, processEvents=True):
+        """Rearm this task with *updatedCommand* (see rearm()) and execute it again.
+        """
+        self.rearm(updatedCommand)
+        self.execute(block=block, processEvents=processEvents)
+
     @staticmethod
     def getDevName(obj):
         if isinstance(obj, str):
@@ -1034,8 +1136,10 @@ class Task:
 
                 prof.mark('reserve')
 
-                ## Determine order of device configuration.
-                configOrder = self.getConfigOrder()
+                ## Determine order of device configuration (this does not change when the task is rearmed).
+                if self._configOrder is None:
+                    self._configOrder = self.getConfigOrder()
+                configOrder = self._configOrder
 
                 ## Configure all subtasks. Some devices may need access to other tasks, so we make all available here.
                 ## This is how we allow multiple devices to communicate and decide how to operate together.
@@ -1070,22 +1174,7 @@ class Task:
                     return
 
                 ## Wait until all tasks are done
-                lastProcess = ptime.time()
-                isGuiThread = Qt.QThread.currentThread() == Qt.QCoreApplication.instance().thread()
-                while not self.isDone():
-                    now = ptime.time()
-                    elapsed = now - self.startTime
-                    if isGuiThread:
-                        if processEvents and now - lastProcess > 20e-3:  ## only process Qt events every 20ms
-                            Qt.QApplication.processEvents()
-                            lastProcess = ptime.time()
-
-                    ## If the task duration has not elapsed yet, only wake up every 10ms, and attempt to wake up 5ms before the end
-                    if elapsed < self.cfg['duration'] - 10e-3:
-                        sleep = min(10e-3, self.cfg['duration'] - elapsed - 5e-3)
-                    else:
-                        sleep = 1.0e-3  ## afterward, wake up more quickly so we can respond as soon as the task finishes
-                    time.sleep(sleep)
+                self.waitUntilDone(processEvents=processEvents)
 
                 self.stop()
             except:
@@ -1096,6 +1185,67 @@ class Task:
             finally:
                 prof.finish()
 
+    def waitUntilDone(self, timeout=None, processEvents=False):
+        """Block until the task is done (see isDone) or *timeout* seconds have elapsed.
+
+        Return True if the task is done. If *processEvents* is True and this is called from the
+        GUI thread, then Qt events are processed every 20 ms while waiting.
+
+        Device tasks that set DeviceTask.signalsCompletion wake this method as soon as they finish.
+        While any unfinished device task does not, its isDone() is polled every 1 ms instead.
+        """
+        start = ptime.time()
+        isGuiThread = Qt.QThread.currentThread() == Qt.QCoreApplication.instance().thread()
+        processEvents = processEvents and isGuiThread
+        lastProcessEvents = None
+        while True:
+            ## remember the wakeup count before checking isDone, so that a wakeup arriving after the
+            ## check is never missed (and waking one waiter never hides the wakeup from another)
+            with self._wakeup:
+                wakeupCount = self._wakeupCount
+            if self.isDone():
+                return True
+            now = ptime.time()
+            if timeout is not None and now - start >= timeout:
+                return False
+
+            remaining = self.cfg['duration'] - (now - self.startTime)
+            if remaining > 0:
+                ## Nothing can finish before the requested duration has elapsed, except an abort
+                wait = remaining
+            elif any(not t.signalsCompletion and not t.isDone() for t in self.tasks.values()):
+                wait = 1e-3
+            else:
+                ## all remaining device tasks will wake us; wake up occasionally anyway to check for timeouts
+                wait = 0.1
+            if processEvents:
+                if lastProcessEvents is None or now - lastProcessEvents >= 20e-3:
+                    Qt.QApplication.processEvents()
+                    lastProcessEvents = now = ptime.time()
+                wait = min(wait, lastProcessEvents + 20e-3 - now)
+            if timeout is not None:
+                wait = min(wait, start + timeout - now)
+
+            with self._wakeup:
+                if self._wakeupCount == wakeupCount:
+                    self._wakeup.wait(max(wait, 0))
+
+    def wait(self):
+        """Return a TaskFuture that finishes as soon as this task is done.
+
+        This is intended for tasks started with execute(block=False).
+        """
+        return TaskFuture(self)
+
+    def _deviceTaskDone(self, devTask):
+        """Called by device tasks (see DeviceTask.taskDone) to wake up waitUntilDone()."""
+        self._wake()
+
+    def _wake(self):
+        with self._wakeup:
+            self._wakeupCount += 1
+            self._wakeup.notify_all()
+
     def isDone(self):
         """Return True if all tasks are completed and ready to return results.
 
@@ -1166,6 +1316,7 @@ class Task:
 
             prof = Profiler("Manager.Task.stop", disabled=True)
             self.abortRequested = abort
+            self._wake()
             try:
                 if not self.stopped:
                     ## Stop all device tasks
@@ -1194,10 +1345,8 @@ class Task:
                     self.result = result
 
                     ## Store data if requested
-                    if 'storeData' in self.cfg and self.cfg['storeData'] is True:
-                        self.cfg['storageDir'].setInfo(result['protocol'])
-                        for t in self.tasks:
-                            self.tasks[t].storeResult(self.cfg['storageDir'])
+                    if 'storeData' in self.cfg and self.cfg['storeData'] is True and not self.deferStorage:
+                        self.storeResults()
                     prof.mark("store data")
             finally:
                 ## Regardless of any other problems, at least make sure we
@@ -1217,6 +1366,28 @@ class Task:
             self.stop()
             return self.result
 
+    def storeResults(self):
+        """Write the results of the task to the storage directory given in the task command.
+
+        This is normally done when the task is stopped. If *deferStorage* is True, it is left to
+        the caller, which may then store the results from another thread after the devices have
+        been released.
+        """
+        storageDir = self.cfg['storageDir']
+        storageDir.setInfo(self.result['protocol'])
+        for t in self.tasks:
+            self.tasks[t].storeResult(storageDir)
+
+    def prepare(self):
+        """Do the parts of execute() that do not require access to hardware.
+
+        This may be called while another task is running, so that the task is ready to be
+        configured as soon as its devices become available.
+        """
+        with self.taskLock:
+            if self._configOrder is None:
+                self._configOrder = self.getConfigOrder()
+
     def reserveDevices(self):
         if self.deviceLock is None:
             try:
@@ -1324,6 +1495,32 @@ class Task:
         return order
 
 
+class TaskFuture(Future):
+    """Tracks the execution of a Manager Task that was started with execute(block=False).
+
+    The future finishes (with the task as its result) as soon as the task is done. Devices are
+    reserved by the thread that executed the task, so that thread must still call
+    Task.getResult() or Task.stop() afterward; likewise, stopping the future only stops waiting.
+    """
+    def __init__(self, task):
+        Future.__init__(self)
+        self.task = task
+        self.executeInThread(self._waitForTask, (), {})
+
+    def percentDone(self):
+        if self.isDone():
+            return 100
+        runTime = self.task.runTime()
+        if runTime is None:
+            return 0
+        return min(99, 100 * runTime / max(self.task.cfg['duration'], 1e-9))
+
+    def _waitForTask(self, _future):
+        while not self.task.waitUntilDone(timeout=0.1):
+            self.checkStop()
+        return self.task
+
+
 DOC_ROOT = 'http://acq4.org/documentation/'
 
 
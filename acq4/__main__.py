@@ -13,6 +13,16 @@ if __package__ is None:
 
     __package__ = 'acq4'
 
+# Start the startup profiler before anything else is imported
+if "--profile-startup" in sys.argv:
+    profileStartup = True
+    sys.argv.pop(sys.argv.index('--profile-startup'))
+    from .util import startupprofile
+
+    startupprofile.start()
+else:
+    profileStartup = False
+
 from .util import pg_setup  
 from .Manager import Manager
 from .util.debug import installExceptionHandler
@@ -103,6 +113,13 @@ gc = GarbageCollector(interval=1, debug=False)
 ## Create Manager. This configures devices and creates the main manager window.
 man = Manager(argv=sys.argv[1:])
 
+if profileStartup:
+    report = startupprofile.stop().formatReport()
+    print(report)
+    from .util.debug import logMsg
+
+    logMsg(report, importance=3)
+
 # If example config was loaded, offer more help to the user.
 message = """\
 <center><b>Demo mode:</b><br>\
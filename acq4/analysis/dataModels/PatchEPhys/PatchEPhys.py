@@ -1,6 +1,8 @@
 # -*- coding: utf-8 -*-
 from __future__ import print_function
 
+import itertools
+from collections import OrderedDict
 import os
 import re
 
@@ -123,6 +125,12 @@ def buildSequenceArray(*args, **kargs):
         truncate: If join=True and some elements differ in shape, truncate to the smallest shape
         fill:    If join=True, pre-fill the empty array with this value. Any points in the
                  parameter space with no data will be left with this value.
+        memmap:  If join=True, build the array in a memory-mapped file rather than in memory, so that
+                 sequences larger than the available memory can be loaded. May be True (use a
+                 temporary file, which is deleted once the array is no longer referenced) or the
+                 name of the file to create.
+        workers: Number of threads used to call func (default 1). At most 2*workers results are
+                 held in memory at once while the output is being filled.
         
     Example: Return an array of all primary-channel clamp recordings across a sequence 
         buildSequenceArray(seqDir, lambda protoDir: getClampFile(protoDir).read()['primary'])"""
@@ -132,7 +140,99 @@ def buildSequenceArray(*args, **kargs):
             return i
 
 
-def buildSequenceArrayIter(dh, func=None, join=True, truncate=False, fill=None):
+_sequenceIndexCache = OrderedDict()  ## LRU cache: {dirName: (stamp, index)}
+_sequenceIndexCacheSize = 64
+
+
+def _indexStamp(path):
+    ## stamp of a directory's index file(s); setInfo() rewrites these without touching the directory mtime
+    from acq4.util.DataManager.indexstore import INDEX_FORMATS
+    from acq4.util.DataManager.metacache import fileStamp
+    stamps = [fileStamp(os.path.join(path, cls.fileName)) for cls in INDEX_FORMATS.values()]
+    mtimes = [mtime for stamp, mtime in stamps if mtime is not None]
+    return tuple(stamp for stamp, mtime in stamps), max(mtimes) if mtimes else None
+
+
+def sequenceIndex(dh):
+    """Return a list of (subDirName, index) for every protocol run in the sequence *dh*, where
+    *index* is the tuple of sequence parameter indexes for that run.
+
+    The result is cached (in memory, and in the DataManager's metadata cache if one is configured)
+    and reused until the index file of any subdirectory is modified, so that the meta-info of every
+    run does not need to be read each time a sequence is loaded.
+    """
+    params = listSequenceParams(dh)
+    subDirs = dh.subDirs()
+    stamp = []
+    newest = None
+    for name in subDirs:
+        subStamp, mtime = _indexStamp(os.path.join(dh.name(), name))
+        stamp.append((name, subStamp))
+        if mtime is not None:
+            newest = mtime if newest is None else max(newest, mtime)
+    stamp = (tuple(params.keys()), tuple(stamp))
+
+    cached = _sequenceIndexCache.get(dh.name())
+    if cached is not None and cached[0] == stamp:
+        _sequenceIndexCache.move_to_end(dh.name())
+        return cached[1]
+
+    from acq4.util import DataManager
+    cache = DataManager.dm.metadataCache
+    index = None if cache is None else cache.get('sequenceIndex', dh.name(), stamp)
+    if index is None:
+        index = []
+        for name in subDirs:
+            dhInfo = dh[name].info()
+            index.append((name, tuple(dhInfo[k] for k in params)))
+        if cache is not None:
+            cache.set('sequenceIndex', dh.name(), stamp, index, mtime=newest)
+    _sequenceIndexCache[dh.name()] = (stamp, index)
+    _sequenceIndexCache.move_to_end(dh.name())
+    while len(_sequenceIndexCache) > _sequenceIndexCacheSize:
+        _sequenceIndexCache.popitem(last=False)
+    return index
+
+
+def _iterResults(dh, func, names, workers):
+    ## yield (name, func(dh[name])) in order, calling func from a pool of threads with bounded prefetch
+    if workers <= 1:
+        for name in names:
+            yield name, func(dh[name])
+        return
+
+    from collections import deque
+    from concurrent.futures import ThreadPoolExecutor
+    pool = ThreadPoolExecutor(max_workers=workers)
+    try:
+        names = iter(names)
+        pending = deque()
+        for name in names:
+            pending.append((name, pool.submit(func, dh[name])))
+            if len(pending) >= 2 * workers:
+                break
+        while pending:
+            name, fut = pending.popleft()
+            result = fut.result()
+            for nextName in names:
+                pending.append((nextName, pool.submit(func, dh[nextName])))
+                break
+            yield name, result
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _emptyArray(shape, dtype, memmap):
+    if memmap is False or memmap is None:
+        return np.empty(shape, dtype)
+    if memmap is True:
+        import tempfile
+        fh = tempfile.TemporaryFile()
+        return np.memmap(fh, dtype=dtype, mode='w+', shape=shape)
+    return np.memmap(memmap, dtype=dtype, mode='w+', shape=shape)
+
+
+def buildSequenceArrayIter(dh, func=None, join=True, truncate=False, fill=None, memmap=False, workers=1):
     """Iterator for buildSequenceArray that yields progress updates."""
 
     if func is None:
@@ -146,9 +246,11 @@ def buildSequenceArrayIter(dh, func=None, join=True, truncate=False, fill=None):
     # fh = dh[name]
     # return func(fh)
     # data = SequenceRunner.runSequence(functools.partial(runFunc, dh, func), inds, inds.keys())
-    subDirs = dh.subDirs()
+    index = sequenceIndex(dh)
+    subDirs = [name for name, ind in index]
     if len(subDirs) == 0:
         yield None, None
+        return
 
     ## set up meta-info for sequence axes
     seqShape = tuple([len(p) for p in params.values()])
@@ -158,8 +260,10 @@ def buildSequenceArrayIter(dh, func=None, join=True, truncate=False, fill=None):
         info[i] = {'name': k, 'values': np.array(v)}
         i += 1
 
+    results = _iterResults(dh, func, subDirs, workers)
+
     ## get a data sample
-    first = func(dh[subDirs[0]])
+    firstName, first = next(results)
 
     ## build empty MetaArray
     if join:
@@ -168,7 +272,7 @@ def buildSequenceArrayIter(dh, func=None, join=True, truncate=False, fill=None):
             info = info + first._info
         else:
             info = info + [{} for i in range(first.ndim + 1)]
-        data = MetaArray(np.empty(shape, first.dtype), info=info)
+        data = MetaArray(_emptyArray(shape, first.dtype, memmap), info=info)
         if fill is not None:
             data[:] = fill
 
@@ -179,33 +283,24 @@ def buildSequenceArrayIter(dh, func=None, join=True, truncate=False, fill=None):
 
     ## fill data
     i = 0
+    indexes = dict(index)
+    results = itertools.chain([(firstName, first)], results)
     if join and truncate:
         minShape = first.shape
-        for name in subDirs:
-            subd = dh[name]
-            d = func(subd)
+        for name, d in results:
             minShape = [min(d.shape[j], minShape[j]) for j in range(d.ndim)]
-            dhInfo = subd.info()
-            ind = []
-            for k in params:
-                ind.append(dhInfo[k])
+            ind = list(indexes[name])
             sl = [slice(0, m) for m in minShape]
             ind += sl
-            data[tuple(ind)] = d[sl]
+            data[tuple(ind)] = d[tuple(sl)]
             i += 1
             yield i, len(subDirs)
         sl = [slice(None)] * len(seqShape)
         sl += [slice(0, m) for m in minShape]
-        data = data[sl]
+        data = data[tuple(sl)]
     else:
-        for name in subDirs:
-            subd = dh[name]
-            d = func(subd)
-            dhInfo = subd.info()
-            ind = []
-            for k in params:
-                ind.append(dhInfo[k])
-            data[tuple(ind)] = d
+        for name, d in results:
+            data[indexes[name]] = d
             i += 1
             yield i, len(subDirs)
 
@@ -0,0 +1,72 @@
+import numpy as np
+import pytest
+
+import acq4.util.DataManager as dm
+from acq4.analysis.dataModels.PatchEPhys import PatchEPhys
+
+A = ('A', 'x')
+B = ('B', 'y')
+
+
+def makeSequence(path):
+    seq = dm.getDirHandle(str(path)).mkdir('seq', info={'sequenceParams': {A: [0, 1, 2], B: [0, 1]}})
+    for i in range(3):
+        for j in range(2):
+            seq.mkdir('%03d_%03d' % (i, j), info={A: i, B: j})
+    return seq
+
+
+def runData(dh):
+    info = dh.info()
+    return np.arange(4) + info[A] * 10 + info[B]
+
+
+def test_sequence_index_invalidation(tmp_path):
+    seq = makeSequence(tmp_path)
+    index = dict(PatchEPhys.sequenceIndex(seq))
+    assert index['002_001'] == (2, 1)
+    assert len(index) == 6
+
+    # setInfo() appends to the subdirectory's index file without changing the directory mtime
+    seq['002_001'].setInfo({A: 1, B: 0})
+    index = dict(PatchEPhys.sequenceIndex(seq))
+    assert index['002_001'] == (1, 0)
+
+
+def test_sequence_index_metadata_cache(tmp_path):
+    seq = makeSequence(tmp_path)
+    dm.dm.setMetadataCache(str(tmp_path / 'cache.sqlite'))
+    try:
+        dm.dm.metadataCache.racyInterval = 0
+        expected = PatchEPhys.sequenceIndex(seq)
+        PatchEPhys._sequenceIndexCache.clear()
+        assert PatchEPhys.sequenceIndex(seq) == expected
+
+        seq['000_000'].setInfo({A: 2, B: 1})
+        PatchEPhys._sequenceIndexCache.clear()
+        assert dict(PatchEPhys.sequenceIndex(seq))['000_000'] == (2, 1)
+    finally:
+        dm.dm.setMetadataCache(None)
+
+
+@pytest.mark.parametrize('workers,memmap', [(1, False), (3, False), (1, True), (3, True)])
+def test_build_sequence_array(tmp_path, workers, memmap):
+    seq = makeSequence(tmp_path)
+    data = PatchEPhys.buildSequenceArray(seq, runData, workers=workers, memmap=memmap)
+    assert data.shape == (3, 2, 4)
+    for i in range(3):
+        for j in range(2):
+            assert np.array_equal(data[i, j], np.arange(4) + i * 10 + j)
+    assert list(data.xvals(0)) == [0, 1, 2]
+
+    mmFile = str(tmp_path / 'seq.dat')
+    data = PatchEPhys.buildSequenceArray(seq, runData, workers=workers, memmap=mmFile)
+    assert np.array_equal(np.memmap(mmFile, dtype=data.dtype, shape=data.shape), data.asarray())
+
+
+def test_build_sequence_array_truncate(tmp_path):
+    seq = makeSequence(tmp_path)
+    func = lambda dh: np.arange(4 + dh.info()[A])
+    data = PatchEPhys.buildSequenceArray(seq, func, truncate=True, workers=2)
+    assert data.shape == (3, 2, 4)
+    assert np.array_equal(data[2, 1], np.arange(4))
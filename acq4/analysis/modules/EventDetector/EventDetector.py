@@ -230,17 +230,11 @@ class EventDetector(AnalysisModule):
         #if pRow is None:
             #return None, None
         
+        ## selectColumns returns an empty array with the correct field names if there are no events
         if sourceFile is not None:
-            events = db.select(table, '*', where={'SourceFile': sourceFile}, toArray=True)
+            events = db.selectColumns(table, '*', where={'SourceFile': sourceFile})
         else:
-            events = db.select(table, '*', where={'ProtocolSequenceDir': sequenceDir}, toArray=True)
-        
-        if events is None:
-            ## need to make an empty array with the correct field names
-            schema = db.tableSchema(table)
-            ## NOTE: dtype MUST be specified as {names: formats: } since the names are unicode objects
-            ##  [(name, format), ..] does NOT work.
-            events = np.empty(0, dtype={'names': [k for k in schema], 'formats': [object]*len(schema)})
+            events = db.selectColumns(table, '*', where={'ProtocolSequenceDir': sequenceDir})
             
         #else:   ## convert file strings to handles
             #if sourceFile is None:
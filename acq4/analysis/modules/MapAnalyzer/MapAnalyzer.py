@@ -182,7 +182,7 @@ class MapAnalyzer(AnalysisModule):
         eventTable = self.loader.dbGui.getTableName('Photostim.events')
         db = self.loader.dbGui.getDb()
         stats = db.select(statTable, '*', where={'ProtocolSequenceDir': sourceDir})
-        events = db.select(eventTable, '*', where={'ProtocolSequenceDir': sourceDir}, toArray=True)
+        events = db.selectColumns(eventTable, '*', where={'ProtocolSequenceDir': sourceDir})
         return events, stats
         
     def loadSpotFromDB(self, sourceDir):
@@ -191,7 +191,7 @@ class MapAnalyzer(AnalysisModule):
         eventTable = self.loader.dbGui.getTableName('Photostim.events')
         db = self.loader.dbGui.getDb()
         stats = db.select(statTable, '*', where={'ProtocolDir': sourceDir})
-        events = db.select(eventTable, '*', where={'ProtocolDir': sourceDir}, toArray=True)
+        events = db.selectColumns(eventTable, '*', where={'ProtocolDir': sourceDir})
         return events, stats
         
     def loadFileRequested(self, fhList):
@@ -682,6 +682,8 @@ class EventStatisticsAnalyzer:
         postScores = {'PoissonScore': [], 'PoissonAmpScore': [], 'ZScore': [], 'FitAmpSum': []}
         
         
+        ## collect events for every site so that all sites can be scored in a single pass
+        siteInputs = []
         for site in map.spots:
             postSiteEvents = []
             preSiteEvents = []
@@ -708,20 +710,32 @@ class EventStatisticsAnalyzer:
                 preSiteEvents.append(ev2)
                 
                 rates.append(spontRate[dh]['filteredSpontRate'])
+            siteInputs.append((postSiteEvents, preSiteEvents, rates, latencies, nEvents))
         
+        allPost = [inp[0] for inp in siteInputs]
+        allPre = [inp[1] for inp in siteInputs]
+        allRates = [inp[2] for inp in siteInputs]
+        poissonScores = poissonScore.PoissonScore.scoreMany(allPost, allRates, tMax=postDt)
+        poissonAmpScores = poissonScore.PoissonAmpScore.scoreMany(allPost, allRates, tMax=postDt, ampMean=ampMean, ampStdev=ampStdev)
+        poissonScoresPre = poissonScore.PoissonScore.scoreMany(allPre, allRates, tMax=postDt)
+        poissonAmpScoresPre = poissonScore.PoissonAmpScore.scoreMany(allPre, allRates, tMax=postDt, ampMean=ampMean, ampStdev=ampStdev)
+            
+        for i, site in enumerate(map.spots):
+            postSiteEvents, preSiteEvents, rates, latencies, nEvents = siteInputs[i]
+            
             ## compute score for each site
             ## note that keys added to site here are ultimately passed to host.getColor via Map.recolor
             site['data']['spontaneousRates'] = rates
             site['data']['events'] = events
             site['data']['ampMean'] = ampMean
             site['data']['ampStdev'] = ampStdev
-            site['data']['PoissonScore'] = poissonScore.PoissonScore.score(postSiteEvents, rates, tMax=postDt)
-            site['data']['PoissonAmpScore'] = poissonScore.PoissonAmpScore.score(postSiteEvents, rates, tMax=postDt, ampMean=ampMean, ampStdev=ampStdev)
+            site['data']['PoissonScore'] = poissonScores[i]
+            site['data']['PoissonAmpScore'] = poissonAmpScores[i]
             postScores['PoissonScore'].append(site['data']['PoissonScore'])
             postScores['PoissonAmpScore'].append(site['data']['PoissonAmpScore'])
             
-            site['data']['PoissonScore_Pre'] = poissonScore.PoissonScore.score(preSiteEvents, rates, tMax=postDt)
-            site['data']['PoissonAmpScore_Pre'] = poissonScore.PoissonAmpScore.score(preSiteEvents, rates, tMax=postDt, ampMean=ampMean, ampStdev=ampStdev)
+            site['data']['PoissonScore_Pre'] = poissonScoresPre[i]
+            site['data']['PoissonAmpScore_Pre'] = poissonAmpScoresPre[i]
             preScores['PoissonScore'].append(site['data']['PoissonScore_Pre'])
             preScores['PoissonAmpScore'].append(site['data']['PoissonAmpScore_Pre'])
             
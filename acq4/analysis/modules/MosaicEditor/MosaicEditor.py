@@ -6,8 +6,10 @@ import glob
 import json
 import weakref
 from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
 import scipy
+import scipy.ndimage
 import scipy.stats
 
 import acq4.util.debug as debug
@@ -109,7 +111,7 @@ class MosaicEditor(AnalysisModule):
         self.canvas.sigItemTransformChangeFinished.connect(self.itemMoved)
         self.ui.atlasCombo.currentIndexChanged.connect(self.atlasComboChanged)
         self.ui.normalizeBtn.clicked.connect(self.normalizeImages)
-        self.ui.tileShadingBtn.clicked.connect(self.rescaleImages)
+        self.ui.tileShadingBtn.clicked.connect(lambda: self.rescaleImages())
         self.ui.mosaicApplyScaleBtn.clicked.connect(self.updateScaling)
         self.ui.mosaicFlipLRBtn.clicked.connect(self.flipLR)
         self.ui.mosaicFlipUDBtn.clicked.connect(self.flipUD)
@@ -252,7 +254,7 @@ class MosaicEditor(AnalysisModule):
         else:
             return self.canvas.addItem(item, type, **kwds)
 
-    def rescaleImages(self):
+    def rescaleImages(self, workers=None):
         """
         Apply corrections to the images and rescale the data.
         This does the following:
@@ -262,56 +264,46 @@ class MosaicEditor(AnalysisModule):
         4. apply the scale.
         Use the min/max mosaic button to readjust the display scale after this
         automatic operation if the scaling is not to your liking.
+
+        Statistics are accumulated one tile at a time (see tileStatistics), and the
+        corrections are applied by each item at render time, so the image data
+        itself is never copied. *workers* is passed to tileStatistics.
         """
-        nsel =  len(self.canvas.selectedItems())
-        if nsel == 0:
+        selected = [item for item in self.canvas.selectedItems()
+                    if isinstance(item, items.ImageCanvasItem.ImageCanvasItem) and item.data is not None]
+        if len(selected) == 0:
             return
-       # print dir(self.selectedItems()[0].data)
-        nxm = self.canvas.selectedItems()[0].data.shape
-        meanImage = np.zeros((nxm[0], nxm[1]))
-        nhistbins = 100
-        # generate a histogram of the global levels in the image (all images selected)
-        hm = np.histogram(np.dstack([x.data for x in self.canvas.selectedItems()]), nhistbins)
-        print(hm)
-        #$meanImage = np.mean(self.selectedItems().asarray(), axis=0)
-        n = 0
-        self.imageMax = 0.0
-        print('nsel: ', nsel)
-        for i in range(nsel):
-            try:
-                meanImage = meanImage + np.array(self.canvas.selectedItems()[i].data)
-                imagemax = np.amax(np.amax(meanImage, axis=1), axis=0)
-                if imagemax > self.imageMax:
-                    self.imageMax = imagemax
-                n = n + 1
-            except:
-                print('image i = %d failed' % i)
-                print('file name: ', self.canvas.selectedItems()[i].name)
-                print('expected shape of nxm: ', nxm)
-                print(' but got data shape: ', self.canvas.selectedItems()[i].data.shape)
-
-        meanImage = meanImage/n # np.mean(meanImage[0:n], axis=0)
-        filtwidth = np.floor(nxm[0]/10+1)
-        blimg = scipy.ndimage.filters.gaussian_filter(meanImage, filtwidth, order = 0, mode='reflect')
-        #pg.image(blimg)
-        
-        m = np.argmax(hm[0]) # returns the index of the max count
-        print('m = ', m)
-        # now rescale each individually
+        shape = selected[0].data.shape
+        tiles = []
+        for item in selected:
+            if item.data.ndim != 2 or item.data.shape != shape:
+                print('Skipping %s: expected shape %s but got data shape %s' % (item.opts['name'], shape, item.data.shape))
+                continue
+            tiles.append(item)
+        if len(tiles) == 0:
+            return
+        stats = tileStatistics([item.data for item in tiles], nBins=100, workers=workers)
+
+        filtwidth = np.floor(shape[0]/10+1)
+        blimg = scipy.ndimage.gaussian_filter(stats['mean'], filtwidth, order=0, mode='reflect')
+        if blimg.mean() > 0:
+            minFlatField = items.ImageCanvasItem.ImageCanvasItem.minFlatField
+            flatField = np.maximum(blimg / blimg.mean(), minFlatField).astype(np.float32)
+        else:
+            # no usable illumination pattern (e.g. background-subtracted tiles)
+            flatField = None
+
         # rescaling is done against the global histogram, to keep the gain constant.
-        for i in range(nsel):
-            d = np.array(self.canvas.selectedItems()[i].data)
-#            hmd = np.histogram(d, 512) # return (count, bins)
-            xh = d.shape # capture shape just in case it is not right (have data that is NOT !!)
-            # flatten the illumination using the blimg average illumination pattern
-            newImage = d # / blimg[0:xh[0], 0:xh[1]] # (d - imin)/(blimg - imin) # rescale image.
-            hn = np.histogram(newImage, bins = hm[1]) # use bins from global image
-            n = np.argmax(hn[0])
-            newImage = (hm[1][m]/hn[1][n])*newImage # rescale to the global max.
-            self.canvas.selectedItems()[i].updateImage(newImage)
-         #   self.canvas.selectedItems()[i].levelRgn.setRegion([0, 2.0])
-            self.canvas.selectedItems()[i].levelRgn.setRegion([0., self.imageMax])
-        print("MosaicEditor::self imageMax: ", self.imageMax)
+        centers = 0.5 * (stats['bins'][:-1] + stats['bins'][1:])
+        globalMode = centers[np.argmax(stats['histogram'])]
+        self.imageMax = 0.0
+        for item, mode, tileMax in zip(tiles, stats['modes'], stats['max']):
+            tileMode = centers[mode]
+            gain = float(globalMode / tileMode) if tileMode > 0 and globalMode > 0 else 1.0
+            item.setCorrection(gain, flatField)
+            self.imageMax = max(self.imageMax, tileMax * gain / (1.0 if flatField is None else flatField.min()))
+        for item in tiles:
+            setItemLevels(item, 0., self.imageMax)
 
     def normalizeImages(self):
         self.canvas.view.autoRange()
@@ -324,8 +316,8 @@ class MosaicEditor(AnalysisModule):
         if nsel == 0:
             return
         for i in range(nsel):
-            self.canvas.selectedItems()[i].levelRgn.setRegion([self.ui.mosaicDisplayMin.value(),
-                                                               self.ui.mosaicDisplayMax.value()])
+            setItemLevels(self.canvas.selectedItems()[i], self.ui.mosaicDisplayMin.value(),
+                          self.ui.mosaicDisplayMax.value())
 
     def flipUD(self):
         """
@@ -477,6 +469,75 @@ class MosaicEditor(AnalysisModule):
         self.canvas.clear()
 
 
+def setItemLevels(item, minLevel, maxLevel):
+    """Set fixed display levels on an image canvas item (and stop it from auto-leveling)."""
+    item.autoBtn.setChecked(False)
+    item.graphicsItem().setLevels([minLevel, maxLevel])
+
+
+# below this many pixels in total, tileStatistics does not start worker threads by default
+parallelTilePixels = 2**22
+
+
+def tileStatistics(tiles, nBins=100, workers=None):
+    """Compute global statistics over a list of equally-shaped 2D image tiles.
+
+    The tiles are never stacked together; each pass visits one tile at a time, so the
+    memory needed beyond the tiles themselves is a few tile-sized accumulators. The
+    per-tile work is spread over *workers* threads; by default, small selections (fewer
+    than parallelTilePixels pixels in total) are processed in the calling thread and
+    larger ones use one thread per CPU.
+
+    Returns a dict with:
+
+    * mean: the mean image (float64)
+    * bins, histogram: the histogram of all pixels in all tiles, with *nBins* bins
+    * modes: for each tile, the index of the most populated bin of its own histogram
+      (using the global bins)
+    * min, max: per-tile minimum and maximum values
+    """
+    tiles = [t.asarray() if hasattr(t, 'asarray') else np.asarray(t) for t in tiles]
+    if workers is None:
+        if sum(tile.size for tile in tiles) < parallelTilePixels:
+            workers = 1
+        else:
+            workers = os.cpu_count() or 1
+    workers = max(1, min(workers, len(tiles)))
+
+    if workers == 1:
+        return _tileStatistics(tiles, nBins, map)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return _tileStatistics(tiles, nBins, executor.map)
+
+
+def _tileStatistics(tiles, nBins, mapFn):
+    def extrema(tile):
+        return tile.min(), tile.max()
+
+    # pass 1: range and mean image
+    mean = np.zeros(tiles[0].shape, dtype=np.float64)
+    mins = []
+    maxs = []
+    for tile, (tmin, tmax) in zip(tiles, mapFn(extrema, tiles)):
+        np.add(mean, tile, out=mean)
+        mins.append(tmin)
+        maxs.append(tmax)
+    mean /= len(tiles)
+
+    # pass 2: per-tile histograms on shared bins; the global histogram is their sum
+    bins = np.histogram_bin_edges([min(mins), max(maxs)], nBins)
+    histogram = np.zeros(nBins, dtype=np.int64)
+    modes = []
+    for counts in mapFn(lambda tile: np.histogram(tile, bins=bins)[0], tiles):
+        histogram += counts
+        modes.append(np.argmax(counts))
+
+    return {
+        'mean': mean, 'bins': bins, 'histogram': histogram, 'modes': modes,
+        'min': np.array(mins), 'max': np.array(maxs),
+    }
+
+
 class Encoder(json.JSONEncoder):
     """Used to clean up state for JSON export.
     """
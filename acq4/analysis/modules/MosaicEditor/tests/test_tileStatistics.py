@@ -0,0 +1,21 @@
+import numpy as np
+import pytest
+
+from acq4.analysis.modules.MosaicEditor.MosaicEditor import tileStatistics
+
+
+@pytest.mark.parametrize('workers', [None, 1, 4])
+def test_matches_stacked(workers):
+    rng = np.random.RandomState(0)
+    tiles = [rng.gamma(2.0 + i, 100., size=(64, 48)).astype(np.uint16) for i in range(7)]
+    stats = tileStatistics(tiles, nBins=100, workers=workers)
+
+    # statistics computed the way rescaleImages did before, by stacking all tiles
+    stack = np.dstack(tiles)
+    counts, bins = np.histogram(stack, 100)
+    assert np.array_equal(stats['bins'], bins)
+    assert np.array_equal(stats['histogram'], counts)
+    assert np.array_equal(stats['mean'], stack.astype(np.float64).sum(axis=2) / len(tiles))
+    assert stats['modes'] == [np.argmax(np.histogram(tile, bins=bins)[0]) for tile in tiles]
+    assert np.array_equal(stats['min'], [tile.min() for tile in tiles])
+    assert np.array_equal(stats['max'], [tile.max() for tile in tiles])
@@ -15,6 +15,9 @@ from acq4.analysis.AnalysisModule import AnalysisModule
 from pyqtgraph import multiprocess
 from pyqtgraph.flowchart import Flowchart
 from acq4.util import Qt
+from acq4.util import DataManager
+from acq4.util.DataManager.metacache import MetadataCache, fileStamp
+from acq4.util.flowchartpool import FlowchartPool, flowchartStateHash, portable, unportable
 from acq4.util.HelpfulException import HelpfulException
 from .DBCtrl import DBCtrl
 from .Scan import Scan, loadScanSequence
@@ -29,6 +32,10 @@ class Photostim(AnalysisModule):
       3) Multiple scans may (optionally) be combined to produce a single map with repeated measures and/or extended area.
       4) The values generated in steps 2 and 3 are mapped to colors which are displayed in a canvas.
     """
+    # limits for the cached per-spot results; older entries are removed when the module starts
+    resultCacheMaxAge = 30 * 24 * 3600  # seconds
+    resultCacheMaxSize = 1e9  # bytes
+
     def __init__(self, host):
         AnalysisModule.__init__(self, host)
         if self.dataModel is None:
@@ -82,6 +89,11 @@ class Photostim(AnalysisModule):
         self.scans = []
         #self.seriesScans = {}
         self.maps = []
+
+        ## worker processes for recoloring, and a persistent cache of per-spot results
+        self._pool = None
+        self._fcHashes = None
+        self.resultCache = self._openResultCache()
         
         ## create event detector
         fcDir = os.path.join(os.path.abspath(os.path.split(__file__)[0]), "detector_fc")
@@ -127,6 +139,9 @@ class Photostim(AnalysisModule):
     def quit(self):
         self.scans = []
         self.maps = []
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
         return AnalysisModule.quit(self)
         
     def elementChanged(self, element, old, new):
@@ -341,6 +356,7 @@ class Photostim(AnalysisModule):
     def detectorStateChanged(self):
         #print "STATE CHANGE"
         #print "Detector state changed"
+        self._fcHashes = None
         for scan in self.scans:
             scan.invalidateEvents()
         
@@ -356,6 +372,7 @@ class Photostim(AnalysisModule):
 
     def analyzerStateChanged(self):
         #print "Analyzer state changed."
+        self._fcHashes = None
         for scan in self.scans:
             scan.invalidateStats()
         
@@ -428,7 +445,11 @@ class Photostim(AnalysisModule):
             
         if stats is None:
             raise Exception('No data returned from analysis (check flowchart for errors).')
-            
+
+        return self._addSpotInfo(stats, spot, dh)
+
+    def _addSpotInfo(self, stats, spot, dh):
+        ## add the spot position and protocol directories to the output of the stats flowchart
         try:
             pos = spot.viewPos()
             stats['xPos'] = pos.x()
@@ -438,22 +459,100 @@ class Photostim(AnalysisModule):
             p = spot.pos()
             stats['xPos'] = p[0]
             stats['yPos'] = p[1]
-        #d = spot.data.parent()
-        #size = d.info().get('Scanner', {}).get('spotSize', 100e-6)
-        #stats['spotSize'] = size
-        #print "Process Stats:", spot.data
-        
-        #stats['SourceFile'] = self.dataModel.getClampFile(dh)
         stats['ProtocolDir'] = dh  ## stats should be stored with the protocol dir, not the clamp file.
         stats['ProtocolSequenceDir'] = self.dataModel.getParent(dh, 'ProtocolSequence')
-        #parent = dh.parent()
-        #if self.dataModel.dirType(parent) != 'ProtocolSequence':
-            #parent = None
-        
-        #stats['ProtocolSequenceDir'] = parent
-        
         return stats
 
+    def _openResultCache(self):
+        ## Events and stats are cached on disk, keyed by clamp file and the state of both flowcharts,
+        ## so reopening a map only reprocesses spots whose data or analysis has changed.
+        cache = DataManager.dm.metadataCache
+        if cache is None:
+            try:
+                import acq4.Manager
+                man = acq4.Manager.getManager()
+                cache = MetadataCache(os.path.join(man.appDataDir(), 'photostimCache.sqlite'))
+            except Exception:
+                debug.printExc("Could not open Photostim result cache; results will not be cached:")
+                return None
+        cache.prune(maxAge=self.resultCacheMaxAge, maxSize=self.resultCacheMaxSize,
+                    kinds=['photostim.events', 'photostim.stats'])
+        return cache
+
+    def flowchartHashes(self):
+        """Return hashes of the (detector, analyzer) flowchart states, used to validate cached results."""
+        if self._fcHashes is None:
+            self._fcHashes = (
+                flowchartStateHash(self.detector.flowchart.saveState()),
+                flowchartStateHash(self.flowchart.saveState()),
+            )
+        return self._fcHashes
+
+    def _cacheStamp(self, fh, withAnalysis):
+        stamp, mtime = fileStamp(fh.name())
+        detHash, anHash = self.flowchartHashes()
+        return (stamp, detHash, anHash if withAnalysis else None), mtime
+
+    def loadCachedEvents(self, fh):
+        """Return the detector output for clamp file *fh* from the on-disk cache, or None."""
+        if self.resultCache is None or fh is None:
+            return None
+        stamp, mtime = self._cacheStamp(fh, withAnalysis=False)
+        events = self.resultCache.get('photostim.events', fh.name(), stamp)
+        return None if events is None else unportable(events)
+
+    def storeCachedEvents(self, fh, events):
+        if self.resultCache is None or fh is None:
+            return
+        stamp, mtime = self._cacheStamp(fh, withAnalysis=False)
+        self.resultCache.set('photostim.events', fh.name(), stamp, portable(events), mtime=mtime)
+
+    def loadCachedStats(self, dh, spot):
+        """Return stats for protocol directory *dh* from the on-disk cache, or None."""
+        fh = self.dataModel.getClampFile(dh)
+        if self.resultCache is None or fh is None:
+            return None
+        stamp, mtime = self._cacheStamp(fh, withAnalysis=True)
+        stats = self.resultCache.get('photostim.stats', dh.name(), stamp)
+        return None if stats is None else self._addSpotInfo(unportable(stats), spot, dh)
+
+    def storeCachedStats(self, dh, stats):
+        fh = self.dataModel.getClampFile(dh)
+        if self.resultCache is None or fh is None:
+            return
+        stamp, mtime = self._cacheStamp(fh, withAnalysis=True)
+        self.resultCache.set('photostim.stats', dh.name(), stamp, portable(stats), mtime=mtime)
+
+    def submitSpots(self, jobs):
+        """Process spots in worker processes.
+
+        *jobs* is a list of (dh, fh, events) tuples, where *events* is the detector output for the
+        spot if it is already known (otherwise None, and the event detector is run as well).
+        Returns a list of (indexes, future) pairs as from FlowchartPool.submit(); each future's
+        result is a list of (index, (events, stats), error) with handles still in portable form
+        (see finishSpot()).
+        """
+        if self._pool is None:
+            self._pool = FlowchartPool()
+        regions = None
+        spotJobs = []
+        for dh, fh, events in jobs:
+            if events is not None and 'regions' not in events:
+                ## events loaded from the DB do not include the detector regions
+                if regions is None:
+                    regions = self.detector.flowchart.output()['regions']
+                events = dict(events)
+                events['regions'] = regions
+            spotJobs.append((dh, fh, events))
+        charts = {'detector': self.detector.flowchart.saveState(), 'analyzer': self.flowchart.saveState()}
+        return self._pool.submit(processSpot, charts, spotJobs)
+
+    def finishSpot(self, dh, fh, spot, result):
+        """Return (events, stats) for a result from submitSpots(), storing both to the on-disk cache."""
+        events, stats = unportable(result)
+        self.storeCachedEvents(fh, events)
+        self.storeCachedStats(dh, stats)
+        return events, self._addSpotInfo(stats, spot, dh)
 
 
     def storeDBSpot(self):
@@ -682,3 +781,15 @@ class Photostim(AnalysisModule):
         return db
 
 
+def processSpot(charts, job):
+    ## Runs in a FlowchartPool worker: the same processing as Photostim.processEvents / processStats,
+    ## using copies of the detector and analyzer flowcharts.
+    dh, fh, events = job
+    if events is None:
+        events = charts['detector'].process(dataIn=fh)
+    data = dict(events)
+    data['fileHandle'] = dh
+    stats = charts['analyzer'].process(**data)['dataOut']
+    if stats is None:
+        raise Exception('No data returned from analysis (check flowchart for errors).')
+    return events, stats
@@ -1,5 +1,6 @@
 import numpy as np
 import time
+from concurrent import futures
 
 import acq4.util.Canvas as Canvas
 import acq4.util.functions as fn
@@ -277,53 +278,79 @@ class Scan(Qt.QObject):
             return
         spots = self.spots()
         handles = [(spot.data(), self.host.dataModel.getClampFile(spot.data())) for spot in spots]
-        result = []
         
-        ## This can be very slow; try to run in parallel (requires fork(); runs serially on windows).
+        ## Spots with cached results (in memory or on disk) are colored immediately. The rest are
+        ## processed here, or by a pool of worker processes if parallel is True.
         start = time.time()
-        workers = None if parallel else 1
         msg = "Processing scan (%d / %d)" % (n+1, nMax)
-        with mp.Parallelize(tasks=enumerate(handles), result=result, workers=workers, progressDialog=msg) as tasker:
-            for i, dhfh in tasker:
-                dh, fh = dhfh
-                events = self.getEvents(fh, signal=False)
-                stats = self.getStats(dh, signal=False)
-                color = self.host.getColor(stats)
-                tasker.result.append((i, color, stats, events))
+        todo = []
+        with pg.ProgressDialog(msg, 0, len(spots)) as dlg:
+            for i, (dh, fh) in enumerate(handles):
+                stats = self.getStats(dh, signal=False, process=not parallel)
+                if stats is None:
+                    todo.append(i)
+                else:
+                    spots[i].setBrush(self.host.getColor(stats))
+                    dlg.setValue(i + 1)
+                if dlg.wasCanceled():
+                    raise mp.CanceledError()
+            
+            if len(todo) > 0:
+                jobs = [handles[i] + (self.getEvents(handles[i][1], process=False, signal=False),) for i in todo]
+                chunks = self.host.submitSpots(jobs)
+                done = len(spots) - len(todo)
+                try:
+                    while chunks:
+                        finished, _ = futures.wait([f for _, f in chunks], timeout=0.1, return_when=futures.FIRST_COMPLETED)
+                        for indexes, fut in [c for c in chunks if c[1] in finished]:
+                            chunks.remove((indexes, fut))
+                            for j, result, error in fut.result():
+                                if error is not None:
+                                    raise Exception("Error processing %s:\n%s" % (handles[todo[j]][0].name(), error))
+                                i = todo[j]
+                                dh, fh = handles[i]
+                                events, stats = self.host.finishSpot(dh, fh, spots[i], result)
+                                self.updateEventCache(fh, events, signal=False)
+                                self.updateStatCache(dh, stats)
+                                spots[i].setBrush(self.host.getColor(stats))
+                            done += len(indexes)
+                            dlg.setValue(done)
+                        Qt.QApplication.processEvents()
+                        if dlg.wasCanceled():
+                            raise mp.CanceledError()
+                finally:
+                    for _, fut in chunks:
+                        fut.cancel()
                 
         print("recolor took %0.2fsec" % (time.time() - start))
         
-        ## Collect all results, store to caches, and recolor spots
-        for i, color, stats, events in result:
-            dh, fh = handles[i]
-            self.updateStatCache(dh, stats)
-            self.updateEventCache(fh, events, signal=False)
-            spot = spots[i]
-            spot.setBrush(color)
-        
         self.sigEventsChanged.emit(self)  ## it's possible events didn't actually change, but meh.
         
         
             
-    def getStats(self, dh, signal=True):
+    def getStats(self, dh, signal=True, process=True):
         ## Return stats for a single file. (cached if available)
-        ## fh is the clamp file
+        ## If process is False, return None rather than computing stats that are not cached.
         #print "getStats", dh
         spot = self.getSpot(dh)
         #print "  got spot:", spot
         #except:
             #raise Exception("File %s is not in this scan" % fh.name())
         if dh not in self.stats or (not self.statsLocked and dh not in self.statCacheValid):
-            #print "No stats cache for", dh.name(), "compute.."
-            fh = self.host.dataModel.getClampFile(dh)
-            events = self.getEvents(fh, signal=signal)
-            try:
-                stats = self.host.processStats(events, spot)
-            except:
-                print(events)
-                raise
+            stats = self.host.loadCachedStats(dh, spot)
+            if stats is None:
+                if not process:
+                    return None
+                #print "No stats cache for", dh.name(), "compute.."
+                fh = self.host.dataModel.getClampFile(dh)
+                events = self.getEvents(fh, signal=signal)
+                try:
+                    stats = self.host.processStats(events, spot)
+                except:
+                    print(events)
+                    raise
+                self.host.storeCachedStats(dh, stats)
             
-            ## NOTE: Cache update must be taken care of elsewhere if this function is run in a parallel process!
             self.updateStatCache(dh, stats)
             
         return self.stats[dh].copy()
@@ -342,13 +369,14 @@ class Scan(Qt.QObject):
             #if p in self.stats:
                 #return []
             
-            if process:
+            events = self.host.loadCachedEvents(fh)
+            if events is None:
+                if not process:
+                    return None
                 #print "No event cache for", fh.name(), "compute.."
                 events = self.host.processEvents(fh)  ## need ALL output from the flowchart; not just events
-                ## NOTE: Cache update must be taken care of elsewhere if this function is run in a parallel process!
-                self.updateEventCache(fh, events, signal)
-            else:
-                return None
+                self.host.storeCachedEvents(fh, events)
+            self.updateEventCache(fh, events, signal)
         return self.events[fh]
         
     def updateEventCache(self, fh, events, signal=True):
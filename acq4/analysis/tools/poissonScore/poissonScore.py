@@ -106,6 +106,9 @@ import pyqtgraph as pg
 import pyqtgraph.multiprocess as mp
 import os
 
+from acq4.util.appdata import appDataDir
+
+
 def poissonProcess(rate, tmax=None, n=None):
     """Simulate a poisson process; return a list of event times"""
     events = []
@@ -122,8 +125,16 @@ def poissonProcess(rate, tmax=None, n=None):
 def poissonProb(n, t, l, clip=False):
     """
     For a poisson process, return the probability of seeing at least *n* events in *t* seconds given
-    that the process has a mean rate *l*.
+    that the process has a mean rate *l*. *l* may be an array (one rate per value of *n*).
     """
+    if not np.isscalar(l):
+        l = np.asarray(l, dtype=float)
+        p = stats.poisson(l*t).sf(n)
+        p = np.where(l == 0, np.where(np.asarray(n) == 0, 1.0, 1e-25), p)
+        if clip:
+            p = np.clip(p, 0, 1.0-1e-25)
+        return p
+
     if l == 0:
         if np.isscalar(n):
             if n == 0:
@@ -153,7 +164,67 @@ def gaussProb(amps, mean, stdev):
     if len(amps) == 0:
         return 1.0
     return stats.norm(mean, stdev).sf(amps)
-    
+
+
+def precedingEventCounts(times):
+    """For each event time, return the number of *other* events that occurred at or before that time.
+
+    Equivalent to ``[(times <= t).sum() - 1 for t in times]`` (which looks like arange, but consider
+    what happens if two events occur at the same time), computed in O(n log n).
+    """
+    times = np.asarray(times)
+    return np.searchsorted(np.sort(times), times, side='right') - 1
+
+
+def interpolateTable(xs, ys, x):
+    """Linear interpolation of *x* in the monotonic table (xs, ys), extrapolating linearly from the first
+    or last two points for values outside the table."""
+    ind = np.clip(np.searchsorted(xs, x, side='right'), 1, len(xs)-1)
+    x1 = xs[ind-1]
+    x2 = xs[ind]
+    y1 = ys[ind-1]
+    y2 = ys[ind]
+    dx = x2 - x1
+    s = np.where(dx == 0, 0.0, (x - x1) / np.where(dx == 0, 1.0, dx))
+    return y1 + s * (y2 - y1)
+
+
+
+def normalizationCacheFile(cls):
+    """Return the name of the file holding the cached normalization table for a score class.
+
+    Tables are generated on first use and kept in the user's application data directory, since
+    the installed package directory may be read-only or shared.
+    """
+    path = os.path.join(appDataDir(), 'poissonScore')
+    return os.path.join(path, '%s_normTable_v%d.npz' % (cls.__name__, cls.normalizationVersion))
+
+
+def loadNormalizationCache(cls):
+    """Return the cached normalization table for *cls*, or None if there is no valid cache."""
+    cacheFile = normalizationCacheFile(cls)
+    if not os.path.exists(cacheFile):
+        return None
+    try:
+        with np.load(cacheFile) as cache:
+            if str(cache['name']) != cls.__name__ or int(cache['version']) != cls.normalizationVersion:
+                return None
+            return cache['table'].copy()
+    except Exception:
+        print("Ignoring unreadable normalization cache %s" % cacheFile)
+        return None
+
+
+def saveNormalizationCache(cls, table):
+    cacheFile = normalizationCacheFile(cls)
+    try:
+        os.makedirs(os.path.dirname(cacheFile), exist_ok=True)
+        tmpFile = cacheFile + '.tmp.npz'
+        np.savez(tmpFile, name=cls.__name__, version=cls.normalizationVersion, table=table)
+        os.replace(tmpFile, cacheFile)
+    except OSError:
+        print("Could not write normalization cache %s" % cacheFile)
+
     
 class PoissonScore:
     """
@@ -173,6 +244,9 @@ class PoissonScore:
     
     normalizationTable = None
     
+    ## Increment this whenever the scoring or the normalization table generation changes, so that
+    ## stale cached tables are regenerated.
+    normalizationVersion = 1
         
     @classmethod
     def score(cls, ev, rate, tMax=None, normalize=True, **kwds):
@@ -180,6 +254,8 @@ class PoissonScore:
         Compute poisson score for a set of events.
         ev must be a list of record arrays. Each array describes a set of events; only required field is 'time'
         *rate* may be either a single value or a list (in which case the mean will be used)
+
+        To score many sets of events at once (eg. one per stimulus site), use scoreMany().
         """
         nSets = len(ev)
         events = np.concatenate(ev)
@@ -194,7 +270,7 @@ class PoissonScore:
             #ev = np.concatenate(ev)   ## mix events together
             ev = events['time']
             
-            nVals = np.array([(ev<=t).sum()-1 for t in ev]) ## looks like arange, but consider what happens if two events occur at the same time.
+            nVals = precedingEventCounts(ev)
             pi = poissonProb(nVals, ev, rate*nSets)  ## note that by using n=0 to len(ev)-1, we correct for the fact that the time window always ends at the last event
             pi = 1.0 / pi
             
@@ -223,6 +299,52 @@ class PoissonScore:
         
         return ret
 
+    @classmethod
+    def scoreMany(cls, evSets, rates, tMax=None, normalize=True, **kwds):
+        """
+        Compute the poisson score for many sets of events in a single vectorized pass.
+
+        *evSets* is a list with one item per site; each item is a list of record arrays exactly as
+        accepted by score(). *rates* is a list with one rate (or list of rates) per site.
+        Returns an array of scores, one per site, identical to calling score() on each site.
+        """
+        nSites = len(evSets)
+        nSets = np.array([len(ev) for ev in evSets], dtype=float)
+        rates = np.array([r if np.isscalar(r) else np.mean(r) for r in rates], dtype=float)
+        scores = np.ones(nSites)
+
+        siteEvents = [np.concatenate(ev) if len(ev) > 0 else None for ev in evSets]
+        counts = np.array([0 if ev is None else len(ev) for ev in siteEvents])
+        if counts.sum() > 0:
+            events = np.concatenate([ev for ev in siteEvents if ev is not None and len(ev) > 0])
+            site = np.repeat(np.arange(nSites), counts)
+            times = events['time']
+
+            ## sort by site, then time; count the events at or before each event within its own site
+            order = np.lexsort((times, site))
+            sTimes = times[order]
+            sSite = site[order]
+            runEnd = np.ones(len(sTimes), dtype=bool)
+            runEnd[:-1] = (sSite[1:] != sSite[:-1]) | (sTimes[1:] != sTimes[:-1])
+            runId = np.concatenate([[0], np.cumsum(runEnd[:-1])])
+            lastInRun = np.flatnonzero(runEnd)[runId]
+            siteStart = np.concatenate([[0], np.cumsum(counts)[:-1]])
+            nVals = np.empty(len(times), dtype=int)
+            nVals[order] = lastInRun - siteStart[sSite]
+
+            pi = 1.0 / poissonProb(nVals, times, (rates * nSets)[site])
+            pi *= cls.amplitudeScore(events, **kwds)
+
+            hasEvents = counts > 0
+            scores[hasEvents] = np.maximum.reduceat(pi, siteStart[hasEvents])
+
+        if normalize:
+            ret = cls.mapScore(scores, rates * tMax * nSets)
+        else:
+            ret = scores
+        assert not np.any(np.isnan(ret))
+        return ret
+
     @classmethod
     def amplitudeScore(cls, events, **kwds):
         """Computes extra probability information about events based on their amplitude.
@@ -249,35 +371,24 @@ class PoissonScore:
     @classmethod
     def mapScore(cls, x, n):
         """
-        Map score x to probability given we expect n events per set
+        Map score x to probability given we expect n events per set.
+        *x* and *n* may be arrays, in which case an array of mapped scores is returned.
         """
-        if cls.normalizationTable is None:
-            cls.normalizationTable = cls.generateNormalizationTable()
-            cls.extrapolateNormTable()
-            
-        nind = max(0, np.log(n)/np.log(2))
-        n1 = np.clip(int(np.floor(nind)), 0, cls.normalizationTable.shape[1]-2)
-        n2 = n1+1
+        table = cls.loadNormalizationTable()
+        scalar = np.isscalar(x) and np.isscalar(n)
+        x, n = np.broadcast_arrays(np.asarray(x, dtype=float), np.asarray(n, dtype=float))
         
-        mapped1 = []
-        for i in [n1, n2]:
-            norm = cls.normalizationTable[:,i]
-            ind = np.argwhere(norm[0] > x)
-            if len(ind) == 0:
-                ind = len(norm[0])-1
-            else:
-                ind = ind[0,0]
-            if ind == 0:
-                ind = 1
-            x1, x2 = norm[0, ind-1:ind+1]
-            y1, y2 = norm[1, ind-1:ind+1]
-            if x1 == x2:
-                s = 0.0
-            else:
-                s = (x-x1) / float(x2-x1)
-            mapped1.append(y1 + s*(y2-y1))
+        with np.errstate(divide='ignore'):
+            nind = np.maximum(0, np.log(n)/np.log(2))
+        n1 = np.clip(np.floor(nind).astype(int), 0, table.shape[1]-2)
+        n2 = n1+1
         
-        mapped = mapped1[0] + (mapped1[1]-mapped1[0]) * (nind-n1)/float(n2-n1)
+        mapped = np.empty(x.shape)
+        for i in np.unique(n1):
+            mask = n1 == i
+            m1 = interpolateTable(table[0, i], table[1, i], x[mask])
+            m2 = interpolateTable(table[0, i+1], table[1, i+1], x[mask])
+            mapped[mask] = m1 + (m2-m1) * (nind[mask]-i)
         
         ## doesn't handle points outside of the original data.
         #mapped = scipy.interpolate.griddata(poissonScoreNorm[0], poissonScoreNorm[1], [x], method='cubic')[0]
@@ -285,10 +396,27 @@ class PoissonScore:
         #spline = scipy.interpolate.RectBivariateSpline(tVals, xVals, normTable)
         #mapped = spline.ev(n, x)[0]
         #raise Exception()
-        assert not (np.isinf(mapped) or np.isnan(mapped))
-        assert mapped>0
+        assert not np.any(np.isinf(mapped) | np.isnan(mapped))
+        assert np.all(mapped>0)
+        if scalar:
+            return float(mapped)
         return mapped
 
+    @classmethod
+    def loadNormalizationTable(cls):
+        """Return the (extrapolated) normalization table for this class.
+
+        The table is kept in memory and in a versioned cache file (see normalizationCacheFile), so
+        only the first process to use a new table version needs to generate it.
+        """
+        if cls.__dict__.get('normalizationTable') is None:
+            cls.normalizationTable = loadNormalizationCache(cls)
+            if cls.normalizationTable is None:
+                cls.normalizationTable = cls.generateNormalizationTable()
+                cls.extrapolateNormTable()
+                saveNormalizationCache(cls, cls.normalizationTable)
+        return cls.normalizationTable
+
     #@classmethod
     #def generateNormalizationTable(cls, nEvents=1000000000):
 
@@ -398,7 +526,7 @@ class PoissonScore:
                             ev = cls.generateRandom(rate=rate, tMax=t, reps=1)
                             
                             score = cls.score(ev, rate, normalize=False)
-                            ind = np.log(score) / np.log(r)
+                            ind = int(np.log(score) / np.log(r))
                             count[i, :ind+1] += 1
                     tasker.counts.append(count)
                             
@@ -434,7 +562,7 @@ class PoissonScore:
     
     @classmethod
     def poissonScoreBlame(cls, ev, rate):
-        nVals = np.array([(ev<=t).sum()-1 for t in ev]) 
+        nVals = precedingEventCounts(ev)
         pp1 = 1.0 /   (1.0 - poissonProb(nVals, ev, rate, clip=True))
         pp2 = 1.0 /   (1.0 - poissonProb(nVals-1, ev, rate, clip=True))
         diff = pp1 / pp2
@@ -537,6 +665,7 @@ class PoissonRepeatScore:
     
     """
     normalizationTable = None
+    normalizationVersion = 1
     
     @classmethod
     def score(cls, ev, rate, tMax=None, normalize=True, **kwds):
@@ -571,14 +700,12 @@ class PoissonRepeatScore:
         ev = list(map(np.sort, ev))
         pp = np.empty((len(ev), len(ev2)))
         for i, trial in enumerate(ev):
-            nVals = []
-            for j in range(len(ev2)):
-                n = (trial<ev2[j]['time']).sum()
-                if any(trial == ev2[j]['time']) and ev2[j]['trial'] > i:  ## need to correct for the case where two events in separate trials happen to have exactly the same time.
-                    n += 1
-                nVals.append(n)
+            nVals = np.searchsorted(trial, ev2['time'], side='left')
+            ## need to correct for the case where two events in separate trials happen to have exactly the same time.
+            coincident = np.searchsorted(trial, ev2['time'], side='right') > nVals
+            nVals += coincident & (ev2['trial'] > i)
             
-            pp[i] = 1.0 / (1.0 - poissonProb(np.array(nVals), ev2['time'], rate[i]))
+            pp[i] = 1.0 / (1.0 - poissonProb(nVals, ev2['time'], rate[i]))
            
             ## apply extra score for uncommonly large amplitudes
             ## (note: by default this has no effect; see amplitudeScore)
@@ -616,11 +743,8 @@ class PoissonRepeatScore:
         """
         Map score x to probability given we expect n events per set and m repeat sets
         """
-        if cls.normalizationTable is None:
-            cls.normalizationTable = cls.generateNormalizationTable()
-            cls.extrapolateNormTable()
-            
-        table = cls.normalizationTable[:,min(m-1, cls.normalizationTable.shape[1]-1)]  # select the table for this repeat number
+        normTable = cls.loadNormalizationTable()
+        table = normTable[:,min(m-1, normTable.shape[1]-1)]  # select the table for this repeat number
         
         nind = np.log(n)/np.log(2)
         n1 = np.clip(int(np.floor(nind)), 0, table.shape[2]-2)
@@ -655,6 +779,11 @@ class PoissonRepeatScore:
         assert not (np.isinf(mapped) or np.isnan(mapped))
         return mapped
 
+    @classmethod
+    def loadNormalizationTable(cls):
+        """See PoissonScore.loadNormalizationTable()"""
+        return PoissonScore.loadNormalizationTable.__func__(cls)
+
     @classmethod
     def generateRandom(cls, rate, tMax, reps):
         ret = []
@@ -700,7 +829,7 @@ class PoissonRepeatScore:
                             ev = cls.generateRandom(rate=rate, tMax=t, reps=reps[-1])
                             for m in reps:
                                 score = cls.score(ev[:m], rate, normalize=False)
-                                ind = np.log(score) / np.log(r)
+                                ind = int(np.log(score) / np.log(r))
                                 count[m-1, i, :ind+1] += 1
                     tasker.counts.append(count)
                             
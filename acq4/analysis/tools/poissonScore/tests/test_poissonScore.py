@@ -0,0 +1,67 @@
+import numpy as np
+import pytest
+
+from acq4.analysis.tools.poissonScore import poissonScore
+from acq4.analysis.tools.poissonScore.poissonScore import PoissonScore, PoissonAmpScore
+
+eventDtype = [('time', float), ('amp', float)]
+
+
+def randomEvents(rng, rate, tMax):
+    times = np.sort(rng.uniform(0, tMax, rng.poisson(rate * tMax)))
+    events = np.zeros(len(times), dtype=eventDtype)
+    events['time'] = times
+    events['amp'] = rng.normal(1.0, 0.3, len(times))
+    return events
+
+
+@pytest.fixture
+def cacheDir(tmp_path, monkeypatch):
+    monkeypatch.setattr(poissonScore, 'appDataDir', lambda: str(tmp_path))
+    for cls in (PoissonScore, PoissonAmpScore):
+        monkeypatch.setattr(cls, 'normalizationTable', None, raising=False)
+    return tmp_path
+
+
+@pytest.mark.parametrize('cls,kwds', [(PoissonScore, {}), (PoissonAmpScore, {'ampMean': 1.0, 'ampStdev': 0.3})])
+def test_score_many(cls, kwds, cacheDir):
+    rng = np.random.default_rng(0)
+    tMax = 0.5
+    evSets = []
+    rates = []
+    for site in range(30):
+        nTrials = rng.integers(0, 4)
+        rate = rng.uniform(1, 20)
+        evSets.append([randomEvents(rng, rate, tMax) for i in range(nTrials)])
+        rates.append(rate)
+    # a site with coincident event times
+    evSets.append([np.array([(0.1, 1.0), (0.1, 1.0), (0.2, 1.0)], dtype=eventDtype)])
+    rates.append(5.0)
+
+    for normalize in (False, True):
+        many = cls.scoreMany(evSets, rates, tMax=tMax, normalize=normalize, **kwds)
+        single = [
+            cls.score(ev, rate, tMax=tMax, normalize=normalize, **kwds) if len(ev) > 0 else None
+            for ev, rate in zip(evSets, rates)
+        ]
+        for i, s in enumerate(single):
+            if s is not None:
+                assert np.isclose(many[i], s, rtol=1e-10), i
+
+
+def test_normalization_cache(cacheDir, monkeypatch):
+    table = PoissonScore.loadNormalizationTable()
+    cacheFile = poissonScore.normalizationCacheFile(PoissonScore)
+    assert cacheFile.startswith(str(cacheDir))
+    assert (cacheDir / 'poissonScore').exists()
+
+    # a new process loads the cached table rather than regenerating it
+    PoissonScore.normalizationTable = None
+    def fail(*args, **kwds):
+        raise AssertionError("normalization table should have been loaded from the cache")
+    monkeypatch.setattr(PoissonScore, 'generateNormalizationTable', classmethod(fail))
+    assert np.array_equal(PoissonScore.loadNormalizationTable(), table)
+
+    # a cache written for a different table version is ignored
+    monkeypatch.setattr(PoissonScore, 'normalizationVersion', PoissonScore.normalizationVersion + 1)
+    assert poissonScore.loadNormalizationCache(PoissonScore) is None
@@ -3,6 +3,7 @@ from __future__ import annotations
 import queue
 import threading
 from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from contextlib import contextmanager, ExitStack
 from typing import Callable, Optional
 
@@ -23,6 +24,7 @@ from acq4.util.Thread import Thread
 from acq4.util.debug import printExc
 from acq4.util.future import Future
 from acq4.util.imaging.frame import Frame
+from acq4.util.imaging.frame_pool import FramePool
 from pyqtgraph import Vector, SRTTransform3D
 from pyqtgraph.debug import Profiler
 from .CameraInterface import CameraInterface
@@ -52,6 +54,7 @@ class Camera(DAQGeneric, OptomechDevice):
         exposeChannel: 'DAQ', '/Dev1/port0/line14'  # Channel for recording expose signal
         triggerOutChannel: 'DAQ', '/Dev1/PFI5'  # Channel the DAQ should trigger off of to sync with camera
         triggerInChannel: 'DAQ', '/Dev1/port0/line13'  # Channel the DAQ should raise to trigger the camera
+        framePoolSize: 64  # Number of preallocated frame buffers for drivers that support it (default 0; disabled)
         params:
             GAIN_INDEX: 2
             CLEAR_MODE: 'CLEAR_PRE_SEQUENCE'  # Overlap mode for QuantEM
@@ -106,6 +109,8 @@ class Camera(DAQGeneric, OptomechDevice):
         tr.translate(-self.sensorSize[0] * 0.5, -self.sensorSize[1] * 0.5)
         self.setDeviceTransform(self.deviceTransform() * tr)
         self._frameInfoUpdater = None
+        self._framePoolSize = config.get("framePoolSize", 0)
+        self._framePool = None
 
         self.acqThread = AcquireThread(self)
         self.acqThread.finished.connect(self.acqThreadFinished)
@@ -236,12 +241,49 @@ class Camera(DAQGeneric, OptomechDevice):
         """Returns a list of all new frames that have arrived since the last call. The list looks like:
             [{'id': 0, 'data': array, 'time': 1234678.3213}, ...]
         id is a unique integer representing the frame number since the start of the program.
-        data should be a permanent copy of the image (ie, not directly from a circular buffer)
+        data should be a permanent copy of the image (ie, not directly from a circular buffer);
+            use frameBuffer() to get an array to copy into.
         time is the time of arrival of the frame. Optionally, 'exposeStartTime' and 'exposeDoneTime' 
             may be specified if they are available.
         """
         raise NotImplementedError("Function must be reimplemented in subclass.")
 
+    def frameBuffer(self, shape, dtype) -> np.ndarray:
+        """Return an array that a driver may fill with one new frame from newFrames().
+
+        If framePoolSize is configured, the array is a slot in a preallocated FramePool that is
+        recycled once nothing refers to the frame any more; otherwise (or if the pool is
+        exhausted) a new array is allocated.
+        """
+        if self._framePoolSize > 0:
+            pool = self._framePool
+            if pool is None or not pool.matches(shape, dtype):
+                # region, binning, or bit depth changed; frames still in use keep the old buffer alive
+                pool = self._framePool = FramePool(self._framePoolSize, shape, dtype)
+            arr = pool.acquire()
+            if arr is not None:
+                return arr
+        return np.empty(shape, dtype=dtype)
+
+    def frameStats(self) -> dict:
+        """Return counters describing frame delivery.
+
+        droppedFrames is the number of frames the driver reported as skipped (by frame id), and
+        framePool holds the occupancy and overflow counters of the frame pool (or None if disabled).
+        """
+        pool = self._framePool
+        return {
+            "droppedFrames": self.acqThread.droppedFrames,
+            "framePool": None if pool is None else pool.stats(),
+        }
+
+    def frameProcessorStats(self, bins=20) -> dict:
+        """Return per-processor counters and processing-time histograms.
+
+        See FrameProcessingThread.processorStats().
+        """
+        return self._processingThread.processorStats(bins)
+
     def startCamera(self):
         """Calls the camera driver to start the camera's acquisition. Call start instead of this to actually record frames."""
         raise NotImplementedError("Function must be reimplemented in subclass.")
@@ -533,8 +575,24 @@ class Camera(DAQGeneric, OptomechDevice):
     def showMessage(self, msg):
         self.sigShowMessage.emit(msg)
 
-    def addFrameProcessor(self, processor: Callable[[Frame], None], final: bool = False):
-        self._processingThread.addFrameProcessor(processor, final)
+    def addFrameProcessor(
+        self,
+        processor: Callable[[Frame], None],
+        final: bool = False,
+        dependsOn: Optional[list] = None,
+        maxLatency: Optional[float] = None,
+        dropPolicy: str = "never",
+    ):
+        """Register a callable to be invoked for every new frame before sigNewFrame is emitted.
+
+        By default, processors run one at a time in the order they were added. Processors that
+        give an explicit *dependsOn* list of other processors may run concurrently with any
+        processor they do not depend on (frame info is always added first). *maxLatency* and
+        *dropPolicy* allow a slow processor to skip frames; see FrameProcessingThread.
+        """
+        if dependsOn is not None and self.addFrameInfo not in dependsOn:
+            dependsOn = [self.addFrameInfo] + list(dependsOn)
+        self._processingThread.addFrameProcessor(processor, final, dependsOn, maxLatency, dropPolicy)
 
     def removeFrameProcessor(self, processor: Callable[[Frame], None]):
         self._processingThread.removeFrameProcessor(processor)
@@ -824,55 +882,269 @@ class CameraTaskResult:
         return self._frameTimes, self._frameTimesPrecise
 
 
+class FrameProcessorStage:
+    """A frame processor registered with FrameProcessingThread, with its scheduling options and timing statistics."""
+
+    dropPolicies = ("never", "busy")
+    historyLength = 1000
+
+    def __init__(self, processor, dependsOn, maxLatency=None, dropPolicy="never"):
+        if dropPolicy not in self.dropPolicies:
+            raise ValueError(f"dropPolicy must be one of {self.dropPolicies}, not {dropPolicy!r}")
+        self.processor = processor
+        self.dependsOn = dependsOn  # list of processors that must finish with each frame first
+        self.explicitDeps = False  # if True, frames skipped by any dependency are skipped here too
+        self.maxLatency = maxLatency
+        self.dropPolicy = dropPolicy
+        self.busy = False
+        self.waiting = deque()  # frames that became ready while the stage was busy
+        self.durations = deque(maxlen=self.historyLength)  # time spent inside the processor
+        self.latencies = deque(maxlen=self.historyLength)  # time from frame arrival until the stage finished
+        self.counts = {"processed": 0, "droppedBusy": 0, "droppedLatency": 0, "droppedUpstream": 0, "errors": 0}
+
+    def name(self) -> str:
+        return getattr(self.processor, "__qualname__", None) or repr(self.processor)
+
+    def stats(self, bins=20) -> dict:
+        stats = dict(self.counts)
+        durations = np.array(self.durations)
+        if len(durations) > 0:
+            stats["meanDuration"] = durations.mean()
+            stats["maxDuration"] = durations.max()
+            stats["meanLatency"] = np.mean(self.latencies)
+            stats["histogram"] = np.histogram(durations, bins=bins)
+        return stats
+
+
+class _FrameJob:
+    """Tracks the progress of one frame through a snapshot of the processing graph."""
+
+    def __init__(self, frame, graph):
+        self.frame = frame
+        self.arrival = ptime.time()
+        self.graph = graph
+        stages, deps, _ = graph
+        self.depsRemaining = {stage: len(deps[stage]) for stage in stages}
+        self.skipped = set()
+        self.remaining = len(stages)
+
+
 class FrameProcessingThread(Thread):
+    """Runs the registered frame processors on each new frame, then emits sigFrameFullyProcessed.
+
+    Processors form a dependency graph. By default, each processor depends on every processor
+    added before it, so they run one after another as in a simple loop. Processors registered
+    with an explicit *dependsOn* list may run concurrently with any processors they do not
+    depend on. The `final` processor always runs after all others. Frames are pipelined: each
+    processor handles one frame at a time, but different processors may be working on
+    different frames at once.
+
+    When processing cannot keep up, each processor may shed load independently:
+
+    * dropPolicy='busy' skips the processor for a frame that arrives while it is still busy
+      with an earlier frame.
+    * maxLatency skips the processor for a frame that has waited longer than this many
+      seconds by the time the processor is ready for it.
+
+    Skipping a processor also skips any processors that explicitly listed it in *dependsOn*,
+    but processors relying on the default ordering still run, and the frame is still emitted.
+    Frames are emitted as soon as they are finished, so when dropping is enabled they may be
+    emitted out of order.
+    """
+
     sigFrameFullyProcessed = Qt.Signal(object)  # Frame
 
-    def __init__(self):
+    def __init__(self, maxWorkers=4):
         super().__init__()
         self._stop = False
-        self._processors = []
-        self._final_processor = None
+        self._stages = []
+        self._final_stage = None
+        self._graph = None
+        self._lock = threading.RLock()
+        self._pool = ThreadPoolExecutor(max_workers=maxWorkers, thread_name_prefix="FrameProcessor")
         self._queue = queue.Queue()
 
-    def addFrameProcessor(self, processor: Callable[[Frame], None], final=False):
-        if final:
-            if self._final_processor is not None:
-                raise RuntimeError("Only one `final` processor can be added.")
-            self._final_processor = processor
-        else:
-            self._processors.append(processor)
+    def addFrameProcessor(
+        self,
+        processor: Callable[[Frame], None],
+        final=False,
+        dependsOn: Optional[list] = None,
+        maxLatency: Optional[float] = None,
+        dropPolicy: str = "never",
+    ):
+        """Add a callable to be invoked for every frame.
+
+        *dependsOn* is a list of processors that must finish with a frame before this one is
+        called; by default it is every processor added before this one. See the class
+        documentation for *maxLatency* and *dropPolicy*.
+        """
+        with self._lock:
+            if final:
+                if self._final_stage is not None:
+                    raise RuntimeError("Only one `final` processor can be added.")
+                self._final_stage = FrameProcessorStage(processor, None, maxLatency, dropPolicy)
+            else:
+                stage = FrameProcessorStage(processor, None, maxLatency, dropPolicy)
+                if dependsOn is None:
+                    stage.dependsOn = [s.processor for s in self._stages]
+                else:
+                    stage.dependsOn = list(dependsOn)
+                    stage.explicitDeps = True
+                self._stages.append(stage)
+            self._graph = None
 
     def removeFrameProcessor(self, processor: Callable[[Frame], None]):
-        if processor in self._processors:
-            self._processors.remove(processor)
-        if processor == self._final_processor:
-            self._final_processor = None
+        with self._lock:
+            self._stages = [stage for stage in self._stages if stage.processor != processor]
+            if self._final_stage is not None and self._final_stage.processor == processor:
+                self._final_stage = None
+            self._graph = None
 
     def stop(self):
         self._stop = True
 
     @property
     def processors(self):
-        if self._final_processor is not None:
-            return self._processors + [self._final_processor]
-        return self._processors
+        return [stage.processor for stage in self._allStages()]
+
+    def _allStages(self):
+        if self._final_stage is not None:
+            return self._stages + [self._final_stage]
+        return self._stages
+
+    def processorStats(self, bins=20) -> dict:
+        """Return {processor name: stats} for each registered processor.
+
+        Stats include counts of processed and dropped frames, mean/max processing time and mean
+        latency (seconds since the frame arrived), and a histogram of recent processing times as
+        returned by np.histogram.
+        """
+        with self._lock:
+            return {stage.name(): stage.stats(bins) for stage in self._allStages()}
+
+    def _getGraph(self):
+        """Return (stages, {stage: dependencies}, {stage: dependents}) for the current processors.
+
+        Jobs keep the graph they started with, so processors may be added or removed while
+        frames are in flight. Dependencies on processors that are no longer registered are ignored.
+        """
+        if self._graph is None:
+            stages = self._allStages()
+            deps = {}
+            for stage in self._stages:
+                # match processors by equality: bound methods are new objects on every access
+                matches = (next((s for s in self._stages if s.processor == p), None) for p in stage.dependsOn)
+                deps[stage] = [dep for dep in matches if dep is not None and dep is not stage]
+            if self._final_stage is not None:
+                deps[self._final_stage] = list(self._stages)
+            dependents = {stage: [] for stage in stages}
+            for stage in stages:
+                for dep in deps[stage]:
+                    dependents[dep].append(stage)
+            self._graph = (stages, deps, dependents)
+        return self._graph
 
     def handleNewRawFrame(self, frame):
         self._queue.put(frame)
 
     def run(self):
-        while not self._stop:
-            try:
-                frame = self._queue.get(timeout=0.1)
-            except queue.Empty:
-                continue
-            for callback in self.processors:
+        try:
+            while not self._stop:
                 try:
-                    callback(frame)
-                except Exception:
-                    printExc("Frame processing callback failed")
+                    frame = self._queue.get(timeout=0.1)
+                except queue.Empty:
+                    continue
+                with self._lock:
+                    job = _FrameJob(frame, self._getGraph())
+                    done = job.remaining == 0
+                    for stage in job.graph[0]:
+                        if job.depsRemaining[stage] == 0:
+                            done = self._offer(stage, job) or done
+                if done:
+                    self.sigFrameFullyProcessed.emit(frame)
+        finally:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+
+    def _isLate(self, stage, job):
+        return stage.maxLatency is not None and ptime.time() - job.arrival > stage.maxLatency
+
+    def _offer(self, stage, job):
+        """Start, queue, or skip *stage* for a job whose dependencies are complete.
+
+        Must be called with the lock held. Returns True if this finished the job.
+        """
+        if self._isLate(stage, job):
+            stage.counts["droppedLatency"] += 1
+            return self._finishStage(stage, job, skipped=True)
+        if stage.busy:
+            if stage.dropPolicy == "busy":
+                stage.counts["droppedBusy"] += 1
+                return self._finishStage(stage, job, skipped=True)
+            stage.waiting.append(job)
+            return False
+        stage.busy = True
+        self._pool.submit(self._runStage, stage, job)
+        return False
+
+    def _runStage(self, stage, job):
+        """Run *stage* on *job*, then resubmit the stage for the next frame that queued up for it.
+
+        Each call handles a single frame so that a busy stage never holds on to a worker while
+        other stages' work is waiting in the pool.
+        """
+        start = ptime.time()
+        failed = False
+        try:
+            stage.processor(job.frame)
+        except Exception:
+            failed = True
+            printExc("Frame processing callback failed")
+        end = ptime.time()
+
+        finished = []
+        with self._lock:
+            stage.counts["errors"] += int(failed)
+            stage.durations.append(end - start)
+            stage.latencies.append(end - job.arrival)
+            stage.counts["processed"] += 1
+            if self._finishStage(stage, job, skipped=False):
+                finished.append(job.frame)
+            job = None
+            while job is None and len(stage.waiting) > 0:
+                job = stage.waiting.popleft()
+                if self._isLate(stage, job):
+                    stage.counts["droppedLatency"] += 1
+                    if self._finishStage(stage, job, skipped=True):
+                        finished.append(job.frame)
+                    job = None
+            if job is None:
+                stage.busy = False
+            else:
+                self._pool.submit(self._runStage, stage, job)
+        for frame in finished:
             self.sigFrameFullyProcessed.emit(frame)
 
+    def _finishStage(self, stage, job, skipped):
+        """Mark *stage* as done with *job* and release any stages waiting on it.
+
+        Must be called with the lock held. Returns True if this finished the job.
+        """
+        _, deps, dependents = job.graph
+        if skipped:
+            job.skipped.add(stage)
+        job.remaining -= 1
+        done = job.remaining == 0
+        for dependent in dependents[stage]:
+            job.depsRemaining[dependent] -= 1
+            if job.depsRemaining[dependent] > 0:
+                continue
+            if dependent.explicitDeps and any(dep in job.skipped for dep in deps[dependent]):
+                dependent.counts["droppedUpstream"] += 1
+                done = self._finishStage(dependent, job, skipped=True) or done
+            else:
+                done = self._offer(dependent, job) or done
+        return done
+
 
 class AcquireThread(Thread):
     sigShowMessage = Qt.Signal(object)
@@ -888,6 +1160,7 @@ class AcquireThread(Thread):
         self.tasks = []
         self.cameraStartEvent = threading.Event()
         self._recentFPS = deque(maxlen=10)
+        self.droppedFrames = 0
 
     def __del__(self):
         if hasattr(self, "cam"):
@@ -926,6 +1199,7 @@ class AcquireThread(Thread):
                     if lastFrameId is not None:
                         drop = frames[0]["id"] - lastFrameId - 1
                         if drop > 0:
+                            self.droppedFrames += drop
                             print(f"WARNING: Camera dropped {drop} frames")
 
                     # Build meta-info for this frame(s)
@@ -278,6 +278,24 @@ class DAQGenericTask(DeviceTask):
         daqs = set([self.dev.getDAQName(ch) for ch in self._DAQCmd])
         return [], list(daqs)  ## this device should be configured before its DAQs
 
+    def rearm(self, cmd):
+        ## Subclasses usually translate their command into a DAQ command in __init__, so they
+        ## must opt in by overriding this method (see _rearmDAQCmd).
+        if type(self) is not DAQGenericTask:
+            return False
+        return self._rearmDAQCmd(cmd)
+
+    def _rearmDAQCmd(self, daqCmd):
+        """Accept *daqCmd* for the next run if it buffers the same channels as the current command.
+        """
+        def layout(cmd):
+            return {ch: (c.get('record', False), 'command' in c, c.get('lowLevelConf', {})) for ch, c in cmd.items()}
+
+        if layout(daqCmd) != layout(self._DAQCmd):
+            return False
+        self._DAQCmd = daqCmd
+        return True
+
     def configure(self):
         ## Record initial state or set initial value
         ## NOTE:
@@ -350,19 +368,9 @@ class DAQGenericTask(DeviceTask):
             self.bufferedChannels.append(ch)
             # _DAQCmd[ch]['task'] = daqTask  ## ALSO DON't FORGET TO DELETE IT, ASS.
             if chConf['type'] in ['ao', 'do']:
-                # scale = self.getChanScale(ch)
-                cmdData = self._DAQCmd[ch]['command']
+                cmdData = self._daqWaveform(ch, chConf['type'])
                 if cmdData is None:
                     continue
-                # cmdData = cmdData * scale
-
-                ## apply scale, offset or inversion for output lines
-                cmdData = self.mapping.mapToDaq(ch, cmdData)
-
-                if chConf['type'] == 'do':
-                    cmdData = cmdData.astype(np.uint32)
-                    cmdData[cmdData <= 0] = 0
-                    cmdData[cmdData > 0] = 0xFFFFFFFF
 
                 daqTask.addChannel(chConf['channel'], chConf['type'], **self._DAQCmd[ch].get('lowLevelConf', {}))
                 self.daqTasks[ch] = daqTask  ## remember task so we can stop it later on
@@ -378,6 +386,35 @@ class DAQGenericTask(DeviceTask):
                 daqTask.addChannel(chConf['channel'], chConf['type'], **self._DAQCmd[ch].get('lowLevelConf', {}))
                 self.daqTasks[ch] = daqTask  ## remember task so we can stop it later on
 
+    def updateWaveforms(self, daqTask):
+        """Write new command waveforms to the channels previously created on *daqTask*.
+
+        This is called instead of createChannels() when a rearmed task is executed again.
+        """
+        chans = self.dev.listChannels()
+        for ch, task in self.daqTasks.items():
+            chType = chans[ch]['type']
+            if task is not daqTask or chType not in ['ao', 'do']:
+                continue
+            cmdData = self._daqWaveform(ch, chType)
+            if cmdData is not None:
+                daqTask.setWaveform(chans[ch]['channel'], cmdData)
+
+    def _daqWaveform(self, ch, chType):
+        """Return the command waveform for an output channel, converted to DAQ values."""
+        cmdData = self._DAQCmd[ch]['command']
+        if cmdData is None:
+            return None
+
+        ## apply scale, offset or inversion for output lines
+        cmdData = self.mapping.mapToDaq(ch, cmdData)
+
+        if chType == 'do':
+            cmdData = cmdData.astype(np.uint32)
+            cmdData[cmdData <= 0] = 0
+            cmdData[cmdData > 0] = 0xFFFFFFFF
+        return cmdData
+
     def getChanUnits(self, chan):
         if 'units' in self._DAQCmd[chan]:
             return self._DAQCmd[chan]['units']
@@ -455,7 +492,9 @@ class DAQGenericTask(DeviceTask):
         info = [axis(name='Channel', cols=cols), axis(name='Time', units='s', values=timeVals)] + [
             {'DAQ': daqState}]
 
-        protInfo = self._DAQCmd.copy()  ## copy everything but the command arrays and low-level configuration info
+        ## copy everything but the command arrays and low-level configuration info
+        ## (channel commands are copied too, so that the task can be rearmed afterward)
+        protInfo = {ch: self._DAQCmd[ch].copy() for ch in self._DAQCmd}
         for ch in protInfo:
             protInfo[ch].pop('command', None)
             protInfo[ch].pop('lowLevelConf', None)
@@ -8,7 +8,6 @@ from pyqtgraph import SpinBox, WidgetGroup, mkPen
 
 
 from acq4.util import Qt
-from acq4.util.SequenceRunner import runSequence
 
 AOChannelTemplate = Qt.importTemplate('.AOChannelTemplate')
 DOChannelTemplate = Qt.importTemplate('.DOChannelTemplate')
@@ -221,25 +220,21 @@ class OutputChannelGui(DaqChannelGui):
 
         self.clearPlots()
 
-        ## display sequence waves
-        params = {}
-        ps = self.ui.waveGeneratorWidget.listSequences()
-        for k in ps:
-            params[k] = list(range(len(ps[k])))
-        waves = []
-        runSequence(lambda p: waves.append(self.getSingleWave(p)), params,
-                    list(params.keys()))  ## appends waveforms for the entire parameter space to waves
+        ## generate single-mode wave (this also sets the holding offset), then the entire parameter space at once
+        single = self.getSingleWave()
+        waves = self.ui.waveGeneratorWidget.getSequence(self.rate, self.numPts)
+        waves = [] if waves is None else waves.reshape(-1, waves.shape[-1])
+        waves = [w for w in waves if not numpy.all(numpy.isnan(w))]  # points that failed to generate
 
         autoRange = self.plot.getViewBox().autoRangeEnabled()
         self.plot.enableAutoRange(x=False, y=False)
         try:
+            ## display sequence waves
             for w in waves:
-                if w is not None:
-                    # self.ui.functionCheck.setChecked(True)
-                    self.plotCurve(w, color=Qt.QColor(100, 100, 100))
+                # self.ui.functionCheck.setChecked(True)
+                self.plotCurve(w, color=Qt.QColor(100, 100, 100))
 
             ## display single-mode wave in red
-            single = self.getSingleWave()
             if single is not None:
                 # self.ui.functionCheck.setChecked(True)
                 self.plotCurve(single, color=Qt.QColor(200, 100, 100))
@@ -160,6 +160,11 @@ class DeviceTask(object):
     
     DeviceTask instances are usually created by calling Device.createTask().
     """
+
+    # Set to True in subclasses that call taskDone() as soon as isDone() becomes True.
+    # The parent task then waits for that notification instead of polling isDone().
+    signalsCompletion = False
+
     def __init__(self, dev, cmd, parentTask):
         """
         Initialization is provided 3 arguments: *dev* is the Device for which
@@ -224,6 +229,22 @@ class DeviceTask(object):
         """
         pass
 
+    def rearm(self, cmd):
+        """
+        Called by the parent task before it is executed again (see Task.rearm).
+        *cmd* is the device's command for the next run.
+
+        DeviceTasks that can run repeatedly should accept the new command and
+        return True; configure() will be called again before the next start,
+        but may skip any hardware setup that does not depend on the parts of
+        the command that changed. Return False if the command cannot be applied
+        to this DeviceTask, in which case the parent task creates new
+        DeviceTasks for all devices.
+
+        By default, this method returns False.
+        """
+        return False
+
     def getStartOrder(self):
         """
         This method is called by the parent task before starting any devices.
@@ -253,6 +274,15 @@ class DeviceTask(object):
         """
         return True
     
+    def taskDone(self):
+        """
+        Notify the parent task that this DeviceTask has completed. This may be
+        called from any thread; see signalsCompletion.
+        """
+        parent = self.parentTask()
+        if parent is not None:
+            parent._deviceTaskDone(self)
+
     def stop(self, abort=False):
         """
         Stop this DeviceTask. If abort is True, then the task should stop as
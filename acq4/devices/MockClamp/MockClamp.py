@@ -207,6 +207,14 @@ class MockClamp(PatchClamp):
 
 class MockClampTask(DAQGenericTask):
     def __init__(self, dev, cmd, parentTask):
+        DAQGenericTask.__init__(self, dev.daqDev, self._daqCommand(dev, cmd), parentTask)
+
+        self.cmd = cmd
+        self.clampDev = dev
+
+        modPath = os.path.abspath(os.path.split(__file__)[0])
+
+    def _daqCommand(self, dev, cmd):
         ## make a few changes for compatibility with multiclamp        
         if 'daqProtocol' not in cmd:
             cmd['daqProtocol'] = {}
@@ -221,12 +229,13 @@ class MockClampTask(DAQGenericTask):
         daqP['command']['lowLevelConf'] = {'mockFunc': self.write}
 
         cmd['daqProtocol']['primary'] = {'record': True, 'lowLevelConf': {'mockFunc': self.read}}
-        DAQGenericTask.__init__(self, dev.daqDev, cmd['daqProtocol'], parentTask)
+        return daqP
 
+    def rearm(self, cmd):
+        if not self._rearmDAQCmd(self._daqCommand(self.clampDev, cmd)):
+            return False
         self.cmd = cmd
-        self.clampDev = dev
-
-        modPath = os.path.abspath(os.path.split(__file__)[0])
+        return True
 
     def configure(self):
         ### Record initial state or set initial value
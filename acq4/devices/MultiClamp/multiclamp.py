@@ -353,15 +353,29 @@ class MultiClampTask(DeviceTask):
         self.usedChannels = None
         self.daqTasks = {}
 
+        self._checkCommand(self.cmd)
+
+    @staticmethod
+    def _checkCommand(cmd):
         ## Sanity checks and default values for command:
         
-        if ('mode' not in self.cmd) or (type(self.cmd['mode']) is not str) or (self.cmd['mode'].upper() not in ['IC', 'VC', 'I=0']):
+        if ('mode' not in cmd) or (type(cmd['mode']) is not str) or (cmd['mode'].upper() not in ['IC', 'VC', 'I=0']):
             raise ValueError("Multiclamp command must specify clamp mode (IC, VC, or I=0)")
-        self.cmd['mode'] = self.cmd['mode'].upper()
+        cmd['mode'] = cmd['mode'].upper()
         
         for ch in ['primary', 'secondary']:
-            if ch not in self.cmd:
-                self.cmd[ch] = None # defaultModes[self.cmd['mode']][ch]
+            if ch not in cmd:
+                cmd[ch] = None # defaultModes[cmd['mode']][ch]
+
+    def rearm(self, cmd):
+        self._checkCommand(cmd)
+        ## DAQ channels are reused, so the same channels must be in use
+        if cmd.get('recordSecondary', True) != self.cmd.get('recordSecondary', True):
+            return False
+        if ('command' in cmd) != ('command' in self.cmd):
+            return False
+        self.cmd = cmd
+        return True
 
     def getConfigOrder(self):
         """return lists of devices that should be configured (before, after) this device"""
@@ -449,16 +463,23 @@ class MultiClampTask(DeviceTask):
             if chConf['device'] == daqTask.devName():
                 if ch == 'command':
                     daqTask.addChannel(chConf['channel'], chConf['type'])
-                    scale = self.state['extCmdScale']
-                    #scale = self.dev.config['cmdScale'][self.cmd['mode']]
-                    if scale == 0.:
-                        raise Exception('Can not execute command--external command sensitivity is disabled by MultiClamp commander!', 'ExtCmdSensOff')  ## The second string is a hint for modules that don't care when this happens.
-                    cmdData = self.cmd['command'] / scale
-                    daqTask.setWaveform(chConf['channel'], cmdData)
+                    daqTask.setWaveform(chConf['channel'], self._commandWaveform())
                 else:
                     mode = chConf.get('mode', None)
                     daqTask.addChannel(chConf['channel'], chConf['type'], mode)
                 self.daqTasks[ch] = daqTask
+
+    def updateWaveforms(self, daqTask):
+        ## Called instead of createChannels when a rearmed task runs again
+        if self.daqTasks.get('command', None) is daqTask:
+            daqTask.setWaveform(self.dev.config['commandChannel']['channel'], self._commandWaveform())
+
+    def _commandWaveform(self):
+        scale = self.state['extCmdScale']
+        #scale = self.dev.config['cmdScale'][self.cmd['mode']]
+        if scale == 0.:
+            raise Exception('Can not execute command--external command sensitivity is disabled by MultiClamp commander!', 'ExtCmdSensOff')  ## The second string is a hint for modules that don't care when this happens.
+        return self.cmd['command'] / scale
         
     def start(self):
         ## possibly nothing required here, DAQ will start recording.
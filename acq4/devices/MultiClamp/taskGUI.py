@@ -5,7 +5,6 @@ from pyqtgraph import mkPen, disconnect
 from acq4.devices.Device import TaskGui
 from pyqtgraph.WidgetGroup import WidgetGroup
 from acq4.util import Qt
-from acq4.util.SequenceRunner import runSequence
 from acq4.util.debug import printExc
 
 
@@ -146,24 +145,20 @@ class MultiClampTaskGui(TaskGui):
 
         self.clearCmdPlots()
         
-        ## compute sequence waves
-        params = {}
-        ps = self.ui.waveGeneratorWidget.listSequences()
-        for k in ps:
-            params[k] = list(range(len(ps[k])))
-        waves = []
-        runSequence(lambda p: waves.append(self.getSingleWave(p)), params, list(params.keys()))
+        ## compute single-mode wave (this also sets the holding offset), then the entire parameter space at once
+        single = self.getSingleWave()
+        waves = self.ui.waveGeneratorWidget.getSequence(self.rate, self.numPts)
+        waves = [] if waves is None else waves.reshape(-1, waves.shape[-1])
+        waves = [w for w in waves if not numpy.all(numpy.isnan(w))]  # points that failed to generate
 
         # Plot all waves but disable auto-range first to improve performance.
         autoRange = self.ui.bottomPlotWidget.getViewBox().autoRangeEnabled()
         self.ui.bottomPlotWidget.enableAutoRange(x=False, y=False)
         try:
             for w in waves:
-                if w is not None:
-                    self.plotCmdWave(w, color=Qt.QColor(100, 100, 100), replot=False)
+                self.plotCmdWave(w, color=Qt.QColor(100, 100, 100), replot=False)
         
             ## display single-mode wave in red
-            single = self.getSingleWave()
             if single is not None:
                 p = self.plotCmdWave(single, color=Qt.QColor(200, 100, 100))
                 p.setZValue(1000)
@@ -1,3 +1,6 @@
+import threading
+from collections import OrderedDict
+
 import numpy
 import scipy.ndimage
 import scipy.signal
@@ -5,6 +8,7 @@ import scipy.signal
 import acq4.util.Mutex as Mutex
 from acq4.devices.Device import Device, DeviceTask
 from acq4.devices.NiDAQ.taskGUI import NiDAQTask
+from acq4.devices.NiDAQ import processing
 from acq4.util.debug import printExc
 
 
@@ -14,12 +18,16 @@ class NiDAQ(Device):
         defaultAIMode: 'mode'  # mode to use for ai channels by default ('rse', 'nrse', or 'diff')
         defaultAIRange: [-10, 10]  # default voltage range to use for AI ports
         defaultAORange: [-10, 10]  # default voltage range to use for AO ports
+        processingDtype: 'float64'  # use 'float32' to filter and downsample recorded data in single precision
+        processingChunkSize: 1048576  # recordings longer than this (samples) are filtered in chunks
     """
     def __init__(self, dm, config, name):
         Device.__init__(self, dm, config, name)
         self.config = config
         self._defaultAIRange = config.get('defaultAIRange', [-10, 10])
         self._defaultAORange = config.get('defaultAORange', [-10, 10])
+        self.processingDtype = config.get('processingDtype', 'float64')
+        self.processingChunkSize = config.get('processingChunkSize', processing.defaultChunkSize)
 
         ## make local copy of device handle
         if config is not None and config.get('mock', False):
@@ -154,77 +162,42 @@ class NiDAQ(Device):
     @staticmethod
     def meanResample(data, ds, binary=False):
         """Resample data by taking mean of ds samples at a time"""
-        newLen = int(data.shape[0] / ds) * ds
-        data = data[:newLen]
-        data.shape = (int(data.shape[0]/ds), ds)
-        if binary:
-            return data.mean(axis=1).round().astype(numpy.byte)
-        else:
-            return data.mean(axis=1)
+        return processing.meanResample(data, ds, binary=binary)
     
     @staticmethod
     def lowpass(data, cutoff, order=4, bidir=True, filter='bessel', stopCutoff=None, gpass=2., gstop=20., samplerate=None):
         """Bi-directional bessel/butterworth lowpass filter"""
-        if samplerate is not None:
-            cutoff /= 0.5*samplerate
-            if stopCutoff is not None:
-                stopCutoff /= 0.5*samplerate
-        
-        if filter == 'bessel':
-            ## How do we compute Wn?
-            ### function determining magnitude transfer of 4th-order bessel filter
-            #from scipy.optimize import fsolve
-
-            #def m(w):  
-                #return 105. / (w**8 + 10*w**6 + 135*w**4 + 1575*w**2 + 11025.)**0.5
-            #v = fsolve(lambda x: m(x)-limit, 1.0)
-            #Wn = cutoff / (sampr*v)
-            b,a = scipy.signal.bessel(order, cutoff, btype='low') 
-        elif filter == 'butterworth':
-            if stopCutoff is None:
-                stopCutoff = cutoff * 2.0
-            ord, Wn = scipy.signal.buttord(cutoff, stopCutoff, gpass, gstop)
-            #print "butterworth ord %f   Wn %f   c %f   sc %f" % (ord, Wn, cutoff, stopCutoff)
-            b,a = scipy.signal.butter(ord, Wn, btype='low') 
-        else:
-            raise Exception('Unknown filter type "%s"' % filter)
-            
-        padded = numpy.hstack([data[:100], data, data[-100:]])   ## can we intelligently decide how many samples to pad with?
-
-        if bidir:
-            data = scipy.signal.lfilter(b, a, scipy.signal.lfilter(b, a, padded)[::-1])[::-1][100:-100]  ## filter twice; once forward, once reversed. (This eliminates phase changes)
-        else:
-            data = scipy.signal.lfilter(b, a, padded)[100:-100]
-        return data
+        return processing.lowpass(data, cutoff, order=order, bidir=bidir, filter=filter, stopCutoff=stopCutoff,
+                                  gpass=gpass, gstop=gstop, samplerate=samplerate)
 
     @staticmethod
     def denoise(data, radius=2, threshold=4):
         """Very simple noise removal function. Compares a point to surrounding points,
         replaces with nearby values if the difference is too large."""
-        
-        r2 = radius * 2
-        d2 = data[radius:] - data[:-radius] #a derivative
-        stdev = d2.std()
-        mask1 = d2 > stdev*threshold #where derivative is large and positive
-        mask2 = d2 < -stdev*threshold #where derivative is large and negative
-        maskpos = mask1[:-radius] * mask2[radius:] #both need to be true
-        maskneg = mask1[radius:] * mask2[:-radius]
-        mask = maskpos + maskneg
-        d5 = numpy.where(mask, data[:-r2], data[radius:-radius]) #where both are true replace the value with the value from 2 points before
-        d6 = numpy.empty(data.shape, dtype=data.dtype) #add points back to the ends
-        d6[radius:-radius] = d5
-        d6[:radius] = data[:radius]
-        d6[-radius:] = data[-radius:]
-        return d6
+        return processing.denoise(data, radius, threshold)
 
 
 class Task(DeviceTask):
+    signalsCompletion = True
+
     def __init__(self, dev, cmd, parentTask):
         DeviceTask.__init__(self, dev, cmd, parentTask)
         self.cmd = cmd
 
         ## Create supertask from nidaq driver
         self.st = self.dev.n.createSuperTask()
+        self._channelsCreated = False
+        self._stopped = False
+        self._processed = {}  # {task key: (processed data, info)}, filled in by getData()
+
+    def rearm(self, cmd):
+        ## The supertask may be reused as long as its timing and triggering are unchanged;
+        ## filtering and downsampling are applied after acquisition.
+        for key in ('rate', 'numPts', 'triggerChan', 'triggerDevice'):
+            if cmd.get(key, None) != self.cmd.get(key, None):
+                return False
+        self.cmd = cmd
+        return True
 
     def getChanSampleRate(self, ch):
         """Return the sample rate that will be used for ch"""
@@ -234,11 +207,21 @@ class Task(DeviceTask):
     def configure(self):
         #defaultAIMode = self.dev.config.get('defaultAIMode', None)
         
-        ## Request to all devices that they create the channels they use on this task
         tasks = self.parentTask().tasks
+
+        ## If the task was rearmed, channels, clocks and triggers are already configured; only
+        ## the output waveforms need to be replaced.
+        if self._channelsCreated:
+            for dName in tasks:
+                if hasattr(tasks[dName], 'updateWaveforms'):
+                    tasks[dName].updateWaveforms(self)
+            return
+
+        ## Request to all devices that they create the channels they use on this task
         for dName in tasks:
             if hasattr(tasks[dName], 'createChannels'):
                 tasks[dName].createChannels(self)
+        self._channelsCreated = True
         
         ## If no devices requested buffered operations, then do not configure clock.
         ## This might eventually cause some triggering issues..
@@ -283,8 +266,26 @@ class Task(DeviceTask):
         return self.st.setWaveform(*args, **kwargs)
         
     def start(self):
+        self._stopped = False
+        self._processed = {}
         if self.st.hasTasks():
             self.st.start()
+            ## wait for the hardware in a background thread so the parent task does not need to poll
+            threading.Thread(target=self._waitForDone, daemon=True).start()
+        else:
+            self.taskDone()
+
+    def _waitForDone(self):
+        try:
+            while not self._stopped:
+                if self.st.waitUntilDone(timeout=0.1):
+                    break
+        except Exception:
+            ## the parent task still checks isDone(), so there is nothing to lose by giving up here
+            if not self._stopped:
+                printExc("Error while waiting for DAQ task to finish:")
+        finally:
+            self.taskDone()
         
     def isDone(self):
         if self.st.hasTasks():
@@ -294,6 +295,7 @@ class Task(DeviceTask):
         
         
     def stop(self, wait=False, abort=False):
+        self._stopped = True
         if self.st.hasTasks():
             #print "stopping ST..."
             self.st.stop(wait=wait, abort=abort)
@@ -312,9 +314,34 @@ class Task(DeviceTask):
           'data': ndarray,
           'info': {'rate': xx, 'numPts': xx, ...}
         }
+
+        Filtering, downsampling and denoising are applied to all channels of the same type at once,
+        the first time data for any of them is requested.
         """
         res = self.st.getResult(channel)
-        data = res['data']
+        key = self.st.channelInfo[channel]['task']
+        if key not in self._processed:
+            self._processed[key] = self._processTaskData(self.st.getResult()[key]['data'], res['info'])
+        data, procInfo = self._processed[key]
+
+        res['data'] = data[self.st.channelInfo[channel]['index']]
+        res['info'].update(procInfo)
+        res['info']['numPts'] = res['data'].shape[0]
+        return res
+
+    def _processTaskData(self, data, info):
+        """Apply the post-processing requested in the command to a (channels, samples) array of
+        data from one DAQ task. Return the processed array and a dict of info describing the
+        processing."""
+        procInfo = OrderedDict()
+        chanType = info['type']
+
+        ## Data read from input channels is not used elsewhere, so it may be processed in place;
+        ## output data is the waveform we wrote and must be copied.
+        inPlace = chanType in ['ai', 'di']
+        if chanType in ['ai', 'ao'] and self.dev.processingDtype == 'float32':
+            data = data.astype(numpy.float32)
+            inPlace = True
 
         if 'downsample' in self.cmd:
             ds = self.cmd['downsample']
@@ -326,23 +353,17 @@ class Task(DeviceTask):
 
             if method == 'None':
                 pass
-            #elif method == 'gaussian':
-                #width = self.cmd['gaussianWidth']
-
-                #data = scipy.ndimage.gaussian_filter(data, width)
-
-                #res['info']['filterMethod'] = method
-                #res['info']['filterWidth'] = width
             elif method == 'Bessel':
                 cutoff = self.cmd['besselCutoff']
                 order = self.cmd['besselOrder']
                 bidir = self.cmd.get('besselBidirectional', True)
-                data = NiDAQ.lowpass(data, filter='bessel', bidir=bidir, cutoff=cutoff, order=order, samplerate=res['info']['rate'])
+                data = processing.lowpass(data, filter='bessel', bidir=bidir, cutoff=cutoff, order=order,
+                                          samplerate=info['rate'], inPlace=inPlace, chunkSize=self.dev.processingChunkSize)
 
-                res['info']['filterMethod'] = method
-                res['info']['filterCutoff'] = cutoff
-                res['info']['filterOrder'] = order
-                res['info']['filterBidirectional'] = bidir
+                procInfo['filterMethod'] = method
+                procInfo['filterCutoff'] = cutoff
+                procInfo['filterOrder'] = order
+                procInfo['filterBidirectional'] = bidir
             elif method == 'Butterworth':
                 passF = self.cmd['butterworthPassband']
                 stopF = self.cmd['butterworthStopband']
@@ -350,30 +371,31 @@ class Task(DeviceTask):
                 stopDB = self.cmd['butterworthStopDB']
                 bidir = self.cmd.get('butterworthBidirectional', True)
 
-                data = NiDAQ.lowpass(data, filter='butterworth', bidir=bidir, cutoff=passF, stopCutoff=stopF, gpass=passDB, gstop=stopDB, samplerate=res['info']['rate'])
+                data = processing.lowpass(data, filter='butterworth', bidir=bidir, cutoff=passF, stopCutoff=stopF,
+                                          gpass=passDB, gstop=stopDB, samplerate=info['rate'], inPlace=inPlace,
+                                          chunkSize=self.dev.processingChunkSize)
 
-                res['info']['filterMethod'] = method
-                res['info']['filterPassband'] = passF
-                res['info']['filterStopband'] = stopF
-                res['info']['filterPassbandDB'] = passDB
-                res['info']['filterStopbandDB'] = stopDB
-                res['info']['filterBidirectional'] = bidir
+                procInfo['filterMethod'] = method
+                procInfo['filterPassband'] = passF
+                procInfo['filterStopband'] = stopF
+                procInfo['filterPassbandDB'] = passDB
+                procInfo['filterStopbandDB'] = stopDB
+                procInfo['filterBidirectional'] = bidir
 
             else:
                 printExc(f"Unknown filter method '{method}'")
 
         if ds > 1:
-            if res['info']['type'] in ['di', 'do']:
-                res['data'] = (res['data'] > 0).astype(numpy.byte)
-                data = data[::ds]
-                res['info']['downsampling'] = ds
-                res['info']['downsampleMethod'] = 'subsample'
-                res['info']['rate'] = res['info']['rate'] / ds
-            elif res['info']['type'] in ['ai', 'ao']:
-                data = NiDAQ.meanResample(data, ds)
-                res['info']['downsampling'] = ds
-                res['info']['downsampleMethod'] = 'mean'
-                res['info']['rate'] = res['info']['rate'] / ds
+            if chanType in ['di', 'do']:
+                data = data[..., ::ds]
+                procInfo['downsampling'] = ds
+                procInfo['downsampleMethod'] = 'subsample'
+                procInfo['rate'] = info['rate'] / ds
+            elif chanType in ['ai', 'ao']:
+                data = processing.meanResample(data, ds)
+                procInfo['downsampling'] = ds
+                procInfo['downsampleMethod'] = 'mean'
+                procInfo['rate'] = info['rate'] / ds
 
         if 'denoiseMethod' in self.cmd:
             method = self.cmd['denoiseMethod']
@@ -383,17 +405,14 @@ class Task(DeviceTask):
                 width = self.cmd['denoiseWidth']
                 thresh = self.cmd['denoiseThreshold']
 
-                res['info']['denoiseMethod'] = method
-                res['info']['denoiseWidth'] = width
-                res['info']['denoiseThreshold'] = thresh
-                data = NiDAQ.denoise(data, width, thresh)
+                procInfo['denoiseMethod'] = method
+                procInfo['denoiseWidth'] = width
+                procInfo['denoiseThreshold'] = thresh
+                data = processing.denoise(data, width, thresh)
             else:
                 printExc(f"Unknown denoise method '{method}'")
 
-        res['data'] = data
-        res['info']['numPts'] = data.shape[0]
-
-        return res
+        return data, procInfo
         
     def devName(self):
         return self.dev.name()
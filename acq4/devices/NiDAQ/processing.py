@@ -0,0 +1,154 @@
+"""
+processing.py - Post-processing of data acquired by NiDAQ tasks
+
+All functions here operate on the last axis of their input, so a (channels, samples) array is
+processed in a single call. Lowpass filters are designed once per parameter set and applied as
+second-order sections, which is both faster and more numerically stable than the (b, a)
+polynomial form for high-order Butterworth filters.
+"""
+import functools
+
+import numpy as np
+import scipy.signal
+
+
+# recordings longer than this (in samples) are filtered in chunks to limit temporary memory use
+defaultChunkSize = 2**20
+
+
+@functools.lru_cache(maxsize=64)
+def filterDesign(filter, cutoff, order=4, stopCutoff=None, gpass=2., gstop=20.):
+    """Return the second-order sections for a lowpass filter.
+
+    *cutoff* and *stopCutoff* are given as a fraction of the Nyquist frequency. Results are cached,
+    so repeated calls with the same parameters do not re-run the filter design.
+    """
+    if filter == 'bessel':
+        sos = scipy.signal.bessel(order, cutoff, btype='low', output='sos')
+    elif filter == 'butterworth':
+        if stopCutoff is None:
+            stopCutoff = cutoff * 2.0
+        ord, Wn = scipy.signal.buttord(cutoff, stopCutoff, gpass, gstop)
+        sos = scipy.signal.butter(ord, Wn, btype='low', output='sos')
+    else:
+        raise Exception('Unknown filter type "%s"' % filter)
+    sos.setflags(write=False)
+    return sos
+
+
+def lowpass(data, cutoff, order=4, bidir=True, filter='bessel', stopCutoff=None, gpass=2., gstop=20.,
+            samplerate=None, inPlace=False, chunkSize=None):
+    """Bessel/butterworth lowpass filter applied along the last axis of *data*.
+
+    If *bidir* is True, the filter is applied forward and backward to eliminate phase shifts.
+    If *inPlace* is True and *data* is a floating-point array, the result is written back into
+    *data* (float32 data is then filtered in float32). Recordings longer than *chunkSize* samples
+    (default: defaultChunkSize) are filtered in chunks; the result is the same as
+    scipy.signal.sosfiltfilt applied to the whole recording at once.
+    """
+    if samplerate is not None:
+        cutoff /= 0.5*samplerate
+        if stopCutoff is not None:
+            stopCutoff /= 0.5*samplerate
+    sos = filterDesign(filter, float(cutoff), order, None if stopCutoff is None else float(stopCutoff), gpass, gstop)
+
+    data = _floatArray(data, inPlace)
+    if data.shape[-1] == 0:
+        return data
+    sos = sos.astype(data.dtype)
+    if chunkSize is None:
+        chunkSize = defaultChunkSize
+    if bidir:
+        _sosfiltfiltChunked(sos, data, chunkSize)
+    else:
+        _sosfiltChunked(sos, data, chunkSize)
+    return data
+
+
+def meanResample(data, ds, binary=False):
+    """Resample data along the last axis by taking the mean of *ds* samples at a time."""
+    newLen = data.shape[-1] // ds
+    data = data[..., :newLen * ds].reshape(data.shape[:-1] + (newLen, ds))
+    if binary:
+        return data.mean(axis=-1).round().astype(np.byte)
+    else:
+        return data.mean(axis=-1)
+
+
+def denoise(data, radius=2, threshold=4):
+    """Very simple noise removal function. Compares a point to surrounding points,
+    replaces with nearby values if the difference is too large.
+
+    For multi-channel data, the threshold is computed separately for each channel."""
+    r2 = radius * 2
+    d2 = data[..., radius:] - data[..., :-radius]  # a derivative
+    stdev = d2.std(axis=-1, keepdims=True)
+    mask1 = d2 > stdev*threshold  # where derivative is large and positive
+    mask2 = d2 < -stdev*threshold  # where derivative is large and negative
+    maskpos = mask1[..., :-radius] & mask2[..., radius:]  # both need to be true
+    maskneg = mask1[..., radius:] & mask2[..., :-radius]
+    mask = maskpos | maskneg
+    out = data.copy()
+    # where both are true replace the value with the value from 2 points before
+    out[..., radius:-radius] = np.where(mask, data[..., :-r2], data[..., radius:-radius])
+    return out
+
+
+def _floatArray(data, inPlace):
+    if inPlace and isinstance(data, np.ndarray) and data.dtype in (np.float32, np.float64) and data.flags.writeable:
+        return data
+    data = np.asarray(data)
+    dtype = data.dtype if data.dtype in (np.float32, np.float64) else np.float64
+    return data.astype(dtype, copy=True)
+
+
+def _padLen(sos, n):
+    # same default as scipy.signal.sosfiltfilt, limited so that short recordings can still be filtered
+    nSections = sos.shape[0]
+    nTrailingZeros = min((sos[:, 2] == 0).sum(), (sos[:, 5] == 0).sum())
+    return min(3 * (2 * nSections + 1 - nTrailingZeros), n - 1)
+
+
+def _sosfiltChunked(sos, data, chunkSize):
+    """Forward filter *data* in place, starting from rest."""
+    zi = np.zeros((sos.shape[0],) + data.shape[:-1] + (2,), dtype=data.dtype)
+    for start in range(0, data.shape[-1], chunkSize):
+        chunk = data[..., start:start + chunkSize]
+        chunk[...], zi = scipy.signal.sosfilt(sos, chunk, axis=-1, zi=zi)
+
+
+def _sosfiltfiltChunked(sos, data, chunkSize):
+    """Equivalent to data[...] = sosfiltfilt(sos, data, axis=-1) with odd padding, but only
+    allocates temporary arrays the size of one chunk."""
+    n = data.shape[-1]
+    if n == 0:
+        return
+    padlen = _padLen(sos, n)
+    ziUnit = scipy.signal.sosfilt_zi(sos).astype(data.dtype)
+    ziUnit = ziUnit.reshape((sos.shape[0],) + (1,) * (data.ndim - 1) + (2,))
+
+    # forward pass, starting from the odd extension of the signal at the left end. A single
+    # sample is too short to extend, so the filter starts from steady state at that sample
+    # instead (as sosfiltfilt does with padlen=0)
+    if padlen > 0:
+        first = data[..., :1]
+        leftPad = 2 * first - data[..., padlen:0:-1]
+        rightPad = 2 * data[..., -1:] - data[..., -2:-padlen - 2:-1]
+        _, zi = scipy.signal.sosfilt(sos, leftPad, axis=-1, zi=ziUnit * leftPad[..., :1])
+    else:
+        zi = ziUnit * data[..., :1]
+    for start in range(0, n, chunkSize):
+        chunk = data[..., start:start + chunkSize]
+        chunk[...], zi = scipy.signal.sosfilt(sos, chunk, axis=-1, zi=zi)
+
+    # backward pass, starting from the filtered extension at the right end
+    if padlen > 0:
+        rightPad, zi = scipy.signal.sosfilt(sos, rightPad, axis=-1, zi=zi)
+        rev = rightPad[..., ::-1]
+        _, zi = scipy.signal.sosfilt(sos, rev, axis=-1, zi=ziUnit * rev[..., :1])
+    else:
+        zi = ziUnit * data[..., -1:]
+    for stop in range(n, 0, -chunkSize):
+        chunk = data[..., max(0, stop - chunkSize):stop]
+        out, zi = scipy.signal.sosfilt(sos, chunk[..., ::-1], axis=-1, zi=zi)
+        chunk[...] = out[..., ::-1]
@@ -6,6 +6,7 @@ from acq4.devices.PatchClamp.gui import PatchClampDeviceGui
 from acq4.devices.PatchClamp.testpulse import TestPulseThread
 from acq4.filetypes.MultiPatchLog import TEST_PULSE_NUMPY_DTYPE
 from acq4.util import Qt
+from acq4.util.ringbuffer import RingBuffer
 from neuroanalysis.test_pulse import PatchClampTestPulse
 
 
@@ -31,9 +32,8 @@ class PatchClamp(Device):
         self.config = config
         self._lastTestPulse = None
         self._testPulseThread = None
+        self._testPulseHistory = RingBuffer(config.get('testPulseHistorySize', 10000), dtype=TEST_PULSE_NUMPY_DTYPE)
         self._initTestPulse(config.get('testPulse', {}))
-        self._testPulseHistorySize = 0
-        self._testPulseHistory = None
         self._testPulseAnalysisOverrides = {}
 
     def deviceInterface(self, win):
@@ -124,29 +124,21 @@ class PatchClamp(Device):
 
     def _testPulseFinished(self, dev, result: PatchClampTestPulse):
         self._lastTestPulse = result
-        if self._testPulseHistorySize >= self._testPulseHistory.shape[0]:
-            newTPH = np.empty(self._testPulseHistory.shape[0] * 2, dtype=self._testPulseHistory.dtype)
-            newTPH[:self._testPulseHistory.shape[0]] = self._testPulseHistory
-            self._testPulseHistory = newTPH
-        analysis = result.analysis
-        self._testPulseHistory[self._testPulseHistorySize]['event_time'] = result.start_time
-        for k in analysis:
-            val = analysis[k]
-            if val is None:
-                val = np.nan
-            self._testPulseHistory[self._testPulseHistorySize][k] = val
-        self._testPulseHistorySize += 1
+        record = {k: np.nan if v is None else v for k, v in result.analysis.items()}
+        record['event_time'] = result.start_time
+        self._testPulseHistory.append(record)
 
         self.sigTestPulseFinished.emit(self, result)
 
-    def testPulseHistory(self):
-        return self._testPulseHistory[:self._testPulseHistorySize].copy()
+    def testPulseHistory(self, n=None):
+        """Return a copy of the analysis of the last *n* test pulses (default all that are retained, up to
+        the 'testPulseHistorySize' config option) as a structured array, oldest first.
+        """
+        return self._testPulseHistory.view(n).copy()
 
     def resetTestPulseHistory(self):
         self._lastTestPulse = None
-        self._testPulseHistory = np.empty(1000, dtype=TEST_PULSE_NUMPY_DTYPE)
-
-        self._testPulseHistorySize = 0
+        self._testPulseHistory.clear()
 
     def enableTestPulse(self, enable=True, block=False):
         if enable:
@@ -8,7 +8,8 @@ from acq4.util import Qt, ptime
 from acq4.util.Thread import Thread
 from acq4.util.debug import printExc
 from neuroanalysis.data import TSeries, PatchClampRecording
-from neuroanalysis.test_pulse import PatchClampTestPulse
+from neuroanalysis.stimuli import SquarePulse
+from neuroanalysis.test_pulse import PatchClampTestPulse, LowConfidenceFitError
 from acq4.Manager import getManager, Task
 from acq4.analysis.dataModels.PatchEPhys import getBridgeBalanceCompensation
 from acq4.util.functions import downsample
@@ -49,9 +50,12 @@ class TestPulseThread(Thread):
             'icPostDuration': 80e-3,
             'icAmplitude': -10e-12,
             'icAverage': 4,
+            'fitInterval': 1,  # run the full exponential fit analysis on every Nth test pulse
             '_index': 0,
         }
         self._lastTask = None
+        self._tpCount = 0
+        self._cmdCache = None
 
         self._daqName = self._clampDev.getDAQName("primary")
         self._clampName = self._clampDev.name()
@@ -121,6 +125,7 @@ class TestPulseThread(Thread):
                 break
             except Exception:
                 printExc("Error in test pulse thread (will try again):", msgType='warning')
+                self._lastTask = None  # don't reuse a task that may have failed
                 time.sleep(2.0)
 
     def runOnce(self, checkStop=False):
@@ -128,9 +133,6 @@ class TestPulseThread(Thread):
         params = self._params
         runMode = currentMode if params['clampMode'] is None else params['clampMode']
 
-        # Can't reuse tasks yet; remove this when we can.
-        self._lastTask = None
-
         if self._lastTask is None or self._lastTask._paramIndex != params['_index'] or self._lastTask._clampMode != runMode:
             taskParams = self.paramsForMode(runMode)
             task = self.createTask(taskParams)
@@ -139,7 +141,10 @@ class TestPulseThread(Thread):
             self._lastTask = task
             self._lastTaskParams = taskParams
         else:
+            # Parameters are unchanged, so the previous task's hardware configuration can be reused;
+            # only the command waveform needs to be regenerated (the holding level may have changed).
             task = self._lastTask
+            task.rearm(self.taskCommand(self._lastTaskParams))
 
         # if clamp mode changed while we were fiddling around, then abort.
         task.reserveDevices()
@@ -148,12 +153,15 @@ class TestPulseThread(Thread):
                 task.releaseDevices()
                 return
             
-            task.execute()
-                
-            while not task.isDone():
-                if checkStop:
-                    self.checkStop()
-                time.sleep(0.01)
+            task.execute(block=False)
+            try:
+                while not task.waitUntilDone(timeout=0.1):
+                    if checkStop:
+                        self.checkStop()
+            except Exception:
+                task.stop(abort=True)
+                raise
+            task.stop()
         
             tp = None
             if params['autoBiasEnabled']:
@@ -190,8 +198,7 @@ class TestPulseThread(Thread):
             start_time=start_time,
         )
 
-        cmd = task.command[self._clampName]['command']
-        cmd = downsample(cmd[:pulse_len * params['downsample']], params['downsample'])
+        cmd, stimulus = self._downsampledCommand(task, params, times)
         holding = cmd[0]
         if mode == 'VC':
             extra_kwds = {
@@ -202,10 +209,9 @@ class TestPulseThread(Thread):
                 'holding_current': holding,
                 'bridge_balance': getBridgeBalanceCompensation(result),
             }
-        cmd -= holding  # neuroanalysis will double-count the baseline otherwise
         cmd = TSeries(
             channel_id='command',
-            data=cmd,
+            data=cmd - holding,  # neuroanalysis will double-count the baseline otherwise
             time_values=times,
             units='V' if mode == 'VC' else 'A',
             start_time=start_time,
@@ -222,12 +228,41 @@ class TestPulseThread(Thread):
         pri.recording = rec
         cmd.recording = rec
 
-        tp = PatchClampTestPulse(rec)
+        # only every Nth test pulse gets the full (exponential fit) analysis
+        fitInterval = self._params['fitInterval']
+        tpClass = PatchClampTestPulse if fitInterval <= 1 or self._tpCount % fitInterval == 0 else FastTestPulse
+        self._tpCount += 1
+        tp = tpClass(rec, stimulus=stimulus)
         if self._params['postProcessing'] is not None:
             tp = self._params['postProcessing'](tp)
         return tp
 
+    def _downsampledCommand(self, task: Task, params: dict, times: np.ndarray):
+        # The command waveform only changes when the task is recreated or the holding level changes,
+        # so the downsampled command and the test pulse stimulus found in it are reused otherwise.
+        cmd = task.command[self._clampName]['command']
+        pulse_len = len(times)
+        key = (id(task), task._paramIndex, cmd[0], pulse_len)
+        if self._cmdCache is None or self._cmdCache[0] != key:
+            dsCmd = downsample(cmd[:pulse_len * params['downsample']], params['downsample'])
+            dsCmd.flags.writeable = False
+            stimulus = None
+            pulses = np.argwhere(np.diff(dsCmd) != 0)[:, 0] + 1
+            if len(pulses) == 2:
+                stimulus = SquarePulse(
+                    start_time=times[pulses[0]] - times[0],
+                    duration=(pulses[1] - pulses[0]) * (times[1] - times[0]),
+                    amplitude=dsCmd[pulses[0]] - dsCmd[0],
+                    units='V' if params['clampMode'] == 'VC' else 'A',
+                )
+                stimulus.description = 'test pulse'
+            self._cmdCache = (key, dsCmd, stimulus)
+        return self._cmdCache[1], self._cmdCache[2]
+
     def createTask(self, params: dict) -> Task:
+        return self._manager.createTask(self.taskCommand(params))
+
+    def taskCommand(self, params: dict) -> dict:
         duration = params['preDuration'] + params['pulseDuration'] + params['postDuration']
         numPts = int(float(duration * params['sampleRate']) * params['downsample']) // params['downsample']
         params['numPts'] = numPts  # send this back for analysis
@@ -251,7 +286,7 @@ class TestPulseThread(Thread):
             }
         }
 
-        return self._manager.createTask(cmd)
+        return cmd
 
     def checkStop(self):
         if self._stop:
@@ -279,3 +314,49 @@ class TestPulseThread(Thread):
             newHolding = np.clip(newHolding, self._params['autoBiasMinCurrent'], self._params['autoBiasMaxCurrent'])
 
             self._clampDev.setHolding(mode, newHolding)
+
+
+class FastTestPulse(PatchClampTestPulse):
+    """Test pulse analysis that replaces the exponential fits of PatchClampTestPulse with direct
+    estimates from the recorded trace.
+
+    The fit region is split into three equal segments; for a single exponential decay with an
+    offset, the segment sums determine the offset, amplitude and time constant in closed form. All
+    other values are computed exactly as by PatchClampTestPulse. This is much cheaper than fitting,
+    at the cost of being more sensitive to noise and to multi-exponential decays. No fit traces are
+    available for display.
+    """
+    def two_pass_exp_fit(self, pulse):
+        fit_region = pulse.time_slice(pulse.t0 + 150e-6, None)
+        data = fit_region.data
+        if len(data) < 12:
+            raise LowConfidenceFitError("pulse too short")
+        dt = fit_region.dt
+        with np.errstate(invalid='ignore', divide='ignore'):
+            # First pass: take the offset from the end of the pulse, and q**3 from the ratio of the mean of
+            # the first three samples of the decay (A * (1 + q + q**2) / 3) to its sum (A / (1 - q)).
+            yoffset = data[-len(data) // 5:].mean()
+            decay = data - yoffset
+            first = decay[:3].mean()
+            q = np.cbrt(1 - 3 * first / decay.sum())
+            amp = first * 3 / (1 + q + q**2)
+            tau = -dt / np.log(q)
+
+            # Second pass, which also corrects the offset if the decay is not complete by the end of the pulse:
+            # for samples y[k] = A*q**k + C, the sums S0, S1, S2 over three consecutive segments of m samples
+            # satisfy (S2 - S1) / (S1 - S0) = q**m, and C = (S0*S2 - S1**2) / (m * (S0 + S2 - 2*S1)).
+            # Segments of about 1.5 tau keep the estimate from being dominated by noise after the decay.
+            m = len(data) // 3
+            if np.isfinite(tau):
+                m = int(np.clip(round(1.5 * tau / dt), 4, m))
+            s0, s1, s2 = data[:3 * m].reshape(3, m).sum(axis=1)
+            qm = (s2 - s1) / (s1 - s0)
+            if 0 < qm < 1:
+                q = qm ** (1 / m)
+                yoffset = (s0 * s2 - s1 ** 2) / (m * (s0 + s2 - 2 * s1))
+                amp = (s0 - m * yoffset) * (1 - q) / (1 - qm)
+                tau = -dt / np.log(q)
+        if not np.isfinite(tau) or tau <= dt or tau > fit_region.duration:
+            raise LowConfidenceFitError(tau)
+        y0 = yoffset + amp * np.exp((fit_region.t0 - pulse.t0) / tau)
+        return amp, tau, yoffset, y0
@@ -1,7 +1,7 @@
 from __future__ import print_function
 import scipy.optimize, scipy.ndimage
 import numpy as np
-from acq4.util.image_registration import iterativeImageTemplateMatch
+from acq4.util.image_registration import MultiTemplateMatcher
 import pyqtgraph as pg
 
 
@@ -89,30 +89,42 @@ class PipetteDetector(object):
 
 
 class TemplateMatchPipetteDetector(PipetteDetector):
+    """Detects the pipette tip by matching the image against every reference z-frame.
+
+    All frames are scored together by a MultiTemplateMatcher, which is built once per detector;
+    reuse the same detector to avoid recomputing the template pyramid and FFTs for every image.
+    """
     def __init__(self, reference):
         PipetteDetector.__init__(self, reference)
+        self._matcher = None
+
+    @property
+    def matcher(self):
+        if self._matcher is None:
+            self._matcher = MultiTemplateMatcher(self.filtered_ref)
+        return self._matcher
 
     def estimateOffset(self, img, show=False):
         reference = self.reference
 
         # run template match against all template frames
-        match = [iterativeImageTemplateMatch(img, t) for t in self.filtered_ref]
+        pos, vals = self.matcher.match(img)
 
         if show:
-            pg.plot([m[0][0] for m in match], title='x match vs z')
-            pg.plot([m[0][1] for m in match], title='y match vs z')
-            pg.plot([m[1] for m in match], title='match correlation vs z')
+            pg.plot(pos[:, 0], title='x match vs z')
+            pg.plot(pos[:, 1], title='y match vs z')
+            pg.plot(vals, title='match correlation vs z')
 
         # find frame with best match
-        maxInd = np.argmax([m[1] for m in match])
+        maxInd = np.argmax(vals)
 
         # estimate z error in meters from focal plane
         zErr = (maxInd - reference['centerInd']) * reference['zStep']
 
         # xy offset in pixels from image origin
-        xyOffset = match[maxInd][0]
+        xyOffset = pos[maxInd]
 
-        return xyOffset, zErr, match[maxInd][1]
+        return xyOffset, zErr, vals[maxInd]
 
     def filterImage(self, img):
         # Sobel should reduce background artifacts, but it also seems to increase the noise in the signal
@@ -32,6 +32,7 @@ class PipetteTracker(object):
                 self.reference = pickle.load(fh)
         except Exception:
             self.reference = {}
+        self._detector = None
 
     def takeFrame(self, imager=None):
         """Acquire one frame from an imaging device.
@@ -250,7 +251,7 @@ class PipetteTracker(object):
         minImgPos, maxImgPos, tipRelPos = self.getTipImageArea(frame, padding, pos=pos, tipLength=tipLength)
 
         # apply machine vision algorithm
-        detector = self.detectorClass(reference)
+        detector = self._getDetector(reference)
         tipPos, performance = detector.findPipette(frame, minImgPos, maxImgPos, pos, bg_frame)
 
         if performance < threshold:
@@ -279,6 +280,12 @@ class PipetteTracker(object):
                 "No reference frames found for this pipette / objective / filter combination: %s" % repr(key)
             )
 
+    def _getDetector(self, reference):
+        # reuse the detector (and its precomputed templates) until the reference changes
+        if self._detector is None or self._detector.reference is not reference:
+            self._detector = self.detectorClass(reference)
+        return self._detector
+
     def autoCalibrate(self, **kwds):
         """Automatically calibrate the pipette tip position using template matching on a single camera frame.
 
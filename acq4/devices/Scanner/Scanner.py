@@ -161,6 +161,21 @@ class Scanner(Device, OptomechDevice):
         #print "voltage:", x1, y1
         return [x1, y1]
         
+    def getMappingStateKey(self, laser, opticState=None):
+        """Return a hashable key that changes whenever the result of mapToScanner(x, y, *laser*) may change:
+        the optical state, the calibration in use, and the global transform of the parent device.
+        """
+        if opticState is None:
+            opticState = self.getDeviceStateKey()
+        with self.lock:
+            index = self.getCalibrationIndex()
+        cal = index.get(laser, {}).get(opticState, None)
+        params = None if cal is None else cal.get('params', None)
+        parent = self.parentDevice()
+        tr = None if parent is None else parent.globalTransform()
+        trKey = None if tr is None else tuple(tr.data())
+        return (laser, opticState, repr(params), trKey)
+
     def getCalibrationIndex(self):
         with self.lock:
             if self.calibrationIndex is None:
@@ -322,7 +337,11 @@ class ScannerTask(DeviceTask):
             self.cmd['yCommand'] = np.empty(len(laser), dtype=float)
             self.cmd['xCommand'][:] = x
             self.cmd['yCommand'][:] = y
-        
+        else:
+            ## command arrays may be shared with the task generator (ScanProgram caches them read-only); don't modify them
+            self.cmd['xCommand'] = np.array(self.cmd['xCommand'], dtype=float)
+            self.cmd['yCommand'] = np.array(self.cmd['yCommand'], dtype=float)
+
         ## Find all regions where the laser is activated, make sure the shutter opens 10ms before each
         shutter = np.zeros(len(laser), dtype=bool)
         dif = laser[1:] - laser[:-1]
@@ -1,5 +1,6 @@
 from __future__ import print_function
 from acq4.util import Qt
+import numpy as np
 import weakref
 
 
@@ -100,6 +101,17 @@ class ScanProgramComponent(object):
         """
         return self.scanMask()
 
+    def stateKey(self):
+        """Return a hashable object that changes whenever the arrays generated
+        by this component may change. ScanProgram uses this to cache generated
+        arrays.
+
+        By default, this is derived from saveState(). Subclasses whose output
+        depends on anything else (besides the program's sampling parameters
+        and the scanner calibration) must extend this method.
+        """
+        return hashableState(self.saveState())
+
     def saveState(self):
         """Return a serializable data structure representing the state of this 
         component.
@@ -121,3 +133,22 @@ class ScanProgramComponent(object):
         v = self.program().isVisible() and self.isActive()
         for item in self.graphicsItems():
             item.setVisible(v)
+
+
+def hashableState(state):
+    """Convert a state structure (nested dicts, lists, arrays, points) into an
+    equivalent hashable object.
+    """
+    if isinstance(state, dict):
+        return tuple((k, hashableState(v)) for k, v in state.items())
+    elif isinstance(state, (list, tuple)):
+        return tuple(hashableState(v) for v in state)
+    elif isinstance(state, np.ndarray):
+        return (state.dtype.str, state.shape, state.tobytes())
+    elif isinstance(state, Qt.QPointF):
+        return (state.x(), state.y())
+    try:
+        hash(state)
+        return state
+    except TypeError:
+        return repr(state)
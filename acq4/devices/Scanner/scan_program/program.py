@@ -57,6 +57,9 @@ class ScanProgram:
 
         self._visible = True  # whether graphics items should be displayed
 
+        self._cache = OrderedDict()  # recently generated arrays, keyed by program state (see _cacheKey)
+        self.maxCacheSize = 8
+
         self.preview = ScanProgramPreview(self)
         
     def addComponent(self, component):
@@ -164,54 +167,72 @@ class ScanProgram:
     def generateVoltageArray(self):
         """Generate an array of x,y voltage commands needed to drive the scanner
         for this program.
+
+        The returned array is cached and must not be modified (see generatePositionArray).
         """
         return self.generatePositionArray(_voltage=True)
 
     def generatePositionArray(self, _voltage=False):
         """Generate an array of x,y position values for this scan program.
+
+        Recently generated arrays are cached and returned again (read-only) as long as the
+        state of all active components and the sampling parameters are unchanged, and, for
+        voltage arrays, the scanner calibration, transform and resting voltage.
         """
-        arr = np.zeros((self.numSamples, 2))
+        key = self._cacheKey(_voltage)
+        arr = self._cache.get(key, None)
+        if arr is None:
+            arr = self._generatePositionArray(_voltage)
+            arr.setflags(write=False)
+            self._cacheArray(key, arr)
+        else:
+            self._cache.move_to_end(key)
+        return arr
+
+    def _generatePositionArray(self, voltage):
+        arr = np.zeros((int(self.numSamples), 2))
 
         # Generate command for each component
         for component in self.components:
             if not component.isActive():
                 continue
             
-            if _voltage:
+            if voltage:
                 component.generateVoltageArray(arr)
             else:
                 component.generatePositionArray(arr)
 
-        # Fill in gaps
-        mask = self.generateLaserMask().astype(np.byte)
-        dif = mask[1:] - mask[:-1]
-        on = list(np.argwhere(dif == 1)[:,0]+1)
-        off = list(np.argwhere(dif == -1)[:,0]+1)
-        if mask[-1] == 0:
-            on.append(len(mask))
-
-        if _voltage:
-            lastValue = np.array(self.scanner.getVoltage())
+        # Fill in gaps: wherever the laser is off, hold the last value from the preceding
+        # laser-on segment (or the initial value, before the first segment).
+        if voltage:
+            initValue = np.array(self.scanner.getVoltage())
         else:
-            lastValue = np.array([np.nan, np.nan])
-        lastOff = 0
-
-        while len(on) > 0 or len(off) > 0:
-            nextOn  = on[0]  if len(on)  > 0 else np.inf
-            nextOff = off[0] if len(off) > 0 else np.inf
-
-            if nextOn < nextOff:
-                on.pop(0)
-                arr[lastOff:nextOn] = lastValue
-            else:
-                off.pop(0)
-                lastOff = nextOff
-                lastValue = arr[nextOff-1]
-            
+            initValue = np.array([np.nan, np.nan])
+        mask = self._generateLaserMask()
+        lastOn = np.maximum.accumulate(np.where(mask, np.arange(len(mask)), -1))
+        gaps = np.argwhere(~mask)[:, 0]
+        src = lastOn[gaps]
+        arr[gaps[src >= 0]] = arr[src[src >= 0]]
+        arr[gaps[src < 0]] = initValue
         return arr
     
     def generateLaserMask(self):
-        mask = np.zeros(self.numSamples, dtype=bool)
+        """Return a boolean array that is True wherever any active component drives the scan mirrors.
+
+        The returned array is cached and must not be modified (see generatePositionArray).
+        """
+        key = self._cacheKey(voltage=None)
+        mask = self._cache.get(key, None)
+        if mask is None:
+            mask = self._generateLaserMask()
+            mask.setflags(write=False)
+            self._cacheArray(key, mask)
+        else:
+            self._cache.move_to_end(key)
+        return mask
+
+    def _generateLaserMask(self):
+        mask = np.zeros(int(self.numSamples), dtype=bool)
         for component in self.components:
             if not component.isActive():
                 continue
@@ -219,6 +240,31 @@ class ScanProgram:
 
         return mask
 
+    def _cacheKey(self, voltage):
+        # Everything the generated arrays depend on. *voltage* is True for voltage arrays,
+        # False for position arrays, and None for the laser mask.
+        active = [c for c in self.components if c.isActive()]
+        key = [voltage, self.sampleRate, self.numSamples, self.downsample]
+        key.extend((c.type, c.stateKey()) for c in active)
+        if voltage:
+            key.append(tuple(self.scanner.getVoltage()))
+            lasers = set(None if c.laser is None else c.laser.name() for c in active)
+            key.extend(self.scanner.getMappingStateKey(laser) for laser in sorted(lasers, key=str))
+        return tuple(key)
+
+    def _cacheArray(self, key, arr):
+        self._cache[key] = arr
+        while len(self._cache) > self.maxCacheSize:
+            self._cache.popitem(last=False)
+
+    def clearCache(self):
+        """Discard all cached arrays.
+
+        This is only necessary if a component's output changes in a way that is not
+        reflected by its stateKey().
+        """
+        self._cache.clear()
+
     def close(self):
         self.clearGraphicsItems()
 
@@ -10,7 +10,7 @@ import pyqtgraph as pg
 from acq4.util import Qt
 import pyqtgraph.parametertree.parameterTypes as pTypes
 from pyqtgraph.parametertree import Parameter, ParameterTree, ParameterItem, registerParameterType, ParameterSystem, SystemSolver
-from .component import ScanProgramComponent
+from .component import ScanProgramComponent, hashableState
 
 
 
@@ -72,6 +72,16 @@ class RectScanComponent(ScanProgramComponent):
     
     def restoreState(self, state):
         self.ctrl.restoreState(state)
+
+    def stateKey(self):
+        # The scan system stores the values it solves for (for example, while generating arrays),
+        # so only the values that are fixed by the user determine the generated arrays.
+        state = self.saveState()
+        state['scanInfo'] = OrderedDict(
+            (name, (value if constraint == 'fixed' else None, constraint))
+            for name, (value, constraint) in state['scanInfo'].items()
+        )
+        return hashableState(state)
         
 
 class RectScanROI(pg.ROI):
@@ -414,6 +424,28 @@ class RectScan(SystemSolver):
         is True, then the offset may shift the image by a fraction of a pixel 
         using linear interpolation.
         """
+        forward, reverse = self.extractFields(data, offset=offset, subpixel=subpixel)
+        if reverse is None:
+            return forward
+
+        # assemble both fields into a new image in a single pass
+        shape = (forward.shape[0], forward.shape[1] + reverse.shape[1]) + forward.shape[2:]
+        image = np.empty(shape, dtype=np.result_type(forward, reverse))
+        image[:, 0::2] = forward
+        image[:, 1::2] = reverse
+        return image
+
+    def extractFields(self, data, offset=0.0, subpixel=False):
+        """Return the forward and reverse fields of a bidirectional scan as
+        arrays of shape (frames, rows, width).
+
+        The reverse field contains the odd-numbered rows of the image, already
+        flipped to run in the same direction as the forward field. Unless
+        subpixel interpolation is required, both fields are views of *data*
+        and no image data is copied. For unidirectional scans, the full image
+        (as a view) is returned in place of the forward field and the reverse
+        field is None. Arguments are the same as for extractImage().
+        """
         offset = self.imageOffset + offset * self.sampleRate / self.downsample
         intOffset = int(np.floor(offset))
         fracOffset = offset - intOffset
@@ -421,24 +453,26 @@ class RectScan(SystemSolver):
         shape = self.imageShape
         stride = self.imageStride
 
+        image = pg.subArray(data, intOffset, shape, stride)
         if subpixel and fracOffset != 0:
-            print(fracOffset)
-            interp = data[:-1] * (1.0 - fracOffset) + data[1:] * fracOffset
-            image = pg.subArray(interp, intOffset, shape, stride)            
-        else:
-            image = pg.subArray(data, intOffset, shape, stride)
-
-        if self.bidirectional:
-            image = image.copy()
-            image[:, 1::2] = image[:, 1::2, ::-1]
+            # interpolate only the samples that make up the image
+            image = image * (1.0 - fracOffset) + pg.subArray(data, intOffset + 1, shape, stride) * fracOffset
 
-        return image
+        if not self.bidirectional:
+            return image, None
+        return image[:, 0::2], image[:, 1::2, ::-1]
 
-    def measureMirrorLag(self, data, subpixel=False, minOffset=0., maxOffset=500e-6):
+    def measureMirrorLag(self, data, subpixel=False, minOffset=0., maxOffset=500e-6, method='fft'):
         """Estimate the mirror lag in a bidirectional raster scan.
 
         The *data* argument is a photodetector recording array.
         The return value can be used as the *offset* argument to extractImage().
+
+        With method='fft' (the default), the lag is found in a single pass by
+        cross-correlating adjacent forward and reverse rows (see
+        _rowPairLag). With method='exhaustive', an image is extracted and
+        compared for every candidate offset; this is much slower and is kept
+        as a reference.
         """
         if not self.bidirectional:
             raise Exception("Mirror lag can only be measured for bidirectional scans.")
@@ -448,6 +482,11 @@ class RectScan(SystemSolver):
         pxTime = self.downsample / self.sampleRate
         maxOffset = min(maxOffset, rowTime * 0.6)
 
+        if method == 'fft':
+            return self._rowPairLag(data, minOffset / pxTime, maxOffset / pxTime, subpixel) * pxTime
+        elif method != 'exhaustive':
+            raise ValueError("Unknown mirror lag method %r" % method)
+
         # see whether we need to pad the data
         stride = self.imageStride
         shape = self.imageShape
@@ -455,7 +494,7 @@ class RectScan(SystemSolver):
         minSize = stride[0] * shape[0] + offset
         if data.shape[0] < minSize:
             appendShape = list(data.shape)
-            appendShape[0] = 1 + minSize - data.shape[0]
+            appendShape[0] = 1 + int(np.ceil(minSize)) - data.shape[0]
             data = np.concatenate([data, np.zeros(appendShape, dtype=data.dtype)], axis=0)
 
         # find optimal shift by pixel
@@ -465,15 +504,85 @@ class RectScan(SystemSolver):
         # Refine optimal shift by subpixel
         if subpixel:
             # Refine the estimate in two stages
+            searchMin = minOffset
             for i in range(2):
                 w = offsets[1] - offsets[0]
-                minOffset = bestOffset - (w/2)
+                minOffset = max(searchMin, bestOffset - (w/2))
                 maxOffset = bestOffset + (w/2)
                 offsets = np.linspace(minOffset, maxOffset, 5)
                 bestOffset = self._findBestOffset(data, offsets, subpixel=True)
 
         return bestOffset
 
+    def _rowPairLag(self, data, minLag, maxLag, subpixel):
+        # Return the offset (in image pixels) that best aligns the forward and
+        # reverse rows of a bidirectional scan.
+        #
+        # For each row we take a window that extends the image row by *margin*
+        # pixels on both sides. Shifting the extraction offset by one pixel moves
+        # forward rows one pixel left and (flipped) reverse rows one pixel right,
+        # so if forward row F and flipped reverse row R are related by
+        # F[k] = R[k - s], the optimal offset is s / 2. The cross-correlations of
+        # all adjacent row pairs are summed in the frequency domain so that only
+        # one inverse FFT is needed.
+        margin = int(np.ceil(max(abs(minLag), abs(maxLag)))) + 2
+        nFrames, nRows, nCols = self.imageShape
+        width = nCols + 2 * margin
+        stride = self.imageStride
+        start = self.imageOffset - margin
+
+        # pad the data if the windows extend past either end of the recording
+        data = np.asarray(data)
+        stop = start + stride[0] * (nFrames - 1) + stride[1] * (nRows - 1) + width
+        before = max(0, -start)
+        after = max(0, stop - data.shape[0])
+        if before > 0 or after > 0:
+            pad = [(before, after)] + [(0, 0)] * (data.ndim - 1)
+            data = np.pad(data, pad)
+            start += before
+
+        # average rows over frames (and any extra data axes)
+        rows = pg.subArray(data, start, (nFrames, nRows, width), stride)
+        rows = rows.reshape(nFrames, nRows, width, -1).mean(axis=(0, 3))
+        rows = rows - rows.mean(axis=1, keepdims=True)
+
+        nPairs = nRows // 2
+        if nPairs == 0:
+            raise Exception("Mirror lag measurement requires at least two image rows.")
+        nfft = 2 * width
+        fwd = np.fft.rfft(rows[0::2], n=nfft, axis=1)
+        rev = np.conj(np.fft.rfft(rows[1::2, ::-1], n=nfft, axis=1))
+        cross = (fwd[:nPairs] * rev[:nPairs]).sum(axis=0)
+        nNext = min(len(fwd) - 1, nPairs)
+        if nNext > 0:
+            cross += (fwd[1:nNext+1] * rev[:nNext]).sum(axis=0)
+        corr = np.fft.irfft(cross, n=nfft)
+
+        def corrAt(s):
+            # linearly interpolated correlation at (fractional) shift s
+            s0 = np.floor(s).astype(int)
+            f = s - s0
+            return corr[s0 % nfft] * (1 - f) + corr[(s0 + 1) % nfft] * f
+
+        if not subpixel:
+            # search the same grid of offsets as the exhaustive method
+            lags = np.arange(minLag, maxLag, 1.0)
+            if len(lags) == 0:
+                return minLag
+            return lags[np.argmax(corrAt(2 * lags))]
+
+        shifts = np.arange(int(np.ceil(2 * minLag)), int(np.floor(2 * maxLag)) + 1)
+        if len(shifts) == 0:
+            return minLag
+        i = np.argmax(corr[shifts % nfft])
+        s = float(shifts[i])
+        # refine with a parabola through the peak and its neighbors
+        y0, y1, y2 = corr[(shifts[i] + np.array([-1, 0, 1])) % nfft]
+        denom = y0 - 2 * y1 + y2
+        if denom < 0:
+            s += np.clip(0.5 * (y0 - y2) / denom, -0.5, 0.5)
+        return float(np.clip(s / 2., minLag, maxLag))
+
     def _findBestOffset(self, data, offsets, subpixel):
         # Try generating image using each item from a list of offsets. 
         # Return the offset that produced the least error between fields.
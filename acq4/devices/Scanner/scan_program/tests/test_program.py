@@ -0,0 +1,119 @@
+import numpy as np
+import pyqtgraph as pg
+
+from acq4.devices.Scanner.scan_program import ScanProgram
+
+app = pg.mkQApp()
+
+
+def loopGapFill(arr, mask, initValue):
+    # the gap-filling loop previously used by ScanProgram.generatePositionArray
+    arr = arr.copy()
+    mask = mask.astype(np.byte)
+    dif = mask[1:] - mask[:-1]
+    on = list(np.argwhere(dif == 1)[:, 0] + 1)
+    off = list(np.argwhere(dif == -1)[:, 0] + 1)
+    if mask[-1] == 0:
+        on.append(len(mask))
+    lastValue = initValue
+    lastOff = 0
+    while len(on) > 0 or len(off) > 0:
+        nextOn = on[0] if len(on) > 0 else np.inf
+        nextOff = off[0] if len(off) > 0 else np.inf
+        if nextOn < nextOff:
+            on.pop(0)
+            arr[lastOff:nextOn] = lastValue
+        else:
+            off.pop(0)
+            lastOff = nextOff
+            lastValue = arr[nextOff - 1]
+    return arr
+
+
+def makeProgram():
+    # spiral ROIs must be in a view to map their positions
+    view = pg.ViewBox()
+    prog = ScanProgram()
+    prog.setSampling(rate=100e3, samples=2000, downsample=1)
+    s1 = prog.addComponent('spiral')
+    s1.ctrl.params['startTime'] = 1e-3
+    s1.ctrl.params['duration'] = 2e-3
+    s2 = prog.addComponent('spiral')
+    s2.ctrl.params['startTime'] = 12e-3
+    s2.ctrl.params['duration'] = 3e-3
+    s2.ctrl.roi.setPos([20e-6, 5e-6])
+    for s in (s1, s2):
+        view.addItem(s.ctrl.roi)
+    prog.view = view
+    return prog, s1, s2
+
+
+def test_gap_fill():
+    prog, s1, s2 = makeProgram()
+    arr = prog.generatePositionArray()
+    mask = prog.generateLaserMask()
+    assert mask.sum() == 500
+
+    raw = np.zeros((2000, 2))
+    s1.generatePositionArray(raw)
+    s2.generatePositionArray(raw)
+    expected = loopGapFill(raw, mask, np.array([np.nan, np.nan]))
+    assert np.array_equal(arr, expected, equal_nan=True)
+    assert np.all(np.isnan(arr[:100]))
+    assert np.all(arr[300:1200] == arr[299])
+    assert np.all(arr[1500:] == arr[1499])
+
+
+def test_cache():
+    prog, s1, s2 = makeProgram()
+    arr = prog.generatePositionArray()
+    mask = prog.generateLaserMask()
+    assert prog.generatePositionArray() is arr
+    assert prog.generateLaserMask() is mask
+    assert not arr.flags.writeable
+
+    # changing component state regenerates
+    s2.ctrl.params['radius'] = 15e-6
+    arr2 = prog.generatePositionArray()
+    assert arr2 is not arr
+    assert not np.array_equal(arr2[1200:1500], arr[1200:1500])
+    assert np.array_equal(prog.generateLaserMask(), mask)
+
+    # changing back returns the previously generated array
+    s2.ctrl.params['radius'] = 10e-6
+    assert prog.generatePositionArray() is arr
+
+    # deactivating a component or changing sampling regenerates
+    s1.ctrl.params.setValue(False)
+    assert prog.generateLaserMask().sum() == 300
+    prog.setSampling(rate=100e3, samples=3000, downsample=1)
+    assert prog.generatePositionArray().shape == (3000, 2)
+
+
+def test_rect_cache():
+    view = pg.ViewBox()
+    prog = ScanProgram()
+    prog.setSampling(rate=1e6, samples=100000, downsample=1)
+    rect = prog.addComponent('rect')
+    view.addItem(rect.ctrl.roi)
+    prog.view = view
+    rect.ctrl.roi.setSize([20e-6, 10e-6])
+    rect.ctrl.roiChanged()
+    rect.ctrl.params['imageRows'] = 50
+    rect.ctrl.params['imageCols'] = 50
+    for name in ['imageRows', 'imageCols']:
+        rect.ctrl.params.child(name, 'fixed').setValue(True)
+
+    # solving the scan while generating does not change the cache key
+    key = prog._cacheKey(False)
+    arr = prog.generatePositionArray()
+    assert prog._cacheKey(False) == key
+    assert prog.generatePositionArray() is arr
+    assert len(prog._cache) == 1
+
+    rect.ctrl.params['imageRows'] = 40
+    mask = prog.generateLaserMask()
+    assert prog.generatePositionArray() is not arr
+    rect.ctrl.params['imageRows'] = 50
+    assert prog.generatePositionArray() is arr
+    assert prog.generateLaserMask().sum() > mask.sum()
@@ -1,12 +1,17 @@
 from __future__ import print_function
 from __future__ import division
 import numpy as np
+import pytest
 
 from acq4.devices.Scanner.scan_program.rect import RectScan, RectScanParameter
 from pyqtgraph.parametertree import ParameterTree
 import pyqtgraph as pg
 
 
+@pytest.fixture
+def qapp():
+    return pg.mkQApp()
+
 
 def assertState(rs, state):
     #print "=== assert state:"
@@ -177,7 +182,7 @@ def test_RectScan():
     state = dict([(n,v[0]) for n,v in state.items()])
     assertState(rs, state)
 
-def test_RectScanParameter():
+def test_RectScanParameter(qapp):
     p = RectScanParameter()
     p.system.defaultState['sampleRate'][0] = 1e4
     p.system.defaultState['sampleRate'][2] = 'fixed'
@@ -195,11 +200,63 @@ def test_RectScanParameter():
     w.setParameters(p)
     w.show()
     return p, w
-    
+
+
+def simulateRecording(rs, lag, noise=0.1, seed=0):
+    """Return a downsampled photodetector recording of a test pattern scanned
+    by *rs*, delayed by *lag* seconds and with added gaussian noise."""
+    n = int(rs.totalDuration * rs.sampleRate)
+    n -= n % rs.downsample
+    pos = np.zeros((n, 2))
+    rs.writeArray(pos)
+    # periodic texture plus a few blobs (coordinates in um)
+    x, y = pos.T * 1e6
+    img = 0.5 * np.sin(x / 3.) * np.cos(y / 5.)
+    for cx, cy, r in [(40, 60, 7), (70, 25, 4), (20, 30, 10)]:
+        img += np.exp(-((x - cx)**2 + (y - cy)**2) / (2 * r**2))
+    t = np.arange(n)
+    signal = np.interp(t - lag * rs.sampleRate, t, img)
+    signal += np.random.RandomState(seed).normal(scale=noise, size=n)
+    return signal.reshape(-1, rs.downsample).mean(axis=1)
+
+
+def test_mirrorLag():
+    rs = RectScan()
+    rs.p0 = (0, 0)
+    rs.p1 = (100e-6, 0)
+    rs.p2 = (0, 100e-6)
+    rs.sampleRate = 1e6
+    rs.downsample = 2
+    rs.frameDuration = 0.05
+    rs.minOverscan = 0.0
+    rs.pixelAspectRatio = 1.0
+    rs.numFrames = 2
+    rs.interFrameDuration = 0.
+    rs.startTime = 0.
+    rs.bidirectional = True
+    pxTime = rs.downsample / rs.sampleRate
+    for lag in [0, 13.4e-6, 61.7e-6]:
+        data = simulateRecording(rs, lag)
+        est = rs.measureMirrorLag(data, subpixel=True)
+        assert abs(est - lag) < 0.25 * pxTime
+        est = rs.measureMirrorLag(data)
+        assert abs(est - lag) <= pxTime
+        assert est == rs.measureMirrorLag(data, method='exhaustive')
+
+    # zero-copy fields match the extracted image
+    data = np.concatenate([data, np.zeros(10)])
+    image = rs.extractImage(data, offset=2 * pxTime)
+    fwd, rev = rs.extractFields(data, offset=2 * pxTime)
+    assert np.shares_memory(fwd, data) and np.shares_memory(rev, data)
+    assert np.all(image[:, 0::2] == fwd)
+    assert np.all(image[:, 1::2] == rev)
+    assert np.all(image[0, 1] == data[rs.imageOffset + 2 + rs.imageStride[1]:][:rs.imageShape[2]][::-1])
+
+
 if __name__ == '__main__':
     import user
     test_RectScan()
-    p, w = test_RectScanParameter()
+    p, w = test_RectScanParameter(pg.mkQApp())
     w.resize(300, 700)
     plt = pg.plot()
     def update():
@@ -222,4 +279,3 @@ if __name__ == '__main__':
         except RuntimeError:
             pass
     p.sigTreeStateChanged.connect(update)
-
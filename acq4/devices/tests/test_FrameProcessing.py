@@ -0,0 +1,136 @@
+import threading
+import time
+
+import pyqtgraph as pg
+
+from acq4.devices.Camera.Camera import FrameProcessingThread
+from acq4.util import Qt
+
+app = pg.mkQApp()
+
+
+class Recorder:
+    """Frame processors implemented as bound methods, like Camera.addFrameInfo."""
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.lock = threading.Lock()
+        self.events = []  # (name, frame, 'start'|'end')
+        self.active = 0
+        self.maxActive = 0
+
+    def _run(self, name, frame):
+        with self.lock:
+            self.events.append((name, frame, 'start'))
+        time.sleep(self.delay)
+        with self.lock:
+            self.events.append((name, frame, 'end'))
+
+    def a(self, frame):
+        self._run('a', frame)
+
+    def b(self, frame):
+        self._run('b', frame)
+
+    def c(self, frame):
+        self._run('c', frame)
+
+    def fail(self, frame):
+        self._run('fail', frame)
+        raise ValueError("processing error")
+
+    def index(self, name, frame, kind):
+        return self.events.index((name, frame, kind))
+
+
+def runFrames(thread, frames, timeout=10):
+    done = []
+    thread.sigFrameFullyProcessed.connect(done.append, Qt.Qt.DirectConnection)
+    thread.start()
+    try:
+        for frame in frames:
+            thread.handleNewRawFrame(frame)
+        start = time.time()
+        while len(done) < len(frames):
+            assert time.time() - start < timeout, "timed out waiting for frames"
+            time.sleep(0.01)
+    finally:
+        thread.stop()
+        thread.wait()
+    return done
+
+
+def test_explicit_dependencies():
+    rec = Recorder(delay=0.01)
+    thread = FrameProcessingThread()
+    # bound methods are new objects on every attribute access; dependencies must still match
+    thread.addFrameProcessor(rec.a, dependsOn=[])
+    thread.addFrameProcessor(rec.b, dependsOn=[])
+    thread.addFrameProcessor(rec.c, dependsOn=[rec.a, rec.b])
+    done = runFrames(thread, list(range(5)))
+    assert sorted(done) == list(range(5))
+    for frame in range(5):
+        cStart = rec.index('c', frame, 'start')
+        assert rec.index('a', frame, 'end') < cStart
+        assert rec.index('b', frame, 'end') < cStart
+
+
+def test_default_order_and_final():
+    rec = Recorder()
+    thread = FrameProcessingThread()
+    thread.addFrameProcessor(rec.c, final=True)
+    thread.addFrameProcessor(rec.a)
+    thread.addFrameProcessor(rec.b)
+    done = runFrames(thread, list(range(10)))
+    # without dropping, frames are emitted in order
+    assert done == list(range(10))
+    for frame in range(10):
+        assert rec.index('a', frame, 'end') < rec.index('b', frame, 'start')
+        assert rec.index('b', frame, 'end') < rec.index('c', frame, 'start')
+    # each processor sees frames in order
+    for name in 'abc':
+        assert [f for n, f, kind in rec.events if n == name and kind == 'start'] == list(range(10))
+
+
+def test_processor_error():
+    rec = Recorder()
+    thread = FrameProcessingThread()
+    thread.addFrameProcessor(rec.fail)
+    thread.addFrameProcessor(rec.a)
+    done = runFrames(thread, list(range(3)))
+    assert done == [0, 1, 2]
+    # an error in one processor does not prevent the others from running
+    assert [f for n, f, kind in rec.events if n == 'a' and kind == 'end'] == [0, 1, 2]
+    stats = thread.processorStats()
+    failStats = next(v for k, v in stats.items() if k.endswith('fail'))
+    assert failStats['errors'] == 3
+    assert failStats['processed'] == 3
+
+
+def test_add_remove_while_running():
+    rec = Recorder(delay=0.002)
+    thread = FrameProcessingThread()
+    thread.addFrameProcessor(rec.a)
+    done = []
+    thread.sigFrameFullyProcessed.connect(done.append, Qt.Qt.DirectConnection)
+    thread.start()
+    try:
+        for i in range(60):
+            thread.handleNewRawFrame(i)
+            if i == 20:
+                thread.addFrameProcessor(rec.b, dependsOn=[rec.a])
+            elif i == 40:
+                thread.removeFrameProcessor(rec.a)
+            time.sleep(0.001)
+        start = time.time()
+        while len(done) < 60:
+            assert time.time() - start < 10, "timed out waiting for frames"
+            time.sleep(0.01)
+    finally:
+        thread.stop()
+        thread.wait()
+    assert sorted(done) == list(range(60))
+    aFrames = [f for n, f, kind in rec.events if n == 'a' and kind == 'end']
+    bFrames = [f for n, f, kind in rec.events if n == 'b' and kind == 'end']
+    assert aFrames[:20] == list(range(20))
+    assert len(bFrames) > 0 and min(bFrames) >= 20
+    assert 59 not in aFrames and 59 in bFrames
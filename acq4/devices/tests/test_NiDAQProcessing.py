@@ -0,0 +1,60 @@
+import numpy as np
+import scipy.signal
+
+from acq4.devices.NiDAQ import processing
+
+
+def test_lowpass_batched_matches_single_channel():
+    data = np.random.normal(size=(4, 5000))
+    batched = processing.lowpass(data, 1e3, samplerate=20e3)
+    for i in range(data.shape[0]):
+        single = processing.lowpass(data[i], 1e3, samplerate=20e3)
+        assert np.allclose(batched[i], single)
+    # input is not modified unless requested
+    assert not np.shares_memory(batched, data)
+
+
+def test_lowpass_chunked_matches_unchunked():
+    data = np.random.normal(size=(3, 10007))
+    for bidir in (True, False):
+        for filt in ('bessel', 'butterworth'):
+            full = processing.lowpass(data, 2e3, bidir=bidir, filter=filt, samplerate=20e3)
+            chunked = processing.lowpass(data, 2e3, bidir=bidir, filter=filt, samplerate=20e3, chunkSize=1000)
+            assert np.allclose(full, chunked)
+
+    sos = np.array(processing.filterDesign('bessel', 0.2, 4))
+    assert np.allclose(processing.lowpass(data, 0.2), scipy.signal.sosfiltfilt(sos, data))
+
+
+def test_lowpass_short_recordings():
+    sos = np.array(processing.filterDesign('bessel', 0.1, 4))
+    for n in (0, 1, 2):
+        data = np.random.normal(size=(2, n))
+        for bidir in (True, False):
+            out = processing.lowpass(data, 0.1, bidir=bidir)
+            assert out.shape == data.shape
+            assert np.all(np.isfinite(out))
+        if n > 0:
+            padlen = processing._padLen(sos, n)
+            assert np.allclose(processing.lowpass(data, 0.1), scipy.signal.sosfiltfilt(sos, data, padlen=padlen))
+    # a constant signal passes unchanged
+    assert np.allclose(processing.lowpass(np.ones(1), 0.1), 1)
+
+
+def test_lowpass_in_place_float32():
+    data = np.random.normal(size=(2, 3000)).astype(np.float32)
+    result = processing.lowpass(data, 1e3, samplerate=20e3, inPlace=True)
+    assert result is data
+    assert result.dtype == np.float32
+
+
+def test_mean_resample_and_denoise():
+    data = np.arange(2 * 103, dtype=float).reshape(2, 103)
+    ds = processing.meanResample(data, 10)
+    assert ds.shape == (2, 10)
+    assert np.allclose(ds[1], data[1, :100].reshape(10, 10).mean(axis=1))
+
+    data = np.zeros((2, 100))
+    data[1, 50] = 100
+    out = processing.denoise(data)
+    assert out[1, 50] == 0
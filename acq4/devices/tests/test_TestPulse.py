@@ -0,0 +1,56 @@
+import numpy as np
+import pytest
+from neuroanalysis.data import TSeries, PatchClampRecording
+from neuroanalysis.stimuli import SquarePulse
+from neuroanalysis.test_pulse import PatchClampTestPulse
+
+from acq4.devices.PatchClamp.testpulse import FastTestPulse
+
+analysisKeys = ['steady_state_resistance', 'input_resistance', 'access_resistance', 'capacitance', 'time_constant']
+
+
+def mockVCPulse(rAccess, rInput, cSoma, noise=0, seed=0, amp=-10e-3, dt=10e-6, pre=5e-3, dur=10e-3, post=5e-3):
+    """Voltage clamp test pulse recorded from a single-compartment cell through an access resistance."""
+    n = int(round((pre + dur + post) / dt))
+    t = np.arange(n) * dt
+    start, stop = int(round(pre / dt)), int(round((pre + dur) / dt))
+    tau = rAccess * rInput * cSoma / (rAccess + rInput)
+    transient = amp / rAccess - amp / (rAccess + rInput)
+
+    cmd = np.zeros(n)
+    cmd[start:stop] = amp
+    current = np.zeros(n)
+    current[start:stop] = amp / (rAccess + rInput) + transient * np.exp(-(t[start:stop] - t[start]) / tau)
+    current[stop:] = -transient * np.exp(-(t[stop:] - t[stop]) / tau)
+    current += np.random.RandomState(seed).normal(scale=noise, size=n)
+
+    pri = TSeries(channel_id='primary', data=current, dt=dt, units='A')
+    cmd = TSeries(channel_id='command', data=cmd, dt=dt, units='V')
+    rec = PatchClampRecording(
+        channels={'primary': pri, 'command': cmd},
+        clamp_mode='vc',
+        holding_potential=-65e-3,
+        device_type='patch clamp amplifier',
+        device_id='clamp',
+        start_time=0,
+    )
+    pri.recording = rec
+    cmd.recording = rec
+    stimulus = SquarePulse(start_time=pre, duration=dur, amplitude=amp, units='V')
+    stimulus.description = 'test pulse'
+    return rec, stimulus
+
+
+@pytest.mark.parametrize('rAccess, rInput, cSoma', [
+    (5e6, 100e6, 50e-12),
+    (10e6, 200e6, 100e-12),
+    (15e6, 500e6, 200e-12),  # decay not complete by the end of the pulse
+])
+@pytest.mark.parametrize('noise, rtol', [(0, 1e-4), (2e-12, 0.02), (5e-12, 0.05)])
+def test_fast_matches_fit(rAccess, rInput, cSoma, noise, rtol):
+    for seed in range(3):
+        rec, stimulus = mockVCPulse(rAccess, rInput, cSoma, noise=noise, seed=seed)
+        full = PatchClampTestPulse(rec, stimulus=stimulus).analysis
+        fast = FastTestPulse(rec, stimulus=stimulus).analysis
+        for k in analysisKeys:
+            assert fast[k] == pytest.approx(full[k], rel=rtol), k
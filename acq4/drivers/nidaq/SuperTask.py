@@ -128,6 +128,7 @@ class SuperTask:
             self.channelInfo[chan]["clipped"] = False
 
         key = self.getTaskKey(chan)
+        self.taskInfo[key]["cache"] = None
         self.taskInfo[key]["dataWritten"] = False
 
         # if info is not None:
@@ -275,6 +276,14 @@ class SuperTask:
                 return False
         return True
 
+    def waitUntilDone(self, timeout):
+        """Block until all tasks are done or *timeout* seconds have elapsed. Return True if all tasks are done."""
+        stop = ptime.time() + timeout
+        for t in self.tasks.values():
+            if not t.waitUntilDone(max(0.0, stop - ptime.time())):
+                return False
+        return True
+
     def read(self):
         data = {}
         for t in self.tasks:
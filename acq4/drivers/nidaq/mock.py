@@ -157,6 +157,11 @@ class MockNIDAQ:
         if diff > 0:
             time.sleep(diff)
 
+    def waitClock(self, clock, timeout):
+        start, dur = self.clocks[clock]
+        time.sleep(max(0, min(timeout, (start + dur) - time.time())))
+        return self.checkClock(clock)
+
     def checkClock(self, clock):
         now = time.time()
         start, dur = self.clocks[clock]
@@ -260,6 +265,9 @@ class Task:
         else:
             return self.nd.checkClock(self.clock)
 
+    def waitUntilDone(self, timeout):
+        return self.nd.waitClock(self.nativeClock if self.clock is None else self.clock, timeout)
+
     def GetTaskNumChans(self):
         return len(self.chans)
 
@@ -266,6 +266,15 @@ class Task:
     def isDone(self):
         return self.IsTaskDone()
 
+    def waitUntilDone(self, timeout):
+        """Block until the task is done or *timeout* seconds have elapsed. Return True if the task is done."""
+        try:
+            self.WaitUntilTaskDone(timeout)
+        except Exception:
+            # DAQmx reports a timeout (or a task stopped from another thread) as an error
+            pass
+        return self.isDone()
+
     def read(self, samples=None, timeout=10.0, dtype=None):
         # reqSamps = samples
         # if samples is None:
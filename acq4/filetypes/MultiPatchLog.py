@@ -1,5 +1,7 @@
 import json
+import os
 import re
+import warnings
 from typing import Any
 
 import numpy as np
@@ -178,73 +180,132 @@ class IrregularTimeSeries(object):
         return len(self.events)
 
 
+def possible_uses_for_type(event_type: str) -> list[str]:
+    uses = ['event']
+    if event_type in {'pipette_transform_changed', 'move_start', 'move_stop'}:
+        uses.append('position')
+    if event_type in {'pressure_changed'}:
+        uses.append('pressure')
+    if event_type in {'state_change', 'state_event'}:
+        uses.append('state')
+    if event_type in {'auto_bias_change'}:
+        uses.append('auto_bias_change')
+    if event_type in {'target_changed'}:
+        uses.append('target')
+    # currently ignored:
+    # if event_type in {'move_requested'}:
+    #     uses.append('move_request')
+    if event_type in {'test_pulse'}:
+        uses.append('test_pulse')
+    return uses
+
+
 class MultiPatchLogData(object):
-    def __init__(self, filename=None):
+    """Per-device, per-use columnar arrays parsed from a MultiPatch log.
+
+    The log is parsed one line at a time into compact arrays (no per-event dicts are kept), which
+    are then cached in a hidden file next to the log (see cacheFileName()). The cache is reused as
+    long as the log's size and modification time are unchanged, so reopening a log does not
+    require parsing its JSON again.
+
+    ``data[dev][use]`` gives the array for one device and use ('event', 'position', 'pressure',
+    'state', 'auto_bias_change', 'target' or 'test_pulse'); events are sorted by time. Use
+    timeSlice() to select the events within a time range.
+    """
+    CACHE_VERSION = 1
+    bool_fields = ('clean', 'broken', 'active', 'enabled')
+
+    def __init__(self, filename=None, useCache=True):
         self._filename = filename
         self._devices = {}
         self._minTime = None
         self._maxTime = None
 
         if filename is not None:
-            self.process(filename)
+            if not useCache or not self._readCache(filename):
+                self.process(filename)
+                if useCache:
+                    self._writeCache(filename)
 
-    def process(self, filename) -> None:
-        def possible_uses_for_type(event_type: str) -> list[str]:
-            uses = ['event']
-            if event_type in {'pipette_transform_changed', 'move_start', 'move_stop'}:
-                uses.append('position')
-            if event_type in {'pressure_changed'}:
-                uses.append('pressure')
-            if event_type in {'state_change', 'state_event'}:
-                uses.append('state')
-            if event_type in {'auto_bias_change'}:
-                uses.append('auto_bias_change')
-            if event_type in {'target_changed'}:
-                uses.append('target')
-            # currently ignored:
-            # if event_type in {'move_requested'}:
-            #     uses.append('move_request')
-            if event_type in {'test_pulse'}:
-                uses.append('test_pulse')
-            return uses
+    @staticmethod
+    def cacheFileName(filename: str) -> str:
+        dirName, baseName = os.path.split(filename)
+        return os.path.join(dirName, f".{baseName}.cache")
 
+    def process(self, filename) -> None:
+        rows_by_dev_and_use: dict[str, dict[str, list]] = {}
+        min_time = max_time = None
+        bad_line = None
         with open(filename, 'rb') as fh:
-            events: list[dict[str, Any]] = [json.loads(line.rstrip(b',\r\n')) for line in fh]
-
-            events_by_dev_and_use = {}
-            bool_fields = ('clean', 'broken', 'active', 'enabled')
-            for ev in events:
-                is_true = [ev[f] for f in bool_fields if f in ev]
-                ev["is_true"] = not is_true or any(is_true)  # empty should mean True
-                for use in possible_uses_for_type(ev['event']):
-                    events_by_dev_and_use.setdefault(ev['device'], {}).setdefault(use, [])
-                    events_by_dev_and_use[ev['device']][use].append(ev)
-            for dev in events_by_dev_and_use:
-                self._devices[dev] = self._initial_data_structures(events_by_dev_and_use[dev])
-                for use in events_by_dev_and_use[dev]:
-                    for i, event in enumerate(events_by_dev_and_use[dev][use]):
-                        if self._minTime is None or event['event_time'] < self._minTime:
-                            self._minTime = event['event_time']
-                        if self._maxTime is None or event['event_time'] > self._maxTime:
-                            self._maxTime = event['event_time']
-                        self._devices[dev][use][i] = self._prepare_event_for_use(event, use)
-                        if use == 'position':
-                            time, *pos = self._prepare_event_for_use(event, use)
-                            self._devices[dev]['position_ITS'][time] = pos
+            for line_num, line in enumerate(fh, start=1):
+                line = line.rstrip(b',\r\n')
+                if not line:
+                    continue
+                if bad_line is not None:
+                    warnings.warn(f"Skipping corrupt line {bad_line} in MultiPatch log {filename}")
+                    bad_line = None
+                try:
+                    event = json.loads(line)
+                except ValueError:
+                    # the last line may be incomplete while the log is being written; anywhere
+                    # else, this is reported once the next line is read
+                    bad_line = line_num
+                    continue
+                is_true = [event[f] for f in self.bool_fields if f in event]
+                event["is_true"] = not is_true or any(is_true)  # empty should mean True
+                event_time = event['event_time']
+                if min_time is None or event_time < min_time:
+                    min_time = event_time
+                if max_time is None or event_time > max_time:
+                    max_time = event_time
+                rows_by_use = rows_by_dev_and_use.setdefault(event['device'], {})
+                for use in possible_uses_for_type(event['event']):
+                    rows_by_use.setdefault(use, []).append(self._prepare_event_for_use(event, use))
+
+        self._minTime = min_time
+        self._maxTime = max_time
+        for dev, rows_by_use in rows_by_dev_and_use.items():
+            self._devices[dev] = self._initial_data_structures({})
+            for use, rows in rows_by_use.items():
+                arr = self._rows_to_array(use, rows)
+                order = np.argsort(self._times(arr), kind='stable')
+                self._devices[dev][use] = arr[order]
 
     def devices(self) -> list[str]:
         return list(self._devices.keys())
 
     def __getitem__(self, dev: str) -> dict[str, Any]:
-        return self._devices[dev]
+        return _DeviceLogData(self._devices[dev])
+
+    def timeSlice(self, dev: str, use: str, start: float = None, stop: float = None):
+        """Return the events of *dev* for *use* with start <= time < stop (either bound may be None).
+        """
+        arr = self._devices[dev][use]
+        times = self._times(arr)
+        i0 = 0 if start is None else np.searchsorted(times, start, side='left')
+        i1 = len(arr) if stop is None else np.searchsorted(times, stop, side='left')
+        arr = arr[i0:i1]
+        return _state_list(arr) if use == 'state' else arr
 
     def state(self, time):
         # Used by MultiPatchLogCanvasItem
         return {
-            dev: {'position': self._devices[dev]['position_ITS'][time]}
+            dev: {'position': self._positionAt(self._devices[dev]['position'], time)}
             for dev in self.devices()
         }
 
+    @staticmethod
+    def _positionAt(path: np.ndarray, time: float):
+        # linear interpolation of (time, x, y, z) rows, as done by IrregularTimeSeries
+        if len(path) == 0 or time < path[0, 0]:
+            return None
+        if time >= path[-1, 0]:
+            return tuple(path[-1, 1:])
+        i = np.searchsorted(path[:, 0], time, side='right') - 1
+        t1, t2 = path[i, 0], path[i + 1, 0]
+        s = (time - t1) / (t2 - t1)
+        return tuple(path[i, 1:] * (1.0 - s) + path[i + 1, 1:] * s)
+
     def firstTime(self):
         return self._minTime
 
@@ -252,13 +313,32 @@ class MultiPatchLogData(object):
         return self._maxTime
 
     @staticmethod
-    def _initial_data_structures(events_by_use: dict[str, list]) -> dict[str, Any]:
+    def _times(arr: np.ndarray) -> np.ndarray:
+        if arr.dtype.names is None:
+            return arr[:, 0]
+        return arr[arr.dtype.names[0]]
+
+    @staticmethod
+    def _state_dtype(rows: list) -> list:
+        state_len = max([len(r[1]) for r in rows], default=1)
+        info_len = max([len(r[2]) for r in rows], default=1)
+        return [('time', float), ('state', f'U{max(state_len, 1)}'), ('info', f'U{max(info_len, 1)}')]
+
+    @classmethod
+    def _rows_to_array(cls, use: str, rows: list) -> np.ndarray:
+        if use == 'state':
+            return np.array(rows, dtype=cls._state_dtype(rows))
+        template = cls._initial_data_structures({})[use]
+        if template.dtype.names is None:
+            return np.array(rows, dtype=template.dtype).reshape((len(rows),) + template.shape[1:])
+        return np.array(rows, dtype=template.dtype)
+
+    @classmethod
+    def _initial_data_structures(cls, events_by_use: dict[str, list]) -> dict[str, Any]:
         def count_for_use(use: str):
             return len(events_by_use[use]) if use in events_by_use else 0
 
         return {
-            # 'position_ITS' is a special case, to support Canvas
-            'position_ITS': IrregularTimeSeries(interpolate=True),
             'position': np.zeros(
                 (count_for_use('position'), 4),
                 dtype=float,
@@ -271,7 +351,7 @@ class MultiPatchLogData(object):
                 count_for_use('pressure'),
                 dtype=[('time', float), ('pressure', float), ('source', 'U32')],
             ),
-            'state': list(range(count_for_use('state'))),
+            'state': np.zeros(count_for_use('state'), dtype=cls._state_dtype([])),
             'auto_bias_change': np.zeros(
                 (count_for_use('auto_bias_change'), 2),
                 dtype=float,
@@ -313,7 +393,71 @@ class MultiPatchLogData(object):
         # if use == 'move_request':
         #     return event_time, event['opts']
         if use == 'test_pulse':
-            return tuple(event[info['name']] for info in TEST_PULSE_METAARRAY_INFO)
+            return tuple(np.nan if event.get(info['name']) is None else event[info['name']]
+                         for info in TEST_PULSE_METAARRAY_INFO)
+
+    def _cacheStamp(self, filename) -> list:
+        st = os.stat(filename)
+        return [self.CACHE_VERSION, st.st_size, st.st_mtime_ns]
+
+    def _readCache(self, filename) -> bool:
+        cacheFile = self.cacheFileName(filename)
+        try:
+            if not os.path.exists(cacheFile):
+                return False
+            with np.load(cacheFile, allow_pickle=False) as cache:
+                meta = json.loads(str(cache['meta']))
+                if meta['stamp'] != self._cacheStamp(filename):
+                    return False
+                devices = {}
+                for dev, uses in meta['devices'].items():
+                    devices[dev] = self._initial_data_structures({})
+                    for use, key in uses.items():
+                        devices[dev][use] = cache[key]
+        except Exception:
+            # unreadable cache; fall back to parsing the log
+            return False
+        self._devices = devices
+        self._minTime = meta['minTime']
+        self._maxTime = meta['maxTime']
+        return True
+
+    def _writeCache(self, filename) -> None:
+        arrays = {}
+        meta = {
+            'stamp': self._cacheStamp(filename),
+            'minTime': self._minTime,
+            'maxTime': self._maxTime,
+            'devices': {},
+        }
+        for i, (dev, uses) in enumerate(self._devices.items()):
+            meta['devices'][dev] = {}
+            for use, arr in uses.items():
+                key = f"d{i}_{use}"
+                meta['devices'][dev][use] = key
+                arrays[key] = arr
+        arrays['meta'] = np.array(json.dumps(meta))
+        cacheFile = self.cacheFileName(filename)
+        try:
+            with open(cacheFile + '.tmp', 'wb') as fh:
+                np.savez(fh, **arrays)
+            os.replace(cacheFile + '.tmp', cacheFile)
+        except OSError:
+            pass  # read-only storage; parse again next time
+
+
+class _DeviceLogData(dict):
+    """The arrays for one device; 'state' is returned as a list of (time, state, info) tuples."""
+    def __getitem__(self, use):
+        value = dict.__getitem__(self, use)
+        return _state_list(value) if use == 'state' else value
+
+    def get(self, use, default=None):
+        return self[use] if use in self else default
+
+
+def _state_list(arr: np.ndarray) -> list:
+    return arr.tolist()
 
 
 class MultiPatchLog(FileType):
@@ -511,7 +655,12 @@ class MultiPatchLogWidget(Qt.QWidget):
         self._regions_by_plot: dict[pg.PlotItem, list[PipetteStateRegion]] = {}
         self._status_by_plot: dict[pg.PlotItem, list[pg.InfiniteLine]] = {}
         self._plot_items_by_plot: dict[pg.PlotItem, list[pg.PlotDataItem]] = {}
+        # plot items showing one field of a device's log data; only the events near the visible
+        # time range are loaded into them (see _updateVisibleData)
+        self._windowed_items: list[tuple[pg.PlotDataItem, str, str, str]] = []
+        self._loaded_range = None
         self._devices = {}
+        self._logs_by_device: dict[str, MultiPatchLogData] = {}
         self._time_sliders = []
         ctrl_widget = Qt.QWidget(self)
         ctrl_widget.setMaximumWidth(200)
@@ -533,6 +682,8 @@ class MultiPatchLogWidget(Qt.QWidget):
             plot.setXLink(self._plots_by_units[list(self._plots_by_units.keys())[0]])
         else:
             plot.setXRange(0, self.endTime() - self.startTime())
+            # the other plots are x-linked to this one
+            plot.sigXRangeChanged.connect(self._updateVisibleData)
         time_slider = pg.InfiniteLine(
             movable=True,
             angle=90,
@@ -652,30 +803,61 @@ class MultiPatchLogWidget(Qt.QWidget):
         meta = next(m for m in TEST_PULSE_METAARRAY_INFO if m['name'] == ev.name)
         plot = self.buildPlotForUnits(meta.get('units', ''))
         if state:
-            for data in self._devices.values():
-                test_pulses = data.get('test_pulse', np.zeros(0, dtype=TEST_PULSE_NUMPY_DTYPE))
-                time = test_pulses['event_time'] - self.startTime()
-                if len(time) > 0:
+            for dev, data in self._devices.items():
+                if len(data.get('test_pulse', [])) > 0:
                     idx = next(i for i, m in enumerate(TEST_PULSE_METAARRAY_INFO) if m['name'] == ev.name)
-                    plot_item = plot.plot(time, test_pulses[ev.name], pen=pg.mkPen((idx, len(TEST_PULSE_NUMPY_DTYPE))))
+                    plot_item = self._plotWindowed(
+                        plot, dev, 'test_pulse', ev.name, pen=pg.mkPen((idx, len(TEST_PULSE_NUMPY_DTYPE))))
                     self._plot_items_by_plot.setdefault(plot, []).append(plot_item)
         else:
             for item in self._plot_items_by_plot.get(plot, []):
                 plot.removeItem(item)
+            removed = set(self._plot_items_by_plot.get(plot, []))
+            self._windowed_items = [w for w in self._windowed_items if w[0] not in removed]
             self._plot_items_by_plot[plot] = []
 
     def _togglePressurePlot(self, state: bool):
         if state:
             plot = self.buildPlotForUnits('Pa')
             plot.show()
-            for data in self._devices.values():
-                pressure = data.get('pressure', np.zeros(0, dtype=[('time', float), ('pressure', float)]))
-                time = pressure['time'] - self.startTime()
-                if len(time) > 0:
-                    plot.plot(time, pressure['pressure'], pen=pg.mkPen((0, len(TEST_PULSE_NUMPY_DTYPE))))
+            for dev, data in self._devices.items():
+                if len(data.get('pressure', [])) > 0:
+                    self._plotWindowed(
+                        plot, dev, 'pressure', 'pressure', pen=pg.mkPen((0, len(TEST_PULSE_NUMPY_DTYPE))))
         elif 'Pa' in self._plots_by_units:
             self._plots_by_units['Pa'].hide()
 
+    def _plotWindowed(self, plot: pg.PlotItem, dev: str, use: str, field: str, **kwds) -> pg.PlotDataItem:
+        """Plot *field* of the *use* events of *dev*, loading only the events near the visible time range."""
+        item = plot.plot(clipToView=True, autoDownsample=True, **kwds)
+        self._windowed_items.append((item, dev, use, field))
+        if self._loaded_range is None:
+            self._updateVisibleData()
+        else:
+            self._setWindowedData(item, dev, use, field, *self._loaded_range)
+        return item
+
+    def _updateVisibleData(self, *args):
+        # load the events within one view width on either side of the visible range, so that
+        # panning and zooming out a little does not require reloading
+        if len(self._plots_by_units) == 0:
+            return
+        x0, x1 = next(iter(self._plots_by_units.values())).viewRange()[0]
+        width = x1 - x0
+        if self._loaded_range is not None:
+            start, stop = self._loaded_range
+            if start <= x0 + self.startTime() and x1 + self.startTime() <= stop and stop - start <= 6 * width:
+                return
+        start = x0 - width + self.startTime()
+        stop = x1 + width + self.startTime()
+        self._loaded_range = (start, stop)
+        for item, dev, use, field in self._windowed_items:
+            self._setWindowedData(item, dev, use, field, start, stop)
+
+    def _setWindowedData(self, item: pg.PlotDataItem, dev: str, use: str, field: str, start: float, stop: float):
+        events = self._logs_by_device[dev].timeSlice(dev, use, start, stop)
+        item.setData(MultiPatchLogData._times(events) - self.startTime(), events[field])
+
     def _toggleAnalysis(self, state: bool):
         from acq4.devices.PatchPipette.states import ResealAnalysis
 
@@ -746,6 +928,7 @@ class MultiPatchLogWidget(Qt.QWidget):
         self.loadImagesFromDir(log.parent())
         for dev in log_data.devices():
             self._devices[dev] = log_data[dev]
+            self._logs_by_device[dev] = log_data
         self.redraw()
 
     def redraw(self):
@@ -762,6 +945,8 @@ class MultiPatchLogWidget(Qt.QWidget):
         for plot in self._plots_by_units.values():
             plot.setXRange(0, self.endTime() - self.startTime())
             break  # they should be x-linked
+        self._loaded_range = None  # the start time may have changed
+        self._updateVisibleData()
         self.setTime(0)
 
     def _makeStateRegion(self, start, end, brush, label) -> PipetteStateRegion:
@@ -9,7 +9,54 @@ and should not be accessed directly.
 import os
 import acq4.util.debug as debug
 
-KNOWN_FILE_TYPES = None
+KNOWN_FILE_TYPES = {}  # name: FileType class, for the types that have been imported or registered
+_MODULE_TYPE_NAMES = None
+
+# Static description of the file types in this package, so that we can tell which classes might
+# handle a file or a data object without importing them all (several pull in heavy GUI or
+# imaging dependencies). Each entry lists the name extensions, the data types (by qualified
+# class name; subclasses match too) and the priority of the FileType class of the same name.
+# The class's own acceptsFile() / acceptsData() make the final decision; the manifest is only
+# used to skip classes that cannot possibly apply. Modules in this package that are missing
+# from the manifest (and classes added with registerFileType) are always consulted.
+FILE_TYPE_MANIFEST = {
+    'Analyze75': {'extensions': ['.nii', '.hdr'], 'dataTypes': [], 'priority': 100},
+    'CSVFile': {'extensions': ['.csv'], 'dataTypes': ['MetaArray.MetaArray', 'numpy.ndarray'], 'priority': 10},
+    'ImageFile': {
+        'extensions': ['.png', '.tif', '.jpg'],
+        'dataTypes': ['MetaArray.MetaArray', 'numpy.ndarray'],
+        'priority': 50,
+    },
+    'MetaArray': {'extensions': ['.ma'], 'dataTypes': ['MetaArray.MetaArray', 'numpy.ndarray'], 'priority': 100},
+    'MultiPatchLog': {'extensions': ['.log'], 'dataTypes': [], 'priority': 0},
+    'YamlFile': {
+        'extensions': ['.yml', '.yaml'],
+        'dataTypes': ['builtins.dict', 'builtins.list', 'builtins.tuple'],
+        'priority': 50,
+    },
+}
+
+
+def _readCandidates(fileName):
+    """Return names of file types that might read *fileName*, according to the manifest."""
+    name = fileName.lower()
+    cands = []
+    for typ in listFileTypes():
+        info = FILE_TYPE_MANIFEST.get(typ)
+        if info is None or any(name.endswith(ext) for ext in info['extensions']):
+            cands.append(typ)
+    return cands
+
+
+def _writeCandidates(data):
+    """Return names of file types that might write *data*, according to the manifest."""
+    typeNames = {f"{c.__module__}.{c.__qualname__}" for c in type(data).__mro__}
+    cands = []
+    for typ in listFileTypes():
+        info = FILE_TYPE_MANIFEST.get(typ)
+        if info is None or typeNames.intersection(info['dataTypes']):
+            cands.append(typ)
+    return cands
 
 
 def suggestReadType(fileHandle):
@@ -17,7 +64,7 @@ def suggestReadType(fileHandle):
     Return the name of the class."""
     maxVal = None
     maxType = None
-    for typ in listFileTypes():
+    for typ in _readCandidates(fileHandle.name()):
         try:
             cls = getFileType(typ)
         except Exception:
@@ -37,7 +84,7 @@ def suggestWriteType(data, fileName=None):
     Return the name of the class."""
     maxVal = None
     maxType = None
-    for typ in listFileTypes():
+    for typ in _writeCandidates(data):
         try:
             cls = getFileType(typ)
         except Exception:
@@ -54,12 +101,12 @@ def suggestWriteType(data, fileName=None):
 
 def listReadTypes(fileHandle):
     """List all fileType classes that can read the file indicated."""
-    return [typ for typ in listFileTypes() if typ.acceptsFile(fileHandle) is not False]
+    return [typ for typ in _readCandidates(fileHandle.name()) if getFileType(typ).acceptsFile(fileHandle) is not False]
 
 
 def listWriteTypes(data, fileName=None):
     """List all fileType classes that can write the data to file."""
-    return [typ for typ in listFileTypes() if typ.acceptsData(data, fileName) is not False]
+    return [typ for typ in _writeCandidates(data) if getFileType(typ).acceptsData(data, fileName) is not False]
 
 
 def registerFileType(name, cls):
@@ -74,39 +121,35 @@ def registerFileType(name, cls):
     cls : FileType subclass
         FileType subclass to register
     """
-    global KNOWN_FILE_TYPES
     KNOWN_FILE_TYPES[name] = cls
 
 
 def getFileType(typName):
-    """Return the fileType class for the given name.
+    """Return the fileType class for the given name, importing its module if needed.
     (this is generally only for internal use)"""
-    global KNOWN_FILE_TYPES
     if typName not in KNOWN_FILE_TYPES:
         mod = __import__(f'acq4.filetypes.{typName}', fromlist=['*'])
         cls = getattr(mod, typName)
         registerFileType(typName, cls)
 
     return KNOWN_FILE_TYPES[typName]
-    
-    
+
+
+def _moduleTypeNames():
+    files = os.listdir(os.path.dirname(__file__))
+    for f in ['filetypes.py', '__init__.py', 'FileType.py']:
+        if f in files:
+            files.remove(f)
+    return [os.path.splitext(f)[0] for f in files if f[-3:] == '.py']
+
+
 def listFileTypes():
-    """Return a list of the names of all available fileType subclasses."""
-    global KNOWN_FILE_TYPES
-    if KNOWN_FILE_TYPES is None:
-        KNOWN_FILE_TYPES = {}
-        files = os.listdir(os.path.dirname(__file__))
-        for f in ['filetypes.py', '__init__.py', 'FileType.py']:
-            if f in files:
-                files.remove(f)
-        typs = [os.path.splitext(f)[0] for f in files if f[-3:] == '.py']
-        for typ in typs:
-            try:
-                getFileType(typ)
-            except Exception:
-                debug.printExc(f"Error loading file type library '{typ}':")
-    return list(KNOWN_FILE_TYPES.keys())
-
-
-# initialize:
-listFileTypes()
+    """Return a list of the names of all available fileType subclasses.
+
+    This does not import the file type modules; see getFileType().
+    """
+    global _MODULE_TYPE_NAMES
+    if _MODULE_TYPE_NAMES is None:
+        _MODULE_TYPE_NAMES = _moduleTypeNames()
+    return _MODULE_TYPE_NAMES + [typ for typ in KNOWN_FILE_TYPES if typ not in _MODULE_TYPE_NAMES]
+
@@ -0,0 +1,48 @@
+import subprocess
+import sys
+
+import numpy as np
+from MetaArray import MetaArray
+
+from acq4.filetypes import filetypes
+
+
+class FakeFileHandle:
+    def __init__(self, name):
+        self._name = name
+
+    def name(self):
+        return '/data/' + self._name
+
+    def shortName(self):
+        return self._name
+
+
+def test_manifest_matches_classes():
+    for typ, info in filetypes.FILE_TYPE_MANIFEST.items():
+        cls = filetypes.getFileType(typ)
+        assert info['extensions'] == cls.extensions
+        assert info['priority'] == cls.priority
+        assert info['dataTypes'] == [f"{t.__module__}.{t.__qualname__}" for t in cls.dataTypes]
+
+
+def test_suggest_types():
+    assert filetypes.suggestReadType(FakeFileHandle('image.tif')) == 'ImageFile'
+    assert filetypes.suggestReadType(FakeFileHandle('data.ma')) == 'MetaArray'
+    assert filetypes.suggestReadType(FakeFileHandle('MultiPatch_000.log')) == 'MultiPatchLog'
+    assert filetypes.suggestReadType(FakeFileHandle('notes.txt')) is None
+    assert filetypes.suggestWriteType(np.zeros(3)) == 'MetaArray'
+    assert filetypes.suggestWriteType(MetaArray(np.zeros(3))) == 'MetaArray'
+    assert filetypes.suggestWriteType({'a': 1}) == 'YamlFile'
+    assert filetypes.suggestWriteType(object()) is None
+    assert sorted(filetypes.listWriteTypes(np.zeros(3))) == ['CSVFile', 'ImageFile', 'MetaArray']
+
+
+def test_lazy_import():
+    code = (
+        "import sys; from acq4.filetypes import filetypes; "
+        "assert filetypes.suggestReadType(type('F', (), {'name': lambda self: 'x.ma'})()) == 'MetaArray'; "
+        "print(sorted(m for m in sys.modules if m.startswith('acq4.filetypes.')))"
+    )
+    out = subprocess.check_output([sys.executable, '-c', code], text=True).strip().splitlines()[-1]
+    assert out == str(['acq4.filetypes.FileType', 'acq4.filetypes.MetaArray', 'acq4.filetypes.filetypes'])
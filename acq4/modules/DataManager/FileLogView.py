@@ -4,7 +4,7 @@ from __future__ import print_function
 from acq4.util import Qt
 import acq4.Manager
 from acq4.util.LogWindow import LogWidget
-import pyqtgraph.configfile as cf
+from acq4.util import logfile
 import acq4.util.debug as debug
 
 
@@ -18,7 +18,8 @@ class FileLogView(LogWidget):
     
     def selectedFileChanged(self, dh):
         """Finds the log file associated with dh (a FileHandle or DirHandle). Checks dh and all (grand)parent directories
-        until a log.txt file is found, and passes that file on to be displayed. If no log.txt file is found, then nothing is displayed."""
+        until a log file (log.jsonl, or log.txt from older versions) is found, and passes that file on to be displayed. If no log
+        file is found, then nothing is displayed."""
         ## make sure a file is actually selected
         if dh is None:
             self.clear()
@@ -26,13 +27,13 @@ class FileLogView(LogWidget):
             self.dirFilter = False
             return
         
-        ## check dh and parents for a log.txt file
+        ## check dh and parents for a log file
         if not dh.isDir():
             dh = dh.parent()
         logDir = None 
         p = dh
         while p != self.mod.baseDir: 
-            if p.exists('log.txt'):
+            if p.exists(logfile.logFileName) or p.exists(logfile.configLogFileName):
                 logDir = p
                 break
             else:
@@ -49,8 +50,12 @@ class FileLogView(LogWidget):
     def setCurrentLog(self, dh):
         if dh is not None:
             try:
-                self.loadFile(dh['log.txt'].name())
-                self.ui.dirLabel.setText("Currently displaying " + self.currentLogDir.name(relativeTo=self.manager.baseDir)+'/log.txt')    
+                ## a directory may have a log.txt from older versions followed by a log.jsonl
+                names = [f for f in (logfile.configLogFileName, logfile.logFileName) if dh.exists(f)]
+                for i, name in enumerate(names):
+                    self.loadFile(dh[name].name(), append=i > 0)
+                self.ui.dirLabel.setText("Currently displaying " + ", ".join(
+                    self.currentLogDir.name(relativeTo=self.manager.baseDir) + '/' + name for name in names))
             except:
                 debug.printExc("Error loading log file:")
                 self.clear()
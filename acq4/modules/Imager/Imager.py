@@ -298,8 +298,6 @@ class Imager(Module):
 
         self.fieldSize = 63.0 * 120e-6  # field size for 63x, will be scaled for others
 
-        self.scanVoltageCache = None  # cached scan protocol computed by generateScanProtocol
-
         self.objectiveROImap = {}  # this is a dict that we will populate with the name
         # of the objective and the associated ROI object .
         # That way, each objective has a scan region appopriate for it's magnification.
@@ -597,8 +595,6 @@ class Imager(Module):
         if self.ignoreRoiChange:
             return
 
-        self.scanVoltageCache = None  # invalidate cache
-
         # update scan position
         self.setScanPosFromRoi()
 
@@ -702,8 +698,6 @@ class Imager(Module):
 
         scanControl = self.param.child("Scan Control")
 
-        self.scanVoltageCache = None  # invalidate cache
-
         sampleRate = scanControl["Sample Rate"]
         downsample = scanControl["Downsample"]
         # we'll let the rect tell us later how many samples are needed
@@ -881,15 +875,11 @@ class Imager(Module):
         # first make sure laser information is updated on the module interface
         self.updateLaserInfo()
 
-        # return cached command if possible
-        if self.scanVoltageCache is not None:
-            vscan = self.scanVoltageCache
-        else:
-            # Generate scan voltages
-            vscan = self.scanProgram.generateVoltageArray()
-            # scanner lags laser too much to make this worthwhile without some timing correction
-            # mask = self.scanProgram.generateLaserMask().astype(np.float32)
-            self.scanVoltageCache = vscan
+        # Generate scan voltages (the scan program returns its cached array unless the ROI, scan
+        # parameters, or scanner calibration have changed)
+        vscan = self.scanProgram.generateVoltageArray()
+        # scanner lags laser too much to make this worthwhile without some timing correction
+        # mask = self.scanProgram.generateLaserMask().astype(np.float32)
 
         # sample rate, duration, and other meta data
         rect = self.scanProgram.components[0].ctrlParameter()
@@ -1,6 +1,10 @@
+import json
+import os
+
 import numpy as np
+import pytest
 
-from acq4.util.MultiPatchLog import IrregularTimeSeries
+from acq4.filetypes.MultiPatchLog import IrregularTimeSeries, MultiPatchLogData
 
 
 def test_timeseries_index():
@@ -67,4 +71,113 @@ def test_timeseries_index():
                     ts[t] = v
                 for t in np.arange(-1, 40, 0.05):
                     assert ts[t] == lookup(t, ts)
-    
\ No newline at end of file
+    
+
+def writeLog(path, events):
+    with open(path, 'wb') as fh:
+        for ev in events:
+            fh.write(json.dumps(ev).encode('utf8') + b",\n")
+
+
+def test_read_log(tmp_path):
+    events = [
+        {'device': 'Pipette1', 'event': 'move_start', 'event_time': 100.0, 'position': [0, 0, 0]},
+        {'device': 'Pipette1', 'event': 'state_change', 'event_time': 101.0, 'state': 'bath'},
+        {'device': 'Pipette1', 'event': 'move_stop', 'event_time': 102.0, 'position': [10, 20, 30]},
+        {'device': 'Pipette2', 'event': 'pressure_changed', 'event_time': 100.5, 'pressure': -1000., 'source': 'regulator'},
+        {'device': 'Pipette1', 'event': 'target_changed', 'event_time': 103.0, 'target_position': [1, 2, 3]},
+        {'device': 'Pipette2', 'event': 'pressure_changed', 'event_time': 104.0, 'pressure': 0., 'source': 'atmosphere'},
+    ]
+    logFile = str(tmp_path / 'MultiPatch_000.log')
+    writeLog(logFile, events)
+    with open(logFile, 'ab') as fh:
+        fh.write(b'{"device": "Pipette1", "eve')  # incomplete line from a log still being written
+
+    for useCache in (False, True, True):
+        log = MultiPatchLogData(logFile, useCache=useCache)
+        assert sorted(log.devices()) == ['Pipette1', 'Pipette2']
+        assert log.firstTime() == 100.0
+        assert log.lastTime() == 104.0
+        p1 = log['Pipette1']
+        assert p1['position'].shape == (2, 4)
+        assert p1['state'] == [(101.0, 'bath', '')]
+        assert list(p1['target'][0]) == [103.0, 1, 2, 3]
+        assert len(p1['event']) == 4
+        assert list(log['Pipette2']['pressure']['source']) == ['regulator', 'atmosphere']
+
+        assert list(log.timeSlice('Pipette1', 'event', 101.0, 103.0)['event']) == ['state_change', 'move_stop']
+        assert len(log.timeSlice('Pipette2', 'pressure', start=101.0)) == 1
+        assert log.timeSlice('Pipette1', 'state', stop=101.0) == []
+
+        assert log.state(99.0)['Pipette1']['position'] is None
+        assert log.state(101.0)['Pipette1']['position'] == (5, 10, 15)
+        assert log.state(200.0)['Pipette1']['position'] == (10, 20, 30)
+    assert os.path.exists(MultiPatchLogData.cacheFileName(logFile))
+
+    # appending to the log invalidates the cache
+    events.append({'device': 'Pipette1', 'event': 'state_change', 'event_time': 105.0, 'state': 'cell attached'})
+    writeLog(logFile, events)
+    log = MultiPatchLogData(logFile)
+    assert log.lastTime() == 105.0
+    assert [s[1] for s in log['Pipette1']['state']] == ['bath', 'cell attached']
+
+
+def test_corrupt_log_lines(tmp_path):
+    events = [
+        {'device': 'Pipette1', 'event': 'state_change', 'event_time': 100.0 + i, 'state': 'bath'}
+        for i in range(3)
+    ]
+    logFile = str(tmp_path / 'MultiPatch_000.log')
+    writeLog(logFile, events[:2])
+    with open(logFile, 'ab') as fh:
+        fh.write(b'{"device": "Pipette1", "eve\n')
+    writeLog(str(tmp_path / 'tail.log'), events[2:])
+    with open(logFile, 'ab') as fh, open(str(tmp_path / 'tail.log'), 'rb') as tail:
+        fh.write(tail.read())
+
+    # corrupt lines before the end of the log are skipped with a warning
+    with pytest.warns(UserWarning, match='line 3'):
+        log = MultiPatchLogData(logFile, useCache=False)
+    assert [s[0] for s in log['Pipette1']['state']] == [100.0, 101.0, 102.0]
+
+
+def test_widget_loads_visible_range(tmp_path):
+    import pyqtgraph as pg
+    import acq4.util.DataManager as dm
+    from acq4.filetypes.MultiPatchLog import MultiPatchLogWidget
+
+    pg.mkQApp()
+    events = [{'device': 'Pipette1', 'event': 'state_change', 'event_time': 0.0, 'state': 'bath'}]
+    for i in range(1000):
+        events.append({'device': 'Pipette1', 'event': 'test_pulse', 'event_time': float(i),
+                       'capacitance': i * 1e-12})
+        events.append({'device': 'Pipette1', 'event': 'pressure_changed', 'event_time': i + 0.5,
+                       'pressure': float(i), 'source': 'regulator'})
+    logDir = tmp_path / 'cell'
+    logDir.mkdir()
+    writeLog(str(logDir / 'MultiPatch_000.log'), events)
+
+    widget = MultiPatchLogWidget()
+    try:
+        widget.addLog(dm.getDirHandle(str(logDir))['MultiPatch_000.log'])
+        cb = next(cb for cb in widget._testPulseAnalysisCheckboxes if cb.name == 'capacitance')
+        cb.setChecked(True)
+        widget._displayPressure.setChecked(True)
+        plot = widget._plots_by_units['F']
+        tpItem = widget._plot_items_by_plot[plot][0]
+        pressureItem = next(w[0] for w in widget._windowed_items if w[2] == 'pressure')
+        assert len(tpItem.xData) == 1000
+
+        # only the events around the visible range are loaded
+        plot.setXRange(500, 510, padding=0)
+        assert tpItem.xData[0] >= 490 and tpItem.xData[-1] < 520
+        assert np.allclose(tpItem.yData, tpItem.xData * 1e-12)
+        assert pressureItem.xData[0] >= 490 and pressureItem.xData[-1] < 520
+        assert np.allclose(pressureItem.yData, pressureItem.xData - 0.5)
+        plot.setXRange(100, 200, padding=0)
+        assert tpItem.xData[0] == 0 and tpItem.xData[-1] == 299
+
+        cb.setChecked(False)
+        assert all(w[0] is not tpItem for w in widget._windowed_items)
+    finally:
+        widget.close()
@@ -1,4 +1,5 @@
-from collections import OrderedDict
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
 
 import gc
 import numpy as np
@@ -81,6 +82,10 @@ class TaskRunner(Module):
         # Since most modern systems have adequate memory, this is now disabled by default.
         self._reduceMemoryUsage = config.get('reduceMemoryUsage', False)
 
+        # If True, each task in a sequence is created while the previous one is still running, and
+        # results are stored by a background thread. See TaskThread.runPipelined().
+        self._pipelineSequences = config.get('pipelineSequences', False)
+
         self.lastProtoTime = None
         self.loopEnabled = False
         self.devListItems = {}
@@ -649,7 +654,7 @@ class TaskRunner(Module):
             self.sigTaskSequenceStarted.emit({})
             logMsg('Started %s task sequence of length %i' % (self.currentTask.name(), pLen), importance=6)
             # print 'PR task positions:
-            future = self.taskThread.startTask(prot, paramInds)
+            future = self.taskThread.startTask(prot, paramInds, pipelined=self._pipelineSequences)
 
         except:
             self.setStartBtnsEnable(True)
@@ -962,8 +967,10 @@ class TaskThread(Thread):
         self._currentTask = None
         self._currentFuture = None
         self._systrace = None
+        self._resultWriter = None
+        self.pipelined = False
 
-    def startTask(self, task, paramSpace=None):
+    def startTask(self, task, paramSpace=None, pipelined=False):
         with self.lock:
             self._systrace = sys.gettrace()
             while self.isRunning():
@@ -977,6 +984,7 @@ class TaskThread(Thread):
 
             self._currentFuture = TaskFuture(self, task, paramSize)
             self.paramSpace = paramSpace
+            self.pipelined = pipelined
             self.lastRunTime = None
             self.start()  ### causes self.run() to be called from new thread
             logMsg("Task started.", importance=1)
@@ -1003,6 +1011,8 @@ class TaskThread(Thread):
                 except Exception as e:
                     if e.args[0] != 'stop':
                         raise
+            elif self.pipelined:
+                self.runPipelined()
             else:
                 runSequence(self.runOnce, self.paramSpace, list(self.paramSpace.keys()))
 
@@ -1017,7 +1027,46 @@ class TaskThread(Thread):
             self._currentFuture._taskDone()
             self._currentFuture = None
 
-    def runOnce(self, params=None):
+    def runPipelined(self):
+        """Run the task sequence, overlapping the work between tasks with acquisition.
+
+        While each task is running, the next task is created and prepared (see Manager.Task.prepare).
+        Devices are still reserved, configured and released one task at a time, in sequence order.
+        Results are written to disk by a background ResultWriter after the devices are released.
+        """
+        paramList = []
+        runSequence(lambda p: paramList.append(dict(p)), self.paramSpace, list(self.paramSpace.keys()))
+
+        self._resultWriter = ResultWriter()
+        try:
+            nextTask = None
+            for i, params in enumerate(paramList):
+                nextParams = paramList[i + 1] if i + 1 < len(paramList) else None
+                try:
+                    nextTask = self.runOnce(params, task=nextTask, nextParams=nextParams)
+                except Exception as e:
+                    if len(e.args) > 0 and e.args[0] == 'stop':
+                        break
+                    raise
+        finally:
+            writer = self._resultWriter
+            self._resultWriter = None
+            writer.finish()
+
+    def selectCommand(self, params):
+        """Return the command for a single task in the sequence."""
+        cmd = self.task
+        if params is not None:
+            for p in params:
+                cmd = cmd[p: params[p]]
+        return cmd
+
+    def runOnce(self, params=None, task=None, nextParams=None):
+        """Run a single task from the sequence.
+
+        If *task* is given, it must be a Manager Task already created for *params*. If *nextParams*
+        is given, the task for those parameters is created while this one is running and returned.
+        """
         # good time to collect garbage
         if self.ui._reduceMemoryUsage:
             gc.collect()
@@ -1027,10 +1076,7 @@ class TaskThread(Thread):
             params = {}
 
         ## Select correct command to execute
-        cmd = self.task
-        if params is not None:
-            for p in params:
-                cmd = cmd[p: params[p]]
+        cmd = self.selectCommand(params)
         prof.mark('select command')
 
         ## Wait before starting if we've already run too recently
@@ -1067,7 +1113,9 @@ class TaskThread(Thread):
                 "TaskRunner.runOnce failed to generate a proper command structure. Object type was '%s', should have been 'dict'." % type(
                     cmd))
 
-        task = self.dm.createTask(cmd)
+        if task is None:
+            task = self.dm.createTask(cmd)
+        task.deferStorage = self._resultWriter is not None
         prof.mark('create task')
 
         self.lastRunTime = ptime.time()
@@ -1076,8 +1124,6 @@ class TaskThread(Thread):
             with self.lock:
                 self._currentTask = task
             task.execute(block=False)
-            # record estimated end time
-            endTime = time.time() + cmd['protocol']['duration']
             self.sigTaskStarted.emit(params)
             prof.mark('execute')
         except:
@@ -1094,23 +1140,32 @@ class TaskThread(Thread):
         prof.mark('start task')
         ### Do not put code outside of these try: blocks; may cause device lockup
 
+        nextTask = None
         try:
+            if nextParams is not None:
+                ## prepare the next task while this one runs
+                try:
+                    nextTask = self.dm.createTask(self.selectCommand(nextParams))
+                    nextTask.prepare()
+                except Exception:
+                    ## try again (and report the error) when it is time to run the next task
+                    nextTask = None
+                prof.mark('prepare next task')
+
             ## wait for finish, watch for abort requests
-            while True:
-                if task.isDone():
-                    prof.mark('task done')
-                    break
+            ## (waitUntilDone returns as soon as the task finishes; the timeout only bounds abort latency)
+            while not task.waitUntilDone(timeout=20e-3):
                 with self.lock:
                     if self.abortThread:
                         # should be taken care of in TaskThread.abort()
                         # NO -- task.stop() is not thread-safe.
                         task.stop(abort=True)
                         return
-                # adjust sleep time based on estimated time remaining in the task.
-                sleep = np.clip((endTime - time.time()) * 0.5, 1e-3, 20e-3)
-                time.sleep(sleep)
+            prof.mark('task done')
 
             result = task.getResult()
+            if task.deferStorage and task.cfg.get('storeData', False) is True:
+                self._resultWriter.submit(task)
         except:
             ## Make sure the task is fully stopped if there was a failure at any point.
             # printExc("\nError during task execution:")
@@ -1135,6 +1190,7 @@ class TaskThread(Thread):
         Qt.QThread.yieldCurrentThread()
         prof.mark('yield')
         prof.finish()
+        return nextTask
 
     def checkStop(self):
         with self.lock:
@@ -1158,6 +1214,33 @@ class TaskThread(Thread):
                 self.abortThread = True
 
 
+class ResultWriter:
+    """Stores the results of completed tasks from a background thread, in the order they were submitted.
+
+    At most *maxPending* tasks may wait to be stored; submit() blocks when the queue is full so
+    that a slow disk does not cause unbounded memory use. Errors raised while storing are re-raised
+    from submit() or finish().
+    """
+
+    def __init__(self, maxPending=4):
+        self.maxPending = maxPending
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="TaskResultWriter")
+        self._pending = deque()
+
+    def submit(self, task):
+        self._pending.append(self._executor.submit(task.storeResults))
+        while len(self._pending) > self.maxPending or (len(self._pending) > 0 and self._pending[0].done()):
+            self._pending.popleft().result()
+
+    def finish(self):
+        """Wait until all submitted results have been stored."""
+        try:
+            while len(self._pending) > 0:
+                self._pending.popleft().result()
+        finally:
+            self._executor.shutdown()
+
+
 class TaskFuture(Future):
     """Used to check on progress for a running task or task sequence.
 
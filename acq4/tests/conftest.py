@@ -0,0 +1,66 @@
+import os
+
+import pyqtgraph as pg
+import pytest
+
+deviceConfig = """
+devices:
+    DAQ:
+        driver: 'NiDAQ'
+        mock: True
+        defaultAIMode: 'NRSE'
+        defaultAIRange: [-10, 10]
+        defaultAORange: [-10, 10]
+    DaqDevice:
+        driver: 'DAQGeneric'
+        channels:
+            AIChan:
+                device: 'DAQ'
+                channel: '/Dev1/ai0'
+                type: 'ai'
+            AOChan:
+                device: 'DAQ'
+                channel: '/Dev1/ao0'
+                type: 'ao'
+    Clamp1:
+        driver: 'MockClamp'
+        simulator: 'builtin'
+        Command:
+            device: 'DAQ'
+            channel: '/Dev1/ao1'
+            type: 'ao'
+        ScaledSignal:
+            device: 'DAQ'
+            channel: '/Dev1/ai5'
+            mode: 'NRSE'
+            type: 'ai'
+        icHolding: 0.0
+        vcHolding: -65e-3
+"""
+
+
+@pytest.fixture(scope='session')
+def manager(tmp_path_factory):
+    """A Manager running simulated DAQ, DAQGeneric and MockClamp devices, with only the console module loaded."""
+    import acq4.Manager
+
+    pg.mkQApp()
+    path = tmp_path_factory.mktemp('acq4')
+    configFile = path / 'default.cfg'
+    configFile.write_text(deviceConfig)
+    # MockClamp runs its simulator in a child process that must be able to import acq4
+    repoRoot = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    pythonPath = os.environ.get('PYTHONPATH')
+    os.environ['PYTHONPATH'] = os.pathsep.join(p for p in (repoRoot, pythonPath) if p)
+    cwd = os.getcwd()
+    os.chdir(path)  # the log window keeps its temporary log in the working directory
+    try:
+        man = acq4.Manager.Manager(configFile=str(configFile), argv=['-n', '-m', 'Console'])
+        yield man
+        man.quit()
+    finally:
+        os.chdir(cwd)
+        if pythonPath is None:
+            del os.environ['PYTHONPATH']
+        else:
+            os.environ['PYTHONPATH'] = pythonPath
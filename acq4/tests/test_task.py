@@ -0,0 +1,111 @@
+import threading
+import time
+
+import pyqtgraph as pg
+import pytest
+
+from acq4.Manager import Task
+from acq4.devices.Device import DeviceTask
+from acq4.util import Qt, ptime
+
+app = pg.mkQApp()
+
+
+class FakeDeviceTask(DeviceTask):
+    def __init__(self, dev, cmd, parentTask):
+        DeviceTask.__init__(self, dev, cmd, parentTask)
+        self.signalsCompletion = cmd.get('signalsCompletion', False)
+        self.done = False
+
+    def isDone(self):
+        return self.done
+
+    def finishLater(self, delay):
+        def finish():
+            time.sleep(delay)
+            self.done = True
+            if self.signalsCompletion:
+                self.taskDone()
+        threading.Thread(target=finish, daemon=True).start()
+
+
+class FakeDevice:
+    def __init__(self, name):
+        self._name = name
+
+    def name(self):
+        return self._name
+
+    def createTask(self, cmd, parentTask):
+        return FakeDeviceTask(self, cmd, parentTask)
+
+
+class FakeManager:
+    def getDevice(self, name):
+        return FakeDevice(name)
+
+
+def startedTask(signalsCompletion, duration=0.0):
+    task = Task(FakeManager(), {'protocol': {'duration': duration}, 'Dev': {'signalsCompletion': signalsCompletion}})
+    # the state execute() sets up before waiting
+    task.stopped = False
+    task.abortRequested = False
+    task._done = False
+    task.startTime = ptime.time()
+    return task, task.tasks['Dev']
+
+
+def test_wakeup():
+    task, devTask = startedTask(signalsCompletion=True)
+    devTask.finishLater(0.02)
+    start = time.perf_counter()
+    assert task.waitUntilDone(timeout=5)
+    # woken by the device task rather than the 100 ms fallback poll
+    assert time.perf_counter() - start < 0.08
+
+
+def test_wakeup_multiple_waiters():
+    task, devTask = startedTask(signalsCompletion=True)
+    elapsed = []
+
+    def wait():
+        start = time.perf_counter()
+        task.waitUntilDone(timeout=5)
+        elapsed.append(time.perf_counter() - start)
+
+    threads = [threading.Thread(target=wait) for i in range(4)]
+    for t in threads:
+        t.start()
+    devTask.finishLater(0.02)
+    for t in threads:
+        t.join()
+    assert len(elapsed) == 4
+    assert max(elapsed) < 0.08
+
+
+def test_polling():
+    task, devTask = startedTask(signalsCompletion=False)
+    devTask.finishLater(0.02)
+    start = time.perf_counter()
+    assert task.waitUntilDone(timeout=5)
+    assert time.perf_counter() - start < 0.08
+
+
+@pytest.mark.parametrize('signalsCompletion', [True, False])
+def test_timeout(signalsCompletion):
+    task, devTask = startedTask(signalsCompletion)
+    start = time.perf_counter()
+    assert task.waitUntilDone(timeout=0.1) is False
+    assert 0.09 < time.perf_counter() - start < 0.3
+    devTask.done = True
+    assert task.waitUntilDone(timeout=0.1) is True
+
+
+def test_process_events_rate(monkeypatch):
+    calls = []
+    monkeypatch.setattr(Qt.QApplication, 'processEvents', staticmethod(lambda *args: calls.append(time.perf_counter())))
+    task, devTask = startedTask(signalsCompletion=False)
+    assert task.waitUntilDone(timeout=0.2, processEvents=True) is False
+    # events are processed about every 20 ms, even though isDone() is polled every 1 ms
+    assert 5 <= len(calls) <= 12
+    assert min(b - a for a, b in zip(calls[:-1], calls[1:])) >= 0.019
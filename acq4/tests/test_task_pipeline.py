@@ -0,0 +1,89 @@
+import numpy as np
+import pytest
+
+from acq4.modules.TaskRunner.TaskRunner import TaskThread
+from acq4.util import Qt
+from acq4.util.DataManager import getDirHandle
+from acq4.util.SequenceRunner import runSequence
+
+numPts = 1000
+amplitudes = [0.5, 1.0, -1.0, 2.0, 0.0]
+
+
+class FakeTaskRunner:
+    """The parts of the TaskRunner module that TaskThread uses."""
+    _reduceMemoryUsage = False
+
+    def __init__(self, manager):
+        self.manager = manager
+
+
+def makeSequence(baseDir):
+    def generate(params):
+        ind = params[('DaqDevice', 'amplitude')]
+        return {
+            'protocol': {
+                'duration': numPts / 10000,
+                'cycleTime': 0,
+                'storeData': True,
+                'storageDir': baseDir.mkdir('%03d' % ind),
+                'timeout': None,
+            },
+            'DAQ': {'rate': 10000, 'numPts': numPts},
+            'DaqDevice': {
+                'AOChan': {'command': np.linspace(0, amplitudes[ind], numPts)},
+                'AIChan': {'record': True},
+            },
+            'Clamp1': {'mode': 'VC', 'command': np.full(numPts, -65e-3)},
+        }
+
+    paramSpace = {('DaqDevice', 'amplitude'): list(range(len(amplitudes)))}
+    return runSequence(generate, paramSpace, list(paramSpace.keys())), paramSpace
+
+
+def storedCommand(dh):
+    data = dh['DaqDevice.ma'].read()
+    return data['Channel': 'AOChan'].asarray()
+
+
+def runThread(manager, tmp_path, pipelined, monkeypatch):
+    baseDir = getDirHandle(str(tmp_path), create=True)
+    task, paramSpace = makeSequence(baseDir)
+    thread = TaskThread(FakeTaskRunner(manager))
+
+    # record whether each device task is created while another task is acquiring
+    overlapped = []
+    createTask = manager.createTask
+
+    def recordingCreateTask(cmd):
+        overlapped.append(thread._currentTask is not None)
+        return createTask(cmd)
+
+    monkeypatch.setattr(manager, 'createTask', recordingCreateTask)
+
+    frames = []
+    thread.sigNewFrame.connect(frames.append, Qt.Qt.ConnectionType.DirectConnection)
+    future = thread.startTask(task, paramSpace, pipelined=pipelined)
+    future.wait(timeout=60)
+    assert thread.wait(10000)
+    return frames, baseDir, overlapped
+
+
+@pytest.mark.parametrize('pipelined', [False, True])
+def test_sequence_order(manager, tmp_path, pipelined, monkeypatch):
+    frames, baseDir, overlapped = runThread(manager, tmp_path, pipelined, monkeypatch)
+
+    assert [f['params'][('DaqDevice', 'amplitude')] for f in frames] == list(range(len(amplitudes)))
+    for i, frame in enumerate(frames):
+        expected = np.linspace(0, amplitudes[i], numPts)
+        result = frame['result']
+        assert np.allclose(result['DaqDevice']['Channel': 'AOChan'].asarray(), expected)
+        assert result['Clamp1']['Channel': 'primary'].shape == (numPts,)
+        assert np.allclose(storedCommand(baseDir['%03d' % i]), expected)
+        assert 'Clamp1Daq.ma' in baseDir['%03d' % i].ls()
+
+    # every task after the first is created while the previous one is still running
+    if pipelined:
+        assert overlapped == [False] + [True] * (len(amplitudes) - 1)
+    else:
+        assert not any(overlapped)
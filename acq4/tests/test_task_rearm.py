@@ -0,0 +1,72 @@
+import numpy as np
+
+
+def command(amplitude, numPts=1000, rate=10000):
+    return {
+        'protocol': {'duration': numPts / rate},
+        'DAQ': {'rate': rate, 'numPts': numPts},
+        'DaqDevice': {'AOChan': {'command': np.linspace(0, amplitude, numPts)}, 'AIChan': {'record': True}},
+        'Clamp1': {'mode': 'VC', 'command': np.full(numPts, -65e-3)},
+    }
+
+
+def checkResult(result, cmd):
+    numPts = cmd['DAQ']['numPts']
+    daq = result['DaqDevice']
+    assert daq.shape == (2, numPts)
+    assert np.allclose(daq['Channel': 'AOChan'].asarray(), cmd['DaqDevice']['AOChan']['command'])
+    clamp = result['Clamp1']
+    assert clamp['Channel': 'primary'].shape == (numPts,)
+    assert np.all(np.isfinite(clamp.asarray()))
+
+
+def test_rearm_same_command(manager):
+    cmd = command(1.0)
+    task = manager.createTask(command(1.0))
+    task.execute()
+    first = task.getResult()
+    checkResult(first, cmd)
+
+    devTasks = dict(task.tasks)
+    assert task.rearm() is True
+    # device tasks were reused rather than recreated
+    assert all(task.tasks[name] is devTasks[name] for name in devTasks)
+    task.execute()
+    second = task.getResult()
+    checkResult(second, cmd)
+    assert np.array_equal(first['DaqDevice'].asarray(), second['DaqDevice'].asarray())
+
+
+def test_rearm_matches_fresh_task(manager):
+    task = manager.createTask(command(1.0))
+    task.execute()
+    task.getResult()
+
+    for amplitude in (0.5, -2.0):
+        newCmd = command(amplitude)
+        assert task.rearm(command(amplitude)) is True
+        task.execute()
+        rearmed = task.getResult()
+
+        fresh = manager.createTask(command(amplitude))
+        fresh.execute()
+        expected = fresh.getResult()
+
+        checkResult(rearmed, newCmd)
+        assert np.array_equal(rearmed['DaqDevice'].asarray(), expected['DaqDevice'].asarray())
+        assert rearmed['Clamp1'].shape == expected['Clamp1'].shape
+        assert set(rearmed.keys()) == set(expected.keys())
+        assert rearmed['protocol'].keys() == expected['protocol'].keys()
+
+
+def test_rearm_new_timing_recreates_tasks(manager):
+    task = manager.createTask(command(1.0))
+    task.execute()
+    task.getResult()
+    devTasks = dict(task.tasks)
+
+    # the DAQ cannot keep its clock configuration when the number of samples changes
+    cmd = command(1.0, numPts=500)
+    task.reexecute(command(1.0, numPts=500))
+    assert any(task.tasks[name] is not devTasks[name] for name in devTasks)
+    checkResult(task.getResult(), cmd)
@@ -22,6 +22,10 @@ class ImageCanvasItem(CanvasItem):
 
     """
     _typeName = "Image"
+
+    # smallest flat field value used by setCorrection(); a smoothed background-subtracted image
+    # may be zero or negative, which would otherwise blow up or invert the displayed image
+    minFlatField = 1e-3
     
     def __init__(self, image=None, **opts):
 
@@ -31,6 +35,7 @@ class ImageCanvasItem(CanvasItem):
 
         item = None
         self.data = None
+        self.correction = None  # (gain, flatField) applied at render time; see setCorrection()
         
         if isinstance(image, Qt.QGraphicsItem):
             item = image
@@ -172,13 +177,42 @@ class ImageCanvasItem(CanvasItem):
         if showTime:
             self.timeSlider.setMinimum(0)
             self.timeSlider.setMaximum(data.shape[0]-1)
-            self.graphicsItem().setImage(data[self.timeSlider.value()].asarray(), autoLevels=self.autoBtn.isChecked())
+            frame = data[self.timeSlider.value()]
         else:
-            self.graphicsItem().setImage(data.asarray(), autoLevels=self.autoBtn.isChecked())
+            frame = data
+        frame = frame.asarray() if isinstance(frame, MetaArray) else np.asarray(frame)
+        self.graphicsItem().setImage(self._applyCorrection(frame), autoLevels=self.autoBtn.isChecked())
 
         for widget in self.timeControls:
             widget.setVisible(showTime)
 
+    def setCorrection(self, gain=1.0, flatField=None):
+        """Set an intensity correction that is applied to the displayed frame at render time.
+
+        The displayed image is ``frame * gain / flatField``; the stored data is not modified.
+        *flatField* must have the same 2D shape as the image (or be None); values below
+        minFlatField are raised to it. Call with no arguments to remove the correction.
+        """
+        if gain == 1.0 and flatField is None:
+            self.correction = None
+        else:
+            if flatField is not None:
+                flatField = np.maximum(flatField, np.float32(self.minFlatField))
+            self.correction = (gain, flatField)
+        if self.data is not None:
+            self.updateImage()
+
+    def _applyCorrection(self, frame):
+        if self.correction is None:
+            return frame
+        gain, flatField = self.correction
+        frame = frame * np.float32(gain)
+        if flatField is not None:
+            if frame.ndim == flatField.ndim + 1:  # color image
+                flatField = flatField[..., np.newaxis]
+            frame /= flatField
+        return frame
+
     def saveState(self, **kwds):
         state = CanvasItem.saveState(self, **kwds)
         state['imagestate'] = self.histogram.saveState()
@@ -21,7 +21,9 @@ from acq4.util import Qt, advancedTypes as advancedTypes
 from acq4.util.Mutex import Mutex
 from acq4.util.debug import printExc
 from pyqtgraph import SignalProxy, BusyCursor
-from pyqtgraph.configfile import readConfigFile, writeConfigFile, appendConfigFile
+from .indexstore import openIndexStore, getIndexStoreClass, indexFileNames, isCacheFileName
+from .metacache import MetadataCache, fileStamp
+from . import treescan
 
 if not hasattr(Qt.QtCore, 'Signal'):
     Qt.Signal = Qt.pyqtSignal
@@ -79,7 +81,33 @@ class DataManager(Qt.QObject):
         DataManager.INSTANCE = self
         self.cache = {}
         self.lock = Mutex(Qt.QMutex.Recursive)
-        
+        self.indexFormat = 'config'
+        self.metadataCache = None
+
+    def setMetadataCache(self, fileName):
+        """Use a persistent metadata cache stored in *fileName* (or disable caching if None).
+
+        The cache holds parsed indexes and sorted directory listings keyed by file modification
+        times. It may be shared by any number of processes, and it persists between sessions, so
+        reopening a large data tree does not require re-reading every index file.
+        """
+        with self.lock:
+            if self.metadataCache is not None:
+                self.metadataCache.close()
+            self.metadataCache = None if fileName is None else MetadataCache(fileName)
+            for h in self.cache.values():
+                if isinstance(h, DirHandle):
+                    h._indexStore.cache = self.metadataCache
+
+    def setIndexFormat(self, fmt):
+        """Set the index format ('config' or 'binary') used for newly managed directories.
+
+        Directories that already have an index keep their existing format; use
+        DirHandle.convertIndex() to migrate them.
+        """
+        getIndexStoreClass(fmt)
+        self.indexFormat = fmt
+
     def getDirHandle(self, dirName, create=False):
         with self.lock:
             dirName = os.path.abspath(dirName)
@@ -125,6 +153,9 @@ class DataManager(Qt.QObject):
         
     def _handleChanged(self, handle, change, *args):
         with self.lock:
+            if change in ['renamed', 'moved', 'deleted'] and self.metadataCache is not None:
+                self.metadataCache.invalidate(args[0])
+
             if change in ['renamed', 'moved']:
                 oldName = args[0]
                 newName = args[1]
@@ -425,21 +456,49 @@ class FileHandle(Qt.QObject):
 class DirHandle(FileHandle):
     def __init__(self, path, manager, create=False):
         FileHandle.__init__(self, path, manager)
-        self._index = None
         self.lsCache = {}  # sortMode: [files...]
         self.cTimeCache = {}
         self._indexFileExists = False
+        self._indexStore = openIndexStore(
+            self.path, getattr(manager, 'indexFormat', 'config'), getattr(manager, 'metadataCache', None))
 
         if not os.path.isdir(self.path) and create:
             os.mkdir(self.path)
             self.createIndex()
 
         # Let's avoid reading the index unless we really need to.
-        self._indexFileExists = os.path.isfile(self._indexFile())
+        self._indexFileExists = self._indexStore.exists()
 
     def _indexFile(self):
         """Return the name of the index file for this directory. NOT the same as indexFile()"""
-        return os.path.join(self.path, '.index')
+        return self._indexStore.indexFile()
+
+    def indexFormat(self):
+        """Return the storage format of this directory's index ('config' or 'binary')."""
+        return self._indexStore.format
+
+    def convertIndex(self, fmt, recursive=False):
+        """Migrate this directory's index to a different storage format ('config' or 'binary').
+
+        The old index file is removed once the new one has been written. Converting to 'config'
+        produces a legacy '.index' file readable by older versions of ACQ4.
+        If *recursive* is True, convert all managed subdirectories as well.
+        """
+        with self.lock:
+            if self.isManaged() and self._indexStore.format != fmt:
+                index = self._readIndex()
+                newStore = getIndexStoreClass(fmt)(self.path, self._indexStore.cache)
+                newStore.write(index)
+                self._indexStore.delete()
+                self._indexStore = newStore
+            if recursive:
+                for d in self.subDirs():
+                    self[d].convertIndex(fmt, recursive=True)
+
+    def exportIndex(self, fileName):
+        """Write a copy of this directory's index to *fileName* in the legacy config-file format."""
+        with self.lock:
+            self._indexStore.export(fileName)
 
     def _logFile(self):
         return os.path.join(self.path, '.log')
@@ -585,14 +644,25 @@ class DirHandle(FileHandle):
                 return files[:]
 
     def _updateLsCache(self, sortMode):
+        cache = self.manager.metadataCache
+        if cache is not None:
+            dirStamp, dirMTime = fileStamp(self.path)
+            indexStamp, indexMTime = fileStamp(self._indexFile())
+            stamp = (sortMode, dirStamp, indexStamp)
+            files = cache.get('ls', self.path, stamp)
+            if files is not None:
+                self.lsCache[sortMode] = files
+                return
+
         try:
             files = os.listdir(self.name())
         except Exception:
             printExc(f"Error while listing files in {self.name()}:")
             files = []
-        for i in ['.index', '.log']:
+        for i in indexFileNames() + ['.log']:
             if i in files:
                 files.remove(i)
+        files = [f for f in files if not isCacheFileName(f)]
 
         if sortMode == 'date':
             # Sort files by creation time
@@ -610,11 +680,28 @@ class DirHandle(FileHandle):
             raise ValueError(f'Unrecognized sort mode "{sortMode}"')
 
         self.lsCache[sortMode] = files
+        if cache is not None and dirStamp is not None:
+            cache.set('ls', self.path, stamp, files, mtime=max(dirMTime, indexMTime or 0))
 
     def __iter__(self):
         for f in self.ls():
             yield self[f]
 
+    def walk(self, parallel=False, maxWorkers=None):
+        """Generate (dirHandle, subDirNames, fileNames) for this directory and every directory beneath it.
+
+        Works like os.walk(); see treescan.walk() for details.
+        """
+        return treescan.walk(self, parallel=parallel, maxWorkers=maxWorkers)
+
+    def scanTree(self, infoKeys=(), parallel=True, maxWorkers=None, block=False):
+        """Return a Future that generates a flat table of every file and directory beneath this one.
+
+        This is much faster than recursively calling ls() and info() on large or network-mounted
+        trees; see treescan.scanTree() for details.
+        """
+        return treescan.scanTree(self, infoKeys=infoKeys, parallel=parallel, maxWorkers=maxWorkers, block=block)
+
     def _getFileCTime(self, fileName):
         if self.isManaged():
             index = self._readIndex()
@@ -682,14 +769,21 @@ class DirHandle(FileHandle):
                 fileName = self.incrementFileName(fileName)
 
             ## Write file
-            open(os.path.join(self.name(), fileName), 'w')
-
-            self._childChanged()
+            fn = os.path.join(self.name(), fileName)
+            isNew = not os.path.exists(fn)
+            open(fn, 'w').close()
 
-            ## Write meta-info
+            ## Write meta-info; don't leave behind an unindexed file if that fails
             if '__timestamp__' not in info:
                 info['__timestamp__'] = t
-            self._setFileInfo(fileName, info)
+            try:
+                self._setFileInfo(fileName, info)
+            except Exception:
+                if isNew:
+                    os.remove(fn)
+                raise
+            finally:
+                self._childChanged()
             self.emitChanged('children', fileName)
             return self[fileName]
 
@@ -756,12 +850,7 @@ class DirHandle(FileHandle):
                 return
             index = self._readIndex(lock=False)
             if fileName in index:
-                try:
-                    del index[fileName]
-                except:
-                    print(type(index))
-                    raise
-                self._writeIndex(index, lock=False)
+                self._indexStore.remove(fileName)
                 self.emitChanged('meta', fileName)
 
     def isManaged(self, fileName=None):
@@ -824,60 +913,39 @@ class DirHandle(FileHandle):
             if not self.isManaged():
                 self.createIndex()
             index = self._readIndex(lock=False)
-            append = False
             if fileName not in index:
-                index[fileName] = {}
-                append = True
-
-            for k in info:
-                index[fileName][k] = info[k]
-
-            if append:
                 self._appendIndex({fileName: info})
-
             else:
-                self._writeIndex(index, lock=False)
+                self._indexStore.update(fileName, info)
             self.emitChanged('meta', fileName)
 
     def _readIndex(self, lock=True, unmanagedOk=False):
         with self.lock:
-            indexFile = self._indexFile()
-            if self._index is None or os.path.getmtime(indexFile) != self._indexMTime:
-                if not os.path.isfile(indexFile):
-                    if unmanagedOk:
-                        return None
-                    else:
-                        raise Exception("Directory '%s' is not managed!" % (self.name()))
-                try:
-                    self._index = readConfigFile(indexFile)
-                    self._indexMTime = os.path.getmtime(indexFile)
-                except:
-                    print("***************Error while reading index file %s!*******************" % indexFile)
-                    raise
-            return self._index
+            try:
+                return self._indexStore.read()
+            except FileNotFoundError:
+                if unmanagedOk:
+                    return None
+                else:
+                    raise Exception("Directory '%s' is not managed!" % (self.name()))
 
     def _writeIndex(self, newIndex, lock=True):
         with self.lock:
-            writeConfigFile(newIndex, self._indexFile())
-            self._index = newIndex
-            self._indexMTime = os.path.getmtime(self._indexFile())
+            self._indexStore.write(newIndex)
             self._indexFileExists = True
 
     def _appendIndex(self, info):
         with self.lock:
-            indexFile = self._indexFile()
-            appendConfigFile(info, indexFile)
+            self._indexStore.append(info)
             self._indexFileExists = True
-            for k in info:
-                self._index[k] = info[k]
-            self._indexMTime = os.path.getmtime(indexFile)
 
     def checkIndex(self):
         ind = self._readIndex(unmanagedOk=True)
         if ind is None:
             return
+        ind = ind.copy()
         changed = False
-        for f in ind:
+        for f in list(ind.keys()):
             if not self.exists(f):
                 print("File %s is no more, removing from index." % (os.path.join(self.name(), f)))
                 del ind[f]
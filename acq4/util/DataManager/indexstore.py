@@ -0,0 +1,453 @@
+"""
+indexstore.py - Storage backends for DirHandle meta-info indexes
+
+Each managed directory keeps an index mapping file names to dicts of meta-info.
+The legacy format is a human-readable config file ('.index') that must be re-parsed
+in full whenever it changes. For directories that accumulate many entries (eg. long
+TaskRunner sequences) the log-structured binary format ('.index.bin') offers O(1)
+appends and reloads only the records written since the last read.
+"""
+import base64
+import datetime
+import json
+import os
+import struct
+import uuid
+from collections import OrderedDict
+
+import numpy as np
+from pyqtgraph import Point, SRTTransform, SRTTransform3D, Transform3D, Vector
+from pyqtgraph.configfile import readConfigFile, writeConfigFile, appendConfigFile
+
+
+class IndexStore(object):
+    """Base class for index storage backends.
+
+    A store caches the index for a single directory as an OrderedDict of {fileName: info}.
+    The dict returned by read() is owned by the store; callers must modify it only through
+    append(), update(), remove() and write() so that changes are persisted.
+    """
+    format = None
+    fileName = None
+
+    def __init__(self, dirPath, cache=None):
+        self.dirPath = dirPath
+        self.cache = cache  # optional MetadataCache shared with other processes
+        self._index = None
+
+    def indexFile(self):
+        """Return the full path of the file backing this index."""
+        return os.path.join(self.dirPath, self.fileName)
+
+    def exists(self):
+        return os.path.isfile(self.indexFile())
+
+    def read(self):
+        """Return the index, reloading from disk only if it has changed since the last read."""
+        raise NotImplementedError()
+
+    def write(self, index):
+        """Replace the entire contents of the index."""
+        raise NotImplementedError()
+
+    def append(self, entries):
+        """Add new entries {fileName: info} to the index."""
+        raise NotImplementedError()
+
+    def update(self, fileName, info):
+        """Merge *info* into the existing entry for *fileName*."""
+        index = self.read()
+        index[fileName].update(info)
+        self.write(index)
+
+    def remove(self, fileName):
+        """Remove *fileName* from the index."""
+        index = self.read()
+        index.pop(fileName, None)
+        self.write(index)
+
+    def delete(self):
+        """Remove the index file from disk."""
+        if self.exists():
+            os.remove(self.indexFile())
+        self._index = None
+
+    def export(self, fileName):
+        """Write a copy of the index to *fileName* in the legacy config-file format."""
+        writeConfigFile(self.read(), fileName)
+
+
+class ConfigIndexStore(IndexStore):
+    """Legacy human-readable index, stored with pyqtgraph's config file format.
+    """
+    format = 'config'
+    fileName = '.index'
+
+    def __init__(self, dirPath, cache=None):
+        IndexStore.__init__(self, dirPath, cache)
+        self._stamp = None
+
+    def read(self):
+        indexFile = self.indexFile()
+        st = os.stat(indexFile)
+        stamp = (st.st_mtime_ns, st.st_size)
+        if self._index is None or stamp != self._stamp:
+            index = None
+            if self.cache is not None:
+                index = self.cache.get('index', indexFile, stamp)
+            if index is None:
+                try:
+                    index = readConfigFile(indexFile)
+                except:
+                    print("***************Error while reading index file %s!*******************" % indexFile)
+                    raise
+                if self.cache is not None:
+                    self.cache.set('index', indexFile, stamp, index, mtime=st.st_mtime)
+            self._index = index
+            self._stamp = stamp
+        return self._index
+
+    def _updateStamp(self):
+        st = os.stat(self.indexFile())
+        self._stamp = (st.st_mtime_ns, st.st_size)
+
+    def write(self, index):
+        writeConfigFile(index, self.indexFile())
+        self._index = index
+        self._updateStamp()
+
+    def append(self, entries):
+        indexFile = self.indexFile()
+        appendConfigFile(entries, indexFile)
+        if self._index is None:
+            self._index = OrderedDict()
+        for k in entries:
+            self._index[k] = dict(entries[k])
+        self._updateStamp()
+
+
+class BinaryIndexStore(IndexStore):
+    """Append-only, log-structured binary index.
+
+    The file begins with a header (magic, format version, and a generation id that changes
+    whenever the file is compacted) followed by length-prefixed JSON records (see encodeRecord;
+    nothing in the file is ever executed, so it is safe to open shared data). Each record
+    is an operation ('append', 'update' or 'remove') replayed in order to rebuild the index.
+    New records are appended without rewriting the file, and a reader that has already seen
+    the first N bytes only needs to read and replay what follows. The log is compacted into a
+    single record once it grows much larger than the index it describes.
+    """
+    format = 'binary'
+    fileName = '.index.bin'
+
+    MAGIC = b'ACQ4IDX\x00'
+    VERSION = 2  # version 1 used pickled records and is no longer read
+    _header = struct.Struct('<8sI16s')
+    _recordLength = struct.Struct('<I')
+
+    # compact the log when it holds more than this many records per index entry
+    compactRatio = 4
+    minCompactRecords = 256
+
+    def __init__(self, dirPath, cache=None):
+        IndexStore.__init__(self, dirPath, cache)
+        self._generation = None
+        self._offset = 0  # number of bytes already replayed into self._index
+        self._stat = None  # (size, mtime) at the time of the last complete read
+        self._nRecords = 0
+
+    def read(self):
+        indexFile = self.indexFile()
+        st = os.stat(indexFile)
+        if self._index is not None and (st.st_size, st.st_mtime_ns) == self._stat:
+            return self._index
+
+        try:
+            with open(indexFile, 'rb') as fh:
+                generation = self._readHeader(fh)
+                if self._index is None or generation != self._generation or st.st_size < self._offset:
+                    # first read, or file was compacted by someone else; start over
+                    index = OrderedDict()
+                    offset = self._header.size
+                    nRecords = 0
+                else:
+                    index = self._index
+                    offset = self._offset
+                    nRecords = self._nRecords
+                fh.seek(offset)
+                data = fh.read()
+        except:
+            print("***************Error while reading index file %s!*******************" % indexFile)
+            raise
+
+        consumed, nNew = self._replay(index, data)
+        self._index = index
+        self._generation = generation
+        self._offset = offset + consumed
+        self._nRecords = nRecords + nNew
+        # a partial record at the end means another writer is mid-append; check again next time
+        self._stat = (st.st_size, st.st_mtime_ns) if consumed == len(data) else None
+        return self._index
+
+    def write(self, index):
+        index = OrderedDict((k, dict(v)) for k, v in index.items())
+        generation = uuid.uuid4().bytes
+        indexFile = self.indexFile()
+        tmpFile = indexFile + '.tmp'
+        record = self._encode('append', index)
+        with open(tmpFile, 'wb') as fh:
+            fh.write(self._header.pack(self.MAGIC, self.VERSION, generation))
+            fh.write(record)
+        os.replace(tmpFile, indexFile)
+        st = os.stat(indexFile)
+        self._index = index
+        self._generation = generation
+        self._offset = st.st_size
+        self._stat = (st.st_size, st.st_mtime_ns)
+        self._nRecords = 1
+
+    def append(self, entries):
+        entries = OrderedDict((k, dict(v)) for k, v in entries.items())
+        if not self.exists():
+            index = OrderedDict() if self._index is None else OrderedDict(self._index)
+            index.update(entries)
+            self.write(index)
+            return
+        self.read()
+        self._appendRecord('append', entries)
+        self._index.update(entries)
+
+    def update(self, fileName, info):
+        self.read()
+        info = dict(info)
+        self._appendRecord('update', (fileName, info))
+        self._index[fileName].update(info)
+        self._compactIfNeeded()
+
+    def remove(self, fileName):
+        self.read()
+        self._appendRecord('remove', fileName)
+        self._index.pop(fileName, None)
+        self._compactIfNeeded()
+
+    def delete(self):
+        IndexStore.delete(self)
+        self._generation = None
+        self._offset = 0
+        self._stat = None
+        self._nRecords = 0
+
+    def _compactIfNeeded(self):
+        if self._nRecords > max(self.minCompactRecords, self.compactRatio * len(self._index)):
+            self.write(self._index)
+
+    def _appendRecord(self, op, args):
+        record = self._encode(op, args)
+        with open(self.indexFile(), 'ab') as fh:
+            pos = fh.seek(0, os.SEEK_END)
+            fh.write(record)
+        if pos == self._offset:
+            # nobody else has written since our last read; skip our own record on the next read
+            st = os.stat(self.indexFile())
+            self._offset = pos + len(record)
+            self._nRecords += 1
+            if st.st_size == self._offset:
+                self._stat = (st.st_size, st.st_mtime_ns)
+        else:
+            # another writer got in first; the next read will replay both (all ops are idempotent)
+            self._stat = None
+
+    def _readHeader(self, fh):
+        header = fh.read(self._header.size)
+        if len(header) < self._header.size:
+            raise IOError("Index file %s is truncated." % self.indexFile())
+        magic, version, generation = self._header.unpack(header)
+        if magic != self.MAGIC:
+            raise IOError("File %s is not a binary index file." % self.indexFile())
+        if version != self.VERSION:
+            raise IOError("Index file %s has unsupported version %d." % (self.indexFile(), version))
+        return generation
+
+    @classmethod
+    def _encode(cls, op, args):
+        payload = encodeRecord([op, args])
+        return cls._recordLength.pack(len(payload)) + payload
+
+    @classmethod
+    def _replay(cls, index, data):
+        """Apply all complete records in *data* to *index*.
+
+        Return the number of bytes consumed and the number of records applied.
+        """
+        pos = 0
+        count = 0
+        lenSize = cls._recordLength.size
+        while pos + lenSize <= len(data):
+            (n,) = cls._recordLength.unpack_from(data, pos)
+            if pos + lenSize + n > len(data):
+                break
+            op, args = decodeRecord(data[pos + lenSize:pos + lenSize + n])
+            if op == 'append':
+                index.update(args)
+            elif op == 'update':
+                fileName, info = args
+                index.setdefault(fileName, {}).update(info)
+            elif op == 'remove':
+                index.pop(args, None)
+            else:
+                raise ValueError("Unknown index record type '%s'" % op)
+            pos += lenSize + n
+            count += 1
+        return pos, count
+
+
+## Meta-info values are encoded as JSON. Types that JSON cannot represent (and dicts with
+## non-string keys) are written as objects tagged with the '__type__' key.
+_TAG = '__type__'
+
+
+def encodeRecord(obj):
+    """Encode *obj* (meta-info made of dicts, lists, tuples, strings, numbers, numpy arrays and
+    scalars, bytes, datetimes, Points, Vectors and pyqtgraph transforms) as UTF-8 JSON bytes."""
+    return json.dumps(_encodeValue(obj), separators=(',', ':')).encode('utf-8')
+
+
+def decodeRecord(data):
+    """Inverse of encodeRecord()."""
+    return _decodeValue(json.loads(data.decode('utf-8')))
+
+
+def _encodeValue(v):
+    if v is None or isinstance(v, (bool, int, float, str)):
+        return v
+    if isinstance(v, dict):
+        if all(isinstance(k, str) for k in v) and _TAG not in v:
+            return {k: _encodeValue(x) for k, x in v.items()}
+        return {_TAG: 'dict', 'items': [[_encodeValue(k), _encodeValue(x)] for k, x in v.items()]}
+    if isinstance(v, list):
+        return [_encodeValue(x) for x in v]
+    if isinstance(v, tuple):
+        return {_TAG: 'tuple', 'items': [_encodeValue(x) for x in v]}
+    if isinstance(v, np.ndarray):
+        if v.dtype.hasobject:
+            return {_TAG: 'objarray', 'shape': list(v.shape), 'items': [_encodeValue(x) for x in v.ravel()]}
+        return {
+            _TAG: 'ndarray',
+            'dtype': np.lib.format.dtype_to_descr(v.dtype),
+            'shape': list(v.shape),
+            'data': base64.b64encode(np.ascontiguousarray(v).tobytes()).decode('ascii'),
+        }
+    if isinstance(v, np.generic):
+        return _encodeValue(v.item())
+    if isinstance(v, bytes):
+        return {_TAG: 'bytes', 'data': base64.b64encode(v).decode('ascii')}
+    if isinstance(v, datetime.datetime):
+        return {_TAG: 'datetime', 'value': v.isoformat()}
+    if isinstance(v, datetime.date):
+        return {_TAG: 'date', 'value': v.isoformat()}
+    if isinstance(v, Point):
+        return {_TAG: 'Point', 'items': [v.x(), v.y()]}
+    if isinstance(v, Vector):
+        return {_TAG: 'Vector', 'items': [v.x(), v.y(), v.z()]}
+    ## SRT transforms are stored by their state so they come back as the same type; any other
+    ## Transform3D is stored as its matrix
+    if isinstance(v, (SRTTransform, SRTTransform3D)):
+        return {_TAG: type(v).__name__, 'state': _encodeValue(v.saveState())}
+    if isinstance(v, Transform3D):
+        return {_TAG: 'Transform3D', 'matrix': v.matrix().tolist()}
+    raise TypeError("Cannot store value of type %s in a binary index: %r" % (type(v).__name__, v))
+
+
+def _decodeValue(v):
+    if isinstance(v, list):
+        return [_decodeValue(x) for x in v]
+    if not isinstance(v, dict):
+        return v
+    tag = v.get(_TAG)
+    if tag is None:
+        return {k: _decodeValue(x) for k, x in v.items()}
+    if tag == 'dict':
+        return {_hashable(_decodeValue(k)): _decodeValue(x) for k, x in v['items']}
+    if tag == 'tuple':
+        return tuple(_decodeValue(x) for x in v['items'])
+    if tag == 'ndarray':
+        dtype = np.lib.format.descr_to_dtype(_dtypeDescr(v['dtype']))
+        return np.frombuffer(base64.b64decode(v['data']), dtype=dtype).reshape(v['shape']).copy()
+    if tag == 'objarray':
+        arr = np.empty(len(v['items']), dtype=object)
+        arr[:] = [_decodeValue(x) for x in v['items']]
+        return arr.reshape(v['shape'])
+    if tag == 'bytes':
+        return base64.b64decode(v['data'])
+    if tag == 'datetime':
+        return datetime.datetime.fromisoformat(v['value'])
+    if tag == 'date':
+        return datetime.date.fromisoformat(v['value'])
+    if tag == 'Point':
+        return Point(*v['items'])
+    if tag == 'Vector':
+        return Vector(*v['items'])
+    if tag == 'SRTTransform':
+        return SRTTransform(_decodeValue(v['state']))
+    if tag == 'SRTTransform3D':
+        return SRTTransform3D(_decodeValue(v['state']))
+    if tag == 'Transform3D':
+        return Transform3D(*np.ravel(v['matrix']))
+    raise ValueError("Unknown value type '%s' in index record" % tag)
+
+
+def _hashable(v):
+    ## dict keys come back from JSON as lists; convert them to tuples
+    if isinstance(v, list):
+        return tuple(_hashable(x) for x in v)
+    return v
+
+
+def _dtypeDescr(d):
+    ## restore the (name, descr[, shape]) field tuples of a structured dtype description
+    if isinstance(d, str):
+        return d
+    return [(f[0], _dtypeDescr(f[1])) + tuple(tuple(x) for x in f[2:]) for f in d]
+
+
+INDEX_FORMATS = OrderedDict([
+    (BinaryIndexStore.format, BinaryIndexStore),
+    (ConfigIndexStore.format, ConfigIndexStore),
+])
+
+
+def indexFileNames():
+    """Return the names of all files that may hold a directory index (these are hidden from directory listings)."""
+    names = []
+    for cls in INDEX_FORMATS.values():
+        names.extend([cls.fileName, cls.fileName + '.tmp'])
+    return names
+
+
+def isCacheFileName(name):
+    """Return True if *name* is a hidden sidecar cache or index written next to a data file
+    (eg. '.<file>.cache' or '.log.jsonl.index').
+
+    These are regenerated as needed and are hidden from directory listings.
+    """
+    return name.startswith('.') and name.endswith(('.cache', '.cache.tmp', '.index'))
+
+
+def getIndexStoreClass(fmt):
+    try:
+        return INDEX_FORMATS[fmt]
+    except KeyError:
+        raise ValueError("Unknown index format '%s'; options are %s" % (fmt, list(INDEX_FORMATS.keys())))
+
+
+def openIndexStore(dirPath, defaultFormat='config', cache=None):
+    """Return an IndexStore for *dirPath*.
+
+    If the directory already has an index, a store matching its format is returned. Otherwise,
+    the store uses *defaultFormat* (the index file is not created until it is first written).
+    """
+    for cls in INDEX_FORMATS.values():
+        store = cls(dirPath, cache)
+        if store.exists():
+            return store
+    return getIndexStoreClass(defaultFormat)(dirPath, cache)
@@ -0,0 +1,186 @@
+"""
+metacache.py - Persistent metadata cache shared between processes
+
+Opening a large data tree requires listing every directory, parsing every index file,
+and looking up creation times for every file. The results rarely change, so MetadataCache
+stores them in an SQLite database that can be shared by all ACQ4 and analysis processes
+(and reused across sessions). Each entry is stored with a stamp derived from the
+modification time of the file(s) it was computed from; an entry is only returned if
+its stamp still matches, so stale data is never used even if invalidation is missed.
+"""
+import os
+import pickle
+import sqlite3
+import threading
+import time
+
+from acq4.util.debug import printExc
+
+
+class MetadataCache(object):
+    """Key/value cache of directory metadata, keyed by (kind, path) and validated by stamp.
+
+    *kind* is a short string identifying the type of data (eg. 'index' or 'ls'), *path* is the
+    absolute path of the file or directory the data describes, and *stamp* is any picklable
+    value that changes whenever the source data changes (typically mtimes and sizes).
+
+    Errors accessing the database are reported once and then the cache is disabled, so a
+    corrupt or unreachable cache file never prevents data from being read.
+    """
+    SCHEMA_VERSION = 2
+
+    # entries whose source was modified more recently than this (seconds) are not stored,
+    # because a further change within the filesystem's timestamp resolution could go unnoticed.
+    racyInterval = 2.0
+
+    def __init__(self, fileName):
+        self.fileName = os.path.abspath(fileName)
+        self._local = threading.local()
+        self._disabled = False
+        dirName = os.path.dirname(self.fileName)
+        if not os.path.isdir(dirName):
+            os.makedirs(dirName)
+        self._connection()
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.fileName, timeout=10.0)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            version = conn.execute('PRAGMA user_version').fetchone()[0]
+            if version != self.SCHEMA_VERSION:
+                with conn:
+                    conn.execute('DROP TABLE IF EXISTS entries')
+                    conn.execute('PRAGMA user_version=%d' % self.SCHEMA_VERSION)
+            with conn:
+                conn.execute(
+                    'CREATE TABLE IF NOT EXISTS entries '
+                    '(kind TEXT, path TEXT, stamp BLOB, value BLOB, time REAL, PRIMARY KEY (kind, path))'
+                )
+            self._local.conn = conn
+        return conn
+
+    def _failed(self):
+        printExc("Error accessing metadata cache %s; cache disabled:" % self.fileName)
+        self._disabled = True
+
+    @staticmethod
+    def _key(path):
+        return os.path.normcase(os.path.abspath(path))
+
+    def get(self, kind, path, stamp):
+        """Return the value cached for (kind, path), or None if there is no entry or its stamp has changed."""
+        if self._disabled:
+            return None
+        try:
+            row = self._connection().execute(
+                'SELECT stamp, value FROM entries WHERE kind=? AND path=?', (kind, self._key(path))
+            ).fetchone()
+            if row is None or pickle.loads(row[0]) != stamp:
+                return None
+            return pickle.loads(row[1])
+        except Exception:
+            self._failed()
+            return None
+
+    def set(self, kind, path, stamp, value, mtime=None):
+        """Store *value* for (kind, path).
+
+        If *mtime* is given and is too recent for the stamp to be trustworthy, nothing is stored.
+        """
+        if self._disabled:
+            return
+        if mtime is not None and time.time() - mtime < self.racyInterval:
+            return
+        try:
+            conn = self._connection()
+            with conn:
+                conn.execute(
+                    'INSERT OR REPLACE INTO entries (kind, path, stamp, value, time) VALUES (?, ?, ?, ?, ?)',
+                    (kind, self._key(path), pickle.dumps(stamp, protocol=4), pickle.dumps(value, protocol=4),
+                     time.time())
+                )
+        except Exception:
+            self._failed()
+
+    def invalidate(self, path, recursive=True):
+        """Remove all entries for *path* (and, if *recursive*, everything beneath it)."""
+        if self._disabled:
+            return
+        key = self._key(path)
+        try:
+            conn = self._connection()
+            with conn:
+                conn.execute('DELETE FROM entries WHERE path=?', (key,))
+                if recursive:
+                    prefix = os.path.join(key, '')
+                    conn.execute(
+                        'DELETE FROM entries WHERE substr(path, 1, ?) = ?', (len(prefix), prefix)
+                    )
+        except Exception:
+            self._failed()
+
+    def prune(self, maxAge=None, maxSize=None, kinds=None):
+        """Remove old entries from the cache.
+
+        Entries stored more than *maxAge* seconds ago are removed. Then, if the stored values
+        take up more than *maxSize* bytes, the oldest entries are removed until they fit. If
+        *kinds* is given, only entries of those kinds are considered (and counted).
+        """
+        if self._disabled:
+            return
+        where = ''
+        args = ()
+        if kinds is not None:
+            kinds = list(kinds)
+            where = 'kind IN (%s)' % ','.join('?' * len(kinds))
+            args = tuple(kinds)
+        try:
+            conn = self._connection()
+            with conn:
+                if maxAge is not None:
+                    conn.execute(
+                        'DELETE FROM entries WHERE (time IS NULL OR time < ?)' + (' AND ' + where if where else ''),
+                        (time.time() - maxAge,) + args
+                    )
+                if maxSize is not None:
+                    rows = conn.execute(
+                        'SELECT rowid, length(value) FROM entries' + (' WHERE ' + where if where else '') +
+                        ' ORDER BY time DESC', args
+                    ).fetchall()
+                    total = 0
+                    remove = []
+                    for rowid, size in rows:
+                        total += size
+                        if total > maxSize:
+                            remove.append((rowid,))
+                    conn.executemany('DELETE FROM entries WHERE rowid=?', remove)
+        except Exception:
+            self._failed()
+
+    def clear(self):
+        """Remove all entries from the cache."""
+        if self._disabled:
+            return
+        try:
+            conn = self._connection()
+            with conn:
+                conn.execute('DELETE FROM entries')
+        except Exception:
+            self._failed()
+
+    def close(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+
+def fileStamp(fileName):
+    """Return (stamp, mtime) identifying the current state of *fileName*, or (None, None) if it does not exist."""
+    try:
+        st = os.stat(fileName)
+    except FileNotFoundError:
+        return None, None
+    return (st.st_mtime_ns, st.st_size), st.st_mtime
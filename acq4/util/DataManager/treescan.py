@@ -0,0 +1,194 @@
+"""
+treescan.py - Bulk traversal of data directory trees
+
+Walking a data set with ls() and info() visits one directory at a time and, for date-sorted
+listings, looks up a creation time for every file. On network-mounted storage the latency of
+each of these calls dominates. The functions here list and read directories from a pool of
+threads so that many requests are in flight at once.
+"""
+import os
+import re
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+import numpy as np
+
+from acq4.util.future import Future
+from .indexstore import openIndexStore, indexFileNames, isCacheFileName
+
+
+def walk(dh, parallel=False, maxWorkers=None):
+    """Generate (dirHandle, subDirNames, fileNames) for *dh* and every directory beneath it.
+
+    Directories are visited top-down, in the same order as os.walk(). As with os.walk(), the
+    caller may remove names from subDirNames to prevent those directories from being visited.
+    If *parallel* is True, the listings of subdirectories are fetched by a thread pool while the
+    caller is busy with their parent.
+    """
+    if not parallel:
+        stack = [dh]
+        while stack:
+            d, dirs, files = _listDir(stack.pop())
+            yield d, dirs, files
+            stack.extend(reversed([d[name] for name in dirs]))
+        return
+
+    pool = ThreadPoolExecutor(max_workers=maxWorkers)
+    try:
+        stack = [pool.submit(_listDir, dh)]
+        while stack:
+            d, dirs, files = stack.pop().result()
+            pending = OrderedDict((name, pool.submit(_listDir, d[name])) for name in dirs)
+            yield d, dirs, files
+            for name in set(pending) - set(dirs):
+                pending[name].cancel()
+            stack.extend(reversed([pending[name] if name in pending else pool.submit(_listDir, d[name]) for name in dirs]))
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _listDir(dh):
+    files = dh.ls()
+    dirs = [f for f in files if os.path.isdir(os.path.join(dh.name(), f))]
+    files = [f for f in files if f not in dirs]
+    return dh, dirs, files
+
+
+def scanTree(dh, infoKeys=(), parallel=True, maxWorkers=None, block=False):
+    """Collect a flat table describing every file and directory beneath *dh*.
+
+    Returns a TreeScanFuture whose result is an OrderedDict of equal-length arrays (one row per
+    file or directory, sorted by path) with the columns:
+
+    * path: path relative to *dh*
+    * isDir: True for directories
+    * dirType: the 'dirType' meta-info value for directories (None for files)
+    * timestamp: creation time, taken from the index when available
+    * one column for each name in *infoKeys*, holding the meta-info value or None
+
+    If *parallel* is True, directories are listed and their indexes read by a pool of
+    *maxWorkers* threads. If *block* is True, wait for the scan to finish before returning.
+    """
+    fut = TreeScanFuture(dh, infoKeys, parallel, maxWorkers)
+    if block:
+        fut.wait()
+    return fut
+
+
+class TreeScanFuture(Future):
+    """Tracks the progress of a scanTree() call.
+
+    The total number of directories is not known until the scan finishes, so percentDone()
+    reports the fraction of directories found so far that have been scanned.
+    """
+    def __init__(self, dh, infoKeys, parallel, maxWorkers):
+        Future.__init__(self)
+        self.root = dh.name()
+        self.infoKeys = list(infoKeys)
+        self._cache = getattr(dh.manager, 'metadataCache', None)
+        self._dirsFound = 1
+        self._dirsScanned = 0
+        self.executeInThread(self._run, (parallel, maxWorkers), {})
+
+    def percentDone(self):
+        if self.isDone():
+            return 100
+        return 100 * self._dirsScanned / self._dirsFound
+
+    def _run(self, parallel, maxWorkers, _future):
+        rows = []
+        if parallel:
+            pool = ThreadPoolExecutor(max_workers=maxWorkers)
+            try:
+                pending = {pool.submit(self._scanDir, self.root, None)}
+                while pending:
+                    self.checkStop()
+                    done, pending = wait(pending, timeout=0.1, return_when=FIRST_COMPLETED)
+                    for fut in done:
+                        dirRows, subdirs = fut.result()
+                        rows.extend(dirRows)
+                        self._dirsScanned += 1
+                        self._dirsFound += len(subdirs)
+                        pending.update(pool.submit(self._scanDir, *args) for args in subdirs)
+            finally:
+                pool.shutdown(wait=False, cancel_futures=True)
+        else:
+            stack = [(self.root, None)]
+            while stack:
+                self.checkStop()
+                dirRows, subdirs = self._scanDir(*stack.pop())
+                rows.extend(dirRows)
+                self._dirsScanned += 1
+                self._dirsFound += len(subdirs)
+                stack.extend(subdirs)
+
+        rows.sort(key=lambda r: r[0])
+        table = OrderedDict()
+        table['path'] = _objectArray([r[0] for r in rows])
+        table['isDir'] = np.array([r[1] for r in rows], dtype=bool)
+        table['dirType'] = _objectArray([r[2] for r in rows])
+        table['timestamp'] = np.array([r[3] for r in rows], dtype=float)
+        for i, key in enumerate(self.infoKeys):
+            table[key] = _objectArray([r[4 + i] for r in rows])
+        return table
+
+    def _readIndex(self, path):
+        store = openIndexStore(path, cache=self._cache)
+        try:
+            return store.read()
+        except FileNotFoundError:
+            return {}
+
+    def _scanDir(self, path, parentEntry):
+        """Scan one directory.
+
+        Return rows for the directory itself (unless it is the root) and the files it contains,
+        plus arguments for scanning each subdirectory. Subdirectory rows are produced when the
+        subdirectory is scanned, since their meta-info lives in their own index.
+        """
+        hidden = set(indexFileNames() + ['.log'])
+        index = self._readIndex(path)
+        rows = []
+        if parentEntry is not None:
+            info = dict(parentEntry)
+            info.update(index.get('.', {}))
+            ts = self._timestamp(path, info)
+            rows.append(self._row(path, True, info.get('dirType', None), ts, info))
+
+        subdirs = []
+        with os.scandir(path) as entries:
+            for entry in entries:
+                if entry.name in hidden or isCacheFileName(entry.name):
+                    continue
+                entryInfo = index.get(entry.name, {})
+                if entry.is_dir():
+                    subdirs.append((entry.path, entryInfo))
+                else:
+                    rows.append(self._row(entry.path, False, None, self._timestamp(entry, entryInfo), entryInfo))
+        return rows, subdirs
+
+    def _row(self, path, isDir, dirType, timestamp, info):
+        return (os.path.relpath(path, self.root), isDir, dirType, timestamp) + tuple(info.get(k, None) for k in self.infoKeys)
+
+    @staticmethod
+    def _timestamp(entry, info):
+        # same order of preference as DirHandle._getFileCTime
+        if '__timestamp__' in info:
+            return info['__timestamp__']
+        name = entry.name if isinstance(entry, os.DirEntry) else os.path.basename(entry)
+        m = re.search(r'(20\d\d\.\d\d?\.\d\d?)', name)
+        if m is not None:
+            return time.mktime(time.strptime(m.groups()[0], "%Y.%m.%d"))
+        try:
+            return entry.stat().st_ctime if isinstance(entry, os.DirEntry) else os.path.getctime(entry)
+        except OSError:
+            return 0
+
+
+def _objectArray(values):
+    # np.array() would try to broadcast sequence-valued entries into extra dimensions
+    arr = np.empty(len(values), dtype=object)
+    for i, v in enumerate(values):
+        arr[i] = v
+    return arr
@@ -1,3 +1,4 @@
+import atexit
 import json
 import os
 import re
@@ -11,7 +12,6 @@ from typing import Union, Optional
 import numpy as np
 import sys
 
-import pyqtgraph.configfile as configfile
 # from pyqtgraph.debug import threadName
 from pyqtgraph import FeedbackButton
 from pyqtgraph import FileDialog
@@ -20,7 +20,7 @@ if __name__ == "__main__":
     libdir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
     sys.path = [os.path.join(libdir, "lib", "util")] + sys.path + [libdir]
 
-from acq4.util import Qt
+from acq4.util import Qt, logfile
 from acq4.util.DataManager import DirHandle
 from acq4.util.HelpfulException import HelpfulException
 from acq4.util.codeEditor import invokeCodeEditor
@@ -65,6 +65,18 @@ pageTemplate = f"""
 
 WIN: Optional["LogWindow"] = None
 
+# record array used for quick filtering of entries in LogWidget
+entryDtype = np.dtype([
+    ("index", "int32"),
+    ("importance", "int32"),
+    ("msgType", "|S10"),
+    ("directory", "|S256"),
+    ("entryId", "int32"),
+    ("file", "int32"),  # index into LogWidget.entryFiles, or -1 for entries held in memory
+    ("offset", "int64"),  # location of the entry in its log file
+    ("length", "int32"),
+])
+
 
 class LogButton(FeedbackButton):
     def __init__(self, *args):
@@ -77,7 +89,7 @@ class LogButton(FeedbackButton):
 
 class LogWindow(Qt.QMainWindow):
     """LogWindow contains a LogWidget inside a window. LogWindow is responsible for collecting messages generated by
-    the program/user, formatting them into a nested dictionary, and saving them in a log.txt file. The LogWidget
+    the program/user, formatting them into a nested dictionary, and saving them in a log.jsonl file. The LogWidget
     takes care of displaying messages.
     
     Messages can be logged by calling logMsg or logExc functions from acq4.Manager. These functions call the
@@ -106,7 +118,10 @@ class LogWindow(Qt.QMainWindow):
         self.entriesVisible = 0
         self.logFile = None
         # start a new temp log file, destroying anything left over from the last session.
-        configfile.writeConfigFile("", self.fileName())
+        logfile.removeLog(self.fileName())
+        # log entries are written to disk in batches by a background thread
+        self.writer = logfile.LogWriter()
+        atexit.register(self.writer.close)
         # weak references to all Log Buttons get added to this list, so it's easy to make them all do things, like flash red.
         self.buttons = []
         self.lock = RLock()
@@ -130,7 +145,7 @@ class LogWindow(Qt.QMainWindow):
           reasons: a list of reasons (as strings) for the message
           traceback: a list of formatted callstack/trackback objects (formatting a traceback/callstack returns a
               list of strings), usually looks like [['line 1', 'line 2', 'line3'], ['line1', 'line2']]
-           Feel free to add your own keyword arguments. These will be saved in the log.txt file, but will not affect the
+           Feel free to add your own keyword arguments. These will be saved in the log.jsonl file, but will not affect the
            content or way that messages are displayed.
         """
 
@@ -150,7 +165,6 @@ class LogWindow(Qt.QMainWindow):
             kwargs["currentDir"] = None
 
         now = datetime.now().astimezone().isoformat()
-        saveName = f"LogEntry_{self.entriesSaved}"
         with self.lock:
             self.entriesSaved += 1
             self.entriesVisible += 1
@@ -171,7 +185,7 @@ class LogWindow(Qt.QMainWindow):
         if entry.get("exception", None) is not None and "msgType" in entry["exception"]:
             entry["msgType"] = entry["exception"]["msgType"]
 
-        self.saveEntries({saveName: {**entry, "id": savedId}})
+        self.saveEntries([{**entry, "id": savedId}])
         self.wid.addEntry(entry)  # takes care of displaying the entry if it passes the current filters on the logWidget
 
         if entry["msgType"] == "error" and self.errorDialog.show(entry) is False:
@@ -283,15 +297,15 @@ class LogWindow(Qt.QMainWindow):
     def fileName(self):
         # return the log file currently used
         if self.logFile is None:
-            return "tempLog.txt"
+            return "tempLog.jsonl"
         else:
             return self.logFile.name()
 
     def setLogDir(self, dh: DirHandle):
         """
-        Move ongoing log operations to a different directory. Creates the log.txt file if needed. Temporary log entries
-        (from before a log dir was set) will be appended to log.txt. Display in the log window will remain unchanged.
-        Thereafter, new log entries will be appended to the new log file.
+        Move ongoing log operations to a different directory. Creates the log.jsonl file if needed. Temporary log
+        entries (from before a log dir was set) will be appended to log.jsonl. Display in the log window will remain
+        unchanged. Thereafter, new log entries will be appended to the new log file.
         """
         if self.fileName() == dh.name():
             return
@@ -302,30 +316,28 @@ class LogWindow(Qt.QMainWindow):
             self.logMsg(f"Previous log storage was {self.logFile.name(relativeTo=self.manager.baseDir)}.")
 
         oldfName = self.fileName()
-        if oldfName == "tempLog.txt":
-            with self.lock:
-                temp = configfile.readConfigFile(oldfName)
+        self.flush()
+        if self.logFile is None:
+            temp = list(logfile.iterEntries(oldfName))
         else:  # already saved log messages needn't be copied into the new file
-            temp = {}
+            temp = []
 
         with self.lock:
-            if dh.exists("log.txt"):
-                self.logFile = dh["log.txt"]
-                try:
-                    tempCount = max(e["id"] for e in configfile.readConfigFile(self.logFile.name()).values())
-                except IndexError:
-                    tempCount = 0
-                newTemp = {}
-                for v in temp.values():
-                    # renumber the entries to be relative to the existing file
-                    tempCount += 1
-                    v["id"] = tempCount
-                    newTemp[f"LogEntry_{tempCount}"] = v
-                self.saveEntries(newTemp)
-                self.entriesSaved = tempCount
+            if dh.exists(logfile.logFileName):
+                self.logFile = dh[logfile.logFileName]
             else:
-                self.logFile = dh.createFile("log.txt")
-                self.saveEntries(temp)
+                self.logFile = dh.createFile(logfile.logFileName)
+            # renumber the entries to be relative to those already stored in this directory (including any log.txt
+            # written by older versions)
+            tempCount = max(
+                logfile.lastEntryId(os.path.join(dh.name(), f))
+                for f in (logfile.logFileName, logfile.configLogFileName)
+            )
+            for v in temp:
+                tempCount += 1
+                v["id"] = tempCount
+            self.saveEntries(temp)
+            self.entriesSaved = tempCount
 
         self.logMsg(f"Moved log storage from {oldfName} to {self.fileName()}.")
         self.logMsg(f"Current configuration: {json.dumps(self.manager.config, cls=ACQ4JSONEncoder)}")
@@ -338,9 +350,15 @@ class LogWindow(Qt.QMainWindow):
         else:
             return self.logFile.parent()
 
-    def saveEntries(self, entry):
-        with self.lock:
-            configfile.appendConfigFile(entry, self.fileName())
+    def saveEntries(self, entries):
+        """Queue a list of entries to be appended to the current log file by the background writer."""
+        fileName = self.fileName()
+        for entry in entries:
+            self.writer.write(fileName, entry)
+
+    def flush(self):
+        """Block until all log entries have been written to disk."""
+        self.writer.flush()
 
     def disablePopups(self, disable):
         self.errorDialog.disable(disable)
@@ -359,23 +377,16 @@ class LogWidget(Qt.QWidget):
         self.ui.setupUi(self)
         self.ui.filterTree.topLevelItem(1).setExpanded(True)
 
-        self.entries = []  # stores all log entries in memory
+        self.entries = []  # stores all log entries in memory (None for entries not yet read from a log file)
+        self.entryFiles = []  # log files that entries are read from
         self.cache = {}  # for storing html strings of entries that have already been processed
         self.displayedEntries = []
         self.typeFilters = []
         self.importanceFilter = 0
         self.dirFilter = False
-        self.entryArrayBuffer = np.zeros(
-            1000,
-            dtype=[  # a record array for quick filtering of entries
-                ("index", "int32"),
-                ("importance", "int32"),
-                ("msgType", "|S10"),
-                ("directory", "|S100"),
-                ("entryId", "int32"),
-            ],
-        )
+        self.entryArrayBuffer = np.zeros(1000, dtype=entryDtype)
         self.entryArray = self.entryArrayBuffer[:0]
+        self.displayChunkSize = 1000  # number of entries read from disk and displayed at a time
 
         self.filtersChanged()
 
@@ -387,45 +398,53 @@ class LogWidget(Qt.QWidget):
         self.ui.output.anchorClicked.connect(self.linkClicked)
         self.sigScrollToAnchor.connect(self.scrollToAnchor, Qt.Qt.QueuedConnection)
 
-    def loadFile(self, f):
-        """Load the file, f. f must be able to be read by configfile.py"""
-        logConf = configfile.readConfigFile(f)
-        self.entries = []
-        self.entryArrayBuffer = np.zeros(
-            len(logConf),
-            dtype=[
-                ("index", "int32"),
-                ("importance", "int32"),
-                ("msgType", "|S10"),
-                ("directory", "|S100"),
-                ("entryId", "int32"),
-            ],
-        )
-        self.entryArray = self.entryArrayBuffer[:]
+    def loadFile(self, f, append=False):
+        """Load the log file, f. This may be a log.jsonl file written by LogWindow, or a log.txt file in the config
+        format written by older versions. If *append* is True, entries are added to those already loaded.
 
-        for i, (k, v) in enumerate(logConf.items()):
-            v["id"] = k[9:]  # record unique ID to facilitate HTML generation (javascript needs this ID)
-            self.entries.append(v)
-            self.entryArray[i] = np.array(
-                [
-                    (
-                        i,
-                        v.get("importance", 5),
-                        v.get("msgType", "status"),
-                        v.get("currentDir", ""),
-                        v.get("entryId", v["id"]),
-                    )
-                ],
-                dtype=[
-                    ("index", "int32"),
-                    ("importance", "int32"),
-                    ("msgType", "|S10"),
-                    ("directory", "|S100"),
-                    ("entryId", "int32"),
-                ],
+        For log.jsonl files, only the index is read here; entries are read from disk as they are displayed.
+        """
+        if not append:
+            self.entries = []
+            self.entryFiles = []
+            self.entryArray = self.entryArrayBuffer[:0]
+
+        if logfile.isConfigLog(f):
+            entries = logfile.readConfigLog(f)
+            index = np.array(
+                [logfile.indexRecord({**v, "id": int(v.get("entryId", v["id"]))}, 0, 0) for v in entries],
+                dtype=logfile.indexDtype,
             )
+            fileIndex = -1
+        else:
+            index = logfile.readIndex(f)
+            entries = [None] * len(index)
+            fileIndex = len(self.entryFiles)
+            self.entryFiles.append(f)
+
+        records = np.empty(len(index), dtype=entryDtype)
+        records["index"] = np.arange(len(self.entries), len(self.entries) + len(index))
+        for name in logfile.indexDtype.names:
+            records[name] = index[name]
+        records["file"] = fileIndex
+
+        self.entries.extend(entries)
+        self.entryArrayBuffer = np.concatenate([self.entryArray, records])
+        self.entryArray = self.entryArrayBuffer[:]
         self.filterEntries()  # puts all entries through current filters and displays the ones that pass
 
+    def loadEntries(self, indices):
+        """Make sure the entries at *indices* have been read from their log files."""
+        missing = np.array([i for i in indices if self.entries[i] is None], dtype=int)
+        if len(missing) == 0:
+            return
+        rows = self.entryArray[missing]
+        for fileIndex in np.unique(rows["file"]):
+            sel = rows["file"] == fileIndex
+            entries = logfile.readEntries(self.entryFiles[fileIndex], rows["offset"][sel], rows["length"][sel])
+            for i, entry in zip(missing[sel], entries):
+                self.entries[i] = entry
+
     def addEntry(self, entry):
         # All incoming messages begin here
 
@@ -442,15 +461,15 @@ class LogWidget(Qt.QWidget):
         if entryDir is None:
             entryDir = ""
 
-        arr = np.array(
-            [(i, entry["importance"], entry["msgType"], entryDir, entry["id"])],
-            dtype=[
-                ("index", "int32"),
-                ("importance", "int32"),
-                ("msgType", "|S10"),
-                ("directory", "|S100"),
-                ("entryId", "int32"),
-            ],
+        record = (
+            i,
+            entry["importance"],
+            str(entry["msgType"]).encode("utf-8"),
+            str(entryDir).encode("utf-8"),
+            entry["id"],
+            -1,
+            0,
+            0,
         )
 
         # make more room if needed
@@ -459,7 +478,7 @@ class LogWidget(Qt.QWidget):
             newArray[: len(self.entryArray)] = self.entryArray
             self.entryArrayBuffer = newArray
         self.entryArray = self.entryArrayBuffer[: len(self.entryArray) + 1]
-        self.entryArray[i] = arr
+        self.entryArray[i] = record
         self.checkDisplay(entry)  # displays the entry if it passes the current filters
 
     def setCheckStates(self, item, column):
@@ -500,25 +519,19 @@ class LogWidget(Qt.QWidget):
 
     def filterEntries(self):
         """Runs each entry in self.entries through the filters and displays if it makes it through."""
-        # make self.entries a record array, then filtering will be much faster (to OR true/false arrays, + them)
-        # TODO FutureWarning: elementwise comparison failed; returning scalar instead, but in the future will perform elementwise comparison
-        typeMask = self.entryArray["msgType"] == ""
-        for t in self.typeFilters:
-            typeMask += self.entryArray["msgType"] == t
-        mask = (self.entryArray["importance"] > self.importanceFilter) * typeMask
+        typeFilters = np.array([b""] + [t.encode("utf-8") for t in self.typeFilters], dtype=entryDtype["msgType"])
+        mask = (self.entryArray["importance"] > self.importanceFilter) & np.isin(self.entryArray["msgType"], typeFilters)
         if self.dirFilter is not False:
-            _d = np.ascontiguousarray(self.entryArray["directory"])
-            j = len(self.dirFilter)
-            i = len(_d)
-            _d = _d.view(np.byte).reshape(i, 100)[:, :j]
-            _d = _d.reshape(i * j).view("|S%d" % j)
-            mask *= _d == self.dirFilter
+            mask &= np.char.startswith(self.entryArray["directory"], self.dirFilter.encode("utf-8"))
 
-        self.ui.output.clear()
+        self.clear()
         global Stylesheet
         self.ui.output.document().setDefaultStyleSheet(Stylesheet)
-        indices = list(self.entryArray[mask]["index"])
-        self.displayEntry([self.entries[i] for i in indices])
+        indices = self.entryArray["index"][mask]
+        for start in range(0, len(indices), self.displayChunkSize):
+            chunk = indices[start:start + self.displayChunkSize]
+            self.loadEntries(chunk)
+            self.displayEntry([self.entries[i] for i in chunk])
 
     def checkDisplay(self, entry):
         # checks whether entry passes the current filters and displays it if it does.
@@ -762,32 +775,21 @@ class LogWidget(Qt.QWidget):
             self.manager.showDocumentation(target)
         elif action == "exc":
             cursor = self.ui.output.document().find(f"Show traceback {target}")
-            try:
-                tb = self.entries[int(target) - 1]["tracebackHtml"]
-            except IndexError:
-                try:
-                    matchingEntry = self.entryArray[(self.entryArray["entryId"] == (int(target)))]
-                    tb = self.entries[int(matchingEntry["index"])]["tracebackHtml"]
-                except IndexError:
-                    print(f"requested index {int(target) - 1}, but only {len(self.entries)} entries exist.")
-                    raise
-            cursor.insertHtml(tb)
+            cursor.insertHtml(self.findDisplayedEntry(target)["tracebackHtml"])
         elif action == "threads":
             cursor = self.ui.output.document().find(f"Show thread states {target}")
-            try:
-                insertion = self.entries[int(target) - 1]["threadsHtml"]
-            except IndexError:
-                try:
-                    matchingEntry = self.entryArray[(self.entryArray["entryId"] == (int(target)))]
-                    insertion = self.entries[int(matchingEntry["index"])]["threadsHtml"]
-                except IndexError:
-                    print(f"requested index {int(target) - 1}, but only {len(self.entries)} entries exist.")
-                    raise
-            cursor.insertHtml(insertion)
+            cursor.insertHtml(self.findDisplayedEntry(target)["threadsHtml"])
         elif action == 'code':
             lineNum, _, codeFile = target.partition(':')
             invokeCodeEditor(fileName=codeFile, lineNum=lineNum)
 
+    def findDisplayedEntry(self, entryId):
+        """Return the most recently displayed entry with the given id (as used in links)."""
+        for entry in reversed(self.displayedEntries):
+            if str(entry["id"]) == entryId:
+                return entry
+        raise ValueError(f"Requested log entry {entryId}, but no displayed entry has that id.")
+
     def clear(self):
         self.ui.output.clear()
         self.displayedEntries = []
@@ -0,0 +1,14 @@
+import os
+import sys
+
+
+def appDataDir():
+    """Return the user application data directory used by ACQ4 for settings and caches."""
+    if sys.platform == 'win32':
+        # resolves to "C:/Documents and Settings/User/Application Data/acq4" on XP
+        # and "C:\User\Username\AppData\Roaming" on win7
+        return os.path.join(os.environ['APPDATA'], 'acq4')
+    elif sys.platform == 'darwin':
+        return os.path.expanduser('~/Library/Preferences/acq4')
+    else:
+        return os.path.expanduser('~/.local/acq4')
@@ -7,67 +7,11 @@ import acq4.util.DataManager
 import acq4.util.debug as debug
 from acq4 import Manager
 from acq4.util import DataManager, functions
-from acq4.util.database.database import SqliteDatabase, parseColumnDefs, TableData
+from acq4.util.advancedTypes import CaselessDict
+from acq4.util.database.database import SqliteDatabase, parseColumnDefs, TableData, columnsToRecordArray
 from pyqtgraph.widgets.ProgressDialog import ProgressDialog
 
 
-class CaselessDict(OrderedDict):
-    """Case-insensitive dict. Values can be set and retrieved using keys of any case.
-    Note that when iterating, the original case is returned for each key."""
-
-    def __init__(self, *args):
-        OrderedDict.__init__(self, {})  ## requirement for the empty {} here seems to be a python bug?
-        self.keyMap = OrderedDict([(k.lower(), k) for k in OrderedDict.keys(self)])
-        if len(args) == 0:
-            return
-        elif len(args) == 1 and isinstance(args[0], dict):
-            for k in args[0]:
-                self[k] = args[0][k]
-        else:
-            raise Exception("CaselessDict may only be instantiated with a single dict.")
-
-    # def keys(self):
-    # return self.keyMap.values()
-
-    def __setitem__(self, key, val):
-        kl = key.lower()
-        if kl in self.keyMap:
-            OrderedDict.__setitem__(self, self.keyMap[kl], val)
-        else:
-            OrderedDict.__setitem__(self, key, val)
-            self.keyMap[kl] = key
-
-    def __getitem__(self, key):
-        kl = key.lower()
-        if kl not in self.keyMap:
-            raise KeyError(key)
-        return OrderedDict.__getitem__(self, self.keyMap[kl])
-
-    def __contains__(self, key):
-        return key.lower() in self.keyMap
-
-    def update(self, d):
-        for k, v in d.items():
-            self[k] = v
-
-    def copy(self):
-        return CaselessDict(OrderedDict.copy(self))
-
-    def __delitem__(self, key):
-        kl = key.lower()
-        if kl not in self.keyMap:
-            raise KeyError(key)
-        OrderedDict.__delitem__(self, self.keyMap[kl])
-        del self.keyMap[kl]
-
-    def __deepcopy__(self, memo):
-        raise Exception("deepcopy not implemented")
-
-    def clear(self):
-        OrderedDict.clear(self)
-        self.keyMap.clear()
-
-
 class AnalysisDatabase(SqliteDatabase):
     """Defines the structure for DBs used for analysis. Essential features are:
      - a table of control parameters "DbParameters"
@@ -94,6 +38,7 @@ class AnalysisDatabase(SqliteDatabase):
         create = False
         self.tableConfigCache = None
         self.columnConfigCache = CaselessDict()
+        self._dirHandleCache = {}  ## {(dirTable, rowid): DirHandle}
         
         self.setDataModel(dataModel)
         self._baseDir = None
@@ -656,14 +601,73 @@ class AnalysisDatabase(SqliteDatabase):
 
     def getDir(self, table, rowid):
         ## Return a DirHandle given table, rowid
-        res = self.select(table, ['Dir'], sql='where rowid=%d'%rowid)
-        if len(res) < 1:
-            raise Exception('rowid %d does not exist in %s' % (rowid, table)) 
-            #logMsg('rowid %d does not exist in %s' % (rowid, table), msgType='error') ### This needs to be caught further up in Photostim or somewhere, not here -- really this shouldn't be caught at all since it means something is wrong with the db
-            #return None
-        #print res
-        #return self.baseDir()[res[0]['Dir']]
-        return res[0]['Dir']
+        return self.getDirs(table, [rowid])[rowid]
+
+    def getDirs(self, table, rowids):
+        """Return a dict {rowid: DirHandle} for all rowids in the directory table.
+        Handles are cached, so repeated lookups do not hit the database."""
+        key = table.lower()
+        rowids = set(int(rid) for rid in rowids if rid is not None)
+        missing = [rid for rid in rowids if (key, rid) not in self._dirHandleCache]
+        for i in range(0, len(missing), 500):
+            chunk = missing[i:i+500]
+            res = SqliteDatabase.select(self, table, ['rowid', 'Dir'], sql='where rowid in (%s)' % ','.join(map(str, chunk)))
+            for rec in res:
+                self._dirHandleCache[(key, rec['rowid'])] = self._fileHandle(rec['Dir'])
+            for rid in chunk:
+                if (key, rid) not in self._dirHandleCache:
+                    raise Exception('rowid %d does not exist in %s' % (rid, table))
+                    #logMsg('rowid %d does not exist in %s' % (rowid, table), msgType='error') ### This needs to be caught further up in Photostim or somewhere, not here -- really this shouldn't be caught at all since it means something is wrong with the db
+        return {rid: self._dirHandleCache[(key, rid)] for rid in rowids}
+
+    def _fileHandle(self, name):
+        ## Return the file/dir handle for a name stored in a 'file' column
+        if name is None:
+            return None
+        if os.sep == '/':
+            sep = '\\'
+        else:
+            sep = '/'
+        name = name.replace(sep, os.sep) ## make sure file handles have an operating-system-appropriate separator (/ for Unix, \ for Windows)
+        return self.baseDir()[name]
+
+    def delete(self, table, where):
+        self._clearDirHandleCache(table)
+        return SqliteDatabase.delete(self, table, where)
+
+    def update(self, table, vals, where=None, rowid=None, sql=''):
+        self._clearDirHandleCache(table)
+        return SqliteDatabase.update(self, table, vals, where=where, rowid=rowid, sql=sql)
+
+    def iterInsert(self, table, records=None, replaceOnConflict=False, **args):
+        ## a replacing insert may rewrite existing rows
+        if not replaceOnConflict:
+            yield from SqliteDatabase.iterInsert(self, table, records=records, **args)
+            return
+        self._clearDirHandleCache(table)
+        try:
+            yield from SqliteDatabase.iterInsert(self, table, records=records, replaceOnConflict=True, **args)
+        finally:
+            self._clearDirHandleCache(table)
+
+    def iterInsertColumns(self, table, columns, replaceOnConflict=False, **args):
+        if not replaceOnConflict:
+            yield from SqliteDatabase.iterInsertColumns(self, table, columns, **args)
+            return
+        self._clearDirHandleCache(table)
+        try:
+            yield from SqliteDatabase.iterInsertColumns(self, table, columns, replaceOnConflict=True, **args)
+        finally:
+            self._clearDirHandleCache(table)
+
+    def removeTable(self, table):
+        self._clearDirHandleCache(table)
+        return SqliteDatabase.removeTable(self, table)
+
+    def _clearDirHandleCache(self, table):
+        key = table.lower()
+        for k in [k for k in self._dirHandleCache if k[0] == key]:
+            del self._dirHandleCache[k]
 
     def dirTableName(self, dh):
         """Return the name of the directory table that should hold dh.
@@ -780,22 +784,12 @@ class AnalysisDatabase(SqliteDatabase):
             if conf.get('Type', '').startswith('directory'):
                 rids = set([d[column] for d in data])
                 linkTable = conf['Link']
-                handles = dict([(rid, self.getDir(linkTable, rid)) for rid in rids if rid is not None])
+                handles = self.getDirs(linkTable, rids)
                 handles[None] = None
                 data[column] = list(map(handles.get, data[column]))
                     
             elif conf.get('Type', None) == 'file':
-                def getHandle(name):
-                    if name is None:
-                        return None
-                    else:
-                        if os.sep == '/':
-                            sep = '\\'
-                        else:
-                            sep = '/'
-                        name = name.replace(sep, os.sep) ## make sure file handles have an operating-system-appropriate separator (/ for Unix, \ for Windows)
-                        return self.baseDir()[name]
-                data[column] = list(map(getHandle, data[column]))
+                data[column] = list(map(self._fileHandle, data[column]))
                 
         prof.mark("converted file/dir handles")
                 
@@ -806,6 +800,64 @@ class AnalysisDatabase(SqliteDatabase):
         prof.finish()
         return ret
     
+    def selectColumns(self, table, columns='*', where=None, sql='', toArray=True, distinct=False, limit=None, offset=None):
+        """Extends selectColumns to convert directory/file columns back into Dir/FileHandles.
+        Each distinct directory or file is only looked up once."""
+        prof = debug.Profiler("AnalysisDatabase.selectColumns()", disabled=True)
+        data = SqliteDatabase.selectColumns(self, table, columns, where=where, sql=sql, toArray=False,
+                                            distinct=distinct, limit=limit, offset=offset)
+        prof.mark("got data from SQliteDatabase")
+
+        config = self.getColumnConfig(table)
+        for column, conf in config.items():
+            if column not in data:
+                continue
+            vals = data[column]
+            if conf.get('Type', '').startswith('directory'):
+                handles = self.getDirs(conf['Link'], vals)
+                lookup = handles.get
+            elif conf.get('Type', None) == 'file':
+                lookup = self._fileHandle
+            else:
+                continue
+
+            if len(vals) > 0 and vals.dtype.kind in 'iu':
+                ## no NULL values; look up each distinct value once and index back out
+                uniq, inverse = np.unique(vals, return_inverse=True)
+                uniqHandles = np.fromiter(map(lookup, uniq.tolist()), dtype=object, count=len(uniq))
+                data[column] = uniqHandles[inverse]
+            else:
+                cache = {None: None}
+                for v in vals:
+                    if v not in cache:
+                        cache[v] = lookup(v)
+                data[column] = np.fromiter(map(cache.get, vals), dtype=object, count=len(vals))
+        prof.mark("converted file/dir handles")
+
+        if toArray:
+            data = columnsToRecordArray(data)
+        prof.finish()
+        return data
+
+    def _prepareColumns(self, table, columns, ignoreUnknownColumns=False):
+        """Extends SqliteDatabase._prepareColumns() to convert Dir/FileHandles the same way as _prepareData()."""
+        if isinstance(columns, np.ndarray):
+            columns = OrderedDict([(k, columns[k]) for k in columns.dtype.names])
+        else:
+            columns = OrderedDict(columns)
+        config = self.getColumnConfig(table)
+        for colName, colConf in config.items():
+            if colName not in columns:
+                continue
+            if colConf.get('Type', '').startswith('directory') or colConf.get('Type', None) == 'file':
+                ## let _prepareData convert each distinct handle once
+                vals = list(columns[colName])
+                uniq = list(set(vals))
+                converted = self._prepareData(table, {colName: uniq}, batch=True)[colName]
+                lookup = dict(zip(uniq, converted))
+                columns[colName] = [lookup[v] for v in vals]
+        return SqliteDatabase._prepareColumns(self, table, columns, ignoreUnknownColumns)
+
     def _prepareData(self, table, data, ignoreUnknownColumns=False, batch=False):
         """
         Extends SqliteDatabase._prepareData():
@@ -116,30 +116,58 @@ class SqliteDatabase:
         ============== ================================================================
         """
         p = debug.Profiler("SqliteDatabase.select", disabled=True)
-        if columns != '*':
-            # if isinstance(columns, str):
-            # columns = columns.split(',')
-            if not isinstance(columns, str):
-                qf = []
-                for f in columns:
-                    if f == '*':
-                        qf.append(f)
-                    else:
-                        qf.append('"' + f + '"')
-                columns = ','.join(qf)
-            # columns = quoteList(columns)
-
-        whereStr = self._buildWhereClause(where, table)
-        distinct = "distinct" if (distinct is True) else ""
-        limit = ("limit %d" % limit) if (limit is not None) else ""
-        offset = ("offset %d" % offset) if (offset is not None) else ""
-
-        cmd = "SELECT %s %s FROM %s %s %s %s %s" % (distinct, columns, table, whereStr, sql, limit, offset)
+        cmd = self._selectCommand(table, columns, where, sql, distinct, limit, offset)
         p.mark("generated command")
         q = self.exe(cmd, toDict=toDict, toArray=toArray)
         p.finish()
         return q
 
+    def selectColumns(self, table, columns='*', where=None, sql='', toArray=True, distinct=False, limit=None,
+                      offset=None):
+        """
+        Construct and execute a SELECT statement, returning the results column-by-column.
+
+        This is much faster than select() for large result sets because records are never
+        converted to dicts; each column is converted to a numpy array in a single step.
+        Integer and real columns become int/float arrays where possible (NULL values in a
+        real column become NaN), all other columns become object arrays. Pickled objects in
+        BLOB columns are unpickled.
+
+        All arguments are the same as for select(), except:
+
+        ============== ================================================================
+        toArray        If True (default), return a numpy record array. Otherwise, return an
+                       OrderedDict of {columnName: array}.
+        ============== ================================================================
+
+        Unlike select(), an empty result is returned as a zero-length array with the
+        requested columns.
+        """
+        p = debug.Profiler("SqliteDatabase.selectColumns", disabled=True)
+        cmd = self._selectCommand(table, columns, where, sql, distinct, limit, offset)
+        cur = self.db.cursor()
+        cur.row_factory = None  ## plain tuples
+        cur.execute(cmd)
+        names = [d[0] for d in cur.description]
+        rows = cur.fetchall()
+        p.mark("executed query")
+
+        schema = self.tableSchema(table) if self.hasTable(table) else {}
+        if len(rows) > 0:
+            values = list(zip(*rows))
+        else:
+            values = [()] * len(names)
+        data = collections.OrderedDict()
+        for i, name in enumerate(names):
+            data[name] = self._columnToArray(values[i], schema[name] if name in schema else '')
+        p.mark("converted columns")
+
+        if toArray:
+            data = columnsToRecordArray(data)
+            p.mark("built record array")
+        p.finish()
+        return data
+
     def iterSelect(self, *args, **kargs):
         """
         Return a generator that iterates through the results of a select query using limit/offset arguments.
@@ -236,6 +264,50 @@ class SqliteDatabase:
 
         p.finish()
 
+    def insertColumns(self, table, columns, replaceOnConflict=False, ignoreExtraColumns=False):
+        """Insert records given column-by-column into table.
+
+        *columns* may be a numpy record array or a dict of {columnName: array or list}. Each column is
+        converted for storage in a single step and all records are bound with executemany(), so this is
+        much faster than insert() for large amounts of data. See insert() for the other arguments.
+        """
+        for n, nmax in self.iterInsertColumns(table, columns, replaceOnConflict=replaceOnConflict,
+                                              ignoreExtraColumns=ignoreExtraColumns, chunkAll=True):
+            pass
+
+    def iterInsertColumns(self, table, columns, replaceOnConflict=False, ignoreExtraColumns=False, chunkSize=10000,
+                          chunkAll=False):
+        """
+        Iteratively insert chunks of column data into a table while yielding a tuple (n, max)
+        indicating progress. This *must* be used inside a for loop (see iterInsert()).
+        See insertColumns() for a description of the arguments.
+        """
+        p = debug.Profiler("SqliteDatabase.insertColumns", disabled=True)
+        with self.transaction():
+            columns = self._prepareColumns(table, columns, ignoreUnknownColumns=ignoreExtraColumns)
+            p.mark("prepared data")
+            names = list(columns.keys())
+            if len(names) == 0:
+                return
+            numRecs = len(columns[names[0]])
+            if numRecs == 0:
+                return
+
+            insert = "INSERT"
+            if replaceOnConflict:
+                insert += " OR REPLACE"
+            cmd = "%s INTO %s (%s) VALUES (%s)" % (insert, table, quoteList(names), ','.join(['?'] * len(names)))
+
+            values = [columns[n] for n in names]
+            if chunkAll:
+                chunkSize = numRecs
+            chunkSize = int(chunkSize)
+            for offset in range(0, numRecs, chunkSize):
+                self.db.executemany(cmd, zip(*[v[offset:offset + chunkSize] for v in values]))
+                yield (min(offset + chunkSize, numRecs), numRecs)
+            p.mark("Transaction done")
+        p.finish()
+
     def delete(self, table, where):
         with self.transaction():
             whereStr = self._buildWhereClause(where, table)
@@ -351,6 +423,28 @@ class SqliteDatabase:
     def tableLength(self, table):
         return self('select count(*) from "%s"' % table)[0]['count(*)']
 
+    def _selectCommand(self, table, columns='*', where=None, sql='', distinct=False, limit=None, offset=None):
+        ## Generate the SQL for select() / selectColumns()
+        if columns != '*':
+            # if isinstance(columns, str):
+            # columns = columns.split(',')
+            if not isinstance(columns, str):
+                qf = []
+                for f in columns:
+                    if f == '*':
+                        qf.append(f)
+                    else:
+                        qf.append('"' + f + '"')
+                columns = ','.join(qf)
+            # columns = quoteList(columns)
+
+        whereStr = self._buildWhereClause(where, table)
+        distinct = "distinct" if (distinct is True) else ""
+        limit = ("limit %d" % limit) if (limit is not None) else ""
+        offset = ("offset %d" % offset) if (offset is not None) else ""
+
+        return "SELECT %s %s FROM %s %s %s %s %s" % (distinct, columns, table, whereStr, sql, limit, offset)
+
     def _buildWhereClause(self, where, table):
         if where is None or len(where) == 0:
             return ''
@@ -430,6 +524,75 @@ class SqliteDatabase:
         # print "new data:", newData
         return newData
 
+    def _prepareColumns(self, table, columns, ignoreUnknownColumns=False):
+        ## Columnar version of _prepareData. (internal use only)
+        ## Returns an OrderedDict of {columnName: list of values}, ready to be bound to a query.
+        ## Numerical and text arrays are converted in a single step; only BLOB columns and
+        ## columns holding a mixture of types are converted value-by-value.
+        if isinstance(columns, np.ndarray):
+            columns = collections.OrderedDict([(k, columns[k]) for k in columns.dtype.names])
+        schema = self.tableSchema(table)
+        newData = collections.OrderedDict()
+        for k, vals in columns.items():
+            if k not in schema and k.lower() != 'rowid':
+                if ignoreUnknownColumns:
+                    continue
+                raise Exception("Column '%s' not present in table '%s'" % (k, table))
+            typ = schema[k].lower() if k in schema else ''
+            if isinstance(vals, np.ndarray):
+                kind = vals.dtype.kind
+                if typ == 'real' and kind in 'iub':
+                    vals = vals.astype(float)
+                    kind = 'f'
+            else:
+                kind = 'O'
+            vals = vals.tolist() if isinstance(vals, np.ndarray) else list(vals)
+
+            if typ == 'blob':
+                dump = pickle.dumps
+                newData[k] = [None if v is None else buffer(dump(v)) for v in vals]
+            elif (typ == 'int' and kind in 'iub') or (typ == 'real' and kind == 'f') or (typ == 'text' and kind == 'U'):
+                ## tolist() already returned python int / float / str
+                newData[k] = vals
+            elif typ in ('int', 'real', 'text'):
+                conv = {'int': int, 'real': float, 'text': str}[typ]
+                newData[k] = [self._convertValue(table, k, typ, conv, v) for v in vals]
+            else:
+                newData[k] = vals
+        return newData
+
+    def _convertValue(self, table, column, typ, converter, val):
+        ## convert a single value the same way _prepareData does
+        if val is None:
+            return val
+        try:
+            return converter(val)
+        except Exception:
+            if column.lower() != 'rowid':
+                print("Warning: Setting %s column %s.%s with type %s" % (typ, table, column, str(type(val))))
+            return val
+
+    def _columnToArray(self, values, typ):
+        ## Convert one column of query results (a tuple of values) into a numpy array.
+        typ = typ.lower()
+        n = len(values)
+        if typ == 'blob':
+            values = [pickle.loads(v) if isinstance(v, (bytes, buffer)) else v for v in values]
+        elif n > 0:
+            try:
+                if typ == 'real':
+                    return np.array(values, dtype=float)  ## NULL becomes NaN
+                arr = np.array(values)
+                if arr.ndim == 1 and arr.dtype.kind in 'if':
+                    return arr
+            except (TypeError, ValueError, OverflowError):
+                pass
+        elif typ == 'int':
+            return np.empty(0, dtype=int)
+        elif typ == 'real':
+            return np.empty(0, dtype=float)
+        return np.fromiter(values, dtype=object, count=n)
+
     def _queryToDict(self, q):
         prof = debug.Profiler("_queryToDict", disabled=True)
         res = []
@@ -464,8 +627,8 @@ class SqliteDatabase:
             name = names[i]
             ## Unpickle byte arrays into their original objects.
             ## (Hopefully they were stored as pickled data in the first place!)
-            if isinstance(val, buffer):
-                val = pickle.loads(str(val))
+            if isinstance(val, (bytes, buffer)):
+                val = pickle.loads(bytes(val))
             data[name] = val
         prof.finish()
         return data
@@ -562,10 +725,17 @@ class TableData:
         else:
             raise Exception("Cannot create TableData from object '%s' (type='%s')" % (str(data), type(data)))
 
-        for fn in ['__getitem__', '__setitem__']:
-            setattr(self, fn, getattr(self, '_TableData' + fn + self.mode))
+        ## special methods are looked up on the class, so __getitem__ / __setitem__ dispatch through these
+        self._getitem = getattr(self, '_TableData__getitem__' + self.mode)
+        self._setitem = getattr(self, '_TableData__setitem__' + self.mode)
         self.copy = getattr(self, 'copy_' + self.mode)
 
+    def __getitem__(self, arg):
+        return self._getitem(arg)
+
+    def __setitem__(self, arg, val):
+        self._setitem(arg, val)
+
     def originalData(self):
         return self.data
 
@@ -719,6 +889,16 @@ class TableData:
         return self.columnNames()
 
 
+def columnsToRecordArray(columns):
+    """Combine an OrderedDict of {columnName: array} into a numpy record array."""
+    names = list(columns.keys())
+    n = len(columns[names[0]]) if len(names) > 0 else 0
+    arr = np.empty(n, dtype=[(name, columns[name].dtype) for name in names])
+    for name in names:
+        arr[name] = columns[name]
+    return arr
+
+
 def parseColumnDefs(defs, keyOrder=None):
     """
     Translate a few different forms of column definitions into a single common format.
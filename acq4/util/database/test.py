@@ -85,3 +85,69 @@ def testBatchInsert():
     
     for i, row in enumerate(db.iterSelect('t', limit=1)):
         assert tuple(row[0].values()) == tuple(data[i])
+
+
+def testColumns():
+    db = SqliteDatabase()
+    db("create table 't' ('int' int, 'real' real, 'text' text, 'blob' blob, 'other' other)")
+
+    data = np.array([
+        (1, 27.3, u'x', [5], None),
+        (3, 23.4, u'yy', None, 2),
+        (5, 21.3, u'zzz', [(5,3), 'q'], 'a'),
+        (7, 24.3, u'wwww', 'q', None),
+    ], dtype=[('int', int), ('real', float), ('text', object), ('blob', object), ('other', object)])
+
+    db.insertColumns('t', data)
+    db.insertColumns('t', {'int': np.arange(3), 'real': [1, None, 3.5], 'text': np.array(['a', 'b', 'c'])})
+
+    result = db.selectColumns('t')
+    assert result.dtype['int'].kind == 'i'
+    assert result.dtype['real'].kind == 'f'
+    assert np.all(result[:4] == data)
+    assert np.isnan(result['real'][5])
+    assert list(result['text'][4:]) == ['a', 'b', 'c']
+
+    ## columnar and row-wise selects agree
+    rows = db.select('t')
+    cols = db.selectColumns('t', toArray=False)
+    for i, row in enumerate(rows):
+        for k in ['int', 'text', 'blob', 'other']:
+            assert row[k] == cols[k][i]
+
+    empty = db.selectColumns('t', ['int', 'text'], where={'int': 100})
+    assert len(empty) == 0
+    assert empty.dtype.names == ('int', 'text')
+
+
+def testDirHandleCache(tmp_path):
+    import pytest
+    import acq4.analysis.dataModels.PatchEPhys as PatchEPhys
+    from acq4.util.DataManager import getDirHandle
+    from acq4.util.database.AnalysisDatabase import AnalysisDatabase
+
+    base = getDirHandle(str(tmp_path))
+    dirA = base.mkdir('a')
+    dirB = base.mkdir('b')
+    db = AnalysisDatabase(str(tmp_path / 'db.sqlite'), dataModel=PatchEPhys, baseDir=base)
+    db.createTable('DirTable_Cell', [('Dir', 'file'), ('name', 'text', 'unique')])
+    db.insert('DirTable_Cell', {'Dir': dirA, 'name': 'x'})
+    rowid = db.select('DirTable_Cell', ['rowid'])[0]['rowid']
+    assert db.getDir('DirTable_Cell', rowid) is dirA
+
+    ## cached handles follow rewritten rows
+    db.update('DirTable_Cell', {'Dir': dirB}, rowid=rowid)
+    assert db.getDir('DirTable_Cell', rowid) is dirB
+
+    ## a replacing insert deletes the conflicting row and inserts a new one
+    db.insert('DirTable_Cell', {'Dir': dirA, 'name': 'x'}, replaceOnConflict=True)
+    newRowid = db.select('DirTable_Cell', ['rowid'])[0]['rowid']
+    assert db.getDir('DirTable_Cell', newRowid) is dirA
+    if newRowid != rowid:
+        with pytest.raises(Exception):
+            db.getDir('DirTable_Cell', rowid)
+
+    db.insertColumns('DirTable_Cell', {'Dir': [dirB], 'name': ['x']}, replaceOnConflict=True)
+    newRowid = db.select('DirTable_Cell', ['rowid'])[0]['rowid']
+    assert db.getDir('DirTable_Cell', newRowid) is dirB
+    db.close()
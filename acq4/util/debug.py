@@ -61,7 +61,7 @@ def logMsg(msg, **kwargs):
           reasons: a list of reasons (as strings) for the message
           traceback: a list of formatted callstack/traceback objects (formatting a traceback/callstack returns a list of strings), usually looks like [['line 1', 'line 2', 'line3'], ['line1', 'line2']]
           threads: a dictionary of thread IDs to tracebacks
-       Feel free to add your own keyword arguments. These will be saved in the log.txt file, but will not affect the content or way that messages are displayed.
+       Feel free to add your own keyword arguments. These will be saved in the log.jsonl file, but will not affect the content or way that messages are displayed.
         """
     global LOG_UI
     if LOG_UI is not None:
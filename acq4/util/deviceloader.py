@@ -0,0 +1,197 @@
+"""
+Dependency-ordered, optionally concurrent loading of the devices declared in a configuration.
+
+Devices refer to one another by name in their configuration (``parentDevice``, ``scopeDevice``,
+DAQ channel specs like ``{'device': 'DAQ', 'channel': ...}``, ``clampDevice``, etc.). Any string
+in a device's configuration that names another configured device is treated as a dependency, so
+that a device is only created after every device it refers to. Independent devices (for example,
+several serial-port stages and amplifiers) can then be initialized concurrently by a thread pool.
+"""
+import sys
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+
+def deviceDependencies(devConfigs):
+    """Return {name: set(dependencyNames)} for a dict of {name: config} device definitions.
+
+    Any string found anywhere in a device's configuration (as a value or as a dict key) that
+    matches the name of another device in *devConfigs* is taken to be a dependency.
+    """
+    names = set(devConfigs)
+    deps = {}
+    for name, conf in devConfigs.items():
+        refs = set()
+        _collectNames(conf, names, refs)
+        refs.discard(name)
+        deps[name] = refs
+    return deps
+
+
+def _collectNames(obj, names, refs):
+    if isinstance(obj, str):
+        if obj in names:
+            refs.add(obj)
+    elif isinstance(obj, dict):
+        for k, v in obj.items():
+            _collectNames(k, names, refs)
+            _collectNames(v, names, refs)
+    elif isinstance(obj, (list, tuple, set)):
+        for v in obj:
+            _collectNames(v, names, refs)
+
+
+class DeviceLoadResult:
+    """Timing and outcome of loading a single device."""
+    def __init__(self, name, deps):
+        self.name = name
+        self.deps = deps
+        self.device = None
+        self.startTime = None
+        self.stopTime = None
+        self.thread = None
+        # (type, value, traceback) if loading failed, or a message string if the device was skipped
+        self.error = None
+
+    @property
+    def duration(self):
+        if self.startTime is None or self.stopTime is None:
+            return 0.0
+        return self.stopTime - self.startTime
+
+    @property
+    def failed(self):
+        return self.error is not None
+
+
+class DeviceLoadReport:
+    """Collects per-device results from loadDevices() and summarizes the startup timing."""
+    def __init__(self, results, totalTime):
+        self.results = results  # {name: DeviceLoadResult}, in load-completion order
+        self.totalTime = totalTime
+
+    def failures(self):
+        """Return {name: error} for every device that failed or was skipped."""
+        return {name: r.error for name, r in self.results.items() if r.failed}
+
+    def criticalPath(self):
+        """Return (names, seconds) for the chain of dependent devices with the longest total init time.
+        """
+        best = {}
+
+        def pathTo(name):
+            if name not in best:
+                result = self.results[name]
+                best[name] = (name,), 0.0  # guards against dependency cycles
+                prev = max((pathTo(d) for d in result.deps if d in self.results), key=lambda p: p[1], default=((), 0.0))
+                best[name] = prev[0] + (name,), prev[1] + result.duration
+            return best[name]
+
+        paths = [pathTo(name) for name in self.results]
+        if len(paths) == 0:
+            return [], 0.0
+        names, duration = max(paths, key=lambda p: p[1])
+        return list(names), duration
+
+    def formatReport(self):
+        lines = [f"Device startup took {self.totalTime:0.2f} s:"]
+        for name, r in sorted(self.results.items(), key=lambda item: -item[1].duration):
+            if r.failed:
+                status = "FAILED" if isinstance(r.error, tuple) else f"skipped ({r.error})"
+            else:
+                status = "ok"
+            lines.append(f"    {name:<30s} {r.duration:7.2f} s  {status}")
+        names, duration = self.criticalPath()
+        lines.append(f"  Critical path ({duration:0.2f} s): {' -> '.join(names)}")
+        return "\n".join(lines)
+
+
+def loadDevices(devConfigs, loadFn, maxWorkers=1, onStart=None, onFinish=None, idleFn=None):
+    """Load the devices described by *devConfigs* ({name: config}) in dependency order.
+
+    *loadFn(name, config)* must create and return the device. With *maxWorkers* > 1, devices whose
+    dependencies have all been loaded are created concurrently in a thread pool; otherwise each
+    device is created in the calling thread, in configuration order (as far as dependencies
+    allow). Devices that depend on a failed device are skipped. Devices involved in a dependency
+    cycle are loaded one at a time in configuration order after all others.
+
+    *onStart(name)* and *onFinish(result)* are called from the calling thread as each device is
+    started and finished. *idleFn()* is called repeatedly while waiting for workers (for example,
+    to process GUI events that the devices may depend on during initialization).
+
+    Returns a DeviceLoadReport.
+    """
+    deps = deviceDependencies(devConfigs)
+    pending = list(devConfigs)
+    results = {}
+    done = {}
+    t0 = time.perf_counter()
+
+    def run(name):
+        result = DeviceLoadResult(name, deps[name])
+        result.thread = threading.current_thread().name
+        result.startTime = time.perf_counter() - t0
+        try:
+            result.device = loadFn(name, devConfigs[name])
+        except Exception:
+            result.error = sys.exc_info()
+        result.stopTime = time.perf_counter() - t0
+        return result
+
+    def finish(result):
+        results[result.name] = result
+        done[result.name] = result
+        if onFinish is not None:
+            onFinish(result)
+
+    def nextReady():
+        # devices whose dependencies are all done (including those that will be skipped)
+        return [name for name in pending if deps[name] <= set(done)]
+
+    def skipOrStart(name, submit):
+        pending.remove(name)
+        failedDeps = [d for d in deps[name] if d in done and done[d].failed]
+        if failedDeps:
+            result = DeviceLoadResult(name, deps[name])
+            result.error = f"depends on failed device {', '.join(sorted(failedDeps))}"
+            finish(result)
+            return None
+        if onStart is not None:
+            onStart(name)
+        return submit(name)
+
+    if maxWorkers <= 1:
+        while pending:
+            ready = nextReady() or pending[:1]  # on a dependency cycle, fall back to config order
+            result = skipOrStart(ready[0], run)
+            if result is not None:
+                finish(result)
+    else:
+        pool = ThreadPoolExecutor(max_workers=maxWorkers, thread_name_prefix="DeviceInit")
+        try:
+            running = {}
+            while pending or running:
+                for name in nextReady():
+                    fut = skipOrStart(name, lambda n: pool.submit(run, n))
+                    if fut is not None:
+                        running[fut] = name
+                if not running:
+                    if pending:
+                        # dependency cycle; load the next device by itself
+                        name = pending[0]
+                        fut = skipOrStart(name, lambda n: pool.submit(run, n))
+                        if fut is not None:
+                            running[fut] = name
+                    continue
+                timeout = None if idleFn is None else 0.02
+                finished, _ = wait(list(running), timeout=timeout, return_when=FIRST_COMPLETED)
+                for fut in finished:
+                    del running[fut]
+                    finish(fut.result())
+                if idleFn is not None:
+                    idleFn()
+        finally:
+            pool.shutdown(wait=True)
+
+    return DeviceLoadReport(results, time.perf_counter() - t0)
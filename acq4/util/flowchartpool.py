@@ -0,0 +1,182 @@
+"""
+Process pool for running flowcharts over many files.
+
+Each worker process rebuilds flowcharts from their saved state (``Flowchart.saveState()``) and
+keeps them for as long as the state does not change, so a batch of jobs only pays the cost of
+constructing the flowcharts once per worker. Workers are started with the 'spawn' method, so
+the pool behaves the same on every platform (and does not rely on fork()).
+
+File and directory handles cannot be sent between processes, so job arguments and results are
+passed through portable() / unportable(), which replace handles with HandleRef placeholders
+(these are also safe to pickle into an on-disk cache).
+"""
+import hashlib
+import json
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+
+def flowchartStateHash(state):
+    """Return a hash of a flowchart state that ignores the layout (node positions) of the chart."""
+    text = json.dumps(_canonicalState(state), sort_keys=True, separators=(',', ':'))
+    return hashlib.sha1(text.encode('utf8')).hexdigest()
+
+
+def _canonicalState(state):
+    # Convert a state into JSON-serializable structures. Arrays are represented by a digest of
+    # their contents (their repr() elides the middle of large arrays), and 'pos' entries are dropped.
+    if isinstance(state, dict):
+        return {(k if isinstance(k, str) else repr(k)): _canonicalState(v) for k, v in state.items() if k != 'pos'}
+    if isinstance(state, (list, tuple)):
+        return [_canonicalState(v) for v in state]
+    if isinstance(state, np.ndarray):
+        if state.dtype == object:
+            return {'__objarray__': [list(state.shape), [_canonicalState(v) for v in state.ravel()]]}
+        data = np.ascontiguousarray(state)
+        return {'__ndarray__': [data.dtype.str, list(data.shape), hashlib.sha1(data.tobytes()).hexdigest()]}
+    if isinstance(state, np.generic):
+        return _canonicalState(state.item())
+    if isinstance(state, bytes):
+        return {'__bytes__': state.hex()}
+    if state is None or isinstance(state, (str, bool, int, float)):
+        return state
+    return {'__repr__': repr(state)}
+
+
+class HandleRef:
+    """Picklable stand-in for a DataManager file or directory handle."""
+    def __init__(self, path):
+        self.path = path
+
+    def handle(self):
+        from acq4.util.DataManager import getHandle
+        return getHandle(self.path)
+
+    def __eq__(self, other):
+        return isinstance(other, HandleRef) and other.path == self.path
+
+    def __hash__(self):
+        return hash(self.path)
+
+    def __repr__(self):
+        return f"<HandleRef {self.path}>"
+
+
+def portable(obj):
+    """Return a copy of *obj* with all file/dir handles (including those inside dicts, lists and
+    object arrays) replaced by HandleRef."""
+    from acq4.util.DataManager import FileHandle
+    return _mapObjects(obj, lambda v: HandleRef(v.name()) if isinstance(v, FileHandle) else v)
+
+
+def unportable(obj):
+    """Inverse of portable(): replace every HandleRef in *obj* with the corresponding handle."""
+    return _mapObjects(obj, lambda v: v.handle() if isinstance(v, HandleRef) else v)
+
+
+def _mapObjects(obj, fn):
+    if isinstance(obj, dict):
+        return type(obj)((k, _mapObjects(v, fn)) for k, v in obj.items())
+    if isinstance(obj, (list, tuple)):
+        return type(obj)(_mapObjects(v, fn) for v in obj)
+    if isinstance(obj, np.ndarray):
+        if obj.dtype.names is not None:
+            objFields = [f for f in obj.dtype.names if obj.dtype.fields[f][0] == object]
+            if not objFields:
+                return obj
+            obj = obj.copy()
+            for f in objFields:
+                col = obj[f].ravel()
+                for i in range(len(col)):
+                    col[i] = _mapObjects(col[i], fn)
+                obj[f] = col.reshape(obj[f].shape)
+            return obj
+        if obj.dtype == object:
+            out = np.empty_like(obj)
+            for idx in np.ndindex(obj.shape):
+                out[idx] = _mapObjects(obj[idx], fn)
+            return out
+        return obj
+    return fn(obj)
+
+
+class FlowchartPool:
+    """Run a function over many jobs in worker processes, each of which has its own copies of a set
+    of flowcharts.
+
+    *fn(charts, job)* must be a module-level function; *charts* is a dict of {name: Flowchart}
+    rebuilt from the states passed to submit(), and *job* is one item of the job list (after
+    unportable()). Its return value is passed back through portable().
+    """
+    def __init__(self, maxWorkers=None):
+        self.maxWorkers = maxWorkers or os.cpu_count() or 1
+        self._executor = None
+
+    def _getExecutor(self):
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.maxWorkers,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=_initWorker,
+            )
+        return self._executor
+
+    def submit(self, fn, chartStates, jobs, chunkSize=None):
+        """Submit *jobs* for processing and return a list of (indexes, future) pairs, one per chunk.
+
+        Each future's result is a list of (index, result, error) tuples, where *error* is None or a
+        formatted traceback string.
+        """
+        charts = {name: (flowchartStateHash(state), state) for name, state in chartStates.items()}
+        jobs = [portable(job) for job in jobs]
+        if chunkSize is None:
+            # a few chunks per worker so that slow jobs do not leave other workers idle
+            chunkSize = max(1, len(jobs) // (self.maxWorkers * 4))
+        executor = self._getExecutor()
+        futures = []
+        for start in range(0, len(jobs), chunkSize):
+            indexes = list(range(start, min(start + chunkSize, len(jobs))))
+            chunk = [(i, jobs[i]) for i in indexes]
+            futures.append((indexes, executor.submit(_runChunk, fn, charts, chunk)))
+        return futures
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+# flowcharts built in this worker process: {name: (stateHash, Flowchart)}
+_workerCharts = {}
+
+
+def _initWorker():
+    os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+    import pyqtgraph as pg
+    pg.mkQApp()
+    import acq4.util.flowchart  # registers acq4's node types
+
+
+def _workerChart(name, stateHash, state):
+    from pyqtgraph.flowchart import Flowchart
+    cached = _workerCharts.get(name)
+    if cached is None or cached[0] != stateHash:
+        fc = Flowchart()
+        fc.restoreState(state, clear=True)
+        _workerCharts[name] = (stateHash, fc)
+    return _workerCharts[name][1]
+
+
+def _runChunk(fn, charts, chunk):
+    import traceback
+    charts = {name: _workerChart(name, stateHash, state) for name, (stateHash, state) in charts.items()}
+    results = []
+    for i, job in chunk:
+        try:
+            results.append((i, portable(fn(charts, unportable(job))), None))
+        except Exception:
+            results.append((i, None, traceback.format_exc()))
+    return results
@@ -14,10 +14,10 @@ from collections import OrderedDict
 import numpy as np
 import re
 import sys
-import types
 
 import pyqtgraph.units as units
 from acq4.util import Qt
+from acq4.util.debug import logMsg
 from . import waveforms
 from .SeqParamSet import SequenceParamSet
 from .StimParamSet import StimParamSet
@@ -46,9 +46,11 @@ class StimGenerator(Qt.QWidget):
         
         self.pSpace = None    ## cached sequence parameter space
         
-        self.cache = {}       ## cached waveforms
-        self.cacheRate = None
-        self.cacheNPts = None
+        self.cache = OrderedDict()  ## LRU cache of waveforms: {(rate, nPts, params): waveform}
+        self.cacheBytes = 0         ## total size of the cached waveforms
+        self.maxCacheBytes = 256 * 2**20
+        self._compiled = None       ## (function string, code object, mode) for the current function
+        self._namespace = None      ## units, numpy and extra parameters shared by all evaluations
         
         self.meta = {  ## holds some extra information about signals (units, expected scale and range, etc)
                        ## mostly information useful in configuring SpinBoxes
@@ -122,7 +124,9 @@ class StimGenerator(Qt.QWidget):
         self.stimParams.setMeta(axis, self.meta[axis])
 
     def clearCache(self):
-        self.cache = {}
+        self.cache = OrderedDict()
+        self.cacheBytes = 0
+        self._namespace = None
     
     def functionString(self):
         return str(self.ui.functionText.toPlainText())
@@ -337,27 +341,96 @@ class StimGenerator(Qt.QWidget):
         if params is None:
             params = {}
             
-        if self.cacheRate != rate or self.cacheNPts != nPts:
-            self.clearCache()
-            
-        paramKey = tuple(params.items())
-        if paramKey in self.cache:
-            return self.cache[paramKey]
+        key = (rate, nPts, tuple(params.items()))
+        if key in self.cache:
+            self.cache.move_to_end(key)
+            return self.cache[key]
             
-        self.cacheRate = rate
-        self.cacheNPts = nPts
+        ret, message = self._evaluate(rate, nPts, params)
+        
+        if message is not None:
+            self.setError(message)
+        else:
+            self.setError()
             
+        self._cacheWave(key, ret)
+        return ret
+
+    def getSequence(self, rate, nPts, axes=None, params=None):
+        """
+        Return the waveforms for every point along one or more sequence parameter axes as a single array.
+
+        *axes* is a list of sequence parameter names to iterate over (default is all parameters
+        returned by listSequences(), in that order). *params* may specify the index of any other
+        sequence parameters, as in getSingle(). The returned array has shape
+        (len(axis1), len(axis2), ..., nPts). Points for which the function does not generate a
+        waveform, or fails, are filled with NaN (the first error is displayed); if no point
+        generates a waveform, None is returned.
+
+        The function is compiled and its namespace is built only once for the entire sequence, and
+        all waveforms are added to the cache used by getSingle().
+        """
+        seqs = self.listSequences()
+        if axes is None:
+            axes = list(seqs.keys())
+        if params is None:
+            params = {}
+        shape = tuple(len(seqs[ax]) for ax in axes)
+
+        waves = {}
+        message = None
+        for inds in np.ndindex(*shape):
+            p = dict(params)
+            p.update(zip(axes, inds))
+            key = (rate, nPts, tuple(p.items()))
+            if key in self.cache:
+                self.cache.move_to_end(key)
+                wave = self.cache[key]
+            else:
+                try:
+                    wave, msg = self._evaluate(rate, nPts, p)
+                except Exception as exc:
+                    if message is None:
+                        message = "Error generating sequence point %s: %s" % (dict(zip(axes, inds)), exc)
+                    continue
+                message = msg if msg is not None else message
+                self._cacheWave(key, wave)
+            if wave is not None:
+                waves[inds] = wave
+
+        if message is not None:
+            self.setError(message)
+        if len(waves) == 0:
+            return None
+        first = next(iter(waves.values()))
+        out = np.full(shape + (len(first),), np.nan, dtype=np.result_type(first.dtype, float))
+        for inds, wave in waves.items():
+            out[inds] = wave
+        return out
+
+    def _cacheWave(self, key, wave):
+        ## add a waveform to the cache, discarding the least recently used ones once the cache
+        ## holds more than maxCacheBytes (the most recent waveform is always kept)
+        if key in self.cache:
+            self.cacheBytes -= _nbytes(self.cache.pop(key))
+        self.cache[key] = wave
+        self.cacheBytes += _nbytes(wave)
+        while self.cacheBytes > self.maxCacheBytes and len(self.cache) > 1:
+            self.cacheBytes -= _nbytes(self.cache.popitem(last=False)[1])
+
+    def _evaluate(self, rate, nPts, params):
+        ## Evaluate the function for one set of sequence parameter indices.
+        ## Returns the generated waveform and any warning message reported by the waveform functions.
+        mode, code = self._compileFunction()
+        if mode is None:
+            return np.zeros(nPts) + self.offset, None
+
         ## create namespace with generator functions. 
-        ##   - iterates over all functions provided in waveforms module
-        ##   - wrap each function to automatically provide rate and nPts arguments
-        ns = {}
-        #arg = {'rate': rate * self.timeScale, 'nPts': nPts}
+        ##   - wrap each function provided in waveforms module to automatically provide rate and nPts arguments
         arg = {'rate': rate, 'nPts': nPts}
-        ns.update(arg)  ## copy rate and nPts to eval namespace
-        for i in dir(waveforms):
-            obj = getattr(waveforms, i)
-            if type(obj) is types.FunctionType:
-                ns[i] = self.makeWaveFunction(i, arg)
+        ns = dict(arg)  ## copy rate and nPts to eval namespace
+        for name, obj in waveforms.waveFunctions.items():
+            ns[name] = self.makeWaveFunction(obj, arg)
         
         ## add current sequence parameter values into namespace
         seq = self.paramSpace() # -- this is where the Laser bug was happening -- seq becomes 'Pulse_sum', but params was {'power.Pulse_sum': x}, so the default value is always used instead (fixed by removing 'power.' before the params are sent to stimGenerator, but perhaps there is a better place to fix this)
@@ -366,68 +439,73 @@ class StimGenerator(Qt.QWidget):
                 try:
                     ns[k] = float(seq[k][1][params[k]])
                 except IndexError:
-                    print("Requested value %d for param %s, but only %d in the param list." % (params[k], str(k), len(seq[k][1])))
+                    logMsg("Requested value %d for param %s, but only %d in the param list." % (params[k], str(k), len(seq[k][1])), msgType='error')
                     raise
             else:  ## just use single value
                 ns[k] = float(seq[k][0])
 
-        ## add units into namespace
-        ns.update(units.allUnits)
+        ## add units, extra parameters and numpy to namespace
+        ns.update(self._evalNamespace())
+
+        if mode == 'eval':
+            ret = eval(code, ns, {})
+        else:
+            lns = {}
+            exec(code, ns, lns)
+            ret = lns['output']
+            
+        if isinstance(ret, np.ndarray):
+            #ret *= self.scale
+            ret += self.offset
+        elif ret is not None:
+            raise TypeError("Function must return ndarray or None.")
         
-        ## add extra parameters to namespace
-        ns.update(self.extraParams)
+        return ret, arg.get('message', None)
 
-        ## evaluate and return
+    def _compileFunction(self):
+        ## Return (mode, code object) for the current function string, compiling it only when it changes.
+        ## mode is 'eval', 'exec', or None if the function is empty.
         fn = self.functionString()
-        
-        ## build global namespace with numpy imported
-        #gns = {}
-        ns['np'] = np
-        
-        #print "function: '%s'" % fn
+        if self._compiled is not None and self._compiled[0] == fn:
+            return self._compiled[1:]
+            
         if fn.strip() == '':
-            ret = np.zeros(nPts)
+            mode, code = None, None
         else:
             try:  # first try eval() without line breaks for backward compatibility
-                ret = eval(fn.replace('\n', ''), ns, {})
+                mode, code = 'eval', compile(fn.replace('\n', ''), '<stimulus function>', 'eval')
             except SyntaxError:  # next try exec() as contents of a function
                 try:
                     run = "\noutput=fn()\n"
-                    code = "def fn():\n" + "\n".join(["    "+l for l in fn.split('\n')]) + run
-                    #print "--- Code: ---"
-                    #print code
-                    #print "-------------"
-                    lns = {}
-                    exec(code, ns, lns)
-                    ret = lns['output']
+                    src = "def fn():\n" + "\n".join(["    "+l for l in fn.split('\n')]) + run
+                    mode, code = 'exec', compile(src, '<stimulus function>', 'exec')
                 except SyntaxError as err:
                     err.lineno -= 1
                     raise err
-                
-            
-        if isinstance(ret, np.ndarray):
-            #ret *= self.scale
-            ret += self.offset
-            #print "===eval===", ret.min(), ret.max(), self.scale
-        elif ret is not None:
-            raise TypeError("Function must return ndarray or None.")
+        self._compiled = (fn, mode, code)
+        return mode, code
+
+    def _evalNamespace(self):
+        ## Names shared by all evaluations; rebuilt when the extra parameters change.
+        if self._namespace is None:
+            ns = {}
+            ns.update(units.allUnits)
+            ns.update(self.extraParams)
+            ns['np'] = np
+            self._namespace = ns
+        return self._namespace
         
-        if 'message' in arg:
-            self.setError(arg['message'])
-        else:
-            self.setError()
-            
-        self.cache[paramKey] = ret
-        return ret
-        
-    def makeWaveFunction(self, name, arg):
+    def makeWaveFunction(self, obj, arg):
         ## Creates a copy of a wave function (such as steps or pulses) with the first parameter filled in
         ## Must be in its own function so that obj is properly scoped to the lambda function.
-        obj = getattr(waveforms, name)
         return lambda *args, **kwargs: obj(arg, *args, **kwargs)
         
 
 
+def _nbytes(wave):
+    ## size of a cached waveform (None is cached for functions that generate nothing)
+    return 0 if wave is None else wave.nbytes
+
 
 ## Old sequence parsing functions for backward compatibility:
 ##############################################################
@@ -43,6 +43,32 @@ def pulse(params, times, widths, values, base=0.0):
         
     d = numpy.empty(nPts)
     d[:] = base
+    if len(times) == 0:
+        return d
+    
+    starts = (numpy.asarray(times, dtype=float)[:len(times)] * rate).astype(int)
+    wids = (numpy.asarray(widths, dtype=float)[:len(times)] * rate).astype(int)
+    vals = numpy.asarray(values, dtype=float)[:len(times)]
+    if len(wids) < len(starts) or len(vals) < len(starts) or starts.min() < 0 or wids.min() < 0 or numpy.any(starts[1:] < starts[:-1] + wids[:-1]):
+        ## overlapping or negative pulses; fill one pulse at a time so later pulses overwrite earlier ones
+        return _pulseLoop(params, d, times, widths, values)
+    
+    ## pulses are sorted and do not overlap; fill all at once
+    warn = (wids == 0) | (starts + wids >= nPts)
+    if warn.any():
+        i = numpy.argwhere(warn)[-1, 0]
+        if starts[i] + wids[i] >= nPts:
+            params['message'] = "WARNING: Function is longer than generated waveform."
+        else:
+            params['message'] = "WARNING: Pulse width %f is too short for rate %f" % (widths[i], rate)
+    ends = numpy.clip(starts + wids, 0, nPts)
+    starts = numpy.clip(starts, 0, nPts)
+    d[_segmentIndexes(starts, ends)] = numpy.repeat(vals, ends - starts)
+    return d
+
+def _pulseLoop(params, d, times, widths, values):
+    nPts = params['nPts']
+    rate = params['rate']
     for i in range(len(times)):
         t1 = int(times[i] * rate)
         wid = int(widths[i] * rate)
@@ -53,6 +79,12 @@ def pulse(params, times, widths, values, base=0.0):
         d[t1:t1+wid] = values[i]
     return d
 
+def _segmentIndexes(starts, ends):
+    """Return the concatenated indexes of all segments [starts[i]:ends[i]]."""
+    lens = ends - starts
+    offsets = numpy.cumsum(lens) - lens
+    return numpy.arange(lens.sum()) - numpy.repeat(offsets - starts, lens)
+
 def steps(params, times, values, base=0.0):
     rate = params['rate']
     nPts = params['nPts']
@@ -63,6 +95,28 @@ def steps(params, times, values, base=0.0):
     
     d = numpy.empty(nPts)
     d[:] = base
+    
+    inds = (numpy.asarray(times, dtype=float) * rate).astype(int)
+    if len(inds) == 0 or len(values) < len(inds) - 1 or inds[0] < 0 or numpy.any(inds[1:] < inds[:-1]):
+        ## unsorted times; fill one step at a time so later steps overwrite earlier ones
+        return _stepsLoop(params, d, times, values)
+    
+    ## times are sorted; fill all steps at once
+    warn = (inds[1:] == inds[:-1]) | (inds[1:] >= nPts)
+    if warn.any():
+        i = numpy.argwhere(warn)[-1, 0] + 1
+        if inds[i] >= nPts:
+            params['message'] = "WARNING: Function is longer than generated waveform."
+        else:
+            params['message'] = "WARNING: Step width %f is too short for rate %f" % (times[i]-times[i-1], rate)
+    bounds = numpy.clip(inds, 0, nPts)
+    d[bounds[0]:bounds[-1]] = numpy.repeat(numpy.asarray(values[:len(inds)-1], dtype=float), numpy.diff(bounds))
+    d[inds[-1]:] = values[-1]
+    return d
+
+def _stepsLoop(params, d, times, values):
+    rate = params['rate']
+    nPts = params['nPts']
     for i in range(1, len(times)):
         t1 = int(times[i-1] * rate)
         t2 = int(times[i] * rate)
@@ -315,4 +369,9 @@ def noise(params, mean, sigma, start=0.0, stop=None):
         stop = nPts-1
 
     d[start:stop] = numpy.random.normal(size=stop-start, loc=mean, scale=sigma)
-    return d
\ No newline at end of file
+    return d
+
+
+## All waveform functions made available to StimGenerator functions, by name
+waveFunctions = {name: obj for name, obj in list(globals().items())
+                 if callable(obj) and getattr(obj, '__module__', None) == __name__ and not name.startswith('_')}
@@ -1,4 +1,5 @@
 import numpy as np
+import scipy.fft
 import scipy.ndimage
 import pyqtgraph as pg
 
@@ -58,3 +59,116 @@ def iterativeImageTemplateMatch(img, template, dsVals=(4, 2, 1), matchFn=imageTe
             end = offset + np.array(tmpDs[i+1].shape) + 3
             end = np.clip(end, 0, imgDs[i+1].shape)
             imgDs[i+1] = imgDs[i+1][offset[0]:end[0], offset[1]:end[1]]
+
+
+def _windowSums(img, shape):
+    # sum of *img* over every window of the given shape (valid region only)
+    c = np.zeros((img.shape[0] + 1, img.shape[1] + 1))
+    np.cumsum(np.cumsum(img, axis=0), axis=1, out=c[1:, 1:])
+    h, w = shape
+    return c[h:, w:] - c[:-h, w:] - c[h:, :-w] + c[:-h, :-w]
+
+
+def _normalizeCorrelation(xcorr, img, templates, templateSSD):
+    # convert raw correlations with zero-mean templates into normalized cross-correlation,
+    # following skimage.feature.match_template
+    shape = templates.shape[-2:]
+    n = shape[0] * shape[1]
+    winSum = _windowSums(img, shape)
+    winSum2 = _windowSums(img ** 2, shape)
+    imgVar = np.maximum(winSum2 - winSum ** 2 / n, 0)
+    denom = np.sqrt(imgVar[np.newaxis] * templateSSD.reshape(-1, 1, 1))
+    mask = denom > np.finfo(float).eps
+    response = np.zeros_like(xcorr)
+    response[mask] = xcorr[mask] / denom[mask]
+    return response
+
+
+class MultiTemplateMatcher(object):
+    """Match a stack of equally-shaped templates to image data, giving the same results as
+    calling iterativeImageTemplateMatch() once per template.
+
+    Downsampled templates are computed once when the matcher is created, and each image is
+    downsampled once per call to match() regardless of the number of templates. At the coarsest
+    resolution, all templates are scored with a single batched FFT correlation; the FFTs of the
+    templates are cached for each image shape, so repeated matching of equally-sized images
+    (as when tracking a pipette tip) only transforms the image. The higher resolution passes
+    only search a few pixels around each coarse match and are computed directly.
+    """
+    def __init__(self, templates, dsVals=(4, 2, 1), unsharp=3):
+        self.dsVals = dsVals
+        self.unsharp = unsharp
+        self.templates = []
+        self.templateSSD = []
+        for n in dsVals:
+            t = np.array([pg.downsample(pg.downsample(np.asarray(tmp), n, axis=0), n, axis=1) for tmp in templates], dtype=float)
+            t -= t.mean(axis=(1, 2), keepdims=True)
+            self.templates.append(t)
+            self.templateSSD.append((t ** 2).sum(axis=(1, 2)))
+        self._fftCache = {}
+
+    def match(self, img):
+        """Return an (N, 2) array of pixel offsets and an array of N match values, one for each template.
+        """
+        dsVals = self.dsVals
+        imgDs = [pg.downsample(pg.downsample(img, n, axis=0), n, axis=1).astype(float) for n in dsVals]
+        nTemplates = len(self.templates[0])
+
+        cc = self._batchMatch(imgDs[0])
+        ccFilt = self._unsharp(cc)
+        flat = ccFilt.reshape(nTemplates, -1).argmax(axis=1)
+        pos = np.array(np.unravel_index(flat, cc.shape[1:])).T
+        vals = cc[np.arange(nTemplates), pos[:, 0], pos[:, 1]]
+        if len(dsVals) == 1:
+            return pos, vals
+
+        offsets = np.zeros((nTemplates, 2), dtype=int)
+        for j in range(nTemplates):
+            offset = np.array([0, 0])
+            p = pos[j]
+            for i in range(1, len(dsVals)):
+                scale = dsVals[i-1] // dsVals[i]
+                assert scale == dsVals[i-1] / dsVals[i], "dsVals must satisfy constraint: dsVals[i] == dsVals[i+1] * int(x)"
+                tmp = self.templates[i][j:j+1]
+                offset *= scale
+                offset += np.clip((p - 1) * scale, 0, imgDs[i].shape)
+                end = np.clip(offset + np.array(tmp.shape[1:]) + 3, 0, imgDs[i].shape)
+                region = imgDs[i][offset[0]:end[0], offset[1]:end[1]]
+                cc = self._directMatch(region, tmp, self.templateSSD[i][j:j+1])[0]
+                ind = np.argmax(self._unsharp(cc[np.newaxis])[0])
+                p = np.array(np.unravel_index(ind, cc.shape))
+                vals[j] = cc[p[0], p[1]]
+            offsets[j] = offset + p
+        return offsets, vals
+
+    def _checkShape(self, img, templates):
+        if img.shape[0] < templates.shape[1] or img.shape[1] < templates.shape[2]:
+            raise ValueError(f"Image ({img.shape}) must be larger than template ({templates.shape[1:]})")
+
+    def _unsharp(self, cc):
+        # high-pass filter; we're looking for a fairly sharp peak.
+        if self.unsharp is False:
+            return cc
+        return cc - scipy.ndimage.gaussian_filter(cc, (0, self.unsharp, self.unsharp))
+
+    def _batchMatch(self, img):
+        templates = self.templates[0]
+        self._checkShape(img, templates)
+        h, w = templates.shape[1:]
+        fftShape = tuple(scipy.fft.next_fast_len(img.shape[i] + templates.shape[i+1] - 1, real=True) for i in (0, 1))
+        tmpFft = self._fftCache.get(fftShape)
+        if tmpFft is None:
+            if len(self._fftCache) > 8:
+                self._fftCache.clear()
+            tmpFft = scipy.fft.rfft2(templates[:, ::-1, ::-1], fftShape)
+            self._fftCache[fftShape] = tmpFft
+        imgFft = scipy.fft.rfft2(img, fftShape)
+        xcorr = scipy.fft.irfft2(tmpFft * imgFft[np.newaxis], fftShape)
+        xcorr = xcorr[:, h-1:img.shape[0], w-1:img.shape[1]]
+        return _normalizeCorrelation(xcorr, img, templates, self.templateSSD[0])
+
+    def _directMatch(self, img, templates, templateSSD):
+        self._checkShape(img, templates)
+        windows = np.lib.stride_tricks.sliding_window_view(img, templates.shape[1:])
+        xcorr = np.einsum('ijkl,tkl->tij', windows, templates)
+        return _normalizeCorrelation(xcorr, img, templates, templateSSD)
@@ -0,0 +1,72 @@
+import threading
+import weakref
+from collections import deque
+
+import numpy as np
+
+
+class FramePool:
+    """A preallocated ring of frame buffers, used to avoid allocating a new array for every camera frame.
+
+    Camera drivers request a slot with acquire() and write the image directly into the returned
+    array. The array (and every view derived from it) refers to the pool's shared memory, so
+    frame processors and display code see the image without any copying.
+
+    Slots are reference counted through the arrays themselves: a slot returns to the pool as
+    soon as the last array or view referring to it is garbage collected. In normal operation
+    that happens right after Camera.sigNewFrame has been delivered, but consumers that keep
+    frames (recording, averaging, FrameAcquisitionFuture) simply hold on to their slot until
+    they are done with it. If every slot is in use, acquire() returns None and the caller should
+    fall back to allocating a new array; these events are counted as overflows.
+    """
+
+    def __init__(self, nSlots: int, shape: tuple, dtype):
+        self.nSlots = nSlots
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+        self._buffer = np.empty((nSlots, int(np.prod(self.shape))), dtype=self.dtype)
+        self._free = deque(range(nSlots))
+        self._lock = threading.Lock()
+        self._acquired = 0
+        self._overflows = 0
+        self._maxInUse = 0
+
+    def matches(self, shape, dtype) -> bool:
+        return tuple(shape) == self.shape and np.dtype(dtype) == self.dtype
+
+    def acquire(self) -> "np.ndarray | None":
+        """Return a writable array backed by a free slot, or None if all slots are in use."""
+        with self._lock:
+            if len(self._free) == 0:
+                self._overflows += 1
+                return None
+            slot = self._free.popleft()
+            self._acquired += 1
+            self._maxInUse = max(self._maxInUse, self.nSlots - len(self._free))
+
+        # Build the array on a memoryview so that it does not own its data; numpy then makes
+        # every view derived from it refer back to `root`, which therefore lives exactly as long
+        # as someone is still using the slot.
+        root = np.frombuffer(memoryview(self._buffer[slot]), dtype=self.dtype)
+        weakref.finalize(root, self._release, slot)
+        return root.reshape(self.shape)
+
+    def _release(self, slot):
+        with self._lock:
+            self._free.append(slot)
+
+    def inUse(self) -> int:
+        """Return the number of slots currently holding frames."""
+        with self._lock:
+            return self.nSlots - len(self._free)
+
+    def stats(self) -> dict:
+        """Return occupancy and overflow counters for this pool."""
+        with self._lock:
+            return {
+                'slots': self.nSlots,
+                'inUse': self.nSlots - len(self._free),
+                'maxInUse': self._maxInUse,
+                'acquired': self._acquired,
+                'overflows': self._overflows,
+            }
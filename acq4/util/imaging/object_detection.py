@@ -1,10 +1,14 @@
 from __future__ import annotations
 
-from threading import RLock
+import atexit
+import hashlib
+import threading
+from collections import OrderedDict
 from typing import Optional
 
 import click
 import numpy as np
+import scipy.ndimage
 import scipy.stats
 import tifffile
 from MetaArray import MetaArray
@@ -16,10 +20,10 @@ from pyqtgraph import SRTTransform3D
 from teleprox import ProcessSpawner
 from teleprox.shmem import SharedNDArray
 
-_lock = RLock()
-_remote_process: Optional[ProcessSpawner] = None
-_shared_array: Optional[SharedNDArray] = None
+_pool_lock = threading.Lock()
+_pool: "Optional[DetectionWorkerPool]" = None
 _yolo: "Optional[YOLO]" = None
+_cellpose = None
 
 
 def _get_yolo() -> "YOLO":
@@ -30,6 +34,14 @@ def _get_yolo() -> "YOLO":
     return _yolo
 
 
+def _get_cellpose():
+    from cellpose import models
+    global _cellpose
+    if _cellpose is None:
+        _cellpose = models.Cellpose(gpu=True, model_type="cyto3")
+    return _cellpose
+
+
 def normalize(image: Image, min_in=None, max_in=None):
     # TODO reimplement it with no-copy, maybe?
     if min_in is None:
@@ -57,28 +69,249 @@ def normalize(image: Image, min_in=None, max_in=None):
     return Image.fromarray(image.astype(np.uint8))
 
 
-def _get_shared_array(data: np.ndarray) -> SharedNDArray:
-    global _shared_array
-    # TODO what if someone else is using it?!
-    if _shared_array is not None and _shared_array.data.shape != data.shape:
-        # it might still be in use, so just let the normal shared memory cleanup do unlink
-        _shared_array.shmem.close()
-        _shared_array = None
-    if _shared_array is None:
-        _shared_array = SharedNDArray.copy(data)
-    else:
-        _shared_array.data[:] = data
-    return _shared_array
+def frame_hash(data: np.ndarray) -> str:
+    """Return a key that identifies the contents of *data* (including its shape and dtype)."""
+    data = np.ascontiguousarray(data)
+    digest = hashlib.blake2b(data.data, digest_size=16)
+    digest.update(repr((data.shape, data.dtype.str)).encode())
+    return digest.hexdigest()
+
+
+class DetectionRequest:
+    """A pending detection of neurons in one image (or stack) with one model.
+
+    Requests are created by DetectionWorkerPool.submit(); *result* holds a list of pixel-space boxes
+    ((x0, y0), (x1, y1)) once *done* is set, unless detection failed, in which case *error* is set.
+    """
+    def __init__(self, data: np.ndarray, model: str, key: tuple):
+        self.data = data
+        self.model = model
+        self.key = key
+        self.result = None
+        self.error = None
+        self.done = threading.Event()
+
+    def wait(self, _future: Future = None) -> list:
+        """Wait for the request to complete and return its result, checking *_future* for stop requests."""
+        while not self.done.wait(0.1):
+            if _future is not None:
+                _future.checkStop()
+        if self.error is not None:
+            raise RuntimeError(f"Neuron detection ({self.model}) failed") from self.error
+        return self.result
+
+
+class DetectionWorkerPool:
+    """Runs object detection in a pool of worker processes, so that several callers (pipettes,
+    cameras, ...) can request detections concurrently.
+
+    * Each request is copied into its own shared memory slot; slots are reused for later requests
+      with the same shape and dtype once the worker is done with them. At most *max_free_slots*
+      unused slots are kept (the least recently used shapes are freed first).
+    * Requests are queued and each worker takes up to *max_batch_size* queued requests for the same
+      model at a time, so frames from multiple callers are detected in a single model call.
+    * Worker processes are started on first use and keep their models loaded between requests.
+    * Results are cached by frame hash and model (up to *cache_size* entries), and identical requests
+      that arrive while a detection is already running share its result.
+    * A request never waits forever: if detection fails, or the last worker thread exits, every
+      unfinished request is completed with an error.
+    """
+    def __init__(self, num_workers: int = 1, max_batch_size: int = 8, cache_size: int = 64,
+                 max_free_slots: Optional[int] = None):
+        self.max_batch_size = max_batch_size
+        self.cache_size = cache_size
+        self.max_free_slots = max_batch_size * num_workers if max_free_slots is None else max_free_slots
+        self._cond = threading.Condition()
+        self._queue: list[DetectionRequest] = []
+        self._in_flight: dict[tuple, DetectionRequest] = {}
+        self._cache: OrderedDict[tuple, list] = OrderedDict()
+        self._free_slots: OrderedDict[tuple, list[SharedNDArray]] = OrderedDict()
+        self._n_free_slots = 0
+        self._processes: list[Optional[ProcessSpawner]] = [None] * num_workers
+        self._stopping = False
+        self._running_workers = num_workers
+        self._threads = [
+            threading.Thread(target=self._run_worker, args=(i,), name=f"ObjectDetectionWorker-{i}", daemon=True)
+            for i in range(num_workers)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def submit(self, data: np.ndarray, model: str = "cellpose") -> DetectionRequest:
+        """Queue detection of neurons in *data* and return a DetectionRequest."""
+        if model not in ("cellpose", "yolo"):
+            raise ValueError(f"Unknown model {model}")
+        key = (model, frame_hash(data))
+        with self._cond:
+            if self._stopping or self._running_workers == 0:
+                raise RuntimeError("Object detection pool has been stopped.")
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                request = DetectionRequest(None, model, key)
+                request.result = self._cache[key]
+                request.done.set()
+                return request
+            if key in self._in_flight:
+                return self._in_flight[key]
+            request = DetectionRequest(data, model, key)
+            self._in_flight[key] = request
+            self._queue.append(request)
+            self._cond.notify()
+        return request
+
+    def clear_cache(self):
+        with self._cond:
+            self._cache.clear()
+
+    def stop(self):
+        """Finish queued requests, then stop all worker processes."""
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+        for thread in self._threads:
+            thread.join()
+        with self._cond:
+            for slots in self._free_slots.values():
+                for slot in slots:
+                    self._discard_slot(slot)
+            self._free_slots.clear()
+            self._n_free_slots = 0
+
+    def _next_batch(self) -> list[DetectionRequest]:
+        with self._cond:
+            while len(self._queue) == 0:
+                if self._stopping:
+                    return []
+                self._cond.wait()
+            model = self._queue[0].model
+            batch = [r for r in self._queue if r.model == model][:self.max_batch_size]
+            self._queue = [r for r in self._queue if r not in batch]
+            return batch
+
+    def _get_slot(self, data: np.ndarray) -> SharedNDArray:
+        slot_key = (data.shape, data.dtype.str)
+        with self._cond:
+            slots = self._free_slots.get(slot_key, [])
+            slot = slots.pop() if len(slots) > 0 else None
+            if slot is not None:
+                self._n_free_slots -= 1
+                if len(slots) == 0:
+                    del self._free_slots[slot_key]
+        if slot is None:
+            return SharedNDArray.copy(data)
+        slot.data[:] = data
+        return slot
 
+    def _release_slot(self, slot: SharedNDArray):
+        slot_key = (slot.data.shape, slot.data.dtype.str)
+        with self._cond:
+            self._free_slots.setdefault(slot_key, []).append(slot)
+            self._free_slots.move_to_end(slot_key)
+            self._n_free_slots += 1
+            while self._n_free_slots > self.max_free_slots:
+                oldest_key, oldest = next(iter(self._free_slots.items()))
+                self._discard_slot(oldest.pop(0))
+                self._n_free_slots -= 1
+                if len(oldest) == 0:
+                    del self._free_slots[oldest_key]
 
-def _get_remote_process():
-    global _remote_process
-    # TODO what if someone else is using it?!
-    # TODO how does cleanup happen?
-    if _remote_process is None:
-        # no local server forces no proxies, only serialization and shared mem
-        _remote_process = ProcessSpawner(name="ACQ4 Object Detection", start_local_server=False)
-    return _remote_process
+    @staticmethod
+    def _discard_slot(slot: SharedNDArray):
+        try:
+            slot.shmem.close()
+            slot.shmem.unlink()
+        except Exception:
+            pass
+
+    def _get_process(self, index: int) -> ProcessSpawner:
+        if self._processes[index] is None:
+            # no local server forces no proxies, only serialization and shared mem
+            self._processes[index] = ProcessSpawner(name=f"ACQ4 Object Detection {index}", start_local_server=False)
+        return self._processes[index]
+
+    def _run_worker(self, index: int):
+        batch = []
+        try:
+            while True:
+                batch = self._next_batch()
+                if len(batch) == 0:
+                    return
+                results, error = self._detect_batch(index, batch)
+                if error is None and len(results) != len(batch):
+                    error = RuntimeError(f"Expected {len(batch)} detection results, got {len(results)}")
+                self._finish_requests(batch, results, error)
+        except Exception as exc:
+            self._finish_requests(batch, None, exc)
+            raise
+        finally:
+            if self._processes[index] is not None:
+                self._processes[index].stop()
+                self._processes[index] = None
+            with self._cond:
+                self._running_workers -= 1
+                orphans = []
+                if self._running_workers == 0:
+                    orphans, self._queue = self._queue, []
+            self._finish_requests(orphans, None, RuntimeError("Object detection workers have stopped."))
+
+    def _finish_requests(self, requests: list[DetectionRequest], results: Optional[list], error: Optional[Exception]):
+        with self._cond:
+            for i, request in enumerate(requests):
+                if request.done.is_set():
+                    continue
+                if error is None:
+                    request.result = results[i]
+                    self._cache[request.key] = results[i]
+                    if len(self._cache) > self.cache_size:
+                        self._cache.popitem(last=False)
+                else:
+                    request.error = error
+                self._in_flight.pop(request.key, None)
+                request.data = None
+                request.done.set()
+
+    def _detect_batch(self, index: int, batch: list[DetectionRequest]):
+        """Return (results, None) for the requests in *batch*, or (None, exception) if detection failed."""
+        slots = []
+        try:
+            for request in batch:
+                slots.append(self._get_slot(request.data))
+            try:
+                return self._detect_in_process(index, slots, batch[0].model), None
+            except Exception:
+                # the worker may have died; start a new one for the next batch
+                process, self._processes[index] = self._processes[index], None
+                if process is not None:
+                    try:
+                        process.stop()
+                    except Exception:
+                        pass
+                raise
+        except Exception as exc:
+            return None, exc
+        finally:
+            for slot in slots:
+                self._release_slot(slot)
+
+    def _detect_in_process(self, index: int, slots: list[SharedNDArray], model: str) -> list:
+        process = self._get_process(index)
+        rmt_arrays = [process.client.transfer(slot) for slot in slots]
+        rmt_this = process.client._import("acq4.util.imaging.object_detection")
+        return rmt_this.detect_boxes([a.data for a in rmt_arrays], model)
+
+
+def get_detection_pool() -> DetectionWorkerPool:
+    """Return the shared DetectionWorkerPool, creating it if needed."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = DetectionWorkerPool()
+            atexit.register(_pool.stop)
+        return _pool
+
+
+def _map_boxes(boxes: list, transform: SRTTransform3D) -> list:
+    return [(transform.map(start), transform.map(end)) for start, end in boxes]
 
 
 @future_wrap
@@ -89,26 +322,29 @@ def detect_neurons(frames: Frame | list[Frame], model: str = "cellpose", _future
     else:
         data = np.stack([frame.data() for frame in frames])
         transform = frames[0].globalTransform()
-    shared_array = _get_shared_array(data)
     _future.checkStop()
-    with _lock:
-        rmt_process = _get_remote_process()
-        rmt_array = rmt_process.client.transfer(shared_array)
-        rmt_this = rmt_process.client._import("acq4.util.imaging.object_detection")
-        _future.checkStop()
-        return rmt_this.do_neuron_detection(rmt_array.data, transform, model)
+    request = get_detection_pool().submit(data, model)
+    return _map_boxes(request.wait(_future), transform)
 
 
-def do_neuron_detection(data: np.ndarray, transform: SRTTransform3D, model: str = "cellpose") -> list:
+def detect_boxes(data: list[np.ndarray], model: str = "cellpose") -> list[list]:
+    """Detect neurons in each image in *data* and return a list of pixel-space boxes for each.
+
+    This runs in the detection worker processes; models are loaded once per process.
+    """
     if model == 'yolo':
-        return _do_neuron_detection_yolo(data, transform)
+        return [_detect_boxes_yolo(d) for d in data]
     elif model == 'cellpose':
-        return _do_neuron_detection_cellpose(data, transform)
+        return _detect_boxes_cellpose(data)
     else:
         raise ValueError(f"Unknown model {model}")
 
 
-def _do_neuron_detection_yolo(data: np.ndarray, transform: SRTTransform3D) -> list:
+def do_neuron_detection(data: np.ndarray, transform: SRTTransform3D, model: str = "cellpose") -> list:
+    return _map_boxes(detect_boxes([data], model)[0], transform)
+
+
+def _detect_boxes_yolo(data: np.ndarray) -> list:
     image = Image.fromarray(data)
     image = normalize(image)
     my_yolo = _get_yolo()
@@ -125,34 +361,24 @@ def _do_neuron_detection_yolo(data: np.ndarray, transform: SRTTransform3D) -> li
 
     def xyxy_to_rect(box: tuple):
         start_x, start_y, end_x, end_y = box
-        start = transform.map((start_x, start_y))
-        end = transform.map((end_x, end_y))
-        return start, end
+        return (start_x, start_y), (end_x, end_y)
     return [xyxy_to_rect(box) for box in boxes]  # TODO filter by class? score?
 
 
-def _do_neuron_detection_cellpose(data: np.ndarray, transform: SRTTransform3D) -> list:
-    from cellpose import models
+def _detect_boxes_cellpose(data: list[np.ndarray]) -> list[list]:
+    model = _get_cellpose()
+    masks_pred, flows, styles, diams = model.eval(list(data), diameter=30, niter=2000)
+    return [_mask_boxes(mask) for mask in masks_pred]
+
 
-    model = models.Cellpose(gpu=True, model_type="cyto3")
-    masks_pred, flows, styles, diams = model.eval([data], diameter=30, niter=2000)
-    mask = masks_pred[0]  # each distinct cell gets an id: 1, 2, ...
-
-    def bbox(num) -> tuple[tuple[float, float], tuple[float, float]]:
-        match = mask == num
-        rows = np.any(match, axis=-1)
-        cols = np.any(match, axis=-2)
-        rmin, rmax = np.where(rows)[0][[0, -1]]
-        cmin, cmax = np.where(cols)[0][[0, -1]]
-        start = transform.map((rmin, cmin))
-        end = transform.map((rmax, cmax))
-        return start, end
-
-    cell_num = 1
+def _mask_boxes(mask: np.ndarray) -> list:
+    # each distinct cell gets an id: 1, 2, ...
     boxes = []
-    while np.any(mask == cell_num):
-        boxes.append(bbox(cell_num))
-        cell_num += 1
+    for sl in scipy.ndimage.find_objects(mask):
+        if sl is None:
+            break
+        rows, cols = sl[-2], sl[-1]
+        boxes.append(((rows.start, cols.start), (rows.stop - 1, cols.stop - 1)))
     return boxes
 
 
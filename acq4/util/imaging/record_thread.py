@@ -1,14 +1,13 @@
 from typing import Callable, Optional
 
-import numpy as np
 import time
-from MetaArray import MetaArray
 
 from acq4 import Manager
 from acq4.util import Qt
 from acq4.util import debug
 from acq4.util.Mutex import Mutex
 from acq4.util.Thread import Thread
+from .video_writer import VideoWriter
 
 try:
     import acq4.filetypes.ImageFile
@@ -39,8 +38,12 @@ class RecordThread(Thread):
         self.lock = Mutex(Qt.QMutex.Recursive)
         self.newFrames = []  # list of frames and the files they should be sored / appended to.
 
+        # HDF5 compression used for recorded stacks; see VideoWriter
+        self.compression = 'default'
+
         # Attributes private to worker thread:
         self.currentStack = None  # file handle of currently recorded stack
+        self.videoWriter = None  # open writer for the current stack
         self.startFrameTime = None
         self.lastFrameTime = None
         self.currentFrameNum = 0
@@ -139,6 +142,10 @@ class RecordThread(Thread):
 
             time.sleep(100e-3)
 
+        if self.videoWriter is not None:
+            self.videoWriter.close()
+            self.videoWriter = None
+
     def handleFrames(self, frames):
         # Write as many frames into the stack as possible.
         # If False appears in the list of frames, it indicates the end of a stack
@@ -154,6 +161,8 @@ class RecordThread(Thread):
                     recFrames = []
 
                 if self.currentStack is not None:
+                    self.videoWriter.close()
+                    self.videoWriter = None
                     dur = self.lastFrameTime - self.startFrameTime
                     if dur > 0:
                         fps = (self.currentFrameNum + 1) / dur
@@ -191,29 +200,30 @@ class RecordThread(Thread):
             self.currentFrameNum += len(recFrames)
 
     def writeFrames(self, frames, dh):
-        newRec = self.currentStack is None
-
-        if newRec:
+        if self.currentStack is None:
             self.startFrameTime = frames[0][1]['time']
+            self.currentStack = self.newStack(frames[0], dh)
 
-        times = [f[1]['time'] for f in frames]
-        translations = np.array([f[1]['transform'].getTranslation() for f in frames])
-        arrayInfo = [
-            {
-                'name': 'Time',
-                'values': np.array(times) - self.startFrameTime,
-                'units': 's',
-                'translation': translations,
-            },
-            {'name': 'X'},
-            {'name': 'Y'},
-        ]
-        imgs = [f[0][np.newaxis, ...] for f in frames]
-
-        data = MetaArray(np.concatenate(imgs, axis=0), info=arrayInfo)
-        if newRec:
-            self.currentStack = dh.writeFile(
-                data, 'video', autoIncrement=True, info=frames[0][1], appendAxis='Time', appendKeys=['translation']
-            )
-        else:
-            data.write(self.currentStack.name(), appendAxis='Time', appendKeys=['translation'])
+        for data, info in frames:
+            self.videoWriter.append(data, info['time'], info['transform'].getTranslation())
+        self.videoWriter.flush()
+
+    def newStack(self, firstFrame, dh):
+        """Create a new video file in *dh* and open a VideoWriter for it.
+
+        The file is written in the same layout as MetaArray.write(appendAxis='Time'), so it is
+        read back through the regular MetaArray file type.
+        """
+        data, info = firstFrame
+        info = dict(info)
+        info['__object_type__'] = 'MetaArray'
+        fh = dh.createFile('video.ma', info=info, autoIncrement=True)
+        self.videoWriter = VideoWriter(
+            fh.name(),
+            frameShape=data.shape,
+            dtype=data.dtype,
+            startTime=self.startFrameTime,
+            translationSize=len(info['transform'].getTranslation()),
+            compression=self.compression,
+        )
+        return fh
@@ -0,0 +1,123 @@
+import h5py
+import numpy as np
+from MetaArray import MetaArray
+
+try:
+    import hdf5plugin
+
+    HAVE_HDF5PLUGIN = True
+except ImportError:
+    HAVE_HDF5PLUGIN = False
+
+
+class VideoWriter(object):
+    """Streams camera frames into an HDF5 file that can be read as a MetaArray.
+
+    Unlike MetaArray.write(appendAxis=...), which reopens the file and requires each batch of
+    frames to be concatenated into a single array, VideoWriter keeps the file open for the
+    duration of the recording and writes each frame directly into a dataset chunked one frame
+    at a time. Values for the Time axis (and per-frame stage translations) are buffered and
+    written to the file whenever flush() is called.
+
+    *compression* may be any HDF5 filter accepted by MetaArray ('gzip', ('gzip', level),
+    'lzf', 'szip', or None), 'default' to use MetaArray.defaultCompression, or 'lz4' /
+    'blosc' for fast lossless compression using the optional hdf5plugin package. Note that
+    files written with 'lz4' or 'blosc' can only be read if hdf5plugin is installed.
+    """
+
+    def __init__(self, fileName, frameShape, dtype, startTime, translationSize=3, compression='default'):
+        self.fileName = fileName
+        self.startTime = startTime
+        self._times = []
+        self._translations = []
+        self._nFrames = 0
+
+        frameShape = tuple(frameShape)
+        self._file = h5py.File(fileName, 'w')
+        self._file.attrs['MetaArray'] = MetaArray.version
+        self._data = self._file.create_dataset(
+            'data',
+            shape=(0,) + frameShape,
+            maxshape=(None,) + frameShape,
+            chunks=(1,) + frameShape,
+            dtype=dtype,
+            **compressionOptions(compression),
+        )
+
+        # write axis info in exactly the layout MetaArray.writeHDF5 would produce
+        arrayInfo = [
+            {
+                'name': 'Time',
+                'values': np.empty(0, dtype=float),
+                'units': 's',
+                'translation': np.empty((0, translationSize), dtype=float),
+            },
+            {'name': 'X'},
+            {'name': 'Y'},
+        ]
+        template = MetaArray(np.empty((0,) + frameShape, dtype=dtype), info=arrayInfo)
+        template.writeHDF5Meta(self._file, 'info', template.infoCopy(), chunks=True)
+        self._timeValues = self._file['info/0/values']
+        self._timeTranslation = self._file['info/0/translation']
+
+    @property
+    def frameCount(self):
+        """The number of frames written so far."""
+        return self._nFrames
+
+    def append(self, image, time, translation):
+        """Write a single frame to the file.
+
+        *time* is the absolute acquisition time of the frame and *translation* its stage
+        position; both are stored on the Time axis at the next flush().
+        """
+        n = self._nFrames
+        self._data.resize(n + 1, axis=0)
+        self._data[n] = image
+        self._times.append(time - self.startTime)
+        self._translations.append(translation)
+        self._nFrames = n + 1
+
+    def flush(self):
+        """Write buffered axis values and flush the file to disk."""
+        if len(self._times) > 0:
+            n = len(self._times)
+            for ds, vals in ((self._timeValues, self._times), (self._timeTranslation, self._translations)):
+                start = ds.shape[0]
+                ds.resize(start + n, axis=0)
+                ds[start:] = np.array(vals, dtype=float)
+            self._times = []
+            self._translations = []
+        self._file.flush()
+
+    def close(self):
+        if self._file is None:
+            return
+        self.flush()
+        self._file.close()
+        self._file = None
+
+
+def compressionOptions(compression):
+    """Return h5py dataset keyword arguments for the given compression setting.
+    """
+    if compression == 'default':
+        compression = MetaArray.defaultCompression
+    if compression is None:
+        return {}
+    if isinstance(compression, tuple):
+        name, opts = compression
+    else:
+        name, opts = compression, None
+
+    if name in ('lz4', 'blosc'):
+        if not HAVE_HDF5PLUGIN:
+            raise ImportError(f"'{name}' compression requires the hdf5plugin package.")
+        if name == 'lz4':
+            return dict(hdf5plugin.LZ4())
+        return dict(hdf5plugin.Blosc(cname='lz4', clevel=5 if opts is None else opts, shuffle=hdf5plugin.Blosc.SHUFFLE))
+
+    kwds = {'compression': name}
+    if opts is not None:
+        kwds['compression_opts'] = opts
+    return kwds
@@ -0,0 +1,276 @@
+"""
+logfile.py - Append-only storage for log entries written by LogWindow
+
+Each log entry is stored as a single line of JSON. Next to the log file, a hidden fixed-width binary
+index (.<log file>.index) records the byte offset and length of every entry along with the fields used to
+filter entries in the log viewer (importance, message type, directory and id). Reading the index is
+enough to filter a log; entries themselves are only parsed when they are needed.
+
+Entries are written by a LogWriter, which serializes and appends them in batches from a background
+thread so that logging never blocks on disk access.
+
+Logs written by older versions of ACQ4 (log.txt, in pyqtgraph's config file format) can still be
+read with readConfigLog().
+"""
+import json
+import os
+import queue
+import threading
+import traceback
+
+import numpy as np
+
+import pyqtgraph.configfile as configfile
+from acq4.util.json_encoder import ACQ4JSONEncoder
+
+# file name used for logs in storage directories
+logFileName = "log.jsonl"
+# file name used by older versions of ACQ4
+configLogFileName = "log.txt"
+
+indexDtype = np.dtype([
+    ("offset", "<i8"),
+    ("length", "<i4"),
+    ("importance", "<i4"),
+    ("msgType", "S10"),
+    ("directory", "S256"),
+    ("entryId", "<i4"),
+])
+
+
+class LogEncoder(ACQ4JSONEncoder):
+    """JSON encoder for log entries; objects that cannot be serialized are stored as their repr()."""
+    def default(self, obj):
+        try:
+            return ACQ4JSONEncoder.default(self, obj)
+        except TypeError:
+            return repr(obj)
+
+
+def indexFileName(fileName):
+    """Return the name of the (hidden) index file for the log *fileName*."""
+    dirName, baseName = os.path.split(fileName)
+    return os.path.join(dirName, "." + baseName + ".index")
+
+
+def isConfigLog(fileName):
+    """Return True if *fileName* is a log written in the older config file format."""
+    return not fileName.endswith(".jsonl")
+
+
+def removeLog(fileName):
+    """Delete a log file and its index, if they exist."""
+    for f in (fileName, indexFileName(fileName)):
+        if os.path.exists(f):
+            os.remove(f)
+
+
+def encodeEntry(entry):
+    return (json.dumps(entry, cls=LogEncoder) + "\n").encode("utf-8")
+
+
+def indexRecord(entry, offset, length):
+    directory = entry.get("currentDir", None)
+    if directory is None:
+        directory = ""
+    return (
+        offset,
+        length,
+        entry.get("importance", 5),
+        _encodeField(entry.get("msgType", "status")),
+        _encodeField(directory),
+        entry.get("id", 0),
+    )
+
+
+def _encodeField(value):
+    if isinstance(value, bytes):
+        return value
+    return str(value).encode("utf-8")
+
+
+def appendEntries(fileName, entries):
+    """Append a list of entries to the log file *fileName* and its index."""
+    lines = [encodeEntry(e) for e in entries]
+    with open(fileName, "ab") as fh:
+        offset = fh.seek(0, os.SEEK_END)
+        fh.write(b"".join(lines))
+    records = []
+    for entry, line in zip(entries, lines):
+        records.append(indexRecord(entry, offset, len(line)))
+        offset += len(line)
+    with open(indexFileName(fileName), "ab") as fh:
+        fh.write(np.array(records, dtype=indexDtype).tobytes())
+
+
+def readIndex(fileName):
+    """Return the index of the log file *fileName* as a record array with dtype indexDtype.
+
+    Entries missing from the index file (because it was deleted, or writing was interrupted) are
+    indexed by scanning the end of the log, and the index file is updated if possible.
+    """
+    if not os.path.exists(fileName):
+        return np.empty(0, dtype=indexDtype)
+    size = os.path.getsize(fileName)
+    try:
+        with open(indexFileName(fileName), "rb") as fh:
+            data = fh.read()
+    except FileNotFoundError:
+        data = b""
+    nRecords = len(data) // indexDtype.itemsize
+    index = np.frombuffer(data, dtype=indexDtype, count=nRecords).copy()
+    complete = len(data) == nRecords * indexDtype.itemsize
+
+    end = 0 if len(index) == 0 else int(index["offset"][-1] + index["length"][-1])
+    if end > size:
+        # index does not belong to this file; rebuild it
+        index = index[:0]
+        end = 0
+        complete = False
+    if complete and end == size:
+        return index
+
+    missing = _scanEntries(fileName, end)
+    index = np.concatenate([index, missing])
+    try:
+        with open(indexFileName(fileName), "wb") as fh:
+            fh.write(index.tobytes())
+    except OSError:
+        pass  # read-only storage; the index will be rebuilt next time
+    return index
+
+
+def _scanEntries(fileName, start):
+    records = []
+    with open(fileName, "rb") as fh:
+        fh.seek(start)
+        offset = start
+        for line in fh:
+            if not line.endswith(b"\n"):
+                break  # incomplete entry at the end of the file
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                entry = None
+            if isinstance(entry, dict):
+                records.append(indexRecord(entry, offset, len(line)))
+            offset += len(line)
+    return np.array(records, dtype=indexDtype)
+
+
+def readEntries(fileName, offsets, lengths):
+    """Read and return the entries stored at the given byte *offsets* and *lengths* of a log file.
+
+    Entries are returned in the order requested; the file is read in order of increasing offset.
+    """
+    entries = [None] * len(offsets)
+    order = np.argsort(offsets, kind="stable")
+    with open(fileName, "rb") as fh:
+        for i in order:
+            fh.seek(offsets[i])
+            entries[i] = json.loads(fh.read(lengths[i]))
+    return entries
+
+
+def iterEntries(fileName):
+    """Iterate over all entries in a log file, reading one line at a time."""
+    if not os.path.exists(fileName):
+        return
+    with open(fileName, "rb") as fh:
+        for line in fh:
+            if not line.endswith(b"\n"):
+                break
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue
+            if isinstance(entry, dict):
+                yield entry
+
+
+def readConfigLog(fileName):
+    """Read a log written in the older config file format and return a list of entries.
+
+    The "id" of each entry is taken from its key in the file, as LogWidget has always done.
+    """
+    entries = []
+    for k, v in configfile.readConfigFile(fileName).items():
+        v["id"] = k[9:]  # record unique ID to facilitate HTML generation (javascript needs this ID)
+        entries.append(v)
+    return entries
+
+
+def lastEntryId(fileName):
+    """Return the largest entry id stored in a log file in either format, or 0 if there are none."""
+    if not os.path.exists(fileName):
+        return 0
+    if isConfigLog(fileName):
+        ids = [int(e.get("id", 0)) for e in configfile.readConfigFile(fileName).values()]
+    else:
+        ids = readIndex(fileName)["entryId"]
+    return int(max(ids)) if len(ids) > 0 else 0
+
+
+class LogWriter(object):
+    """Appends log entries to files from a background thread.
+
+    Entries passed to write() are queued and written in batches of up to *maxBatchSize*; consecutive
+    entries destined for the same file are serialized and written with a single call to appendEntries().
+    Call flush() to wait until all queued entries have been written.
+    """
+    def __init__(self, maxBatchSize=1000):
+        self.maxBatchSize = maxBatchSize
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="LogWriter", daemon=True)
+        self._thread.start()
+
+    def write(self, fileName, entry):
+        """Queue *entry* (a dict) to be appended to the log file *fileName*."""
+        self._queue.put((fileName, entry))
+
+    def flush(self):
+        """Block until all queued entries have been written."""
+        if self._thread.is_alive():
+            self._queue.join()
+
+    def close(self):
+        """Write all queued entries and stop the writer thread."""
+        self._queue.put(None)
+        self._thread.join()
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            batch = [item]
+            while item is not None and len(batch) < self.maxBatchSize:
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                batch.append(item)
+
+            stop = batch[-1] is None
+            if stop:
+                batch.pop()
+            try:
+                self._writeBatch(batch)
+            finally:
+                for i in range(len(batch) + stop):
+                    self._queue.task_done()
+            if stop:
+                return
+
+    def _writeBatch(self, batch):
+        start = 0
+        while start < len(batch):
+            fileName = batch[start][0]
+            stop = start + 1
+            while stop < len(batch) and batch[stop][0] == fileName:
+                stop += 1
+            try:
+                appendEntries(fileName, [entry for f, entry in batch[start:stop]])
+            except Exception:
+                # can't report this through the log itself
+                print("Error writing log entries to %s:" % fileName)
+                traceback.print_exc()
+            start = stop
@@ -0,0 +1,63 @@
+import numpy as np
+
+
+class RingBuffer(object):
+    """Fixed-size buffer of the most recent records appended to it.
+
+    Every record is written twice, at index i and i + size of an array twice as long as the buffer.
+    Any run of up to *size* most recent records is therefore stored contiguously, and view() can
+    return it in chronological order without copying.
+
+    Example::
+
+        history = RingBuffer(1000, dtype=[('time', float), ('value', float)])
+        history.append({'time': 0.0, 'value': 1.5})
+        recent = history.view(100)  # last 100 records, oldest first
+    """
+    def __init__(self, size, dtype):
+        self.size = size
+        self._data = np.zeros(size * 2, dtype=dtype)
+        self._count = 0  # total number of records ever appended
+
+    @property
+    def dtype(self):
+        return self._data.dtype
+
+    def __len__(self):
+        return min(self._count, self.size)
+
+    def clear(self):
+        self._count = 0
+
+    def append(self, record):
+        """Append one record, given as a dict of field values (missing fields are left as nan / zero)
+        or as a value accepted by the buffer's dtype.
+        """
+        i = self._count % self.size
+        row = np.zeros(1, dtype=self._data.dtype)
+        if isinstance(record, dict):
+            for name in self._data.dtype.names:
+                if name in record:
+                    row[name] = record[name]
+                elif row[name].dtype.kind == 'f':
+                    row[name] = np.nan
+        else:
+            row[0] = record
+        self._data[i] = row[0]
+        self._data[i + self.size] = row[0]
+        self._count += 1
+
+    def view(self, n=None):
+        """Return a read-only view of the last *n* records (default all), oldest first.
+
+        The view shares memory with the buffer, so its oldest records will be overwritten as
+        new records are appended once the buffer is full; copy it to keep a snapshot.
+        """
+        available = len(self)
+        n = available if n is None else min(n, available)
+        stop = self._count % self.size
+        if stop < n:
+            stop += self.size
+        v = self._data[stop - n:stop]
+        v.flags.writeable = False
+        return v
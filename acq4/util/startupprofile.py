@@ -0,0 +1,155 @@
+"""
+Startup profiling (``python -m acq4 --profile-startup``).
+
+Records how long each python module takes to import (cumulative, including the modules it
+imports, and self time), how long each device takes to initialize, and how long each ACQ4 module
+takes to load, then prints a summary once the Manager has started.
+"""
+import importlib.abc
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+_profiler = None
+
+
+def start():
+    """Begin recording startup times. Import timing covers only modules imported after this call.
+    """
+    global _profiler
+    if _profiler is None:
+        _profiler = StartupProfiler()
+        _profiler.install()
+    return _profiler
+
+
+def active():
+    return _profiler is not None
+
+
+def record(category, name, duration):
+    """Record *duration* seconds spent initializing *name* (a 'device', 'module', ...), if profiling."""
+    if _profiler is not None:
+        _profiler.record(category, name, duration)
+
+
+@contextmanager
+def timed(category, name):
+    """Context manager that records the time spent in its body, if profiling."""
+    if _profiler is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        _profiler.record(category, name, time.perf_counter() - start)
+
+
+def stop():
+    """Stop recording and return the profiler (or None if profiling was not started)."""
+    global _profiler
+    prof = _profiler
+    if prof is not None:
+        prof.uninstall()
+    _profiler = None
+    return prof
+
+
+class StartupProfiler:
+    def __init__(self):
+        self.startTime = time.perf_counter()
+        self.imports = {}  # module name: [cumulative, self] seconds
+        self.timings = {}  # category: {name: seconds}
+        self._finder = _ImportTimer(self)
+
+    def install(self):
+        sys.meta_path.insert(0, self._finder)
+
+    def uninstall(self):
+        if self._finder in sys.meta_path:
+            sys.meta_path.remove(self._finder)
+
+    def record(self, category, name, duration):
+        cat = self.timings.setdefault(category, {})
+        cat[name] = cat.get(name, 0.0) + duration
+
+    def formatReport(self, maxImports=30):
+        total = time.perf_counter() - self.startTime
+        lines = [f"Startup took {total:0.2f} s"]
+        if self.imports:
+            # top-level packages get their own summary, since their modules' self times add up
+            packages = {}
+            for name, (cum, own) in self.imports.items():
+                top = name.split('.')[0]
+                packages[top] = packages.get(top, 0.0) + own
+            lines.append(f"  Import time by package (self time, {len(self.imports)} modules):")
+            for name, t in sorted(packages.items(), key=lambda item: -item[1])[:maxImports]:
+                lines.append(f"    {name:<50s} {t:7.3f} s")
+            lines.append("  Slowest imports (cumulative / self):")
+            for name, (cum, own) in sorted(self.imports.items(), key=lambda item: -item[1][0])[:maxImports]:
+                lines.append(f"    {name:<50s} {cum:7.3f} s  {own:7.3f} s")
+        for category, times in self.timings.items():
+            lines.append(f"  {category} init ({sum(times.values()):0.2f} s total):")
+            for name, t in sorted(times.items(), key=lambda item: -item[1]):
+                lines.append(f"    {name:<50s} {t:7.3f} s")
+        return "\n".join(lines)
+
+
+class _ImportTimer(importlib.abc.MetaPathFinder):
+    """Meta path finder that wraps the loaders found by the other finders to time module execution."""
+    def __init__(self, profiler):
+        self.profiler = profiler
+        self._local = threading.local()
+
+    def find_spec(self, fullname, path, target=None):
+        if getattr(self._local, 'finding', False):
+            return None
+        self._local.finding = True
+        try:
+            for finder in sys.meta_path:
+                if finder is self or not hasattr(finder, 'find_spec'):
+                    continue
+                spec = finder.find_spec(fullname, path, target)
+                if spec is not None:
+                    break
+            else:
+                return None
+        finally:
+            self._local.finding = False
+        if spec.loader is None or not hasattr(spec.loader, 'exec_module'):
+            return spec
+        spec.loader = _TimedLoader(spec.loader, fullname, self)
+        return spec
+
+    def stack(self):
+        if not hasattr(self._local, 'stack'):
+            self._local.stack = []
+        return self._local.stack
+
+
+class _TimedLoader(importlib.abc.Loader):
+    def __init__(self, loader, name, timer):
+        self._loader = loader
+        self._name = name
+        self._timer = timer
+
+    def __getattr__(self, attr):
+        return getattr(self._loader, attr)
+
+    def create_module(self, spec):
+        return self._loader.create_module(spec)
+
+    def exec_module(self, module):
+        stack = self._timer.stack()
+        stack.append(0.0)  # accumulates the time spent importing submodules
+        start = time.perf_counter()
+        try:
+            self._loader.exec_module(module)
+        finally:
+            cum = time.perf_counter() - start
+            children = stack.pop()
+            if stack:
+                stack[-1] += cum
+            self._timer.profiler.imports[self._name] = [cum, cum - children]
@@ -1,5 +1,7 @@
 from __future__ import print_function
-import tempfile, shutil, atexit, os
+import tempfile, shutil, atexit, os, time
+import pytest
+
 import acq4.util.DataManager as dm
 from acq4.util.DirTreeWidget import DirTreeWidget
 import pyqtgraph as pg
@@ -75,3 +77,196 @@ def test_datamanager():
 
 
 
+
+def test_binary_index():
+    from acq4.util.DataManager.indexstore import BinaryIndexStore
+
+    dm.dm.setIndexFormat('binary')
+    try:
+        rh = dm.getDirHandle(root).mkdir('binary_index')
+        subdirs = [rh.mkdir('sub', autoIncrement=True, info={'n': i}) for i in range(5)]
+    finally:
+        dm.dm.setIndexFormat('config')
+    assert rh.indexFormat() == 'binary'
+    assert '.index.bin' in os.listdir(rh.name())
+    assert not os.path.exists(os.path.join(rh.name(), '.index'))
+
+    assert rh.ls() == [d.shortName() for d in subdirs]
+    assert subdirs[3].info()['n'] == 3
+    assert rh['sub_003'].info()['n'] == 3
+    subdirs[3].setInfo(n=30)
+    rh.forget('sub_004')
+    assert not rh.isManaged('sub_004')
+
+    # a separate reader (as in another process) sees the same index, and picks up
+    # records appended later without rereading the whole file
+    other = BinaryIndexStore(rh.name())
+    index = other.read()
+    assert list(index.keys()) == ['.', 'sub_000', 'sub_001', 'sub_002', 'sub_003']
+    assert '__timestamp__' in index['sub_003']
+    assert BinaryIndexStore(subdirs[3].name()).read()['.']['n'] == 30
+    offset = other._offset
+    rh.setInfo(extra='value')
+    assert other.read()['.']['extra'] == 'value'
+    assert other._offset > offset
+
+    # migrate to legacy text format and back
+    rh.convertIndex('config')
+    assert rh.indexFormat() == 'config'
+    assert not os.path.exists(os.path.join(rh.name(), '.index.bin'))
+    assert rh['sub_003'].info()['n'] == 30
+    rh.convertIndex('binary')
+    assert rh.info()['extra'] == 'value'
+    assert rh['sub_001'].info()['n'] == 1
+
+
+def test_binary_index_encoding():
+    import datetime
+    from collections import OrderedDict
+    import numpy as np
+    from pyqtgraph import Point
+    from acq4.util.DataManager.indexstore import encodeRecord, decodeRecord
+
+    info = OrderedDict([
+        ('n', 1), ('x', 2.5), ('none', None), ('list', [1, 'a', True]), ('tuple', (1, (2, 3))),
+        (('Clamp1', 'Holding'), 0.0), ('array', np.arange(6, dtype='>i2').reshape(2, 3)),
+        ('struct', np.zeros(2, dtype=[('x', 'f4'), ('y', 'i8', (3,))])), ('scalar', np.float32(1.5)),
+        ('bytes', b'xy'), ('date', datetime.datetime(2020, 1, 2, 3, 4, 5)), ('point', Point(1, 2)),
+        ('__type__', 'plain key'),
+    ])
+    data = encodeRecord(['append', {'file': info}])
+    # records are plain JSON; nothing is unpickled or evaluated when reading
+    assert data.startswith(b'["append"')
+    op, args = decodeRecord(data)
+    out = args['file']
+    assert list(out.keys()) == list(info.keys())
+    for k, v in info.items():
+        if isinstance(v, np.ndarray):
+            assert out[k].dtype == v.dtype and np.array_equal(out[k], v)
+        else:
+            assert out[k] == v
+            assert isinstance(v, np.generic) or type(out[k]) is type(v)
+
+    with pytest.raises(TypeError):
+        encodeRecord({'obj': object()})
+
+
+def test_binary_index_frame_info():
+    import numpy as np
+
+    # frame info as written by Camera.addFrameInfo and RecordThread.newStack
+    devXform = pg.SRTTransform3D(
+        {'pos': (1e-3, 2e-3, 5e-6), 'scale': (1e-6, -1e-6, 1), 'angle': 90, 'axis': (0, 0, 1)})
+    frameXform = pg.SRTTransform3D()
+    frameXform.translate(16, 32)
+    frameXform.scale(2, 2, 1)
+    info = {
+        'binning': (2, 2), 'exposure': 0.01, 'region': [16, 32, 512, 512], 'triggerMode': 'Normal',
+        'time': 1234.5, 'deviceName': 'Camera', 'pixelSize': [2e-6, 2e-6], 'objective': '40x',
+        'illumination': None, 'deviceTransform': devXform, 'frameTransform': frameXform,
+        'transform': pg.SRTTransform3D(devXform * frameXform), 'matrix': pg.Transform3D(devXform),
+        '__object_type__': 'MetaArray',
+    }
+
+    dm.dm.setIndexFormat('binary')
+    try:
+        rh = dm.getDirHandle(root).mkdir('binary_frame_info')
+    finally:
+        dm.dm.setIndexFormat('config')
+    fh = rh.createFile('video.ma', info=info, autoIncrement=True)
+    out = fh.info()
+    for k in ['deviceTransform', 'frameTransform', 'transform', 'matrix']:
+        assert type(out[k]) is type(info[k])
+        assert np.allclose(out[k].matrix(), info[k].matrix())
+    assert out['transform'].saveState() == info['transform'].saveState()
+    assert {k: v for k, v in out.items() if 'ransform' not in k and k != 'matrix'} == \
+        {k: v for k, v in info.items() if 'ransform' not in k and k != 'matrix'}
+
+    # a file whose info can't be indexed is not left behind
+    with pytest.raises(TypeError):
+        rh.createFile('bad.txt', info={'obj': object()})
+    assert 'bad.txt' not in os.listdir(rh.name())
+    assert rh.ls() == ['video_000.ma']
+
+
+def test_metadata_cache():
+    from acq4.util.DataManager.metacache import MetadataCache
+
+    cacheFile = os.path.join(tempfile.mkdtemp(), 'cache.sqlite')
+    atexit.register(shutil.rmtree, os.path.dirname(cacheFile))
+
+    # stamps are compared exactly; racy-interval protection is tested separately below
+    cache = MetadataCache(cacheFile)
+    cache.set('index', '/x/y', (1, 2), {'a': 1})
+    assert cache.get('index', '/x/y', (1, 2)) == {'a': 1}
+    assert cache.get('index', '/x/y', (1, 3)) is None
+    cache.set('ls', '/x/y/z', 1, ['f'])
+    cache.invalidate('/x/y')
+    assert cache.get('index', '/x/y', (1, 2)) is None
+    assert cache.get('ls', '/x/y/z', 1) is None
+    cache.set('ls', '/x', 1, ['f'], mtime=time.time())
+    assert cache.get('ls', '/x', 1) is None
+
+    # pruning by age and size, optionally limited to some kinds of entry
+    cache.clear()
+    for i in range(5):
+        cache.set('a', '/a/%d' % i, 1, b'x' * 1000)
+        cache.set('b', '/b/%d' % i, 1, b'x' * 1000)
+        time.sleep(0.01)
+    cache.prune(maxSize=3500, kinds=['a'])
+    assert [cache.get('a', '/a/%d' % i, 1) is not None for i in range(5)] == [False, False, True, True, True]
+    assert all(cache.get('b', '/b/%d' % i, 1) is not None for i in range(5))
+    cache.prune(maxAge=3600)
+    assert cache.get('b', '/b/0', 1) is not None
+    time.sleep(0.05)
+    cache.prune(maxAge=0.02)
+    assert all(cache.get(k, '/%s/%d' % (k, i), 1) is None for k in 'ab' for i in range(5))
+
+    rh = dm.getDirHandle(root).mkdir('cached')
+    for i in range(3):
+        rh.mkdir('sub', autoIncrement=True)
+    dm.dm.setMetadataCache(cacheFile)
+    try:
+        dm.dm.metadataCache.racyInterval = 0
+        # a fresh handle (as in a new process) fills the cache
+        files = dm.DirHandle(rh.name(), dm.dm).ls()
+        assert files == ['sub_000', 'sub_001', 'sub_002']
+        other = MetadataCache(cacheFile)
+        index = other.get('index', rh._indexFile(), rh._indexStore._stamp)
+        assert list(index.keys()) == ['.', 'sub_000', 'sub_001', 'sub_002']
+        assert dm.DirHandle(rh.name(), dm.dm).ls() == files
+
+        # changes are picked up even though the cache has an entry
+        rh.mkdir('sub', autoIncrement=True)
+        assert rh.ls()[-1] == 'sub_003'
+        rh['sub_003'].delete()
+        assert rh.ls() == files
+    finally:
+        dm.dm.setMetadataCache(None)
+
+
+def test_scan_tree():
+    rh = dm.getDirHandle(root).mkdir('scan')
+    cell = rh.mkdir('cell', info={'dirType': 'Cell', 'note': 'a'})
+    proto = cell.mkdir('protocol', info={'dirType': 'Protocol'})
+    proto.createFile('data.txt', info={'note': 'b'})
+    open(os.path.join(rh.name(), 'unindexed.txt'), 'w').close()
+
+    walked = [(d.name(relativeTo=rh), dirs, files) for d, dirs, files in rh.walk()]
+    assert walked == [
+        ('', ['cell'], ['unindexed.txt']),
+        ('cell', ['protocol'], []),
+        (os.path.join('cell', 'protocol'), [], ['data.txt']),
+    ]
+    assert [w[0] for w in rh.walk(parallel=True)] == [w[0] for w in rh.walk()]
+
+    for parallel in (False, True):
+        fut = rh.scanTree(infoKeys=['note'], parallel=parallel, block=True)
+        assert fut.percentDone() == 100
+        table = fut.getResult()
+        paths = [os.path.join('cell'), os.path.join('cell', 'protocol'), os.path.join('cell', 'protocol', 'data.txt'), 'unindexed.txt']
+        assert list(table['path']) == paths
+        assert list(table['isDir']) == [True, True, False, False]
+        assert list(table['dirType']) == ['Cell', 'Protocol', None, None]
+        assert list(table['note']) == ['a', None, 'b', None]
+        assert table['timestamp'][0] == cell.info()['__timestamp__']
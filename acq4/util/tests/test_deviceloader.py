@@ -0,0 +1,75 @@
+import threading
+import time
+
+import pytest
+
+from acq4.util.deviceloader import deviceDependencies, loadDevices
+
+
+CONFIGS = {
+    'DAQ': {'driver': 'NiDAQ'},
+    'Microscope': {'driver': 'Microscope', 'parentDevice': 'Stage'},
+    'Stage': {'driver': 'Sensapex'},
+    'Camera': {'driver': 'MockCamera', 'parentDevice': 'Microscope'},
+    'Clamp1': {'driver': 'MultiClamp', 'commandChannel': {'device': 'DAQ', 'channel': '/Dev1/ao0'}},
+    'Pipette1': {'driver': 'Pipette', 'scopeDevice': 'Microscope', 'clampDevice': 'Clamp1'},
+}
+
+
+def test_dependencies():
+    deps = deviceDependencies(CONFIGS)
+    assert deps['DAQ'] == set()
+    assert deps['Camera'] == {'Microscope'}
+    assert deps['Clamp1'] == {'DAQ'}
+    assert deps['Pipette1'] == {'Microscope', 'Clamp1'}
+
+
+@pytest.mark.parametrize('workers', [1, 4])
+def test_load_order(workers):
+    loaded = []
+    lock = threading.Lock()
+
+    def load(name, conf):
+        deps = deviceDependencies(CONFIGS)[name]
+        with lock:
+            assert deps <= set(loaded)
+        time.sleep(0.02)
+        if name == 'Stage':
+            raise RuntimeError("no stage")
+        with lock:
+            loaded.append(name)
+        return name
+
+    report = loadDevices(CONFIGS, load, maxWorkers=workers)
+    assert sorted(loaded) == ['Clamp1', 'DAQ']
+    failures = report.failures()
+    assert isinstance(failures['Stage'], tuple) and isinstance(failures['Stage'][1], RuntimeError)
+    # everything downstream of the stage is skipped
+    assert sorted(failures) == ['Camera', 'Microscope', 'Pipette1', 'Stage']
+    assert report.results['DAQ'].device == 'DAQ'
+    if workers == 1:
+        assert loaded == ['DAQ', 'Clamp1']
+    assert "Critical path" in report.formatReport()
+
+
+def test_parallel_critical_path():
+    durations = {'DAQ': 0.05, 'Stage': 0.1, 'Microscope': 0.0, 'Camera': 0.05, 'Clamp1': 0.05, 'Pipette1': 0.0}
+
+    def load(name, conf):
+        time.sleep(durations[name])
+        return name
+
+    report = loadDevices(CONFIGS, load, maxWorkers=len(CONFIGS))
+    assert report.failures() == {}
+    names, duration = report.criticalPath()
+    assert names == ['Stage', 'Microscope', 'Camera']
+    # independent devices overlap, so startup takes about as long as the critical path
+    assert report.totalTime < sum(durations.values())
+
+
+def test_dependency_cycle():
+    configs = {'A': {'parentDevice': 'B'}, 'B': {'parentDevice': 'A'}, 'C': {}}
+    for workers in (1, 2):
+        report = loadDevices(configs, lambda name, conf: name, maxWorkers=workers)
+        assert sorted(report.results) == ['A', 'B', 'C']
+        assert report.failures() == {}
@@ -0,0 +1,81 @@
+import numpy as np
+import pyqtgraph as pg
+from pyqtgraph.flowchart import Flowchart
+
+import acq4.util.DataManager as dm
+from acq4.util.flowchartpool import FlowchartPool, HandleRef, flowchartStateHash, portable, unportable
+
+app = pg.mkQApp()
+
+
+def makeChart(sigma):
+    fc = Flowchart(terminals={'dataIn': {'io': 'in'}, 'dataOut': {'io': 'out'}})
+    node = fc.createNode('GaussianFilter', name='filter')
+    node.ctrls['sigma'].setValue(sigma)
+    fc.connectTerminals(fc['dataIn'], node['In'])
+    fc.connectTerminals(node['Out'], fc['dataOut'])
+    return fc
+
+
+def filterFile(charts, fh):
+    data = np.load(fh.name())
+    return {'source': fh, 'filtered': charts['filter'].process(dataIn=data)['dataOut']}
+
+
+def test_portable(tmp_path):
+    dh = dm.getDirHandle(str(tmp_path))
+    events = np.zeros(3, dtype=[('time', float), ('SourceFile', object)])
+    events['SourceFile'] = dh
+    data = {'events': events, 'dirs': [dh, 'x'], 'n': 1}
+
+    p = portable(data)
+    assert isinstance(p['events']['SourceFile'][0], HandleRef)
+    assert p['dirs'] == [HandleRef(dh.name()), 'x']
+    assert events['SourceFile'][0] is dh  # original is not modified
+
+    u = unportable(p)
+    assert u['events']['SourceFile'][2] is dh
+    assert u['dirs'][0] is dh
+
+
+def test_state_hash():
+    fc = makeChart(2.0)
+    state = fc.saveState()
+    fc.nodes()['filter'].graphicsItem().setPos(100, 100)
+    assert flowchartStateHash(fc.saveState()) == flowchartStateHash(state)
+    fc.nodes()['filter'].ctrls['sigma'].setValue(3.0)
+    assert flowchartStateHash(fc.saveState()) != flowchartStateHash(state)
+
+    # large arrays that differ only where repr() elides them
+    a = np.zeros(10000)
+    b = a.copy()
+    b[5000] = 1
+    assert repr(a) == repr(b)
+    assert flowchartStateHash({'kernel': a}) != flowchartStateHash({'kernel': b})
+    assert flowchartStateHash({'kernel': a, 'n': 1}) == flowchartStateHash({'n': 1, 'kernel': a.copy()})
+
+
+def test_pool(tmp_path):
+    handles = []
+    for i in range(5):
+        fileName = str(tmp_path / f'data{i}.npy')
+        np.save(fileName, np.random.normal(size=100))
+        handles.append(dm.getFileHandle(fileName))
+
+    fc = makeChart(2.0)
+    pool = FlowchartPool(maxWorkers=2)
+    try:
+        chunks = pool.submit(filterFile, {'filter': fc.saveState()}, handles)
+        results = {}
+        for indexes, fut in chunks:
+            for i, result, error in fut.result(timeout=120):
+                assert error is None, error
+                results[i] = unportable(result)
+    finally:
+        pool.shutdown()
+
+    assert sorted(results) == list(range(5))
+    for i, fh in enumerate(handles):
+        assert results[i]['source'] is fh
+        expected = fc.process(dataIn=np.load(fh.name()))['dataOut']
+        assert np.allclose(results[i]['filtered'], expected)
@@ -0,0 +1,46 @@
+import gc
+
+import numpy as np
+
+from acq4.util.imaging.frame_pool import FramePool
+
+
+def test_slot_not_reused_while_referenced():
+    pool = FramePool(2, (4, 3), np.uint16)
+    a = pool.acquire()
+    a[:] = 1
+    view = a[1:, ::2]  # a derived view keeps the slot in use
+    del a
+    gc.collect()
+    assert pool.inUse() == 1
+
+    b = pool.acquire()
+    b[:] = 2
+    assert pool.acquire() is None  # both slots are held
+    assert np.all(view == 1)
+
+    del b
+    gc.collect()
+    assert pool.inUse() == 1
+    c = pool.acquire()
+    c[:] = 3
+    # the freed slot was reused, but the slot still referenced by `view` was not
+    assert np.all(view == 1)
+    assert not np.shares_memory(c, view)
+
+    del view, c
+    gc.collect()
+    assert pool.inUse() == 0
+
+
+def test_stats():
+    pool = FramePool(3, (2, 2), np.float32)
+    assert pool.matches((2, 2), 'float32')
+    assert not pool.matches((2, 3), 'float32')
+    frames = [pool.acquire() for i in range(3)]
+    assert all(f is not None and f.shape == (2, 2) and f.dtype == np.float32 for f in frames)
+    assert pool.acquire() is None
+    del frames
+    gc.collect()
+    stats = pool.stats()
+    assert stats == {'slots': 3, 'inUse': 0, 'maxInUse': 3, 'acquired': 3, 'overflows': 1}
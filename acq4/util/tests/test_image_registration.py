@@ -0,0 +1,58 @@
+import numpy as np
+import scipy.ndimage
+
+from acq4.util.image_registration import MultiTemplateMatcher, iterativeImageTemplateMatch
+
+
+def slowTemplateMatch(img, template, unsharp=3):
+    # same as imageTemplateMatch, with normalized cross-correlation computed one window at a time
+    img = img.astype(float)
+    t = template - template.mean()
+    h, w = t.shape
+    cc = np.zeros((img.shape[0] - h + 1, img.shape[1] - w + 1))
+    for i in range(cc.shape[0]):
+        for j in range(cc.shape[1]):
+            win = img[i:i+h, j:j+w]
+            denom = np.sqrt(((win - win.mean()) ** 2).sum() * (t ** 2).sum())
+            cc[i, j] = (win * t).sum() / denom if denom > 0 else 0
+    ccFilt = cc - scipy.ndimage.gaussian_filter(cc, (unsharp, unsharp))
+    pos = np.unravel_index(np.argmax(ccFilt), cc.shape)
+    return pos, cc[pos[0], pos[1]], cc
+
+
+def makeTemplates(n=5, shape=(24, 32)):
+    # blurred pipette-like wedge that changes shape with z
+    templates = []
+    y, x = np.mgrid[0:shape[0], 0:shape[1]]
+    for i in range(n):
+        wedge = (np.abs(y - shape[0] / 2) < (x * (0.2 + 0.05 * i))) * (x > 4)
+        templates.append(scipy.ndimage.gaussian_filter(wedge.astype(float), 1 + 0.5 * abs(i - n // 2)))
+    return np.array(templates)
+
+
+def test_multi_template_match():
+    rng = np.random.RandomState(0)
+    templates = makeTemplates()
+    img = rng.normal(scale=0.2, size=(68, 84))
+    img[17:41, 29:61] += templates[3]
+
+    matcher = MultiTemplateMatcher(templates)
+    pos, vals = matcher.match(img)
+    for i, t in enumerate(templates):
+        expPos, expVal = iterativeImageTemplateMatch(img, t, matchFn=slowTemplateMatch)
+        assert np.all(pos[i] == expPos)
+        assert np.allclose(vals[i], expVal)
+    assert np.argmax(vals) == 3
+    assert np.all(pos[3] == (17, 29))
+
+    # cached template FFTs are reused for images of the same shape
+    img2 = np.roll(img, (3, -5), axis=(0, 1))
+    pos2, vals2 = matcher.match(img2)
+    assert len(matcher._fftCache) == 1
+    assert np.all(pos2[3] == (20, 24))
+
+    try:
+        matcher.match(img[:20])
+        raise AssertionError("Expected ValueError")
+    except ValueError:
+        pass
@@ -0,0 +1,100 @@
+import os
+
+import numpy as np
+import pyqtgraph.configfile as configfile
+
+from acq4.util import logfile
+
+
+def makeEntries(n, start=1):
+    return [
+        {
+            "message": "message %d" % i,
+            "importance": i % 10,
+            "msgType": ["status", "warning", "error"][i % 3],
+            "currentDir": "/data/cell_%d" % (i % 4),
+            "id": i,
+            "exception": None,
+            "extra": object(),
+        }
+        for i in range(start, start + n)
+    ]
+
+
+def test_append_and_read(tmp_path):
+    fileName = str(tmp_path / logfile.logFileName)
+    entries = makeEntries(20)
+    logfile.appendEntries(fileName, entries[:5])
+    logfile.appendEntries(fileName, entries[5:])
+
+    index = logfile.readIndex(fileName)
+    assert len(index) == 20
+    assert np.all(index["entryId"] == np.arange(1, 21))
+    assert index["msgType"][2] == b"status"
+    assert np.all(np.char.startswith(index["directory"][index["entryId"] % 4 == 1], b"/data/cell_1"))
+
+    sel = np.where(index["msgType"] == b"error")[0][::-1]
+    loaded = logfile.readEntries(fileName, index["offset"][sel], index["length"][sel])
+    assert [e["id"] for e in loaded] == list(index["entryId"][sel])
+    assert loaded[0]["extra"].startswith("<object object")
+
+    assert [e["message"] for e in logfile.iterEntries(fileName)] == [e["message"] for e in entries]
+    assert logfile.lastEntryId(fileName) == 20
+
+
+def test_index_repair(tmp_path):
+    fileName = str(tmp_path / logfile.logFileName)
+    logfile.appendEntries(fileName, makeEntries(10))
+
+    # lost index
+    os.remove(logfile.indexFileName(fileName))
+    assert len(logfile.readIndex(fileName)) == 10
+    assert os.path.exists(logfile.indexFileName(fileName))
+
+    # entries written without their index records, followed by an incomplete entry
+    full = logfile.readIndex(fileName)
+    with open(logfile.indexFileName(fileName), "wb") as fh:
+        fh.write(full[:6].tobytes() + b"\0\0\0")
+    with open(fileName, "ab") as fh:
+        fh.write(b'{"message": "incomp')
+    index = logfile.readIndex(fileName)
+    assert np.all(index == full)
+
+
+def test_writer(tmp_path):
+    names = [str(tmp_path / "a.jsonl"), str(tmp_path / "b.jsonl")]
+    writer = logfile.LogWriter(maxBatchSize=7)
+    entries = makeEntries(50)
+    for i, entry in enumerate(entries):
+        writer.write(names[(i // 10) % 2], entry)
+    writer.flush()
+    ids = [[e["id"] for e in logfile.iterEntries(name)] for name in names]
+    assert ids[0] == [e["id"] for i, e in enumerate(entries) if (i // 10) % 2 == 0]
+    assert ids[1] == [e["id"] for i, e in enumerate(entries) if (i // 10) % 2 == 1]
+
+    writer.write(names[0], makeEntries(1, start=100)[0])
+    writer.close()
+    assert logfile.lastEntryId(names[0]) == 100
+
+
+def test_config_log(tmp_path):
+    fileName = str(tmp_path / logfile.configLogFileName)
+    for i, entry in enumerate(makeEntries(3)):
+        entry.pop("extra")
+        configfile.appendConfigFile({"LogEntry_%d" % i: entry}, fileName)
+
+    assert logfile.isConfigLog(fileName)
+    entries = logfile.readConfigLog(fileName)
+    assert [e["message"] for e in entries] == ["message 1", "message 2", "message 3"]
+    assert [e["id"] for e in entries] == ["0", "1", "2"]
+    assert logfile.lastEntryId(fileName) == 3
+
+
+def test_index_hidden_from_listing(tmp_path):
+    import acq4.util.DataManager as dm
+
+    fileName = str(tmp_path / logfile.logFileName)
+    logfile.appendEntries(fileName, makeEntries(3))
+    assert os.path.basename(logfile.indexFileName(fileName)) == ".log.jsonl.index"
+    assert os.path.exists(logfile.indexFileName(fileName))
+    assert dm.getDirHandle(str(tmp_path)).ls() == [logfile.logFileName]
@@ -0,0 +1,138 @@
+import threading
+import time
+
+import numpy as np
+import pytest
+
+pytest.importorskip("teleprox")
+from acq4.util.imaging import object_detection
+from acq4.util.imaging.object_detection import DetectionWorkerPool
+
+
+class FakeDetector:
+    """Stands in for detect_boxes(); returns one box per image, derived from the image's first pixel."""
+    def __init__(self):
+        self.calls = []
+        self.release = threading.Event()
+        self.release.set()
+        self.error = None
+
+    def __call__(self, data, model="cellpose"):
+        self.release.wait(5)
+        self.calls.append((len(data), model))
+        if self.error is not None:
+            raise self.error
+        return [[((int(d.flat[0]), 0), (int(d.flat[0]), 1))] for d in data]
+
+
+@pytest.fixture
+def detector(monkeypatch):
+    fake = FakeDetector()
+    monkeypatch.setattr(object_detection, "detect_boxes", fake)
+    # run detection in this process instead of a worker process
+    monkeypatch.setattr(
+        DetectionWorkerPool,
+        "_detect_in_process",
+        lambda self, index, slots, model: object_detection.detect_boxes([s.data for s in slots], model),
+    )
+    return fake
+
+
+@pytest.fixture
+def pool(detector):
+    pool = DetectionWorkerPool(num_workers=1, max_batch_size=4, cache_size=8)
+    yield pool
+    pool.stop()
+
+
+def image(value, shape=(8, 8)):
+    return np.full(shape, value, dtype=np.uint16)
+
+
+def test_batching_and_results(pool, detector):
+    detector.release.clear()
+    first = pool.submit(image(1))
+    # wait for the worker to pick up the first request before queueing the rest
+    deadline = time.time() + 5
+    while len(pool._queue) > 0 and time.time() < deadline:
+        time.sleep(0.005)
+    requests = [pool.submit(image(i)) for i in range(2, 7)]
+    detector.release.set()
+    assert first.wait() == [((1, 0), (1, 1))]
+    for i, request in zip(range(2, 7), requests):
+        assert request.wait() == [((i, 0), (i, 1))]
+    # the first request was picked up alone; the rest were batched up to max_batch_size
+    assert [n for n, model in detector.calls] == [1, 4, 1]
+
+
+def test_cache_and_in_flight(pool, detector):
+    detector.release.clear()
+    request = pool.submit(image(1))
+    assert pool.submit(image(1)) is request
+    detector.release.set()
+    request.wait()
+    cached = pool.submit(image(1))
+    assert cached is not request and cached.done.is_set()
+    assert cached.wait() == request.result
+    assert len(detector.calls) == 1
+    # same pixels with a different model are detected separately
+    pool.submit(image(1), model="yolo").wait()
+    assert detector.calls[-1] == (1, "yolo")
+
+
+def test_detection_error(pool, detector):
+    detector.release.clear()
+    detector.error = ValueError("model failed")
+    pool.submit(image(0))
+    requests = [pool.submit(image(i)) for i in range(1, 4)]
+    detector.release.set()
+    for request in requests:
+        assert request.done.wait(5)
+        with pytest.raises(RuntimeError):
+            request.wait()
+        assert isinstance(request.error, ValueError)
+    # failures are not cached, and the pool keeps working
+    detector.error = None
+    assert pool.submit(image(1)).wait() == [((1, 0), (1, 1))]
+
+
+def test_slot_allocation_error(pool, monkeypatch):
+    def fail(data, close=True):
+        raise OSError("out of shared memory")
+    monkeypatch.setattr(object_detection.SharedNDArray, "copy", fail)
+    request = pool.submit(image(5))
+    assert request.done.wait(5)
+    assert isinstance(request.error, OSError)
+    monkeypatch.undo()
+
+
+@pytest.mark.filterwarnings("ignore::pytest.PytestUnhandledThreadExceptionWarning")
+def test_worker_exit_fails_pending(detector):
+    pool = DetectionWorkerPool(num_workers=1)
+
+    def crash(index, batch):
+        detector.release.wait(5)
+        raise SystemError("worker thread died")
+    pool._detect_batch = crash
+    detector.release.clear()
+    requests = [pool.submit(image(i)) for i in range(3)]
+    detector.release.set()
+    for request in requests:
+        assert request.done.wait(5), "request was never completed"
+        assert request.error is not None
+    with pytest.raises(RuntimeError):
+        pool.submit(image(10))
+    pool.stop()
+
+
+def test_free_slot_limit(detector):
+    pool = DetectionWorkerPool(num_workers=1, max_free_slots=2)
+    try:
+        for i in range(5):
+            pool.submit(image(i, shape=(4 + i, 4))).wait()
+        assert pool._n_free_slots == 2
+        assert sum(len(slots) for slots in pool._free_slots.values()) == 2
+        # the most recently used shapes are kept
+        assert list(pool._free_slots.keys()) == [((7, 4), "<u2"), ((8, 4), "<u2")]
+    finally:
+        pool.stop()
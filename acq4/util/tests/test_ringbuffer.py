@@ -0,0 +1,31 @@
+import numpy as np
+
+from acq4.util.ringbuffer import RingBuffer
+
+
+def test_ringbuffer():
+    rb = RingBuffer(5, dtype=[('time', float), ('value', float), ('count', int)])
+    assert len(rb) == 0
+    assert rb.view().shape == (0,)
+
+    appended = []
+    for i in range(13):
+        rb.append({'time': i, 'value': i * 2., 'count': i, 'unknown': 'ignored'})
+        appended.append(i)
+        assert len(rb) == min(i + 1, 5)
+        assert list(rb.view()['time']) == appended[-5:]
+        assert list(rb.view(3)['count']) == appended[-3:]
+        assert list(rb.view(10)['time']) == appended[-5:]
+
+    v = rb.view()
+    assert np.shares_memory(v, rb._data)
+    assert not v.flags.writeable
+
+    # missing float fields are nan
+    rb.append({'time': 13})
+    assert np.isnan(rb.view(1)['value'][0])
+
+    rb.clear()
+    assert len(rb) == 0
+    rb.append((1., 2., 3))
+    assert rb.view()[0]['count'] == 3
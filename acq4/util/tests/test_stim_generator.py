@@ -0,0 +1,57 @@
+import numpy as np
+import pyqtgraph as pg
+
+from acq4.util.generator.StimGenerator import StimGenerator
+
+app = pg.mkQApp()
+
+
+def makeGenerator(function):
+    gen = StimGenerator()
+    gen.loadState({
+        'function': function,
+        'params': {'x': {'default': '1', 'sequence': 'list', 'list': '1, 2, 0, 4'}},
+        'advancedMode': True,
+    })
+    return gen
+
+
+def test_sequence():
+    gen = makeGenerator('np.ones(nPts) * x')
+    waves = gen.getSequence(1000, 10)
+    assert waves.shape == (4, 10)
+    for i, x in enumerate([1, 2, 0, 4]):
+        assert np.array_equal(waves[i], gen.getSingle(1000, 10, {'x': i}))
+        assert np.all(waves[i] == x)
+
+
+def test_sequence_point_failure():
+    # only the failing point is left out
+    gen = makeGenerator('np.ones(nPts) * (1 / x)')
+    waves = gen.getSequence(1000, 10)
+    assert waves.shape == (4, 10)
+    assert np.all(np.isnan(waves[2]))
+    assert np.allclose(waves[[0, 1, 3], 0], [1, 0.5, 0.25])
+    assert 'division by zero' in gen.ui.errorText.toPlainText()
+
+    gen = makeGenerator('np.ones(nPts) if x != 0 else None')
+    waves = gen.getSequence(1000, 10)
+    assert np.all(np.isnan(waves[2])) and np.all(waves[[0, 1, 3]] == 1)
+
+    gen = makeGenerator('None')
+    assert gen.getSequence(1000, 10) is None
+
+
+def test_cache_size_limit():
+    gen = makeGenerator('np.ones(nPts) * x')
+    gen.maxCacheBytes = 3 * 8000
+    gen.getSequence(1000, 1000)
+    assert len(gen.cache) == 3 and gen.cacheBytes == 3 * 8000
+    # least recently used waveforms are discarded first
+    assert (1000, 1000, (('x', 0),)) not in gen.cache
+
+    # a waveform larger than the limit is still kept until the next one is added
+    gen.getSingle(1000, 5000)
+    assert len(gen.cache) == 1 and gen.cacheBytes == 40000
+    gen.clearCache()
+    assert gen.cacheBytes == 0
@@ -0,0 +1,60 @@
+import numpy as np
+import pytest
+from MetaArray import MetaArray
+
+from acq4.util.imaging.video_writer import VideoWriter, compressionOptions
+
+
+@pytest.mark.parametrize('compression', [None, 'gzip', ('gzip', 1), 'lzf'])
+def test_write_and_read(tmp_path, compression):
+    fileName = str(tmp_path / 'video.ma')
+    frames = np.random.randint(0, 4000, size=(7, 12, 10)).astype(np.uint16)
+    times = 100.0 + np.arange(7) * 0.05
+    translations = np.random.normal(size=(7, 3))
+
+    writer = VideoWriter(fileName, frames.shape[1:], frames.dtype, startTime=100.0, compression=compression)
+    for i in range(4):
+        writer.append(frames[i], times[i], translations[i])
+    writer.flush()
+    for i in range(4, 7):
+        writer.append(frames[i], times[i], translations[i])
+    assert writer.frameCount == 7
+    writer.close()
+    writer.close()  # closing twice is harmless
+
+    data = MetaArray(file=fileName, readAllData=True)
+    assert data.shape == frames.shape
+    assert data.dtype == frames.dtype
+    assert np.array_equal(data.asarray(), frames)
+    assert np.allclose(data.xvals('Time'), times - 100.0)
+    assert np.allclose(data._info[0]['translation'], translations)
+    assert data._info[0]['units'] == 's'
+    assert [data._info[i]['name'] for i in range(3)] == ['Time', 'X', 'Y']
+
+
+def test_matches_metaarray_append(tmp_path):
+    # files are laid out like MetaArray.write(appendAxis='Time')
+    frames = np.random.randint(0, 255, size=(3, 5, 4)).astype(np.uint8)
+    ref = str(tmp_path / 'ref.ma')
+    for i in range(3):
+        info = [{'name': 'Time', 'values': [float(i)], 'units': 's', 'translation': np.zeros((1, 3))},
+                {'name': 'X'}, {'name': 'Y'}]
+        MetaArray(frames[i:i + 1], info=info).write(ref, appendAxis='Time')
+
+    fileName = str(tmp_path / 'video.ma')
+    writer = VideoWriter(fileName, (5, 4), np.uint8, startTime=0.0, compression=None)
+    for i in range(3):
+        writer.append(frames[i], float(i), np.zeros(3))
+    writer.close()
+
+    a = MetaArray(file=ref, readAllData=True)
+    b = MetaArray(file=fileName, readAllData=True)
+    assert np.array_equal(a.asarray(), b.asarray())
+    assert np.allclose(a.xvals('Time'), b.xvals('Time'))
+    assert np.allclose(a._info[0]['translation'], b._info[0]['translation'])
+
+
+def test_compression_options():
+    assert compressionOptions(None) == {}
+    assert compressionOptions('gzip') == {'compression': 'gzip'}
+    assert compressionOptions(('gzip', 4)) == {'compression': 'gzip', 'compression_opts': 4}